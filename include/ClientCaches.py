@@ -1141,6 +1141,7 @@ class ParsingCache( object ):
         self._next_clean_cache_time = HydrusData.GetNow()
         
         self._html_to_soups = {}
+        self._html_to_lxml_trees = {}
         self._json_to_jsons = {}
         
         self._lock = threading.Lock()
@@ -1150,7 +1151,7 @@ class ParsingCache( object ):
         
         if HydrusData.TimeHasPassed( self._next_clean_cache_time ):
             
-            for cache in ( self._html_to_soups, self._json_to_jsons ):
+            for cache in ( self._html_to_soups, self._html_to_lxml_trees, self._json_to_jsons ):
                 
                 dead_datas = set()
                 
@@ -1209,6 +1210,35 @@ class ParsingCache( object ):
             
         
     
+    def GetLXMLTree( self, html ):
+        
+        with self._lock:
+            
+            now = HydrusData.GetNow()
+            
+            if html not in self._html_to_lxml_trees:
+                
+                tree = ClientParsing.GetLXMLTree( html )
+                
+                self._html_to_lxml_trees[ html ] = ( now, tree )
+                
+            
+            ( last_accessed, tree ) = self._html_to_lxml_trees[ html ]
+            
+            if last_accessed != now:
+                
+                self._html_to_lxml_trees[ html ] = ( now, tree )
+                
+            
+            if len( self._html_to_lxml_trees ) > 10:
+                
+                self._CleanCache()
+                
+            
+            return tree
+            
+        
+    
     def GetSoup( self, html ):
         
         with self._lock:
@@ -1255,7 +1285,7 @@ class RenderedImageCache( object ):
         self._data_cache.Clear()
         
     
-    def GetImageRenderer( self, media ):
+    def GetImageRenderer( self, media, target_resolution = None ):
         
         hash = media.GetHash()
         
@@ -1265,7 +1295,7 @@ class RenderedImageCache( object ):
         
         if result is None:
             
-            image_renderer = ClientRendering.ImageRenderer( media )
+            image_renderer = ClientRendering.ImageRenderer( media, target_resolution = target_resolution )
             
             self._data_cache.AddData( key, image_renderer )
             
@@ -666,6 +666,8 @@ class Controller( HydrusController.HydrusController ):
         
         HC.options = self.options
         
+        self.SetThreadPoolSize( self.new_options.GetNoneableInteger( 'thread_pool_size' ) )
+        
         if self.new_options.GetBoolean( 'use_system_ffmpeg' ):
             
             if HydrusVideoHandling.FFMPEG_PATH.startswith( HC.BIN_DIR ):
@@ -791,6 +793,7 @@ class Controller( HydrusController.HydrusController ):
         
         self.sub( self, 'ToClipboard', 'clipboard' )
         self.sub( self, 'RestartClientServerService', 'restart_client_server_service' )
+        self.sub( self, 'NotifyNewOptions', 'notify_new_options' )
         
     
     def InitView( self ):
@@ -1059,6 +1062,11 @@ class Controller( HydrusController.HydrusController ):
         return self._menu_open
         
     
+    def NotifyNewOptions( self ):
+        
+        self.SetThreadPoolSize( self.new_options.GetNoneableInteger( 'thread_pool_size' ) )
+        
+    
     def PageAlive( self, page_key ):
         
         with self._page_key_lock:
@@ -1529,6 +1529,8 @@ class DB( HydrusDB.HydrusDB ):
         self._c.execute( 'CREATE TABLE IF NOT EXISTS duplicate_false_positives ( smaller_alternates_group_id INTEGER, larger_alternates_group_id INTEGER, PRIMARY KEY ( smaller_alternates_group_id, larger_alternates_group_id ) );' )
         self._CreateIndex( 'duplicate_false_positives', [ 'larger_alternates_group_id', 'smaller_alternates_group_id' ], unique = True )
         
+        self._c.execute( 'CREATE TABLE export_folder_manifests ( folder_name TEXT, dest_path TEXT, hash_id INTEGER, size INTEGER, mtime INTEGER, PRIMARY KEY ( folder_name, dest_path ) );' )
+        
         self._c.execute( 'CREATE TABLE local_file_deletion_reasons ( hash_id INTEGER PRIMARY KEY, reason_id INTEGER );' )
         
         self._c.execute( 'CREATE TABLE file_inbox ( hash_id INTEGER PRIMARY KEY );' )
@@ -1735,6 +1737,8 @@ class DB( HydrusDB.HydrusDB ):
         
         self._c.execute( 'CREATE TABLE IF NOT EXISTS external_caches.local_tags_cache ( tag_id INTEGER PRIMARY KEY, tag TEXT UNIQUE );' )
         
+        self._c.execute( 'CREATE TABLE IF NOT EXISTS external_caches.video_keyframe_timestamps ( hash_id INTEGER PRIMARY KEY, timestamps_ms TEXT );' )
+        
     
     def _CullFileViewingStatistics( self ):
         
@@ -1900,10 +1904,20 @@ class DB( HydrusDB.HydrusDB ):
             
             self._c.execute( 'DELETE FROM json_dumps_named WHERE dump_type = ?;', ( dump_type, ) )
             
+            if dump_type == HydrusSerialisable.SERIALISABLE_TYPE_EXPORT_FOLDER:
+                
+                self._c.execute( 'DELETE FROM export_folder_manifests;' )
+                
+            
         elif timestamp is None:
             
             self._c.execute( 'DELETE FROM json_dumps_named WHERE dump_type = ? AND dump_name = ?;', ( dump_type, dump_name ) )
             
+            if dump_type == HydrusSerialisable.SERIALISABLE_TYPE_EXPORT_FOLDER:
+                
+                self._c.execute( 'DELETE FROM export_folder_manifests WHERE folder_name = ?;', ( dump_name, ) )
+                
+            
         else:
             
             self._c.execute( 'DELETE FROM json_dumps_named WHERE dump_type = ? AND dump_name = ? AND timestamp = ?;', ( dump_type, dump_name, timestamp ) )
@@ -3507,6 +3521,8 @@ class DB( HydrusDB.HydrusDB ):
                     
                     self._weakref_media_result_cache.DropMediaResult( hash_id, hash )
                     
+                    self._c.execute( 'DELETE FROM video_keyframe_timestamps WHERE hash_id = ?;', ( hash_id, ) )
+                    
                     new_file_info_hashes.add( hash )
                     
                     result = self._c.execute( 'SELECT 1 FROM local_hashes WHERE hash_id = ?;', ( hash_id, ) ).fetchone()
@@ -4120,6 +4136,11 @@ class DB( HydrusDB.HydrusDB ):
         return { hash for ( hash, ) in self._c.execute( 'SELECT hash FROM file_transfers NATURAL JOIN hashes WHERE service_id = ?;', ( self._combined_local_file_service_id, ) ) }
         
     
+    def _GetExportFolderManifest( self, folder_name ):
+        
+        return { dest_path : ( hash_id, size, mtime ) for ( dest_path, hash_id, size, mtime ) in self._c.execute( 'SELECT dest_path, hash_id, size, mtime FROM export_folder_manifests WHERE folder_name = ?;', ( folder_name, ) ) }
+        
+    
     def _GetFileHashes( self, given_hashes, given_hash_type, desired_hash_type ):
         
         if given_hash_type == 'sha256':
@@ -5868,74 +5889,109 @@ class DB( HydrusDB.HydrusDB ):
     
     def _GetHashIdStatus( self, hash_id, prefix = '' ):
         
+        hash_ids_to_statuses = self._GetHashIdsToStatuses( ( hash_id, ), prefix = prefix )
+        
+        return hash_ids_to_statuses[ hash_id ]
+        
+    
+    def _GetHashIdsToStatuses( self, hash_ids, prefix = '' ):
+        
         if prefix != '':
             
             prefix += ': '
             
         
-        result = self._c.execute( 'SELECT reason_id FROM local_file_deletion_reasons WHERE hash_id = ?;', ( hash_id, ) ).fetchone()
+        hash_ids = set( hash_ids )
         
-        if result is None:
+        hash_ids_to_hashes = self._GetHashIdsToHashes( hash_ids = hash_ids )
+        
+        hash_ids_to_reason_ids = {}
+        deleted_hash_ids = set()
+        hash_ids_to_trash_timestamps = {}
+        hash_ids_to_current_timestamps = {}
+        hash_ids_to_mimes = {}
+        
+        for group_of_hash_ids in HydrusData.SplitListIntoChunks( list( hash_ids ), 256 ):
             
-            file_deletion_reason = 'Unknown deletion reason.'
+            splayed_hash_ids = HydrusData.SplayListForDB( group_of_hash_ids )
             
-        else:
+            hash_ids_to_reason_ids.update( self._c.execute( 'SELECT hash_id, reason_id FROM local_file_deletion_reasons WHERE hash_id IN ' + splayed_hash_ids + ';' ) )
             
-            ( reason_id, ) = result
+            deleted_hash_ids.update( self._STI( self._c.execute( 'SELECT hash_id FROM deleted_files WHERE service_id = ? AND hash_id IN ' + splayed_hash_ids + ';', ( self._combined_local_file_service_id, ) ) ) )
             
-            file_deletion_reason = self._GetText( reason_id )
+            hash_ids_to_trash_timestamps.update( self._c.execute( 'SELECT hash_id, timestamp FROM current_files WHERE service_id = ? AND hash_id IN ' + splayed_hash_ids + ';', ( self._trash_service_id, ) ) )
             
-        
-        hash = self._GetHash( hash_id )
-        
-        result = self._c.execute( 'SELECT 1 FROM deleted_files WHERE service_id = ? AND hash_id = ?;', ( self._combined_local_file_service_id, hash_id ) ).fetchone()
-        
-        if result is not None:
+            hash_ids_to_current_timestamps.update( self._c.execute( 'SELECT hash_id, timestamp FROM current_files WHERE service_id = ? AND hash_id IN ' + splayed_hash_ids + ';', ( self._combined_local_file_service_id, ) ) )
             
-            return ( CC.STATUS_DELETED, hash, prefix + file_deletion_reason )
+            hash_ids_to_mimes.update( self._c.execute( 'SELECT hash_id, mime FROM files_info WHERE hash_id IN ' + splayed_hash_ids + ';' ) )
             
         
-        result = self._c.execute( 'SELECT timestamp FROM current_files WHERE service_id = ? AND hash_id = ?;', ( self._trash_service_id, hash_id ) ).fetchone()
+        hash_ids_to_statuses = {}
         
-        if result is not None:
-            
-            ( timestamp, ) = result
-            
-            note = 'Currently in trash ({}). Sent there at {}, which was {} before this check.'.format( file_deletion_reason, HydrusData.ConvertTimestampToPrettyTime( timestamp ), HydrusData.TimestampToPrettyTimeDelta( timestamp, just_now_threshold = 0 ) )
+        for hash_id in hash_ids:
             
-            return ( CC.STATUS_DELETED, hash, prefix + note )
+            hash = hash_ids_to_hashes[ hash_id ]
             
-        
-        result = self._c.execute( 'SELECT timestamp FROM current_files WHERE service_id = ? AND hash_id = ?;', ( self._combined_local_file_service_id, hash_id ) ).fetchone()
-        
-        if result is not None:
+            if hash_id in hash_ids_to_reason_ids:
+                
+                file_deletion_reason = self._GetText( hash_ids_to_reason_ids[ hash_id ] )
+                
+            else:
+                
+                file_deletion_reason = 'Unknown deletion reason.'
+                
             
-            ( timestamp, ) = result
+            if hash_id in deleted_hash_ids:
+                
+                hash_ids_to_statuses[ hash_id ] = ( CC.STATUS_DELETED, hash, prefix + file_deletion_reason )
+                
+                continue
+                
             
-            result = self._c.execute( 'SELECT mime FROM files_info WHERE hash_id = ?;', ( hash_id, ) ).fetchone()
+            if hash_id in hash_ids_to_trash_timestamps:
+                
+                timestamp = hash_ids_to_trash_timestamps[ hash_id ]
+                
+                note = 'Currently in trash ({}). Sent there at {}, which was {} before this check.'.format( file_deletion_reason, HydrusData.ConvertTimestampToPrettyTime( timestamp ), HydrusData.TimestampToPrettyTimeDelta( timestamp, just_now_threshold = 0 ) )
+                
+                hash_ids_to_statuses[ hash_id ] = ( CC.STATUS_DELETED, hash, prefix + note )
+                
+                continue
+                
             
-            if result is not None:
+            if hash_id in hash_ids_to_current_timestamps:
                 
-                ( mime, ) = result
+                timestamp = hash_ids_to_current_timestamps[ hash_id ]
                 
-                try:
+                if hash_id in hash_ids_to_mimes:
                     
-                    self._controller.client_files_manager.LocklessGetFilePath( hash, mime )
+                    mime = hash_ids_to_mimes[ hash_id ]
                     
-                except HydrusExceptions.FileMissingException:
-                    
-                    note = 'The client believed this file was already in the db, but it was truly missing! Import will go ahead, in an attempt to fix the situation.'
-                    
-                    return ( CC.STATUS_UNKNOWN, hash, prefix + note )
+                    try:
+                        
+                        self._controller.client_files_manager.LocklessGetFilePath( hash, mime )
+                        
+                    except HydrusExceptions.FileMissingException:
+                        
+                        note = 'The client believed this file was already in the db, but it was truly missing! Import will go ahead, in an attempt to fix the situation.'
+                        
+                        hash_ids_to_statuses[ hash_id ] = ( CC.STATUS_UNKNOWN, hash, prefix + note )
+                        
+                        continue
+                        
                     
                 
+                note = 'Imported at {}, which was {} before this check.'.format( HydrusData.ConvertTimestampToPrettyTime( timestamp ), HydrusData.TimestampToPrettyTimeDelta( timestamp, just_now_threshold = 0 ) )
+                
+                hash_ids_to_statuses[ hash_id ] = ( CC.STATUS_SUCCESSFUL_BUT_REDUNDANT, hash, prefix + note )
+                
+                continue
+                
             
-            note = 'Imported at {}, which was {} before this check.'.format( HydrusData.ConvertTimestampToPrettyTime( timestamp ), HydrusData.TimestampToPrettyTimeDelta( timestamp, just_now_threshold = 0 ) )
-            
-            return ( CC.STATUS_SUCCESSFUL_BUT_REDUNDANT, hash, prefix + note )
+            hash_ids_to_statuses[ hash_id ] = ( CC.STATUS_UNKNOWN, hash, '' )
             
         
-        return ( CC.STATUS_UNKNOWN, hash, '' )
+        return hash_ids_to_statuses
         
     
     def _GetHashStatus( self, hash_type, hash, prefix = None ):
@@ -7511,20 +7567,62 @@ class DB( HydrusDB.HydrusDB ):
     
     def _GetURLStatuses( self, url ):
         
-        search_urls = ClientNetworkingDomain.GetSearchURLs( url )
+        urls_to_url_statuses = self._GetURLsToURLStatuses( ( url, ) )
         
-        hash_ids = set()
+        return urls_to_url_statuses[ url ]
+        
+    
+    def _GetURLsToURLStatuses( self, urls ):
         
-        for search_url in search_urls:
+        urls_to_search_urls = { url : ClientNetworkingDomain.GetSearchURLs( url ) for url in urls }
+        
+        all_search_urls = set( itertools.chain.from_iterable( urls_to_search_urls.values() ) )
+        
+        search_urls_to_hash_ids = collections.defaultdict( set )
+        
+        with HydrusDB.TemporaryTextTable( self._c, all_search_urls, 'url' ) as temp_table_name:
+            
+            for ( search_url, hash_id ) in self._c.execute( 'SELECT url, hash_id FROM ' + temp_table_name + ' CROSS JOIN urls USING ( url ) CROSS JOIN url_map USING ( url_id );' ):
+                
+                search_urls_to_hash_ids[ search_url ].add( hash_id )
+                
+            
+        
+        all_hash_ids = set( itertools.chain.from_iterable( search_urls_to_hash_ids.values() ) )
+        
+        hash_ids_to_statuses = self._GetHashIdsToStatuses( all_hash_ids, prefix = 'url recognised' )
+        
+        urls_to_url_statuses = {}
+        
+        for ( url, search_urls ) in urls_to_search_urls.items():
+            
+            hash_ids = set()
+            
+            for search_url in search_urls:
+                
+                hash_ids.update( search_urls_to_hash_ids[ search_url ] )
+                
             
-            results = self._STS( self._c.execute( 'SELECT hash_id FROM url_map NATURAL JOIN urls WHERE url = ?;', ( search_url, ) ) )
+            urls_to_url_statuses[ url ] = [ hash_ids_to_statuses[ hash_id ] for hash_id in hash_ids ]
             
-            hash_ids.update( results )
+        
+        return urls_to_url_statuses
+        
+    
+    def _GetVideoKeyframeTimestamps( self, hash ):
+        
+        hash_id = self._GetHashId( hash )
+        
+        result = self._c.execute( 'SELECT timestamps_ms FROM video_keyframe_timestamps WHERE hash_id = ?;', ( hash_id, ) ).fetchone()
+        
+        if result is None:
+            
+            return None
             
         
-        results = [ self._GetHashIdStatus( hash_id, prefix = 'url recognised' ) for hash_id in hash_ids ]
+        ( timestamps_ms, ) = result
         
-        return results
+        return json.loads( timestamps_ms )
         
     
     def _GetYAMLDump( self, dump_type, dump_name = None ):
@@ -10328,6 +10426,7 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'client_files_locations': result = self._GetClientFilesLocations( *args, **kwargs )
         elif action == 'downloads': result = self._GetDownloads( *args, **kwargs )
         elif action == 'duplicate_pairs_for_filtering': result = self._DuplicatesGetDuplicatePairsForFiltering( *args, **kwargs )
+        elif action == 'export_folder_manifest': result = self._GetExportFolderManifest( *args, **kwargs )
         elif action == 'file_duplicate_hashes': result = self._DuplicatesGetFileHashesByDuplicateType( *args, **kwargs )
         elif action == 'file_duplicate_info': result = self._DuplicatesGetFileDuplicateInfo( *args, **kwargs )
         elif action == 'file_hashes': result = self._GetFileHashes( *args, **kwargs )
@@ -10379,6 +10478,8 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'tag_siblings': result = self._GetTagSiblings( *args, **kwargs )
         elif action == 'potential_duplicates_count': result = self._DuplicatesGetPotentialDuplicatesCount( *args, **kwargs )
         elif action == 'url_statuses': result = self._GetURLStatuses( *args, **kwargs )
+        elif action == 'urls_to_url_statuses': result = self._GetURLsToURLStatuses( *args, **kwargs )
+        elif action == 'video_keyframe_timestamps': result = self._GetVideoKeyframeTimestamps( *args, **kwargs )
         else: raise Exception( 'db received an unknown read command: ' + action )
         
         return result
@@ -10989,6 +11090,13 @@ class DB( HydrusDB.HydrusDB ):
         self.pub_after_job( 'notify_new_tag_censorship' )
         
     
+    def _SetVideoKeyframeTimestamps( self, hash, timestamps_ms ):
+        
+        hash_id = self._GetHashId( hash )
+        
+        self._c.execute( 'REPLACE INTO video_keyframe_timestamps ( hash_id, timestamps_ms ) VALUES ( ?, ? );', ( hash_id, json.dumps( timestamps_ms ) ) )
+        
+    
     def _SetYAMLDump( self, dump_type, dump_name, data ):
         
         if dump_type == YAML_DUMP_ID_LOCAL_BOORU:
@@ -13069,11 +13177,25 @@ class DB( HydrusDB.HydrusDB ):
                 
             
         
+        if version == 357:
+            
+            self._c.execute( 'CREATE TABLE IF NOT EXISTS external_caches.video_keyframe_timestamps ( hash_id INTEGER PRIMARY KEY, timestamps_ms TEXT );' )
+            
+            self._c.execute( 'CREATE TABLE IF NOT EXISTS export_folder_manifests ( folder_name TEXT, dest_path TEXT, hash_id INTEGER, size INTEGER, mtime INTEGER, PRIMARY KEY ( folder_name, dest_path ) );' )
+            
+        
         self._controller.pub( 'splash_set_title_text', 'updated db to v' + str( version + 1 ) )
         
         self._c.execute( 'UPDATE version SET version = ?;', ( version + 1, ) )
         
     
+    def _UpdateExportFolderManifest( self, folder_name, deletee_dest_paths, rows ):
+        
+        self._c.executemany( 'DELETE FROM export_folder_manifests WHERE folder_name = ? AND dest_path = ?;', ( ( folder_name, dest_path ) for dest_path in deletee_dest_paths ) )
+        
+        self._c.executemany( 'REPLACE INTO export_folder_manifests ( folder_name, dest_path, hash_id, size, mtime ) VALUES ( ?, ?, ?, ?, ? );', ( ( folder_name, dest_path, hash_id, size, mtime ) for ( dest_path, hash_id, size, mtime ) in rows ) )
+        
+    
     def _UpdateMappings( self, tag_service_id, mappings_ids = None, deleted_mappings_ids = None, pending_mappings_ids = None, pending_rescinded_mappings_ids = None, petitioned_mappings_ids = None, petitioned_rescinded_mappings_ids = None ):
         
         ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateMappingsTableNames( tag_service_id )
@@ -13641,6 +13763,7 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'dirty_services': self._SaveDirtyServices( *args, **kwargs )
         elif action == 'duplicate_pair_status': self._DuplicatesSetDuplicatePairStatus( *args, **kwargs )
         elif action == 'duplicate_set_king': self._DuplicatesSetKingFromHash( *args, **kwargs )
+        elif action == 'export_folder_manifest': self._UpdateExportFolderManifest( *args, **kwargs )
         elif action == 'export_mappings': self._ExportToTagArchive( *args, **kwargs )
         elif action == 'file_integrity': self._CheckFileIntegrity( *args, **kwargs )
         elif action == 'file_maintenance_add_jobs': self._FileMaintenanceAddJobs( *args, **kwargs )
@@ -13672,6 +13795,7 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'update_server_services': self._UpdateServerServices( *args, **kwargs )
         elif action == 'update_services': self._UpdateServices( *args, **kwargs )
         elif action == 'vacuum': self._Vacuum( *args, **kwargs )
+        elif action == 'video_keyframe_timestamps': self._SetVideoKeyframeTimestamps( *args, **kwargs )
         else: raise Exception( 'db received an unknown write command: ' + action )
         
         return result
@@ -8,6 +8,7 @@ from . import HydrusPaths
 from . import HydrusSerialisable
 from . import HydrusTags
 from . import HydrusThreading
+import collections
 import os
 import re
 import stat
@@ -268,6 +269,73 @@ class ExportFolder( HydrusSerialisable.SerialisableBaseNamed ):
         self._run_now = run_now
         
     
+    def _DeleteAllEmptyDirs( self ):
+        
+        deletee_dirs = set()
+        
+        for ( root, dirnames, filenames ) in os.walk( self._path, topdown = False ):
+            
+            if root == self._path:
+                
+                continue
+                
+            
+            no_files = len( filenames ) == 0
+            
+            useful_dirnames = [ dirname for dirname in dirnames if os.path.join( root, dirname ) not in deletee_dirs ]
+            
+            no_useful_dirs = len( useful_dirnames ) == 0
+            
+            if no_useful_dirs and no_files:
+                
+                deletee_dirs.add( root )
+                
+            
+        
+        for deletee_dir in deletee_dirs:
+            
+            if os.path.exists( deletee_dir ):
+                
+                HydrusPaths.DeletePath( deletee_dir )
+                
+            
+        
+        return deletee_dirs
+        
+    
+    def _DeleteEmptyDirs( self, possibly_empty_dirs ):
+        
+        deletee_dirs = set()
+        
+        dirs_to_check = set( possibly_empty_dirs )
+        
+        while len( dirs_to_check ) > 0:
+            
+            next_dirs_to_check = set()
+            
+            for dir_path in dirs_to_check:
+                
+                if dir_path == self._path or not dir_path.startswith( self._path ) or not os.path.isdir( dir_path ):
+                    
+                    continue
+                    
+                
+                if len( os.listdir( dir_path ) ) == 0:
+                    
+                    HydrusPaths.DeletePath( dir_path )
+                    
+                    deletee_dirs.add( dir_path )
+                    
+                    next_dirs_to_check.add( os.path.dirname( dir_path ) )
+                    
+                
+            
+            dirs_to_check = next_dirs_to_check
+            
+        
+        return deletee_dirs
+        
+    
     def _GetSerialisableInfo( self ):
         
         serialisable_file_search_context = self._file_search_context.GetSerialisableTuple()
@@ -287,6 +355,222 @@ class ExportFolder( HydrusSerialisable.SerialisableBaseNamed ):
         self._file_search_context = HydrusSerialisable.CreateFromSerialisableTuple( serialisable_file_search_context )
         
     
+    def _SyncMediaResults( self, media_results ):
+        
+        terms = ParseExportPhrase( self._phrase )
+        
+        # the manifest remembers what we put where last time, so on a run where nothing changed we do not have to touch the disk at all
+        
+        manifest = HG.client_controller.Read( 'export_folder_manifest', self._name )
+        
+        path_prefix = os.path.join( self._path, '' )
+        
+        manifest_is_good = len( manifest ) > 0 and False not in ( dest_path.startswith( path_prefix ) for dest_path in manifest.keys() )
+        
+        deletee_manifest_paths = set()
+        new_manifest_rows = []
+        
+        if not manifest_is_good:
+            
+            # no manifest yet, or the folder moved. fall back to looking at what is actually there
+            
+            deletee_manifest_paths.update( manifest.keys() )
+            
+            manifest = {}
+            
+            previous_paths = set()
+            
+            for ( root, dirnames, filenames ) in os.walk( self._path ):
+                
+                previous_paths.update( ( os.path.join( root, filename ) for filename in filenames ) )
+                
+            
+        else:
+            
+            previous_paths = set( manifest.keys() )
+            
+        
+        # a manual run double-checks that the files we think are there still are
+        verify_existing = self._run_now or not manifest_is_good
+        
+        client_files_manager = HG.client_controller.client_files_manager
+        
+        dest_paths_to_media_results = {}
+        
+        for media_result in media_results:
+            
+            filename = GenerateExportFilename( self._path, media_result, terms )
+            
+            dest_path = os.path.normpath( os.path.join( self._path, filename ) )
+            
+            if not dest_path.startswith( self._path ):
+                
+                raise Exception( 'It seems a destination path for export folder "{}" was above the main export directory! The file was "{}" and its destination path was "{}".'.format( self._path, media_result.GetHash().hex(), dest_path ) )
+                
+            
+            if dest_path not in dest_paths_to_media_results:
+                
+                dest_paths_to_media_results[ dest_path ] = media_result
+                
+            
+        
+        sync_paths = set( dest_paths_to_media_results.keys() )
+        
+        # files we exported before that are no longer wanted at their old path. if their file is wanted elsewhere, we can rename them rather than copy again
+        # a regular export folder leaves old files where they are, so only a synchronise one has any to spare
+        
+        hash_ids_to_spare_paths = collections.defaultdict( list )
+        
+        if self._export_type == HC.EXPORT_FOLDER_TYPE_SYNCHRONISE:
+            
+            for dest_path in previous_paths.difference( sync_paths ):
+                
+                if dest_path in manifest:
+                    
+                    ( hash_id, size, mtime ) = manifest[ dest_path ]
+                    
+                    hash_ids_to_spare_paths[ hash_id ].append( dest_path )
+                    
+                
+            
+        
+        moved_away_paths = set()
+        
+        num_copied = 0
+        num_renamed = 0
+        
+        try:
+            
+            for ( dest_path, media_result ) in dest_paths_to_media_results.items():
+                
+                if HC.options[ 'pause_export_folders_sync' ] or HydrusThreading.IsThreadShuttingDown():
+                    
+                    return False
+                    
+                
+                hash_id = media_result.GetHashId()
+                
+                if dest_path in manifest and manifest[ dest_path ][0] == hash_id:
+                    
+                    if not verify_existing:
+                        
+                        continue
+                        
+                    
+                    ( hash_id, size, mtime ) = manifest[ dest_path ]
+                    
+                    if os.path.exists( dest_path ):
+                        
+                        stat_result = os.stat( dest_path )
+                        
+                        if stat_result.st_size == size and int( stat_result.st_mtime ) == mtime:
+                            
+                            continue
+                            
+                        
+                    
+                
+                HydrusPaths.MakeSureDirectoryExists( os.path.dirname( dest_path ) )
+                
+                if dest_path in manifest and manifest[ dest_path ][0] != hash_id:
+                    
+                    # different content at the same name. size and date are no good here, we know from the hash it has to go
+                    
+                    HydrusPaths.DeletePath( dest_path )
+                    
+                
+                done = False
+                
+                while not done and len( hash_ids_to_spare_paths[ hash_id ] ) > 0:
+                    
+                    spare_path = hash_ids_to_spare_paths[ hash_id ].pop()
+                    
+                    if os.path.exists( spare_path ):
+                        
+                        done = HydrusPaths.MergeFile( spare_path, dest_path )
+                        
+                        if done:
+                            
+                            num_renamed += 1
+                            
+                            moved_away_paths.add( spare_path )
+                            
+                        
+                    
+                
+                if not done:
+                    
+                    hash = media_result.GetHash()
+                    mime = media_result.GetMime()
+                    
+                    source_path = client_files_manager.GetFilePath( hash, mime )
+                    
+                    done = HydrusPaths.MirrorFile( source_path, dest_path )
+                    
+                    if done:
+                        
+                        num_copied += 1
+                        
+                        HydrusPaths.MakeFileWritable( dest_path )
+                        
+                    
+                
+                if done:
+                    
+                    stat_result = os.stat( dest_path )
+                    
+                    new_manifest_rows.append( ( dest_path, hash_id, stat_result.st_size, int( stat_result.st_mtime ) ) )
+                    
+                
+            
+            if num_copied > 0 or num_renamed > 0:
+                
+                HydrusData.Print( 'Export folder {} exported {} files and renamed {} files.'.format( self._name, HydrusData.ToHumanInt( num_copied ), HydrusData.ToHumanInt( num_renamed ) ) )
+                
+            
+            deletee_manifest_paths.update( moved_away_paths )
+            
+            if self._export_type == HC.EXPORT_FOLDER_TYPE_SYNCHRONISE:
+                
+                deletee_paths = previous_paths.difference( sync_paths ).difference( moved_away_paths )
+                
+                for deletee_path in deletee_paths:
+                    
+                    ClientPaths.DeletePath( deletee_path )
+                    
+                
+                deletee_manifest_paths.update( deletee_paths )
+                
+                if manifest_is_good:
+                    
+                    # we know exactly which dirs we just emptied, so no need to walk the whole tree
+                    
+                    possibly_empty_dirs = { os.path.dirname( path ) for path in deletee_paths.union( moved_away_paths ) }
+                    
+                    deletee_dirs = self._DeleteEmptyDirs( possibly_empty_dirs )
+                    
+                else:
+                    
+                    deletee_dirs = self._DeleteAllEmptyDirs()
+                    
+                
+                if len( deletee_paths ) > 0:
+                    
+                    HydrusData.Print( 'Export folder {} deleted {} files and {} folders.'.format( self._name, HydrusData.ToHumanInt( len( deletee_paths ) ), HydrusData.ToHumanInt( len( deletee_dirs ) ) ) )
+                    
+                
+            
+            return True
+            
+        finally:
+            
+            if len( deletee_manifest_paths ) > 0 or len( new_manifest_rows ) > 0:
+                
+                HG.client_controller.WriteSynchronous( 'export_folder_manifest', self._name, deletee_manifest_paths, new_manifest_rows )
+                
+            
+        
+    
     def _UpdateSerialisableInfo( self, version, old_serialisable_info ):
         
         if version == 1:
@@ -369,109 +653,11 @@ class ExportFolder( HydrusSerialisable.SerialisableBaseNamed ):
                 
                 #
                 
-                terms = ParseExportPhrase( self._phrase )
-                
-                previous_paths = set()
-                
-                for ( root, dirnames, filenames ) in os.walk( self._path ):
-                    
-                    previous_paths.update( ( os.path.join( root, filename ) for filename in filenames ) )
-                    
-                
-                sync_paths = set()
-                
-                client_files_manager = HG.client_controller.client_files_manager
+                sync_completed = self._SyncMediaResults( media_results )
                 
-                num_copied = 0
-                
-                for media_result in media_results:
-                    
-                    if HC.options[ 'pause_export_folders_sync' ] or HydrusThreading.IsThreadShuttingDown():
-                        
-                        return
-                        
-                    
-                    hash = media_result.GetHash()
-                    mime = media_result.GetMime()
-                    size = media_result.GetSize()
-                    
-                    source_path = client_files_manager.GetFilePath( hash, mime )
-                    
-                    filename = GenerateExportFilename( self._path, media_result, terms )
-                    
-                    dest_path = os.path.normpath( os.path.join( self._path, filename ) )
+                if not sync_completed:
                     
-                    if not dest_path.startswith( self._path ):
-                        
-                        raise Exception( 'It seems a destination path for export folder "{}" was above the main export directory! The file was "{}" and its destination path was "{}".'.format( self._path, hash.hex(), dest_path ) )
-                        
-                    
-                    dest_path_dir = os.path.dirname( dest_path )
-                    
-                    HydrusPaths.MakeSureDirectoryExists( dest_path_dir )
-                    
-                    if dest_path not in sync_paths:
-                        
-                        copied = HydrusPaths.MirrorFile( source_path, dest_path )
-                        
-                        if copied:
-                            
-                            num_copied += 1
-                            
-                            HydrusPaths.MakeFileWritable( dest_path )
-                            
-                        
-                    
-                    sync_paths.add( dest_path )
-                    
-                
-                if num_copied > 0:
-                    
-                    HydrusData.Print( 'Export folder ' + self._name + ' exported ' + HydrusData.ToHumanInt( num_copied ) + ' files.' )
-                    
-                
-                if self._export_type == HC.EXPORT_FOLDER_TYPE_SYNCHRONISE:
-                    
-                    deletee_paths = previous_paths.difference( sync_paths )
-                    
-                    for deletee_path in deletee_paths:
-                        
-                        ClientPaths.DeletePath( deletee_path )
-                        
-                    
-                    deletee_dirs = set()
-                    
-                    for ( root, dirnames, filenames ) in os.walk( self._path, topdown = False ):
-                        
-                        if root == self._path:
-                            
-                            continue
-                            
-                        
-                        no_files = len( filenames ) == 0
-                        
-                        useful_dirnames = [ dirname for dirname in dirnames if os.path.join( root, dirname ) not in deletee_dirs ]
-                        
-                        no_useful_dirs = len( useful_dirnames ) == 0
-                        
-                        if no_useful_dirs and no_files:
-                            
-                            deletee_dirs.add( root )
-                            
-                        
-                    
-                    for deletee_dir in deletee_dirs:
-                        
-                        if os.path.exists( deletee_dir ):
-                            
-                            HydrusPaths.DeletePath( deletee_dir )
-                            
-                        
-                    
-                    if len( deletee_paths ) > 0:
-                        
-                        HydrusData.Print( 'Export folder {} deleted {} files and {} folders.'.format( self._name, HydrusData.ToHumanInt( len( deletee_paths ) ), HydrusData.ToHumanInt( len( deletee_dirs ) ) ) )
-                        
+                    return
                     
                 
                 if self._delete_from_client_after_export:
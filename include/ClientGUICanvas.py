@@ -4087,7 +4087,13 @@ class CanvasMediaList( ClientMedia.ListeningMediaList, CanvasWithHovers ):
                 
                 if not image_cache.HasImageRenderer( hash ):
                     
-                    HG.client_controller.CallLaterWXSafe( self, delay, image_cache.GetImageRenderer, media )
+                    # only decode as much as we will show at the default zoom
+                    
+                    ( zoom, canvas_zoom ) = CalculateCanvasZooms( self, media, self._GetShowAction( media ) )
+                    
+                    target_resolution = CalculateMediaSize( media, zoom )
+                    
+                    HG.client_controller.CallLaterWXSafe( self, delay, image_cache.GetImageRenderer, media, target_resolution )
                     
                 
             
@@ -5083,6 +5089,7 @@ class MediaContainer( wx.Window ):
         self.Hide()
         
         self.Bind( wx.EVT_SIZE, self.EventResize )
+        self.Bind( wx.EVT_MOVE, self.EventMove )
         self.Bind( wx.EVT_MOUSE_EVENTS, self.EventPropagateMouse )
         self.Bind( wx.EVT_ERASE_BACKGROUND, self.EventEraseBackground )
         
@@ -5110,12 +5117,17 @@ class MediaContainer( wx.Window ):
         self._animation_bar.Hide()
         
     
-    def _MakeMediaWindow( self ):
+    def _MakeMediaWindow( self, initial_size = None ):
         
         old_media_window = self._media_window
         destroy_old_media_window = True
         
-        ( media_initial_size, media_initial_position ) = ( self.GetClientSize(), ( 0, 0 ) )
+        if initial_size is None:
+            
+            initial_size = self.GetClientSize()
+            
+        
+        ( media_initial_size, media_initial_position ) = ( initial_size, ( 0, 0 ) )
         
         if self._media.GetMime() == HC.APPLICATION_FLASH and not FLASHWIN_OK:
             
@@ -5205,7 +5217,7 @@ class MediaContainer( wx.Window ):
                     self._media_window = self._static_image_window
                     
                 
-                self._media_window.SetMedia( self._media )
+                self._media_window.SetMedia( self._media, media_initial_size )
                 
                 self._HideAnimationBar()
                 
@@ -5267,6 +5279,18 @@ class MediaContainer( wx.Window ):
         pass
         
     
+    def EventMove( self, event ):
+        
+        if isinstance( self._media_window, StaticImage ):
+            
+            # a drag moves a different part of the image on screen
+            
+            self._media_window.VisibleRegionMayHaveChanged()
+            
+        
+        event.Skip()
+        
+    
     def EventPropagateMouse( self, event ):
         
         if self._media is not None:
@@ -5428,7 +5452,7 @@ class MediaContainer( wx.Window ):
             
             self._embed_button.Hide()
             
-            self._MakeMediaWindow()
+            self._MakeMediaWindow( initial_size )
             
         
         self.SetSize( initial_size )
@@ -5698,8 +5722,10 @@ class StaticImage( wx.Window ):
         self._image_renderer = None
         
         self._is_rendered = False
+        self._waiting_for_finer_decode = False
         
         self._canvas_bmp = None
+        self._canvas_region = None
         
         self.Bind( wx.EVT_PAINT, self.EventPaint )
         self.Bind( wx.EVT_SIZE, self.EventResize )
@@ -5718,19 +5744,64 @@ class StaticImage( wx.Window ):
         self._first_background_drawn = True
         
     
+    def _GetVisibleRegion( self ):
+        
+        # when zoomed in, we can be much bigger than the canvas, so we only ever buffer and render the part that is on screen
+        
+        ( my_width, my_height ) = self.GetClientSize()
+        
+        media_container = self.GetParent()
+        canvas = media_container.GetParent()
+        
+        ( canvas_width, canvas_height ) = canvas.GetClientSize()
+        
+        ( container_x, container_y ) = media_container.GetPosition()
+        ( my_x, my_y ) = self.GetPosition()
+        
+        canvas_x = - ( container_x + my_x )
+        canvas_y = - ( container_y + my_y )
+        
+        x = max( 0, canvas_x )
+        y = max( 0, canvas_y )
+        
+        right = min( my_width, canvas_x + canvas_width )
+        bottom = min( my_height, canvas_y + canvas_height )
+        
+        if right <= x or bottom <= y:
+            
+            return None
+            
+        
+        return ( x, y, right - x, bottom - y )
+        
+    
     def _Redraw( self, dc ):
         
-        if self._image_renderer is not None and self._image_renderer.IsReady():
+        if self._image_renderer is not None and self._image_renderer.IsInitialised():
             
             self._DrawBackground( dc )
             
-            wx_bitmap = self._image_renderer.GetWXBitmap( self._canvas_bmp.GetSize() )
+            target_resolution = tuple( self.GetClientSize() )
+            
+            wx_bitmap = self._image_renderer.GetWXBitmap( target_resolution, clip_rect = self._canvas_region )
             
             dc.DrawBitmap( wx_bitmap, 0, 0 )
             
             HG.client_controller.bitmap_manager.ReleaseBitmap( wx_bitmap )
             
-            self._is_rendered = True
+            if self._image_renderer.IsReady( target_resolution ):
+                
+                self._is_rendered = True
+                self._waiting_for_finer_decode = False
+                
+            else:
+                
+                # we drew a reduced decode stretched up--redraw when the finer one is in
+                
+                self._waiting_for_finer_decode = True
+                
+                HG.client_controller.gui.RegisterAnimationUpdateWindow( self )
+                
             
         else:
             
@@ -5757,17 +5828,48 @@ class StaticImage( wx.Window ):
     
     def EventPaint( self, event ):
         
-        if self._canvas_bmp is None:
+        dc = wx.PaintDC( self )
+        
+        visible_region = self._GetVisibleRegion()
+        
+        if visible_region is None:
             
             return
             
         
-        dc = wx.BufferedPaintDC( self, self._canvas_bmp )
+        if visible_region != self._canvas_region:
+            
+            ( x, y, width, height ) = visible_region
+            
+            if self._canvas_bmp is None or self._canvas_bmp.GetSize() != ( width, height ):
+                
+                if self._canvas_bmp is not None:
+                    
+                    HG.client_controller.bitmap_manager.ReleaseBitmap( self._canvas_bmp )
+                    
+                
+                self._canvas_bmp = HG.client_controller.bitmap_manager.GetBitmap( width, height, 24 )
+                
+                self._first_background_drawn = False
+                
+            
+            self._canvas_region = visible_region
+            
+            self._dirty = True
+            
         
         if self._dirty:
             
-            self._Redraw( dc )
+            mem_dc = wx.MemoryDC( self._canvas_bmp )
             
+            self._Redraw( mem_dc )
+            
+            mem_dc.SelectObject( wx.NullBitmap )
+            
+        
+        ( x, y, width, height ) = self._canvas_region
+        
+        dc.DrawBitmap( self._canvas_bmp, x, y )
         
     
     def EventPropagateMouse( self, event ):
@@ -5788,30 +5890,9 @@ class StaticImage( wx.Window ):
         
         if my_width > 0 and my_height > 0:
             
-            if self._canvas_bmp is None:
-                
-                make_new_one = True
-                
-            else:
-                
-                ( current_bmp_width, current_bmp_height ) = self._canvas_bmp.GetSize()
-                
-                make_new_one = my_width != current_bmp_width or my_height != current_bmp_height
-                
+            # a new size is a new zoom, and the buffer is remade on the next paint if the visible region changed
             
-            if make_new_one:
-                
-                if self._canvas_bmp is not None:
-                    
-                    HG.client_controller.bitmap_manager.ReleaseBitmap( self._canvas_bmp )
-                    
-                
-                self._canvas_bmp = HG.client_controller.bitmap_manager.GetBitmap( my_width, my_height, 24 )
-                
-                self._first_background_drawn = False
-                
-                self._SetDirty()
-                
+            self._SetDirty()
             
         
     
@@ -5820,17 +5901,23 @@ class StaticImage( wx.Window ):
         return self._is_rendered
         
     
-    def SetMedia( self, media ):
+    def SetMedia( self, media, initial_size = None ):
         
         self._media = media
         
+        if initial_size is None:
+            
+            initial_size = self.GetClientSize()
+            
+        
         image_cache = HG.client_controller.GetCache( 'images' )
         
-        self._image_renderer = image_cache.GetImageRenderer( self._media )
+        self._image_renderer = image_cache.GetImageRenderer( self._media, tuple( initial_size ) )
         
         self._is_rendered = False
+        self._waiting_for_finer_decode = False
         
-        if not self._image_renderer.IsReady():
+        if not self._image_renderer.IsInitialised():
             
             HG.client_controller.gui.RegisterAnimationUpdateWindow( self )
             
@@ -5843,6 +5930,7 @@ class StaticImage( wx.Window ):
         self._media = None
         self._image_renderer = None
         self._is_rendered = False
+        self._waiting_for_finer_decode = False
         self._first_background_drawn = False
         
     
@@ -5850,7 +5938,20 @@ class StaticImage( wx.Window ):
         
         try:
             
-            if self._image_renderer is None or self._image_renderer.IsReady():
+            if self._image_renderer is None:
+                
+                ready_to_draw = True
+                
+            elif self._waiting_for_finer_decode:
+                
+                ready_to_draw = self._image_renderer.IsReady( tuple( self.GetClientSize() ) )
+                
+            else:
+                
+                ready_to_draw = self._image_renderer.IsInitialised()
+                
+            
+            if ready_to_draw:
                 
                 self._SetDirty()
                 
@@ -5865,3 +5966,11 @@ class StaticImage( wx.Window ):
             
         
     
+    def VisibleRegionMayHaveChanged( self ):
+        
+        if self._canvas_region is not None and self._GetVisibleRegion() != self._canvas_region:
+            
+            self.Refresh()
+            
+        
+    
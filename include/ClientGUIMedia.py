@@ -4336,6 +4336,18 @@ class MediaPanelThumbnails( MediaPanel ):
         event.Skip()
         
     
+    def GetNumThumbnailsPerViewport( self ):
+        
+        ( client_width, client_height ) = self.GetClientSize()
+        
+        ( thumbnail_span_width, thumbnail_span_height ) = self._GetThumbnailSpanDimensions()
+        
+        num_columns = max( 1, client_width // thumbnail_span_width )
+        num_rows = max( 1, client_height // thumbnail_span_height + 1 )
+        
+        return num_columns * num_rows
+        
+    
     def MaintainPageCache( self ):
         
         if not HG.client_controller.GetGUI().IsCurrentPage( self._page_key ):
@@ -356,6 +356,13 @@ class Page( wx.SplitterWindow ):
         self._management_controller.SetKey( 'page', self._page_key )
         
         self._initialised = False
+        self._waiting_to_load = False
+        self._management_panel_started = False
+        
+        self._initial_media_panel = None
+        self._hashes_still_to_load = collections.deque()
+        
+        self._hidden_since = None
         
         self._pretty_status = ''
         
@@ -392,6 +399,49 @@ class Page( wx.SplitterWindow ):
         self._controller.sub( self, 'SetSplitterPositions', 'set_splitter_positions' )
         
     
+    def _AppendInitialMediaResults( self, hashes, media_results ):
+        
+        if self._initial_media_panel is None:
+            
+            # a new search replaced the page's files while we were still loading
+            
+            return
+            
+        
+        for i in range( len( hashes ) ):
+            
+            self._hashes_still_to_load.popleft()
+            
+        
+        self._initial_media_panel.AddMediaResults( self._page_key, media_results )
+        
+        if len( self._hashes_still_to_load ) == 0:
+            
+            self._initial_media_panel = None
+            
+        
+    
+    def _CanLoadLazily( self ):
+        
+        return self._controller.new_options.GetBoolean( 'lazy_load_session_pages' ) and not self.IsImporter()
+        
+    
+    def _LoadInitialMediaResults( self ):
+        
+        self._waiting_to_load = False
+        
+        first_batch_size = None
+        
+        # collections need every file present to be built, so only a flat page can show its first screen early
+        
+        if self._CanLoadLazily() and self._management_panel.GetCollectBy() == []:
+            
+            first_batch_size = self._media_panel.GetNumThumbnailsPerViewport()
+            
+        
+        self._controller.CallToThread( self.THREADLoadInitialMediaResults, self._controller, self._initial_hashes, first_batch_size )
+        
+    
     def _SetPrettyStatus( self, status ):
         
         self._pretty_status = status
@@ -435,6 +485,67 @@ class Page( wx.SplitterWindow ):
         self._controller.pub( 'refresh_page_name', self._page_key )
         
     
+    def _StartManagementPanel( self ):
+        
+        if not self._management_panel_started:
+            
+            self._management_panel_started = True
+            
+            wx.CallAfter( self._management_panel.Start ) # importand this is callafter, so it happens after a heavy session load is done
+            
+        
+    
+    def _UnloadMediaResultsIfStillHidden( self ):
+        
+        unload_hidden_pages_after_minutes = self._controller.new_options.GetNoneableInteger( 'unload_hidden_pages_after_minutes' )
+        
+        if unload_hidden_pages_after_minutes is None or not self._CanLoadLazily():
+            
+            return
+            
+        
+        if self._hidden_since is None or not HydrusData.TimeHasPassedFloat( self._hidden_since + unload_hidden_pages_after_minutes * 60 ):
+            
+            return
+            
+        
+        # only a search page is fully described by its hashes, so only they can be rebuilt later
+        
+        if self._management_controller.GetType() != ClientGUIManagement.MANAGEMENT_TYPE_QUERY:
+            
+            return
+            
+        
+        if not self._initialised or len( self._hashes_still_to_load ) > 0:
+            
+            return
+            
+        
+        if self._controller.MenuIsOpen():
+            
+            self._controller.CallLaterWXSafe( self, 60, self._UnloadMediaResultsIfStillHidden )
+            
+            return
+            
+        
+        hashes = self._media_panel.GetHashes( ordered = True )
+        
+        if len( hashes ) == 0:
+            
+            return
+            
+        
+        file_service_key = self._management_controller.GetKey( 'file_service' )
+        
+        media_panel = ClientGUIMedia.MediaPanelThumbnails( self, self._page_key, file_service_key, [] )
+        
+        self._SwapMediaPanel( media_panel )
+        
+        self._initialised = False
+        self._initial_hashes = hashes
+        self._waiting_to_load = True
+        
+    
     def CheckAbleToClose( self ):
         
         self._management_panel.CheckAbleToClose()
@@ -474,7 +585,14 @@ class Page( wx.SplitterWindow ):
         
         if self._initialised:
             
-            return self._media_panel.GetHashes( ordered = True )
+            if self._initial_media_panel is None:
+                
+                return self._media_panel.GetHashes( ordered = True )
+                
+            else:
+                
+                return self._initial_media_panel.GetHashes( ordered = True ) + list( self._hashes_still_to_load )
+                
             
         else:
             
@@ -512,7 +630,14 @@ class Page( wx.SplitterWindow ):
         
         if self._initialised:
             
-            num_files = self._media_panel.GetNumFiles()
+            if self._initial_media_panel is None:
+                
+                num_files = self._media_panel.GetNumFiles()
+                
+            else:
+                
+                num_files = self._initial_media_panel.GetNumFiles() + len( self._hashes_still_to_load )
+                
             
         else:
             
@@ -607,9 +732,25 @@ class Page( wx.SplitterWindow ):
         self._management_panel.PageHidden()
         self._media_panel.PageHidden()
         
+        unload_hidden_pages_after_minutes = self._controller.new_options.GetNoneableInteger( 'unload_hidden_pages_after_minutes' )
+        
+        if unload_hidden_pages_after_minutes is not None and self._CanLoadLazily():
+            
+            self._hidden_since = HydrusData.GetNowFloat()
+            
+            self._controller.CallLaterWXSafe( self, unload_hidden_pages_after_minutes * 60, self._UnloadMediaResultsIfStillHidden )
+            
+        
     
     def PageShown( self ):
         
+        self._hidden_since = None
+        
+        if self._waiting_to_load:
+            
+            self._LoadInitialMediaResults()
+            
+        
         self._management_panel.PageShown()
         self._media_panel.PageShown()
         
@@ -651,10 +792,15 @@ class Page( wx.SplitterWindow ):
         
         self._SwapMediaPanel( media_panel )
         
+        if len( self._hashes_still_to_load ) > 0:
+            
+            self._initial_media_panel = media_panel
+            
+        
         self._initialised = True
         self._initial_hashes = []
         
-        wx.CallAfter( self._management_panel.Start ) # importand this is callafter, so it happens after a heavy session load is done
+        self._StartManagementPanel()
         
     
     def SetName( self, name ):
@@ -713,18 +859,36 @@ class Page( wx.SplitterWindow ):
         
         if self._initial_hashes is not None and len( self._initial_hashes ) > 0:
             
-            self._controller.CallToThread( self.THREADLoadInitialMediaResults, self._controller, self._initial_hashes )
+            if self._CanLoadLazily() and not self._controller.gui.IsCurrentPage( self._page_key ):
+                
+                self._waiting_to_load = True
+                
+            else:
+                
+                self._LoadInitialMediaResults()
+                
             
         else:
             
             self._initialised = True
             
-            wx.CallAfter( self._management_panel.Start ) # importand this is callafter, so it happens after a heavy session load is done
+            self._StartManagementPanel()
             
         
     
     def SwapMediaPanel( self, new_panel ):
         
+        self._initial_media_panel = None
+        self._hashes_still_to_load = collections.deque()
+        
+        if self._waiting_to_load:
+            
+            self._waiting_to_load = False
+            
+            self._initialised = True
+            self._initial_hashes = []
+            
+        
         self._SwapMediaPanel( new_panel )
         
     
@@ -748,7 +912,7 @@ class Page( wx.SplitterWindow ):
             
         
     
-    def THREADLoadInitialMediaResults( self, controller, initial_hashes ):
+    def THREADLoadInitialMediaResults( self, controller, initial_hashes, first_batch_size = None ):
         
         def wx_code_status( status ):
             
@@ -770,6 +934,62 @@ class Page( wx.SplitterWindow ):
             self.SetMediaResults( media_results )
             
         
+        def wx_code_publish_first_batch( media_results, hashes_still_to_load ):
+            
+            if not self:
+                
+                return
+                
+            
+            self._hashes_still_to_load = collections.deque( hashes_still_to_load )
+            
+            self.SetMediaResults( media_results )
+            
+        
+        def wx_code_append( hashes, media_results ):
+            
+            if not self:
+                
+                return
+                
+            
+            self._AppendInitialMediaResults( hashes, media_results )
+            
+        
+        def read_sorted_media_results( hashes ):
+            
+            media_results = controller.Read( 'media_results', hashes )
+            
+            hashes_to_media_results = { media_result.GetHash() : media_result for media_result in media_results }
+            
+            return [ hashes_to_media_results[ hash ] for hash in hashes if hash in hashes_to_media_results ]
+            
+        
+        if first_batch_size is not None and len( initial_hashes ) > first_batch_size:
+            
+            # show the first screen of thumbnails as soon as we have it and fill in the rest behind it
+            
+            first_hashes = initial_hashes[ : first_batch_size ]
+            hashes_still_to_load = initial_hashes[ first_batch_size : ]
+            
+            wx.CallAfter( wx_code_publish_first_batch, read_sorted_media_results( first_hashes ), hashes_still_to_load )
+            
+            num_done = len( first_hashes )
+            
+            for group_of_hashes in HydrusData.SplitListIntoChunks( hashes_still_to_load, 256 ):
+                
+                wx.CallAfter( wx_code_append, group_of_hashes, read_sorted_media_results( group_of_hashes ) )
+                
+                num_done += len( group_of_hashes )
+                
+                status = 'Loading initial files\u2026 ' + HydrusData.ConvertValueRangeToPrettyString( num_done, len( initial_hashes ) )
+                
+                wx.CallAfter( wx_code_status, status )
+                
+            
+            return
+            
+        
         initial_media_results = []
         
         for group_of_initial_hashes in HydrusData.SplitListIntoChunks( initial_hashes, 256 ):
@@ -41,6 +41,7 @@ from . import HydrusSerialisable
 from . import HydrusTagArchive
 from . import HydrusTags
 from . import HydrusText
+from . import HydrusThreading
 import itertools
 import os
 import random
@@ -2624,6 +2625,12 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             self._set_search_focus_on_page_change = wx.CheckBox( self )
             
+            self._lazy_load_session_pages = wx.CheckBox( self )
+            self._lazy_load_session_pages.SetToolTip( 'If checked, search pages in a loaded session will not fetch their files until you first look at them. This makes booting a large session much faster.' )
+            
+            self._unload_hidden_pages_after_minutes = ClientGUICommon.NoneableSpinCtrl( self, '', none_phrase = 'do not unload', min = 1, max = 1440 )
+            self._unload_hidden_pages_after_minutes.SetToolTip( 'If lazy loading is on, search pages that have not been looked at for this long will drop their files from memory, keeping only the list of what to load when you next look at them.' )
+            
             #
             
             gui_session_names = HG.client_controller.Read( 'serialisable_names', HydrusSerialisable.SERIALISABLE_TYPE_GUI_SESSION )
@@ -2671,6 +2678,10 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             self._set_search_focus_on_page_change.SetValue( self._new_options.GetBoolean( 'set_search_focus_on_page_change' ) )
             
+            self._lazy_load_session_pages.SetValue( self._new_options.GetBoolean( 'lazy_load_session_pages' ) )
+            
+            self._unload_hidden_pages_after_minutes.SetValue( self._new_options.GetNoneableInteger( 'unload_hidden_pages_after_minutes' ) )
+            
             #
             
             rows = []
@@ -2679,6 +2690,8 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             rows.append( ( 'If \'last session\' above, autosave it how often (minutes)?', self._last_session_save_period_minutes ) )
             rows.append( ( 'If \'last session\' above, only autosave during idle time?', self._only_save_last_session_during_idle ) )
             rows.append( ( 'Number of session backups to keep: ', self._number_of_gui_session_backups ) )
+            rows.append( ( 'Only load a session search page\'s files when it is first shown: ', self._lazy_load_session_pages ) )
+            rows.append( ( 'If lazy loading, unload search pages hidden for this many minutes: ', self._unload_hidden_pages_after_minutes ) )
             rows.append( ( 'By default, put new page tabs on (requires restart): ', self._default_new_page_goes ) )
             rows.append( ( 'When switching to a page, focus its input field (if any): ', self._set_search_focus_on_page_change ) )
             rows.append( ( 'Line notebook tabs down the left: ', self._notebook_tabs_on_left ) )
@@ -2722,6 +2735,10 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             self._new_options.SetBoolean( 'set_search_focus_on_page_change', self._set_search_focus_on_page_change.GetValue() )
             
+            self._new_options.SetBoolean( 'lazy_load_session_pages', self._lazy_load_session_pages.GetValue() )
+            
+            self._new_options.SetNoneableInteger( 'unload_hidden_pages_after_minutes', self._unload_hidden_pages_after_minutes.GetValue() )
+            
         
     
     class _ImportingPanel( wx.Panel ):
@@ -3506,6 +3523,9 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             self._forced_search_limit = ClientGUICommon.NoneableSpinCtrl( misc_panel, '', min = 1, max = 100000 )
             
+            self._thread_pool_size = ClientGUICommon.NoneableSpinCtrl( misc_panel, '', min = 1, max = 200, none_phrase = 'automatic (' + HydrusData.ToHumanInt( HydrusThreading.GetDefaultCallToThreadPoolSize() ) + ')' )
+            self._thread_pool_size.SetToolTip( 'The number of threads the client keeps for its normal background jobs. Jobs beyond this wait in a queue, with quick jobs for the ui going first. If the queue stalls, a few extra threads are added temporarily.' )
+            
             #
             
             self._disk_cache_init_period.SetValue( self._new_options.GetNoneableInteger( 'disk_cache_init_period' ) )
@@ -3546,6 +3566,8 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             self._forced_search_limit.SetValue( self._new_options.GetNoneableInteger( 'forced_search_limit' ) )
             
+            self._thread_pool_size.SetValue( self._new_options.GetNoneableInteger( 'thread_pool_size' ) )
+            
             #
             
             rows = []
@@ -3639,6 +3661,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             rows = []
             
             rows.append( ( 'Forced system:limit for all searches: ', self._forced_search_limit ) )
+            rows.append( ( 'Worker thread pool size: ', self._thread_pool_size ) )
             
             gridbox = ClientGUICommon.WrapInGrid( misc_panel, rows )
             
@@ -3749,6 +3772,8 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             self._new_options.SetNoneableInteger( 'forced_search_limit', self._forced_search_limit.GetValue() )
             
+            self._new_options.SetNoneableInteger( 'thread_pool_size', self._thread_pool_size.GetValue() )
+            
             HC.options[ 'num_autocomplete_chars' ] = self._num_autocomplete_chars.GetValue()
             
             HC.options[ 'fetch_ac_results_automatically' ] = self._fetch_ac_results_automatically.GetValue()
@@ -37,6 +37,7 @@ from . import HydrusGlobals as HG
 from . import HydrusNATPunch
 from . import HydrusPaths
 from . import HydrusSerialisable
+from . import HydrusThreading
 import os
 import stat
 import sys
@@ -2315,7 +2316,7 @@ class ReviewNetworkSessionsPanel( ClientGUIScrolledPanels.ReviewPanel ):
         
         listctrl_panel = ClientGUIListCtrl.BetterListCtrlPanel( self )
         
-        columns = [ ( 'network context', -1 ), ( 'cookies', 9 ), ( 'expires', 28 ) ]
+        columns = [ ( 'network context', -1 ), ( 'cookies', 9 ), ( 'expires', 28 ), ( 'requests', 10 ), ( 'connections reused', 20 ) ]
         
         self._listctrl = ClientGUIListCtrl.BetterListCtrl( listctrl_panel, 'review_network_sessions', 32, 34, columns, self._ConvertNetworkContextToListCtrlTuples, delete_key_callback = self._Clear, activation_callback = self._Review )
         
@@ -2436,8 +2437,25 @@ class ReviewNetworkSessionsPanel( ClientGUIScrolledPanels.ReviewPanel ):
                 
             
         
-        display_tuple = ( pretty_network_context, pretty_number_of_cookies, pretty_expiry )
-        sort_tuple = ( pretty_network_context, number_of_cookies, expiry )
+        ( num_requests, num_connections ) = self._session_manager.GetConnectionPoolStats( network_context )
+        
+        pretty_num_requests = HydrusData.ToHumanInt( num_requests )
+        
+        if num_requests == 0:
+            
+            reuse = -1
+            pretty_reuse = ''
+            
+        else:
+            
+            num_reused = max( 0, num_requests - num_connections )
+            
+            reuse = num_reused / num_requests
+            pretty_reuse = HydrusData.ConvertValueRangeToPrettyString( num_reused, num_requests ) + ' (' + HydrusData.ConvertFloatToPercentage( reuse ) + ')'
+            
+        
+        display_tuple = ( pretty_network_context, pretty_number_of_cookies, pretty_expiry, pretty_num_requests, pretty_reuse )
+        sort_tuple = ( pretty_network_context, number_of_cookies, expiry, num_requests, reuse )
         
         return ( display_tuple, sort_tuple )
         
@@ -2942,15 +2960,27 @@ class ReviewThreads( ClientGUIScrolledPanels.ReviewPanel ):
         
         #
         
+        pool_panel = ClientGUICommon.StaticBox( self, 'thread pool queues' )
+        
+        columns = [ ( 'priority', -1 ), ( 'queued', 10 ), ( 'jobs done', 12 ), ( 'average wait', 14 ), ( 'max wait', 14 ) ]
+        
+        self._pool_list_ctrl = ClientGUIListCtrl.BetterListCtrl( pool_panel, 'thread pool review', 4, 12, columns, self._ConvertPoolStatsToListCtrlTuples )
+        
+        #
+        
         self._list_ctrl.Sort( 0 )
+        self._pool_list_ctrl.Sort( 0 )
         
         self._RefreshSnapshot()
         
         #
         
+        pool_panel.Add( self._pool_list_ctrl, CC.FLAGS_EXPAND_BOTH_WAYS )
+        
         vbox = wx.BoxSizer( wx.VERTICAL )
         
         vbox.Add( self._list_ctrl_panel, CC.FLAGS_EXPAND_BOTH_WAYS )
+        vbox.Add( pool_panel, CC.FLAGS_EXPAND_PERPENDICULAR )
         
         self.SetSizer( vbox )
         
@@ -2971,10 +3001,30 @@ class ReviewThreads( ClientGUIScrolledPanels.ReviewPanel ):
         return ( display_tuple, sort_tuple )
         
     
+    def _ConvertPoolStatsToListCtrlTuples( self, stats ):
+        
+        ( priority, queue_depth, num_jobs_done, average_wait, max_wait ) = stats
+        
+        pretty_priority = HydrusThreading.call_priority_string_lookup[ priority ]
+        pretty_queue_depth = HydrusData.ToHumanInt( queue_depth )
+        pretty_num_jobs_done = HydrusData.ToHumanInt( num_jobs_done )
+        pretty_average_wait = HydrusData.TimeDeltaToPrettyTimeDelta( average_wait )
+        pretty_max_wait = HydrusData.TimeDeltaToPrettyTimeDelta( max_wait )
+        
+        display_tuple = ( pretty_priority, pretty_queue_depth, pretty_num_jobs_done, pretty_average_wait, pretty_max_wait )
+        sort_tuple = ( priority, queue_depth, num_jobs_done, average_wait, max_wait )
+        
+        return ( display_tuple, sort_tuple )
+        
+    
     def _RefreshSnapshot( self ):
         
         threads = self._controller.GetThreadsSnapshot()
         
         self._list_ctrl.SetData( threads )
         
+        pool_stats = self._controller.GetThreadPoolStats()
+        
+        self._pool_list_ctrl.SetData( pool_stats )
+        
     
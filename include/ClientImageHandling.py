@@ -23,11 +23,11 @@ def DiscardBlankPerceptualHashes( phashes ):
     
     return phashes
     
-def GenerateNumPyImage( path, mime ):
+def GenerateNumPyImage( path, mime, reduction = 1 ):
     
     force_pil = HG.client_controller.new_options.GetBoolean( 'load_images_with_pil' )
     
-    return HydrusImageHandling.GenerateNumPyImage( path, mime, force_pil = force_pil )
+    return HydrusImageHandling.GenerateNumPyImage( path, mime, force_pil = force_pil, reduction = reduction )
     
 def GenerateShapePerceptualHashes( path, mime ):
     
@@ -7,6 +7,7 @@ from . import ClientParsing
 from . import ClientPaths
 from . import ClientTags
 import collections
+import itertools
 from . import HydrusConstants as HC
 from . import HydrusData
 from . import HydrusExceptions
@@ -154,9 +155,44 @@ def GenerateStatusesToCountsStatus( statuses_to_counts ):
     
     return ( status, simple_status, ( total_processed, total ) )
     
+def NormaliseFileSeeds( file_seeds ):
+    
+    # one trip to the domain manager for a whole batch, rather than one per url
+    
+    url_file_seeds = [ file_seed for file_seed in file_seeds if file_seed.file_seed_type == FILE_SEED_TYPE_URL ]
+    
+    urls = [ file_seed.file_seed_data for file_seed in url_file_seeds ]
+    
+    normalised_urls = HG.client_controller.network_engine.domain_manager.NormaliseURLs( urls )
+    
+    for ( file_seed, normalised_url ) in zip( url_file_seeds, normalised_urls ):
+        
+        file_seed.file_seed_data = normalised_url
+        
+    
+def PrefetchFileSeedURLStatuses( file_seeds ):
+    
+    # a gallery page can give us hundreds of new urls, so look them all up in one db job now rather than one job per url as each seed is worked
+    
+    file_seeds_and_urls = [ ( file_seed, file_seed.GetURLsToCheckForPreImportStatus() ) for file_seed in file_seeds ]
+    
+    all_urls = set( itertools.chain.from_iterable( ( urls for ( file_seed, urls ) in file_seeds_and_urls ) ) )
+    
+    if len( all_urls ) == 0:
+        
+        return
+        
+    
+    urls_to_url_statuses = HG.client_controller.Read( 'urls_to_url_statuses', all_urls )
+    
+    for ( file_seed, urls ) in file_seeds_and_urls:
+        
+        file_seed.SetPrefetchedURLStatuses( { url : urls_to_url_statuses[ url ] for url in urls if url in urls_to_url_statuses } )
+        
+    
 class FileImportJob( object ):
     
-    def __init__( self, temp_path, file_import_options = None ):
+    def __init__( self, temp_path, file_import_options = None, file_hasher = None ):
         
         if file_import_options is None:
             
@@ -165,6 +201,7 @@ class FileImportJob( object ):
         
         self._temp_path = temp_path
         self._file_import_options = file_import_options
+        self._file_hasher = file_hasher
         
         self._hash = None
         self._pre_import_status = None
@@ -215,9 +252,23 @@ class FileImportJob( object ):
     
     def GenerateHashAndStatus( self ):
         
+        if self._file_hasher is not None and not self._file_hasher.IsStillValidFor( self._temp_path ):
+            
+            self._file_hasher = None
+            
+        
         HydrusImageHandling.ConvertToPngIfBmp( self._temp_path )
         
-        self._hash = HydrusFileHandling.GetHashFromPath( self._temp_path )
+        if self._file_hasher is None:
+            
+            self._hash = HydrusFileHandling.GetHashFromPath( self._temp_path )
+            
+        else:
+            
+            # the network job hashed this as it came in, so no need to read it all again
+            
+            self._hash = self._file_hasher.GetHash()
+            
         
         ( self._pre_import_status, hash, note ) = HG.client_controller.Read( 'hash_status', 'sha256', self._hash, prefix = 'file recognised' )
         
@@ -258,7 +309,14 @@ class FileImportJob( object ):
             self._phashes = ClientImageHandling.GenerateShapePerceptualHashes( self._temp_path, mime )
             
         
-        self._extra_hashes = HydrusFileHandling.GetExtraHashesFromPath( self._temp_path )
+        if self._file_hasher is None:
+            
+            self._extra_hashes = HydrusFileHandling.GetExtraHashesFromPath( self._temp_path )
+            
+        else:
+            
+            self._extra_hashes = self._file_hasher.GetExtraHashes()
+            
         
     
     def GetExtraHashes( self ):
@@ -332,6 +390,8 @@ class FileImportJob( object ):
 FILE_SEED_TYPE_HDD = 0
 FILE_SEED_TYPE_URL = 1
 
+URL_STATUS_PREFETCH_PERIOD = 3600
+
 class FileSeed( HydrusSerialisable.SerialisableBase ):
     
     SERIALISABLE_TYPE = HydrusSerialisable.SERIALISABLE_TYPE_FILE_SEED
@@ -369,6 +429,9 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
         self._tags = set()
         self._hashes = {}
         
+        self._urls_to_prefetched_url_statuses = {}
+        self._url_statuses_prefetch_time = 0
+        
     
     def __eq__( self, other ):
         
@@ -401,6 +464,58 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
         return ( self.file_seed_type, self.file_seed_data, self.created, self.modified, self.source_time, self.status, self.note, self._referral_url, serialisable_fixed_service_keys_to_tags, serialisable_urls, serialisable_tags, serialisable_hashes )
         
     
+    def _GetURLStatuses( self, url ):
+        
+        if url in self._urls_to_prefetched_url_statuses and not HydrusData.TimeHasPassed( self._url_statuses_prefetch_time + URL_STATUS_PREFETCH_PERIOD ):
+            
+            url_statuses = self._urls_to_prefetched_url_statuses[ url ]
+            
+            # a file we already had is still there. anything else, like a url nothing had yet, may well have been imported by another downloader since we looked
+            
+            if len( url_statuses ) > 0 and False not in ( status == CC.STATUS_SUCCESSFUL_BUT_REDUNDANT for ( status, hash, note ) in url_statuses ):
+                
+                return url_statuses
+                
+            
+        
+        return HG.client_controller.Read( 'url_statuses', url )
+        
+    
+    def _GetURLsToCheckForPreImportStatus( self, file_url = None ):
+        
+        urls = set( self._urls )
+        
+        if file_url is not None:
+            
+            urls.add( file_url )
+            
+        
+        if self.file_seed_type == FILE_SEED_TYPE_URL:
+            
+            urls.add( self.file_seed_data )
+            
+        
+        urls_to_check = []
+        
+        for url in urls:
+            
+            if HG.client_controller.network_engine.domain_manager.URLCanReferToMultipleFiles( url ):
+                
+                continue
+                
+            
+            # we now only trust url-matched single urls and the post/file urls
+            # trusting unmatched source urls was too much of a hassle with too many boorus providing bad source urls like user account pages
+            
+            if HG.client_controller.network_engine.domain_manager.URLDefinitelyRefersToOneFile( url ) or url in ( self.file_seed_data, file_url ):
+                
+                urls_to_check.append( url )
+                
+            
+        
+        return urls_to_check
+        
+    
     def _InitialiseFromSerialisableInfo( self, serialisable_info ):
         
         ( self.file_seed_type, self.file_seed_data, self.created, self.modified, self.source_time, self.status, self.note, self._referral_url, serialisable_fixed_service_keys_to_tags, serialisable_urls, serialisable_tags, serialisable_hashes ) = serialisable_info
@@ -586,6 +701,7 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
                 
             
             network_job.SetFileImportOptions( file_import_options )
+            network_job.SetFileHashing( True )
             
             HG.client_controller.network_engine.AddJob( network_job )
             
@@ -596,7 +712,7 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
             
             status_hook( 'importing file' )
             
-            self.Import( temp_path, file_import_options )
+            self.Import( temp_path, file_import_options, file_hasher = network_job.GetFileHasher() )
             
         finally:
             
@@ -687,93 +803,65 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
         
         # urls
         
-        urls = set( self._urls )
-        
-        if file_url is not None:
+        for url in self._GetURLsToCheckForPreImportStatus( file_url = file_url ):
             
-            urls.add( file_url )
-            
-        
-        if self.file_seed_type == FILE_SEED_TYPE_URL:
+            results = self._GetURLStatuses( url )
             
-            urls.add( self.file_seed_data )
-            
-        
-        unrecognised_url_results = set()
-        
-        for url in urls:
-            
-            if HG.client_controller.network_engine.domain_manager.URLCanReferToMultipleFiles( url ):
+            if len( results ) == 0: # if no match found, no useful data discovered
                 
                 continue
                 
-            
-            # we now only trust url-matched single urls and the post/file urls
-            # trusting unmatched source urls was too much of a hassle with too many boorus providing bad source urls like user account pages
-            
-            if HG.client_controller.network_engine.domain_manager.URLDefinitelyRefersToOneFile( url ) or url in ( self.file_seed_data, file_url ):
+            elif len( results ) > 1: # if more than one file claims this url, it cannot be relied on to guess the file
                 
-                results = HG.client_controller.Read( 'url_statuses', url )
+                continue
                 
-                if len( results ) == 0: # if no match found, no useful data discovered
-                    
-                    continue
-                    
-                elif len( results ) > 1: # if more than one file claims this url, it cannot be relied on to guess the file
-                    
-                    continue
+            else: # i.e. 1 match found
+                
+                ( status, hash, note ) = results[0]
+                
+                if status != CC.STATUS_UNKNOWN:
                     
-                else: # i.e. 1 match found
+                    # a known one-file url has given a single clear result. sounds good
                     
-                    ( status, hash, note ) = results[0]
+                    we_have_a_match = True
                     
-                    if status != CC.STATUS_UNKNOWN:
+                    if self.file_seed_type == FILE_SEED_TYPE_URL:
                         
-                        # a known one-file url has given a single clear result. sounds good
+                        # to double-check, let's see if the file that claims that url has any other interesting urls
+                        # if the file has another url with the same url class as ours, then this is prob an unreliable 'alternate' source url attribution, and untrustworthy
                         
-                        we_have_a_match = True
+                        my_url = self.file_seed_data
                         
-                        if self.file_seed_type == FILE_SEED_TYPE_URL:
+                        if url != my_url:
                             
-                            # to double-check, let's see if the file that claims that url has any other interesting urls
-                            # if the file has another url with the same url class as ours, then this is prob an unreliable 'alternate' source url attribution, and untrustworthy
+                            ( media_result, ) = HG.client_controller.Read( 'media_results', ( hash, ) )
                             
-                            my_url = self.file_seed_data
+                            this_files_urls = [ this_files_url for this_files_url in media_result.GetLocationsManager().GetURLs() if this_files_url != my_url ]
                             
-                            if url != my_url:
-                                
-                                my_url_class = HG.client_controller.network_engine.domain_manager.GetURLClass( my_url )
-                                
-                                ( media_result, ) = HG.client_controller.Read( 'media_results', ( hash, ) )
-                                
-                                this_files_urls = media_result.GetLocationsManager().GetURLs()
+                            classifications = HG.client_controller.network_engine.domain_manager.GetURLClassifications( [ my_url ] + this_files_urls )
+                            
+                            ( my_url_class_key, my_normalised_url, my_api_url ) = classifications[0]
+                            
+                            for ( this_url_class_key, this_normalised_url, this_api_url ) in classifications[1:]:
                                 
-                                for this_files_url in this_files_urls:
+                                if my_url_class_key == this_url_class_key:
+                                    
+                                    # oh no, the file this source url refers to has a different known url in this same domain
+                                    # it is more likely that an edit on this site points to the original elsewhere
+                                    
+                                    ( status, hash, note ) = UNKNOWN_DEFAULT
                                     
-                                    if this_files_url != my_url:
-                                        
-                                        this_url_class = HG.client_controller.network_engine.domain_manager.GetURLClass( this_files_url )
-                                        
-                                        if my_url_class == this_url_class:
-                                            
-                                            # oh no, the file this source url refers to has a different known url in this same domain
-                                            # it is more likely that an edit on this site points to the original elsewhere
-                                            
-                                            ( status, hash, note ) = UNKNOWN_DEFAULT
-                                            
-                                            we_have_a_match = False
-                                            
-                                            break
-                                            
-                                        
+                                    we_have_a_match = False
+                                    
+                                    break
                                     
                                 
                             
                         
-                        if we_have_a_match:
-                            
-                            break # if a known one-file url gives a single clear result, that result is reliable
-                            
+                    
+                    if we_have_a_match:
+                        
+                        break # if a known one-file url gives a single clear result, that result is reliable
                         
                     
                 
@@ -806,14 +894,19 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
         return search_file_seeds
         
     
+    def GetURLsToCheckForPreImportStatus( self ):
+        
+        return self._GetURLsToCheckForPreImportStatus()
+        
+    
     def HasHash( self ):
         
         return self.GetHash() is not None
         
     
-    def Import( self, temp_path, file_import_options ):
+    def Import( self, temp_path, file_import_options, file_hasher = None ):
         
-        file_import_job = FileImportJob( temp_path, file_import_options )
+        file_import_job = FileImportJob( temp_path, file_import_options, file_hasher = file_hasher )
         
         ( status, hash, note ) = file_import_job.DoWork()
         
@@ -990,6 +1083,12 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def SetPrefetchedURLStatuses( self, urls_to_url_statuses ):
+        
+        self._urls_to_prefetched_url_statuses = urls_to_url_statuses
+        self._url_statuses_prefetch_time = HydrusData.GetNow()
+        
+    
     def SetReferralURL( self, referral_url ):
         
         self._referral_url = referral_url
@@ -1729,6 +1828,10 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            file_seeds = [ file_seed for file_seed in file_seeds if not self._HasFileSeed( file_seed ) ]
+            
+            NormaliseFileSeeds( file_seeds )
+            
             for file_seed in file_seeds:
                 
                 if self._HasFileSeed( file_seed ):
@@ -1736,8 +1839,6 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
                     continue
                     
                 
-                file_seed.Normalise()
-                
                 new_file_seeds.append( file_seed )
                 
                 self._file_seeds.append( file_seed )
@@ -1748,6 +1849,11 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
             self._SetStatusDirty()
             
         
+        if len( new_file_seeds ) > 0:
+            
+            HG.client_controller.CallToThread( PrefetchFileSeedURLStatuses, new_file_seeds )
+            
+        
         self.NotifyFileSeedsUpdated( new_file_seeds )
         
         return len( new_file_seeds )
@@ -2089,6 +2195,10 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
             
             index = min( index, len( self._file_seeds ) )
             
+            file_seeds = [ file_seed for file_seed in file_seeds if not self._HasFileSeed( file_seed ) ]
+            
+            NormaliseFileSeeds( file_seeds )
+            
             for file_seed in file_seeds:
                 
                 if self._HasFileSeed( file_seed ) or file_seed in new_file_seeds:
@@ -2096,8 +2206,6 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
                     continue
                     
                 
-                file_seed.Normalise()
-                
                 new_file_seeds.add( file_seed )
                 
                 self._file_seeds.insert( index, file_seed )
@@ -1,6 +1,5 @@
 from . import ClientConstants as CC
 from . import ClientData
-from . import ClientFiles
 from . import ClientImporting
 from . import ClientImportFileSeeds
 from . import ClientImportOptions
@@ -496,28 +495,35 @@ class ImportFolder( HydrusSerialisable.SerialisableBaseNamed ):
     
     def _CheckFolder( self, job_key ):
         
-        filenames = os.listdir( self._path )
+        # a manual 'check now' always gets a full fresh look, in case the user cleared out the file import cache
         
-        raw_paths = [ os.path.join( self._path, filename ) for filename in filenames ]
+        snapshot = self._GetSnapshot( reset = self._check_now )
         
-        all_paths = ClientFiles.GetAllPaths( raw_paths )
+        watcher = GetImportFolderWatcher()
         
-        all_paths = HydrusPaths.FilterFreePaths( all_paths )
+        if watcher is not None:
+            
+            # grab this before we look, so anything that lands mid-scan triggers another check
+            
+            snapshot.SetWatcherEventCount( watcher.GetEventCount( self._path ) )
+            
+        
+        new_paths = snapshot.Scan( job_key )
+        
+        if watcher is not None:
+            
+            watcher.SetWatchedDirectories( self._path, snapshot.GetDirectories() )
+            
         
         file_seeds = []
         
-        for path in all_paths:
+        for path in new_paths:
             
             if job_key.IsCancelled():
                 
                 break
                 
             
-            if path.endswith( '.txt' ):
-                
-                continue
-                
-            
             file_seed = ClientImportFileSeeds.FileSeed( ClientImportFileSeeds.FILE_SEED_TYPE_HDD, path )
             
             if not self._file_seed_cache.HasFileSeed( file_seed ):
@@ -548,6 +554,21 @@ class ImportFolder( HydrusSerialisable.SerialisableBaseNamed ):
         return ( self._path, self._mimes, serialisable_file_import_options, serialisable_tag_import_options, serialisable_tag_service_keys_to_filename_tagging_options, action_pairs, action_location_pairs, self._period, self._check_regularly, serialisable_file_seed_cache, self._last_checked, self._paused, self._check_now, self._show_working_popup, self._publish_files_to_popup_button, self._publish_files_to_page )
         
     
+    def _GetSnapshot( self, reset = False ):
+        
+        # the snapshot holds the stats of every file in the folder, and the import folder is saved after every check and every few minutes of importing, so it stays in memory rather than being written out every time
+        # the first check after boot does the full scan
+        
+        key = ( self._name, self._path )
+        
+        if reset or key not in import_folder_snapshots:
+            
+            import_folder_snapshots[ key ] = ImportFolderSnapshot( self._path )
+            
+        
+        return import_folder_snapshots[ key ]
+        
+    
     def _ImportFiles( self, job_key ):
         
         did_work = False
@@ -780,6 +801,40 @@ class ImportFolder( HydrusSerialisable.SerialisableBaseNamed ):
             
         
     
+    def _ResetSnapshot( self ):
+        
+        import_folder_snapshots.pop( ( self._name, self._path ), None )
+        
+    
+    def _WatcherSawChanges( self ):
+        
+        watcher = GetImportFolderWatcher()
+        
+        if watcher is None:
+            
+            return False
+            
+        
+        snapshot = self._GetSnapshot()
+        
+        last_event_count = snapshot.GetWatcherEventCount()
+        
+        if last_event_count is None:
+            
+            # we haven't scanned since boot, so nothing is being watched yet. start watching now and leave the full scan to the regular check
+            
+            snapshot.SetWatcherEventCount( watcher.GetEventCount( self._path ) )
+            
+            snapshot.SeedDirectories()
+            
+            watcher.SetWatchedDirectories( self._path, snapshot.GetDirectories() )
+            
+            return False
+            
+        
+        return watcher.GetEventCount( self._path ) != last_event_count
+        
+    
     def CheckNow( self ):
         
         self._paused = False
@@ -819,8 +874,9 @@ class ImportFolder( HydrusSerialisable.SerialisableBaseNamed ):
             
             due_by_check_now = self._check_now
             due_by_period = self._check_regularly and HydrusData.TimeHasPassed( self._last_checked + self._period )
+            due_by_watcher = self._check_regularly and not ( due_by_check_now or due_by_period ) and self._WatcherSawChanges()
             
-            if due_by_check_now or due_by_period:
+            if due_by_check_now or due_by_period or due_by_watcher:
                 
                 if not pubbed_job_key and self._show_working_popup:
                     
@@ -894,9 +950,17 @@ class ImportFolder( HydrusSerialisable.SerialisableBaseNamed ):
         
         self._file_seed_cache = file_seed_cache
         
+        # files the old cache knew about may not be in the new one, so they have to be offered again
+        
+        self._ResetSnapshot()
+        
     
     def SetTuple( self, name, path, mimes, file_import_options, tag_import_options, tag_service_keys_to_filename_tagging_options, actions, action_locations, period, check_regularly, paused, check_now, show_working_popup, publish_files_to_popup_button, publish_files_to_page ):
         
+        # the snapshot only offers files that are new or changed since the last check, so anything the edit let back in, like vetoed files of a newly allowed mime or items the user cleared from the file import cache, needs a full fresh look
+        
+        self._ResetSnapshot()
+        
         if path != self._path:
             
             self._file_seed_cache = ClientImportFileSeeds.FileSeedCache()
@@ -923,5 +987,503 @@ class ImportFolder( HydrusSerialisable.SerialisableBaseNamed ):
         self._publish_files_to_popup_button = publish_files_to_popup_button
         self._publish_files_to_page = publish_files_to_page
         
+        self._ResetSnapshot()
+        
     
 HydrusSerialisable.SERIALISABLE_TYPES_TO_OBJECT_TYPES[ HydrusSerialisable.SERIALISABLE_TYPE_IMPORT_FOLDER ] = ImportFolder
+
+class ImportFolderSnapshot( object ):
+    
+    def __init__( self, path ):
+        
+        self._path = path
+        
+        # dir_path -> ( dir_mtime, { file_path : ( size, mtime, inode ) }, subdir_paths )
+        self._dirs_to_info = {}
+        
+        # files we have seen but that were still in use when we last looked
+        self._pending_paths = set()
+        
+        self._watcher_event_count = None
+        
+    
+    def _ScanDirectory( self, dir_path, now ):
+        
+        try:
+            
+            dir_mtime = os.stat( dir_path ).st_mtime
+            
+        except OSError:
+            
+            return ( False, {}, [] )
+            
+        
+        if dir_path in self._dirs_to_info:
+            
+            ( old_dir_mtime, paths_to_stats, subdir_paths ) = self._dirs_to_info[ dir_path ]
+            
+            # a dir's mtime changes whenever an entry is added, removed or renamed in it, so an unchanged dir has the same listing as before
+            
+            if old_dir_mtime is not None and old_dir_mtime == dir_mtime:
+                
+                return ( False, paths_to_stats, subdir_paths )
+                
+            
+        
+        paths_to_stats = {}
+        subdir_paths = []
+        
+        try:
+            
+            with os.scandir( dir_path ) as entries:
+                
+                for entry in entries:
+                    
+                    try:
+                        
+                        if entry.is_dir():
+                            
+                            subdir_paths.append( entry.path )
+                            
+                        else:
+                            
+                            stat_result = entry.stat()
+                            
+                            paths_to_stats[ entry.path ] = ( stat_result.st_size, stat_result.st_mtime, stat_result.st_ino )
+                            
+                        
+                    except OSError:
+                        
+                        continue
+                        
+                    
+                
+            
+        except OSError:
+            
+            return ( False, {}, [] )
+            
+        
+        if now - dir_mtime < 2:
+            
+            # filesystem mtime resolution can be coarse, so we won't trust a dir that changed while we were looking at it
+            
+            dir_mtime = None
+            
+        
+        self._dirs_to_info[ dir_path ] = ( dir_mtime, paths_to_stats, subdir_paths )
+        
+        return ( True, paths_to_stats, subdir_paths )
+        
+    
+    def GetDirectories( self ):
+        
+        return list( self._dirs_to_info.keys() )
+        
+    
+    def GetWatcherEventCount( self ):
+        
+        return self._watcher_event_count
+        
+    
+    def Scan( self, job_key ):
+        
+        now = time.time()
+        
+        candidate_paths = set()
+        seen_paths = set()
+        seen_dirs = set()
+        
+        walk_completed = True
+        
+        dirs_to_process = [ self._path ]
+        
+        while len( dirs_to_process ) > 0:
+            
+            if HG.view_shutdown:
+                
+                raise HydrusExceptions.ShutdownException()
+                
+            
+            if job_key.IsCancelled():
+                
+                walk_completed = False
+                
+                break
+                
+            
+            dir_path = dirs_to_process.pop()
+            
+            if dir_path in seen_dirs:
+                
+                continue
+                
+            
+            seen_dirs.add( dir_path )
+            
+            if dir_path in self._dirs_to_info:
+                
+                old_paths_to_stats = self._dirs_to_info[ dir_path ][1]
+                
+            else:
+                
+                old_paths_to_stats = {}
+                
+            
+            ( listing_changed, paths_to_stats, subdir_paths ) = self._ScanDirectory( dir_path, now )
+            
+            if listing_changed:
+                
+                for ( path, stats ) in paths_to_stats.items():
+                    
+                    if path not in old_paths_to_stats or old_paths_to_stats[ path ] != stats:
+                        
+                        candidate_paths.add( path )
+                        
+                    
+                
+            
+            seen_paths.update( paths_to_stats.keys() )
+            
+            dirs_to_process.extend( subdir_paths )
+            
+        
+        if walk_completed:
+            
+            for dir_path in list( self._dirs_to_info.keys() ):
+                
+                if dir_path not in seen_dirs:
+                    
+                    del self._dirs_to_info[ dir_path ]
+                    
+                
+            
+            self._pending_paths.intersection_update( seen_paths )
+            
+        
+        candidate_paths.update( self._pending_paths )
+        
+        candidate_paths = [ path for path in candidate_paths if not path.endswith( '.txt' ) ]
+        
+        free_paths = HydrusPaths.FilterFreePaths( candidate_paths )
+        
+        self._pending_paths = set( candidate_paths ).difference( free_paths )
+        
+        HydrusData.HumanTextSort( free_paths )
+        
+        return free_paths
+        
+    
+    def SeedDirectories( self ):
+        
+        # a quick walk that only notes the dirs, so they can be watched before the first full scan. with no mtimes, that scan lists them all properly
+        
+        dirs_to_process = [ self._path ]
+        
+        while len( dirs_to_process ) > 0:
+            
+            if HG.view_shutdown:
+                
+                raise HydrusExceptions.ShutdownException()
+                
+            
+            dir_path = dirs_to_process.pop()
+            
+            if dir_path in self._dirs_to_info:
+                
+                continue
+                
+            
+            subdir_paths = []
+            
+            try:
+                
+                with os.scandir( dir_path ) as entries:
+                    
+                    for entry in entries:
+                        
+                        try:
+                            
+                            if entry.is_dir():
+                                
+                                subdir_paths.append( entry.path )
+                                
+                            
+                        except OSError:
+                            
+                            continue
+                            
+                        
+                    
+                
+            except OSError:
+                
+                continue
+                
+            
+            self._dirs_to_info[ dir_path ] = ( None, {}, subdir_paths )
+            
+            dirs_to_process.extend( subdir_paths )
+            
+        
+    
+    def SetWatcherEventCount( self, watcher_event_count ):
+        
+        self._watcher_event_count = watcher_event_count
+        
+    
+import_folder_snapshots = {}
+
+INOTIFY_OK = False
+
+if HC.PLATFORM_LINUX:
+    
+    try:
+        
+        import ctypes
+        import ctypes.util
+        import select
+        import struct
+        
+        libc = ctypes.CDLL( ctypes.util.find_library( 'c' ), use_errno = True )
+        
+        libc.inotify_init1.argtypes = [ ctypes.c_int ]
+        libc.inotify_add_watch.argtypes = [ ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32 ]
+        libc.inotify_rm_watch.argtypes = [ ctypes.c_int, ctypes.c_int ]
+        
+        INOTIFY_OK = True
+        
+    except:
+        
+        pass
+        
+    
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_IGNORED = 0x00008000
+
+IMPORT_FOLDER_WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+class ImportFolderWatcher( object ):
+    
+    def __init__( self ):
+        
+        self._lock = threading.Lock()
+        
+        self._fd = libc.inotify_init1( os.O_NONBLOCK | os.O_CLOEXEC )
+        
+        if self._fd < 0:
+            
+            raise OSError( ctypes.get_errno(), 'Could not initialise inotify!' )
+            
+        
+        self._wds_to_dirs = {}
+        self._dirs_to_wds = {}
+        self._roots_to_dirs = {}
+        
+        self._roots_to_event_counts = {}
+        
+        self._wake_pending = False
+        self._wake_time = 0
+        
+    
+    def _GetRootsForDir( self, dir_path ):
+        
+        return [ root for ( root, dirs ) in self._roots_to_dirs.items() if dir_path in dirs ]
+        
+    
+    def _ProcessEvents( self, data ):
+        
+        roots_that_changed = set()
+        
+        header_size = struct.calcsize( 'iIII' )
+        
+        i = 0
+        
+        while i + header_size <= len( data ):
+            
+            ( wd, mask, cookie, name_length ) = struct.unpack_from( 'iIII', data, i )
+            
+            i += header_size + name_length
+            
+            if wd not in self._wds_to_dirs:
+                
+                continue
+                
+            
+            dir_path = self._wds_to_dirs[ wd ]
+            
+            if mask & IN_IGNORED:
+                
+                # the dir was deleted or unmounted, the kernel already removed the watch
+                
+                del self._wds_to_dirs[ wd ]
+                
+                if self._dirs_to_wds.get( dir_path ) == wd:
+                    
+                    del self._dirs_to_wds[ dir_path ]
+                    
+                
+            
+            roots_that_changed.update( self._GetRootsForDir( dir_path ) )
+            
+        
+        for root in roots_that_changed:
+            
+            self._roots_to_event_counts[ root ] = self._roots_to_event_counts.get( root, 0 ) + 1
+            
+        
+        return len( roots_that_changed ) > 0
+        
+    
+    def _SyncWatches( self ):
+        
+        all_dirs = set()
+        
+        for dirs in self._roots_to_dirs.values():
+            
+            all_dirs.update( dirs )
+            
+        
+        for dir_path in list( self._dirs_to_wds.keys() ):
+            
+            if dir_path not in all_dirs:
+                
+                wd = self._dirs_to_wds[ dir_path ]
+                
+                libc.inotify_rm_watch( self._fd, wd )
+                
+                del self._dirs_to_wds[ dir_path ]
+                
+                if wd in self._wds_to_dirs:
+                    
+                    del self._wds_to_dirs[ wd ]
+                    
+                
+            
+        
+        for dir_path in all_dirs:
+            
+            if dir_path not in self._dirs_to_wds:
+                
+                wd = libc.inotify_add_watch( self._fd, os.fsencode( dir_path ), IMPORT_FOLDER_WATCH_MASK )
+                
+                if wd < 0:
+                    
+                    # probably out of watches (fs.inotify.max_user_watches), or the dir just went. the regular period check will catch it
+                    
+                    continue
+                    
+                
+                self._dirs_to_wds[ dir_path ] = wd
+                self._wds_to_dirs[ wd ] = dir_path
+                
+            
+        
+    
+    def GetEventCount( self, root ):
+        
+        with self._lock:
+            
+            return self._roots_to_event_counts.get( root, 0 )
+            
+        
+    
+    def MainLoop( self ):
+        
+        try:
+            
+            while not ( HG.model_shutdown or HydrusThreading.IsThreadShuttingDown() ):
+                
+                ( readable, writeable, errored ) = select.select( [ self._fd ], [], [], 1.0 )
+                
+                if len( readable ) > 0:
+                    
+                    try:
+                        
+                        data = os.read( self._fd, 65536 )
+                        
+                    except BlockingIOError:
+                        
+                        data = b''
+                        
+                    
+                    with self._lock:
+                        
+                        something_changed = self._ProcessEvents( data )
+                        
+                    
+                    if something_changed and not self._wake_pending:
+                        
+                        # files tend to arrive in bursts, so give them a moment to settle before waking the daemon
+                        
+                        self._wake_pending = True
+                        self._wake_time = HydrusData.GetNowPrecise() + 2.0
+                        
+                    
+                
+                if self._wake_pending and HydrusData.TimeHasPassedPrecise( self._wake_time ):
+                    
+                    HG.client_controller.pub( 'notify_restart_import_folders_daemon' )
+                    
+                    self._wake_pending = False
+                    
+                
+            
+        finally:
+            
+            os.close( self._fd )
+            
+        
+    
+    def SetWatchedDirectories( self, root, dir_paths ):
+        
+        with self._lock:
+            
+            self._roots_to_dirs[ root ] = set( dir_paths )
+            
+            self._SyncWatches()
+            
+        
+    
+import_folder_watcher = None
+import_folder_watcher_lock = threading.Lock()
+
+def GetImportFolderWatcher():
+    
+    global import_folder_watcher
+    global INOTIFY_OK
+    
+    if not INOTIFY_OK:
+        
+        return None
+        
+    
+    with import_folder_watcher_lock:
+        
+        if import_folder_watcher is None:
+            
+            try:
+                
+                import_folder_watcher = ImportFolderWatcher()
+                
+            except Exception as e:
+                
+                HydrusData.Print( 'Could not start the import folder watcher, so import folders will only be checked on their period:' )
+                HydrusData.PrintException( e, do_wait = False )
+                
+                INOTIFY_OK = False
+                
+                return None
+                
+            
+            HG.client_controller.CallToThreadLongRunning( import_folder_watcher.MainLoop )
+            
+        
+        return import_folder_watcher
+        
+    
@@ -1,5 +1,6 @@
 from . import ClientConstants as CC
 import collections
+import heapq
 from . import HydrusConstants as HC
 from . import HydrusData
 from . import HydrusExceptions
@@ -52,24 +53,37 @@ class NetworkEngine( object ):
         
         self._lock = threading.Lock()
         
-        self.RefreshOptions()
-        
         self._new_work_to_do = threading.Event()
         
+        self.RefreshOptions()
+        
         self._domains_to_login = []
         
         self._active_domains_counter = collections.Counter()
         
-        self._jobs_awaiting_validity = []
+        # rather than re-examine every waiting job every second, a job is only looked at again when something it is waiting on changes
+        # every time a job is put somewhere to wait, it gets a new ticket. anything holding an old ticket is stale and skipped, so a job can be moved without searching for it
+        
+        self._jobs_to_statuses = {}
+        self._jobs_to_tickets = {}
+        self._ticket_counter = itertools.count()
+        
+        self._ready_jobs = { status : collections.deque() for status in ( JOB_STATUS_AWAITING_VALIDITY, JOB_STATUS_AWAITING_BANDWIDTH, JOB_STATUS_AWAITING_LOGIN ) }
+        self._sleeping_jobs = []
+        self._jobs_to_wake = collections.deque()
+        
         self._current_validation_process = None
-        self._jobs_awaiting_bandwidth = []
-        self._jobs_awaiting_login = []
+        self._jobs_awaiting_validation_process = []
         self._current_login_process = None
-        self._jobs_awaiting_slot = []
+        self._jobs_awaiting_login_process = []
+        
+        self._domains_to_jobs_awaiting_slot = collections.OrderedDict()
         self._jobs_running = []
         
         self._pause_all_new_network_traffic = self.controller.new_options.GetBoolean( 'pause_all_new_network_traffic' )
         
+        self._next_connection_pool_maintenance = HydrusData.GetNow() + 60
+        
         self._is_running = False
         self._is_shutdown = False
         self._local_shutdown = False
@@ -77,6 +91,126 @@ class NetworkEngine( object ):
         self.controller.sub( self, 'RefreshOptions', 'notify_new_options' )
         
     
+    def _ForgetJob( self, job ):
+        
+        if job in self._jobs_to_statuses:
+            
+            del self._jobs_to_statuses[ job ]
+            
+        
+        if job in self._jobs_to_tickets:
+            
+            del self._jobs_to_tickets[ job ]
+            
+        
+    
+    def _IsInSlotQueue( self, job ):
+        
+        second_level_domain = job.GetSecondLevelDomain()
+        
+        if second_level_domain not in self._domains_to_jobs_awaiting_slot:
+            
+            return False
+            
+        
+        return ( self._jobs_to_tickets[ job ], job ) in self._domains_to_jobs_awaiting_slot[ second_level_domain ]
+        
+    
+    def _IssueTicket( self, job, status ):
+        
+        ticket = next( self._ticket_counter )
+        
+        self._jobs_to_statuses[ job ] = status
+        self._jobs_to_tickets[ job ] = ticket
+        
+        return ticket
+        
+    
+    def _ParkJob( self, job, status, jobs_awaiting_process ):
+        
+        ticket = self._IssueTicket( job, status )
+        
+        jobs_awaiting_process.append( ( ticket, job ) )
+        
+    
+    def _QueueJob( self, job, status, to_front = False ):
+        
+        ticket = self._IssueTicket( job, status )
+        
+        if status == JOB_STATUS_AWAITING_SLOT:
+            
+            second_level_domain = job.GetSecondLevelDomain()
+            
+            if second_level_domain not in self._domains_to_jobs_awaiting_slot:
+                
+                self._domains_to_jobs_awaiting_slot[ second_level_domain ] = collections.deque()
+                
+            
+            if to_front:
+                
+                self._domains_to_jobs_awaiting_slot[ second_level_domain ].appendleft( ( ticket, job ) )
+                
+            else:
+                
+                self._domains_to_jobs_awaiting_slot[ second_level_domain ].append( ( ticket, job ) )
+                
+            
+        else:
+            
+            self._ready_jobs[ status ].append( ( ticket, job ) )
+            
+        
+    
+    def _ReleaseParkedJobs( self, jobs_awaiting_process ):
+        
+        for ( ticket, job ) in jobs_awaiting_process:
+            
+            if self._TicketIsCurrent( job, ticket ):
+                
+                self._QueueJob( job, self._jobs_to_statuses[ job ] )
+                
+            
+        
+        del jobs_awaiting_process[:]
+        
+    
+    def _RemoveFromSlotQueue( self, job ):
+        
+        second_level_domain = job.GetSecondLevelDomain()
+        
+        if second_level_domain in self._domains_to_jobs_awaiting_slot:
+            
+            job_queue = self._domains_to_jobs_awaiting_slot[ second_level_domain ]
+            
+            job_queue = collections.deque( ( ( ticket, queued_job ) for ( ticket, queued_job ) in job_queue if queued_job is not job ) )
+            
+            if len( job_queue ) == 0:
+                
+                del self._domains_to_jobs_awaiting_slot[ second_level_domain ]
+                
+            else:
+                
+                self._domains_to_jobs_awaiting_slot[ second_level_domain ] = job_queue
+                
+            
+        
+    
+    def _SleepJob( self, job, status ):
+        
+        ticket = self._IssueTicket( job, status )
+        
+        # a job is awake once now > its wake time. a job that did not ask for a sleep gets another look next second, as under the old polling loop
+        
+        time_to_look_again = max( job.GetWakeTime(), HydrusData.GetNow() ) + 1
+        
+        heapq.heappush( self._sleeping_jobs, ( time_to_look_again, ticket, job ) )
+        
+    
+    def _TicketIsCurrent( self, job, ticket ):
+        
+        return self._jobs_to_tickets.get( job, None ) == ticket
+        
+    
     def AddJob( self, job ):
         
         if HG.network_report_mode:
@@ -88,7 +222,7 @@ class NetworkEngine( object ):
             
             job.engine = self
             
-            self._jobs_awaiting_validity.append( job )
+            self._QueueJob( job, JOB_STATUS_AWAITING_VALIDITY )
             
         
         self._new_work_to_do.set()
@@ -103,18 +237,16 @@ class NetworkEngine( object ):
             self._domains_to_login = HydrusData.DedupeList( self._domains_to_login )
             
         
+        self._new_work_to_do.set()
+        
     
     def GetJobsSnapshot( self ):
         
         with self._lock:
             
-            jobs = []
+            jobs = [ ( status, job ) for ( job, status ) in self._jobs_to_statuses.items() ]
             
-            jobs.extend( ( ( JOB_STATUS_AWAITING_VALIDITY, j ) for j in self._jobs_awaiting_validity ) )
-            jobs.extend( ( ( JOB_STATUS_AWAITING_BANDWIDTH, j ) for j in self._jobs_awaiting_bandwidth ) )
-            jobs.extend( ( ( JOB_STATUS_AWAITING_LOGIN, j ) for j in self._jobs_awaiting_login ) )
-            jobs.extend( ( ( JOB_STATUS_AWAITING_SLOT, j ) for j in self._jobs_awaiting_slot ) )
-            jobs.extend( ( ( JOB_STATUS_RUNNING, j ) for j in self._jobs_running ) )
+            jobs.sort( key = lambda status_and_job: status_and_job[0] )
             
             return jobs
             
@@ -124,7 +256,7 @@ class NetworkEngine( object ):
         
         with self._lock:
             
-            return len( self._jobs_awaiting_validity ) + len( self._jobs_awaiting_bandwidth ) + len( self._jobs_awaiting_login ) + len( self._jobs_awaiting_slot ) + len( self._jobs_running ) > 50
+            return len( self._jobs_to_statuses ) > 50
             
         
     
@@ -150,11 +282,11 @@ class NetworkEngine( object ):
             
             if job.IsDone():
                 
-                return False
+                self._ForgetJob( job )
                 
             elif job.IsAsleep():
                 
-                return True
+                self._SleepJob( job, JOB_STATUS_AWAITING_VALIDITY )
                 
             elif not job.IsValid():
                 
@@ -174,10 +306,8 @@ class NetworkEngine( object ):
                         
                         job.SetStatus( 'waiting in user validation queue\u2026' )
                         
-                        job.Sleep( 5 )
-                        
                     
-                    return True
+                    self._ParkJob( job, JOB_STATUS_AWAITING_VALIDITY, self._jobs_awaiting_validation_process )
                     
                 else:
                     
@@ -185,14 +315,12 @@ class NetworkEngine( object ):
                     
                     job.SetError( HydrusExceptions.ValidationException( error_text ), error_text )
                     
-                    return False
+                    self._ForgetJob( job )
                     
                 
             else:
                 
-                self._jobs_awaiting_bandwidth.append( job )
-                
-                return False
+                self._QueueJob( job, JOB_STATUS_AWAITING_BANDWIDTH )
                 
             
         
@@ -204,6 +332,8 @@ class NetworkEngine( object ):
                     
                     self._current_validation_process = None
                     
+                    self._ReleaseParkedJobs( self._jobs_awaiting_validation_process )
+                    
                 
             
         
@@ -211,21 +341,19 @@ class NetworkEngine( object ):
             
             if job.IsDone():
                 
-                return False
+                self._ForgetJob( job )
                 
             elif job.IsAsleep():
                 
-                return True
+                self._SleepJob( job, JOB_STATUS_AWAITING_BANDWIDTH )
                 
             elif not job.BandwidthOK():
                 
-                return True
+                self._SleepJob( job, JOB_STATUS_AWAITING_BANDWIDTH )
                 
             else:
                 
-                self._jobs_awaiting_login.append( job )
-                
-                return False
+                self._QueueJob( job, JOB_STATUS_AWAITING_LOGIN )
                 
             
         
@@ -256,11 +384,11 @@ class NetworkEngine( object ):
             
             if job.IsDone():
                 
-                return False
+                self._ForgetJob( job )
                 
             elif job.IsAsleep():
                 
-                return True
+                self._SleepJob( job, JOB_STATUS_AWAITING_LOGIN )
                 
             elif job.NeedsLogin():
                 
@@ -276,7 +404,7 @@ class NetworkEngine( object ):
                         
                         job.Sleep( 60 )
                         
-                        return True
+                        self._SleepJob( job, JOB_STATUS_AWAITING_LOGIN )
                         
                     else:
                         
@@ -291,9 +419,11 @@ class NetworkEngine( object ):
                         
                         job.Cancel( message )
                         
-                        return False
+                        self._ForgetJob( job )
                         
                     
+                    return
+                    
                 
                 if self._current_login_process is None:
                     
@@ -309,7 +439,9 @@ class NetworkEngine( object ):
                         
                         job.Sleep( 60 )
                         
-                        return True
+                        self._SleepJob( job, JOB_STATUS_AWAITING_LOGIN )
+                        
+                        return
                         
                     
                     self.controller.CallToThread( login_process.Start )
@@ -322,16 +454,14 @@ class NetworkEngine( object ):
                     
                     job.SetStatus( 'waiting in login queue\u2026' )
                     
-                    job.Sleep( 5 )
-                    
                 
-                return True
+                self._ParkJob( job, JOB_STATUS_AWAITING_LOGIN, self._jobs_awaiting_login_process )
                 
             else:
                 
-                self._jobs_awaiting_slot.append( job )
+                job.SetStatus( 'waiting for a slot\u2026' )
                 
-                return False
+                self._QueueJob( job, JOB_STATUS_AWAITING_SLOT )
                 
             
         
@@ -343,6 +473,8 @@ class NetworkEngine( object ):
                     
                     self._current_login_process = None
                     
+                    self._ReleaseParkedJobs( self._jobs_awaiting_login_process )
+                    
                 
             
         
@@ -350,64 +482,123 @@ class NetworkEngine( object ):
             
             if job.IsDone():
                 
-                return False
+                self._ForgetJob( job )
                 
             elif job.IsAsleep():
                 
-                return True
+                self._SleepJob( job, JOB_STATUS_AWAITING_SLOT )
                 
-            elif len( self._jobs_running ) < self.MAX_JOBS:
+            elif not job.TokensOK():
                 
-                if self._pause_all_new_network_traffic:
-                    
-                    job.SetStatus( 'all new network traffic is paused\u2026' )
+                self._SleepJob( job, JOB_STATUS_AWAITING_SLOT )
+                
+            else:
+                
+                if HG.network_report_mode:
                     
-                    job.Sleep( 2 )
+                    HydrusData.ShowText( 'Network Job Starting: ' + job._method + ' ' + job._url )
                     
-                    return True
+                
+                self._active_domains_counter[ job.GetSecondLevelDomain() ] += 1
+                
+                self.controller.CallToThread( job.Start )
+                
+                self._jobs_running.append( job )
+                
+                self._IssueTicket( job, JOB_STATUS_RUNNING )
+                
+            
+        
+        def ProcessSlotQueues():
+            
+            # jobs only wait here while their domain or the engine is full, so we only need to look when a running job finishes or the options change
+            
+            if len( self._domains_to_jobs_awaiting_slot ) == 0:
+                
+                return False
+                
+            
+            if self._pause_all_new_network_traffic:
+                
+                return False
+                
+            
+            if self.controller.JustWokeFromSleep():
+                
+                for job_queue in self._domains_to_jobs_awaiting_slot.values():
                     
-                elif self.controller.JustWokeFromSleep():
+                    if len( job_queue ) > 0:
+                        
+                        ( ticket, job ) = job_queue[0]
+                        
+                        job.SetStatus( 'looks like computer just woke up, waiting a bit' )
+                        
                     
-                    job.SetStatus( 'looks like computer just woke up, waiting a bit' )
+                
+                return True
+                
+            
+            for second_level_domain in list( self._domains_to_jobs_awaiting_slot.keys() ):
+                
+                job_queue = self._domains_to_jobs_awaiting_slot[ second_level_domain ]
+                
+                started_a_job = False
+                
+                while len( job_queue ) > 0:
                     
-                    job.Sleep( 5 )
+                    if len( self._jobs_running ) >= self.MAX_JOBS or self._active_domains_counter[ second_level_domain ] >= self.MAX_JOBS_PER_DOMAIN:
+                        
+                        break
+                        
                     
-                    return True
+                    ( ticket, job ) = job_queue.popleft()
                     
-                elif self._active_domains_counter[ job.GetSecondLevelDomain() ] >= self.MAX_JOBS_PER_DOMAIN:
+                    if self._TicketIsCurrent( job, ticket ):
+                        
+                        ProcessReadyJob( job )
+                        
+                        started_a_job = True
+                        
                     
-                    job.SetStatus( 'waiting for a slot on this domain' )
+                
+                if len( job_queue ) == 0:
                     
-                    job.Sleep( 2 )
+                    del self._domains_to_jobs_awaiting_slot[ second_level_domain ]
                     
-                    return True
+                elif started_a_job:
                     
-                elif not job.TokensOK():
+                    # round robin, so one busy domain does not always get first go at the engine's slots
                     
-                    return True
+                    self._domains_to_jobs_awaiting_slot.move_to_end( second_level_domain )
                     
-                else:
+                
+                if len( self._jobs_running ) >= self.MAX_JOBS:
                     
-                    if HG.network_report_mode:
+                    for job_queue in self._domains_to_jobs_awaiting_slot.values():
                         
-                        HydrusData.ShowText( 'Network Job Starting: ' + job._method + ' ' + job._url )
+                        if len( job_queue ) > 0:
+                            
+                            ( ticket, job ) = job_queue[0]
+                            
+                            job.SetStatus( 'waiting for a slot\u2026' )
+                            
                         
                     
-                    self._active_domains_counter[ job.GetSecondLevelDomain() ] += 1
+                    break
                     
-                    self.controller.CallToThread( job.Start )
+                
+            
+            for ( second_level_domain, job_queue ) in self._domains_to_jobs_awaiting_slot.items():
+                
+                if len( job_queue ) > 0 and self._active_domains_counter[ second_level_domain ] >= self.MAX_JOBS_PER_DOMAIN:
                     
-                    self._jobs_running.append( job )
+                    ( ticket, job ) = job_queue[0]
                     
-                    return False
+                    job.SetStatus( 'waiting for a slot on this domain' )
                     
                 
-            else:
-                
-                job.SetStatus( 'waiting for a slot\u2026' )
-                
-                return True
-                
+            
+            return False
             
         
         def ProcessRunningJob( job ):
@@ -428,6 +619,8 @@ class NetworkEngine( object ):
                     del self._active_domains_counter[ second_level_domain ]
                     
                 
+                self._ForgetJob( job )
+                
                 return False
                 
             else:
@@ -436,28 +629,125 @@ class NetworkEngine( object ):
                 
             
         
+        def ProcessReadyJobs( status, process_job_callable ):
+            
+            job_queue = self._ready_jobs[ status ]
+            
+            while len( job_queue ) > 0:
+                
+                ( ticket, job ) = job_queue.popleft()
+                
+                if self._TicketIsCurrent( job, ticket ):
+                    
+                    process_job_callable( job )
+                    
+                
+            
+        
+        def WakeJobs():
+            
+            while len( self._jobs_to_wake ) > 0:
+                
+                job = self._jobs_to_wake.popleft()
+                
+                if job not in self._jobs_to_statuses:
+                    
+                    continue
+                    
+                
+                status = self._jobs_to_statuses[ job ]
+                
+                if status == JOB_STATUS_RUNNING:
+                    
+                    continue
+                    
+                
+                if status == JOB_STATUS_AWAITING_SLOT:
+                    
+                    if job.IsDone():
+                        
+                        # cancelled while it waited. a full slot queue may not be looked at for a long time, so it goes now
+                        
+                        self._RemoveFromSlotQueue( job )
+                        
+                        self._ForgetJob( job )
+                        
+                    elif not self._IsInSlotQueue( job ):
+                        
+                        # it was asleep after its turn came up, so it goes back where it was
+                        
+                        self._QueueJob( job, status, to_front = True )
+                        
+                    
+                    # and a job still waiting in the queue keeps its place
+                    
+                else:
+                    
+                    self._QueueJob( job, status )
+                    
+                
+            
+            now = HydrusData.GetNow()
+            
+            while len( self._sleeping_jobs ) > 0 and self._sleeping_jobs[0][0] <= now:
+                
+                ( time_to_look_again, ticket, job ) = heapq.heappop( self._sleeping_jobs )
+                
+                if self._TicketIsCurrent( job, ticket ):
+                    
+                    status = self._jobs_to_statuses[ job ]
+                    
+                    # a job only sleeps on a slot after its turn came up, so it goes back to the front
+                    
+                    self._QueueJob( job, status, to_front = status == JOB_STATUS_AWAITING_SLOT )
+                    
+                
+            
+        
         self._is_running = True
         
         while not ( self._local_shutdown or self.controller.ModelIsShutdown() ):
             
             with self._lock:
                 
-                self._jobs_awaiting_validity = list(filter( ProcessValidationJob, self._jobs_awaiting_validity ))
+                WakeJobs()
+                
+                ProcessReadyJobs( JOB_STATUS_AWAITING_VALIDITY, ProcessValidationJob )
                 
                 ProcessCurrentValidationJob()
                 
-                self._jobs_awaiting_bandwidth = list(filter( ProcessBandwidthJob, self._jobs_awaiting_bandwidth ))
+                ProcessReadyJobs( JOB_STATUS_AWAITING_BANDWIDTH, ProcessBandwidthJob )
                 
                 ProcessForceLogins()
                 
-                self._jobs_awaiting_login = list(filter( ProcessLoginJob, self._jobs_awaiting_login ))
+                ProcessReadyJobs( JOB_STATUS_AWAITING_LOGIN, ProcessLoginJob )
                 
                 ProcessCurrentLoginJob()
                 
-                self._jobs_awaiting_slot = list(filter( ProcessReadyJob, self._jobs_awaiting_slot ))
-                
                 self._jobs_running = list(filter( ProcessRunningJob, self._jobs_running ))
                 
+                slots_waiting_on_time = ProcessSlotQueues()
+                
+                # validation and login processes do not tell us when they are done, so keep an eye on them
+                
+                need_to_poll = slots_waiting_on_time or self._current_validation_process is not None or self._current_login_process is not None or len( self._domains_to_login ) > 0
+                
+                if len( self._sleeping_jobs ) > 0:
+                    
+                    time_to_look_again = self._sleeping_jobs[0][0]
+                    
+                else:
+                    
+                    time_to_look_again = None
+                    
+                
+            
+            if HydrusData.TimeHasPassed( self._next_connection_pool_maintenance ):
+                
+                self.session_manager.MaintainConnectionPools()
+                
+                self._next_connection_pool_maintenance = HydrusData.GetNow() + 60
+                
             
             # we want to catch the rollover of the second for bandwidth jobs
             
@@ -466,7 +756,23 @@ class NetworkEngine( object ):
             
             time_until_next_second = 1.0 - subsecond_part
             
-            self._new_work_to_do.wait( time_until_next_second )
+            if need_to_poll:
+                
+                timeout = time_until_next_second
+                
+            else:
+                
+                next_wake_time = self._next_connection_pool_maintenance
+                
+                if time_to_look_again is not None:
+                    
+                    next_wake_time = min( next_wake_time, time_to_look_again )
+                    
+                
+                timeout = max( next_wake_time - HydrusData.GetNow() - 1, 0 ) + time_until_next_second
+                
+            
+            self._new_work_to_do.wait( timeout )
             
             self._new_work_to_do.clear()
             
@@ -478,10 +784,29 @@ class NetworkEngine( object ):
     
     def PausePlayNewJobs( self ):
         
-        self._pause_all_new_network_traffic = not self._pause_all_new_network_traffic
+        with self._lock:
+            
+            self._pause_all_new_network_traffic = not self._pause_all_new_network_traffic
+            
+            if self._pause_all_new_network_traffic:
+                
+                for job_queue in self._domains_to_jobs_awaiting_slot.values():
+                    
+                    for ( ticket, job ) in job_queue:
+                        
+                        if self._TicketIsCurrent( job, ticket ):
+                            
+                            job.SetStatus( 'all new network traffic is paused\u2026' )
+                            
+                        
+                    
+                
+            
         
         self.controller.new_options.SetBoolean( 'pause_all_new_network_traffic', self._pause_all_new_network_traffic )
         
+        self._new_work_to_do.set()
+        
     
     def RefreshOptions( self ):
         
@@ -491,6 +816,8 @@ class NetworkEngine( object ):
             self.MAX_JOBS_PER_DOMAIN = self.controller.new_options.GetInteger( 'max_network_jobs_per_domain' )
             
         
+        self._new_work_to_do.set()
+        
     
     def Shutdown( self ):
         
@@ -499,3 +826,12 @@ class NetworkEngine( object ):
         self._new_work_to_do.set()
         
     
+    def WakeJob( self, job ):
+        
+        # jobs call this under their own lock, so it must not take ours
+        
+        self._jobs_to_wake.append( job )
+        
+        self._new_work_to_do.set()
+
+
@@ -15,6 +15,8 @@ import threading
 import time
 import urllib.parse
 
+URL_CLASSIFICATION_CACHE_SIZE = 100000
+
 def AlphabetiseQueryText( query_text ):
     
     return ConvertQueryDictToText( ConvertQueryTextToDict( query_text ) )
@@ -375,6 +377,8 @@ class NetworkDomainManager( HydrusSerialisable.SerialisableBase ):
         
         self._parser_keys_to_parsers = {}
         
+        self._urls_to_classifications = collections.OrderedDict()
+        
         self._dirty = False
         
         self._lock = threading.Lock()
@@ -443,7 +447,7 @@ class NetworkDomainManager( HydrusSerialisable.SerialisableBase ):
             
         
     
-    def _GetNormalisedAPIURLClassAndURL( self, url ):
+    def _CalculateNormalisedAPIURLClassAndURL( self, url ):
         
         url_class = self._GetURLClass( url )
         
@@ -498,6 +502,69 @@ class NetworkDomainManager( HydrusSerialisable.SerialisableBase ):
         return ( api_url_class, api_url )
         
     
+    def _CalculateNormalisedURL( self, url_class, url ):
+        
+        if url_class is None:
+            
+            p = urllib.parse.urlparse( url )
+            
+            scheme = p.scheme
+            netloc = p.netloc
+            path = p.path
+            params = p.params
+            query = AlphabetiseQueryText( p.query )
+            fragment = p.fragment
+            
+            r = urllib.parse.ParseResult( scheme, netloc, path, params, query, fragment )
+            
+            normalised_url = r.geturl()
+            
+        else:
+            
+            normalised_url = url_class.Normalise( url )
+            
+        
+        return normalised_url
+        
+    
+    def _GetNormalisedAPIURLClassAndURL( self, url ):
+        
+        classification = self._GetURLClassification( url )
+        
+        if classification[2] is None:
+            
+            try:
+                
+                classification[2] = self._CalculateNormalisedAPIURLClassAndURL( url )
+                
+            except HydrusExceptions.URLClassException as e:
+                
+                classification[2] = str( e )
+                
+            
+        
+        api_url_class_and_url = classification[2]
+        
+        if isinstance( api_url_class_and_url, str ):
+            
+            raise HydrusExceptions.URLClassException( api_url_class_and_url )
+            
+        
+        return api_url_class_and_url
+        
+    
+    def _GetNormalisedURL( self, url ):
+        
+        classification = self._GetURLClassification( url )
+        
+        if classification[1] is None:
+            
+            classification[1] = self._CalculateNormalisedURL( classification[0], url )
+            
+        
+        return classification[1]
+        
+    
     def _GetSerialisableInfo( self ):
         
         serialisable_gugs = self._gugs.GetSerialisableTuple()
@@ -521,28 +588,31 @@ class NetworkDomainManager( HydrusSerialisable.SerialisableBase ):
     
     def _GetURLClass( self, url ):
         
-        domain = ConvertDomainIntoSecondLevelDomain( ConvertURLIntoDomain( url ) )
+        return self._GetURLClassification( url )[0]
         
-        if domain in self._domains_to_url_classes:
+    
+    def _GetURLClassification( self, url ):
+        
+        # importers and their seed caches ask about the same urls over and over, so remember what we worked out
+        # this is [ url_class, normalised_url, api_url_class_and_url_or_error_text ], and the latter two are filled in when first asked for
+        
+        if url in self._urls_to_classifications:
             
-            url_classes = self._domains_to_url_classes[ domain ]
+            self._urls_to_classifications.move_to_end( url )
             
-            for url_class in url_classes:
-                
-                try:
-                    
-                    url_class.Test( url )
-                    
-                    return url_class
-                    
-                except HydrusExceptions.URLClassException:
-                    
-                    continue
-                    
-                
+            return self._urls_to_classifications[ url ]
             
         
-        return None
+        classification = [ self._TestURLClasses( url ), None, None ]
+        
+        self._urls_to_classifications[ url ] = classification
+        
+        if len( self._urls_to_classifications ) > URL_CLASSIFICATION_CACHE_SIZE:
+            
+            self._urls_to_classifications.popitem( last = False )
+            
+        
+        return classification
         
     
     def _GetURLToFetchAndParser( self, url ):
@@ -606,6 +676,8 @@ class NetworkDomainManager( HydrusSerialisable.SerialisableBase ):
     
     def _RecalcCache( self ):
         
+        self._urls_to_classifications = collections.OrderedDict()
+        
         self._domains_to_url_classes = collections.defaultdict( list )
         
         for url_class in self._url_classes:
@@ -642,6 +714,32 @@ class NetworkDomainManager( HydrusSerialisable.SerialisableBase ):
         self._dirty = True
         
     
+    def _TestURLClasses( self, url ):
+        
+        domain = ConvertDomainIntoSecondLevelDomain( ConvertURLIntoDomain( url ) )
+        
+        if domain in self._domains_to_url_classes:
+            
+            url_classes = self._domains_to_url_classes[ domain ]
+            
+            for url_class in url_classes:
+                
+                try:
+                    
+                    url_class.Test( url )
+                    
+                    return url_class
+                    
+                except HydrusExceptions.URLClassException:
+                    
+                    continue
+                    
+                
+            
+        
+        return None
+        
+    
     def _UpdateSerialisableInfo( self, version, old_serialisable_info ):
         
         if version == 1:
@@ -1016,7 +1114,7 @@ class NetworkDomainManager( HydrusSerialisable.SerialisableBase ):
                         
                     
                 
-                
+            
             
             for renamee in renamees:
                 
@@ -1340,6 +1438,44 @@ class NetworkDomainManager( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def GetURLClassifications( self, urls ):
+        
+        # one lock for a whole batch, for callers that want to know everything about a list of urls
+        
+        with self._lock:
+            
+            classifications = []
+            
+            for url in urls:
+                
+                url_class = self._GetURLClass( url )
+                
+                url_class_key = None
+                api_url = None
+                
+                if url_class is not None:
+                    
+                    url_class_key = url_class.GetMatchKey()
+                    
+                    try:
+                        
+                        ( api_url_class, api_url ) = self._GetNormalisedAPIURLClassAndURL( url )
+                        
+                    except HydrusExceptions.URLClassException:
+                        
+                        pass
+                        
+                    
+                
+                normalised_url = self._GetNormalisedURL( url )
+                
+                classifications.append( ( url_class_key, normalised_url, api_url ) )
+                
+            
+            return classifications
+            
+        
+    
     def GetURLClassKeysToParserKeys( self ):
         
         with self._lock:
@@ -1458,29 +1594,15 @@ class NetworkDomainManager( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
-            url_class = self._GetURLClass( url )
+            return self._GetNormalisedURL( url )
             
-            if url_class is None:
-                
-                p = urllib.parse.urlparse( url )
-                
-                scheme = p.scheme
-                netloc = p.netloc
-                path = p.path
-                params = p.params
-                query = AlphabetiseQueryText( p.query )
-                fragment = p.fragment
-                
-                r = urllib.parse.ParseResult( scheme, netloc, path, params, query, fragment )
-                
-                normalised_url = r.geturl()
-                
-            else:
-                
-                normalised_url = url_class.Normalise( url )
-                
+        
+    
+    def NormaliseURLs( self, urls ):
+        
+        with self._lock:
             
-            return normalised_url
+            return [ self._GetNormalisedURL( url ) for url in urls ]
             
         
     
@@ -5,6 +5,7 @@ from . import ClientNetworkingDomain
 from . import HydrusConstants as HC
 from . import HydrusData
 from . import HydrusExceptions
+from . import HydrusFileHandling
 from . import HydrusGlobals as HG
 from . import HydrusNetworking
 from . import HydrusThreading
@@ -91,6 +92,59 @@ def ConvertStatusCodeAndDataIntoExceptionInfo( status_code, data, is_hydrus_serv
     
     return ( e, error_text )
     
+def GetContentRangeStart( headers ):
+    
+    # 'bytes 12345-67890/67891'
+    
+    if 'Content-Range' not in headers:
+        
+        return None
+        
+    
+    content_range = headers[ 'Content-Range' ].strip()
+    
+    if not content_range.startswith( 'bytes ' ):
+        
+        return None
+        
+    
+    try:
+        
+        start = content_range[ 6 : ].split( '-', 1 )[0]
+        
+        return int( start )
+        
+    except ValueError:
+        
+        return None
+        
+    
+def GetRangeValidator( headers ):
+    
+    # If-Range only works with a strong etag or a last-modified date. without one of those, we cannot safely resume
+    
+    if 'Accept-Ranges' in headers and headers[ 'Accept-Ranges' ].strip().lower() == 'none':
+        
+        return None
+        
+    
+    if 'ETag' in headers:
+        
+        etag = headers[ 'ETag' ].strip()
+        
+        if not etag.startswith( 'W/' ):
+            
+            return etag
+            
+        
+    
+    if 'Last-Modified' in headers:
+        
+        return headers[ 'Last-Modified' ].strip()
+        
+    
+    return None
+    
 class NetworkJob( object ):
     
     WILLING_TO_WAIT_ON_INVALID_LOGIN = True
@@ -160,6 +214,13 @@ class NetworkJob( object ):
         
         self._file_import_options = None
         
+        self._file_hashing = False
+        self._file_hasher = None
+        
+        self._range_validator = None
+        self._num_bytes_resumable = 0
+        self._range_start = 0
+        
         self._network_contexts = self._GenerateNetworkContexts()
         
         ( self._session_network_context, self._login_network_context ) = self._GenerateSpecificNetworkContexts()
@@ -186,6 +247,11 @@ class NetworkJob( object ):
         return self._current_connection_attempt_number <= max_attempts_allowed
         
     
+    def _CanResume( self ):
+        
+        return self._method == 'GET' and self._temp_path is not None and self._range_validator is not None and self._num_bytes_resumable > 0
+        
+    
     def _GenerateNetworkContexts( self ):
         
         network_contexts = []
@@ -241,6 +307,18 @@ class NetworkJob( object ):
                 headers[ key ] = value
                 
             
+            if self._CanResume():
+                
+                self._range_start = self._num_bytes_resumable
+                
+                headers[ 'Range' ] = 'bytes={}-'.format( self._range_start )
+                headers[ 'If-Range' ] = self._range_validator
+                
+            else:
+                
+                self._range_start = 0
+                
+            
             self._status_text = 'sending request\u2026'
             
             snc = self._session_network_context
@@ -333,7 +411,7 @@ class NetworkJob( object ):
             
         
     
-    def _ReadResponse( self, response, stream_dest, max_allowed = None ):
+    def _ReadResponse( self, response, stream_dest, max_allowed = None, file_hasher = None ):
         
         with self._lock:
             
@@ -347,8 +425,9 @@ class NetworkJob( object ):
                 
             
             if 'content-length' in response.headers:
-            
-                self._num_bytes_to_read = int( response.headers[ 'content-length' ] )
+                
+                # if we are resuming, the content-length is just what is left
+                self._num_bytes_to_read = self._num_bytes_read + int( response.headers[ 'content-length' ] )
                 
                 if max_allowed is not None and self._num_bytes_to_read > max_allowed:
                     
@@ -368,6 +447,8 @@ class NetworkJob( object ):
                 
             
         
+        mime_sniffed = False
+        
         for chunk in response.iter_content( chunk_size = 65536 ):
             
             if self._IsCancelled():
@@ -379,6 +460,25 @@ class NetworkJob( object ):
             
             chunk_length = len( chunk )
             
+            if file_hasher is not None:
+                
+                file_hasher.AddBlock( chunk )
+                
+                if not mime_sniffed and file_hasher.GetNumBytes() >= 256:
+                    
+                    mime_sniffed = True
+                    
+                    # the actual bytes are a better guess than whatever the server said the content-type was
+                    
+                    sniffed_mime = file_hasher.GetPossibleMime()
+                    
+                    if sniffed_mime is not None:
+                        
+                        mime = sniffed_mime
+                        
+                    
+                
+            
             with self._lock:
                 
                 self._num_bytes_read += chunk_length
@@ -411,6 +511,89 @@ class NetworkJob( object ):
             
         
     
+    def _ReadResponseToTempPath( self, response ):
+        
+        with self._lock:
+            
+            resuming = False
+            
+            if self._range_start > 0 and response.status_code == 206:
+                
+                if GetContentRangeStart( response.headers ) == self._range_start:
+                    
+                    resuming = True
+                    
+                else:
+                    
+                    self._range_validator = None
+                    self._num_bytes_resumable = 0
+                    
+                    raise HydrusExceptions.ShouldReattemptNetworkException( 'Server sent the wrong part of the file while resuming.' )
+                    
+                
+            
+            if resuming:
+                
+                # the server honoured our If-Range, so the bytes on disk and anything we hashed are still good
+                
+                file_hasher = self._file_hasher
+                
+                if file_hasher is not None and file_hasher.GetNumBytes() != self._range_start:
+                    
+                    file_hasher = None
+                    
+                
+                self._num_bytes_read = self._range_start
+                
+                self._status_text = 'resuming from ' + HydrusData.ToHumanBytes( self._range_start ) + '\u2026'
+                
+            else:
+                
+                # either a fresh request or the server ignored or rejected our range, so start again from zero
+                
+                if self._file_hashing:
+                    
+                    file_hasher = HydrusFileHandling.FileHasher()
+                    
+                else:
+                    
+                    file_hasher = None
+                    
+                
+                self._num_bytes_read = 0
+                
+                self._range_validator = GetRangeValidator( response.headers )
+                
+            
+        
+        if resuming:
+            
+            f = open( self._temp_path, 'r+b' )
+            
+            f.seek( self._range_start )
+            f.truncate()
+            
+        else:
+            
+            f = open( self._temp_path, 'wb' )
+            
+        
+        try:
+            
+            self._ReadResponse( response, f, file_hasher = file_hasher )
+            
+        finally:
+            
+            with self._lock:
+                
+                self._file_hasher = file_hasher
+                self._num_bytes_resumable = f.tell()
+                
+            
+            f.close()
+            
+        
+    
     def _ReportDataUsed( self, num_bytes ):
         
         self._bandwidth_tracker.ReportDataUsed( num_bytes )
@@ -446,6 +629,8 @@ class NetworkJob( object ):
         
         self._is_done_event.set()
         
+        self._WakeEngine()
+        
     
     def _Sleep( self, seconds ):
         
@@ -475,6 +660,16 @@ class NetworkJob( object ):
             
         
     
+    def _WakeEngine( self ):
+        
+        # the engine only looks at a waiting job again when it has reason to, so tell it when something has changed
+        
+        if self.engine is not None:
+            
+            self.engine.WakeJob( self )
+            
+        
+    
     def AddAdditionalHeader( self, key, value ):
         
         with self._lock:
@@ -676,6 +871,14 @@ class NetworkJob( object ):
             
         
     
+    def GetFileHasher( self ):
+        
+        with self._lock:
+            
+            return self._file_hasher
+            
+        
+    
     def GetLoginNetworkContext( self ):
         
         with self._lock:
@@ -736,6 +939,14 @@ class NetworkJob( object ):
             
         
     
+    def GetWakeTime( self ):
+        
+        with self._lock:
+            
+            return self._wake_time
+            
+        
+    
     def HasError( self ):
         
         with self._lock:
@@ -826,6 +1037,8 @@ class NetworkJob( object ):
                 self._wake_time = min( self._wake_time, self._bandwidth_manual_override_delayed_timestamp + 1 )
                 
             
+            self._WakeEngine()
+            
         
     
     def OverrideToken( self ):
@@ -836,6 +1049,8 @@ class NetworkJob( object ):
             
             self._wake_time = 0
             
+            self._WakeEngine()
+            
         
     
     def SetError( self, e, error ):
@@ -854,6 +1069,14 @@ class NetworkJob( object ):
             
         
     
+    def SetFileHashing( self, file_hashing ):
+        
+        with self._lock:
+            
+            self._file_hashing = file_hashing
+            
+        
+    
     def SetFileImportOptions( self, file_import_options ):
         
         with self._lock:
@@ -952,14 +1175,17 @@ class NetworkJob( object ):
                         
                         if self._temp_path is None:
                             
+                            with self._lock:
+                                
+                                self._stream_io = io.BytesIO()
+                                self._num_bytes_read = 0
+                                
+                            
                             self._ReadResponse( response, self._stream_io, 104857600 )
                             
                         else:
                             
-                            with open( self._temp_path, 'wb' ) as f:
-                                
-                                self._ReadResponse( response, f )
-                                
+                            self._ReadResponseToTempPath( response )
                             
                         
                         with self._lock:
@@ -971,8 +1197,21 @@ class NetworkJob( object ):
                         
                         with self._lock:
                             
+                            if response.status_code == 416 and self._range_start > 0:
+                                
+                                # our partial file is no good to the server any more, so start over
+                                
+                                self._range_validator = None
+                                self._num_bytes_resumable = 0
+                                
+                                raise HydrusExceptions.ShouldReattemptNetworkException( 'Server could not resume the download.' )
+                                
+                            
                             self._status_text = str( response.status_code ) + ' - ' + str( response.reason )
                             
+                            self._stream_io = io.BytesIO()
+                            self._num_bytes_read = 0
+                            
                         
                         self._ReadResponse( response, self._stream_io, 104857600 )
                         
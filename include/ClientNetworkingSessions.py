@@ -6,11 +6,12 @@ from . import HydrusData
 from . import HydrusSerialisable
 from . import HydrusGlobals as HG
 import requests
+import socket
 import threading
+import urllib3
 
 try:
     
-    import socket
     import socks
     
     SOCKS_PROXY_OK = True
@@ -20,6 +21,115 @@ except:
     SOCKS_PROXY_OK = False
     
 
+class NetworkConnectionPoolManager( urllib3.PoolManager ):
+    
+    def __init__( self, *args, **kwargs ):
+        
+        urllib3.PoolManager.__init__( self, *args, **kwargs )
+        
+        self.pools_created = []
+        
+    
+    def _new_pool( self, scheme, host, port, request_context = None ):
+        
+        pool = urllib3.PoolManager._new_pool( self, scheme, host, port, request_context = request_context )
+        
+        self.pools_created.append( pool )
+        
+        return pool
+        
+    
+class NetworkConnectionPoolAdapter( requests.adapters.HTTPAdapter ):
+    
+    def __init__( self, pool_maxsize ):
+        
+        self._stats_lock = threading.Lock()
+        
+        self._num_requests = 0
+        self._num_connections_in_closed_pools = 0
+        self._last_request_time = HydrusData.GetNow()
+        
+        requests.adapters.HTTPAdapter.__init__( self, pool_maxsize = pool_maxsize )
+        
+    
+    def __reduce__( self ):
+        
+        # sessions are pickled to the db, so save as a vanilla adapter. the session manager will swap us back in on load
+        
+        return ( requests.adapters.HTTPAdapter, (), self.__getstate__() )
+        
+    
+    def _GetNumConnections( self ):
+        
+        return self._num_connections_in_closed_pools + sum( ( pool.num_connections for pool in self.poolmanager.pools_created ) )
+        
+    
+    def close( self ):
+        
+        with self._stats_lock:
+            
+            self._num_connections_in_closed_pools = self._GetNumConnections()
+            
+            self.poolmanager.pools_created = []
+            
+        
+        requests.adapters.HTTPAdapter.close( self )
+        
+    
+    def init_poolmanager( self, connections, maxsize, block = requests.adapters.DEFAULT_POOLBLOCK, **pool_kwargs ):
+        
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+        
+        # keep our idle connections alive at the tcp level so the next job to the same host does not have to redo the tls handshake
+        
+        socket_options = list( urllib3.connection.HTTPConnection.default_socket_options )
+        
+        socket_options.append( ( socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1 ) )
+        
+        if hasattr( socket, 'TCP_KEEPIDLE' ):
+            
+            socket_options.append( ( socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 60 ) )
+            
+        
+        pool_kwargs[ 'socket_options' ] = socket_options
+        
+        self.poolmanager = NetworkConnectionPoolManager( num_pools = connections, maxsize = maxsize, block = block, **pool_kwargs )
+        
+    
+    def GetIdleTime( self ):
+        
+        with self._stats_lock:
+            
+            return HydrusData.GetNow() - self._last_request_time
+            
+        
+    
+    def GetPoolMaxSize( self ):
+        
+        return self._pool_maxsize
+        
+    
+    def GetStats( self ):
+        
+        with self._stats_lock:
+            
+            return ( self._num_requests, self._GetNumConnections() )
+            
+        
+    
+    def send( self, request, *args, **kwargs ):
+        
+        with self._stats_lock:
+            
+            self._num_requests += 1
+            self._last_request_time = HydrusData.GetNow()
+            
+        
+        return requests.adapters.HTTPAdapter.send( self, request, *args, **kwargs )
+        
+    
 class NetworkSessionManager( HydrusSerialisable.SerialisableBase ):
     
     SERIALISABLE_TYPE = HydrusSerialisable.SERIALISABLE_TYPE_NETWORK_SESSION_MANAGER
@@ -28,6 +138,8 @@ class NetworkSessionManager( HydrusSerialisable.SerialisableBase ):
     
     SESSION_TIMEOUT = 60 * 60
     
+    CONNECTION_POOL_IDLE_TIMEOUT = 5 * 60
+    
     def __init__( self ):
         
         HydrusSerialisable.SerialisableBase.__init__( self )
@@ -66,6 +178,25 @@ class NetworkSessionManager( HydrusSerialisable.SerialisableBase ):
         session.cookies.clear_expired_cookies()
         
     
+    def _EnsureConnectionPools( self, session ):
+        
+        pool_maxsize = self._GetConnectionPoolMaxSize()
+        
+        for prefix in ( 'https://', 'http://' ):
+            
+            adapter = session.get_adapter( prefix )
+            
+            if isinstance( adapter, NetworkConnectionPoolAdapter ) and adapter.GetPoolMaxSize() == pool_maxsize:
+                
+                continue
+                
+            
+            adapter.close()
+            
+            session.mount( prefix, NetworkConnectionPoolAdapter( pool_maxsize ) )
+            
+        
+    
     def _GenerateSession( self, network_context ):
         
         session = requests.Session()
@@ -78,6 +209,20 @@ class NetworkSessionManager( HydrusSerialisable.SerialisableBase ):
         return session
         
     
+    def _GetConnectionPoolMaxSize( self ):
+        
+        # one warm connection for every job the engine will run on a domain at once
+        
+        if self.engine is None:
+            
+            return HG.client_controller.new_options.GetInteger( 'max_network_jobs_per_domain' )
+            
+        else:
+            
+            return self.engine.MAX_JOBS_PER_DOMAIN
+            
+        
+    
     def _GetSerialisableInfo( self ):
         
         serialisable_network_contexts_to_sessions = [ ( network_context.GetSerialisableTuple(), pickle.dumps( session ).hex() ) for ( network_context, session ) in list(self._network_contexts_to_sessions.items()) ]
@@ -161,6 +306,35 @@ class NetworkSessionManager( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def GetConnectionPoolStats( self, network_context ):
+        
+        with self._lock:
+            
+            network_context = self._GetSessionNetworkContext( network_context )
+            
+            num_requests = 0
+            num_connections = 0
+            
+            if network_context in self._network_contexts_to_sessions:
+                
+                session = self._network_contexts_to_sessions[ network_context ]
+                
+                for adapter in session.adapters.values():
+                    
+                    if isinstance( adapter, NetworkConnectionPoolAdapter ):
+                        
+                        ( adapter_num_requests, adapter_num_connections ) = adapter.GetStats()
+                        
+                        num_requests += adapter_num_requests
+                        num_connections += adapter_num_connections
+                        
+                    
+                
+            
+            return ( num_requests, num_connections )
+            
+        
+    
     def GetNetworkContexts( self ):
         
         with self._lock:
@@ -182,6 +356,8 @@ class NetworkSessionManager( HydrusSerialisable.SerialisableBase ):
             
             session = self._network_contexts_to_sessions[ network_context ]
             
+            self._EnsureConnectionPools( session )
+            
             if session.proxies != self._proxies_dict:
                 
                 session.proxies = dict( self._proxies_dict )
@@ -224,6 +400,25 @@ class NetworkSessionManager( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def MaintainConnectionPools( self ):
+        
+        with self._lock:
+            
+            for session in self._network_contexts_to_sessions.values():
+                
+                for adapter in session.adapters.values():
+                    
+                    if isinstance( adapter, NetworkConnectionPoolAdapter ) and adapter.GetIdleTime() > self.CONNECTION_POOL_IDLE_TIMEOUT:
+                        
+                        # the pools are rebuilt on next use, and the stats are kept
+                        
+                        adapter.close()
+                        
+                    
+                
+            
+        
+    
     def Reinitialise( self ):
         
         with self._lock:
@@ -32,6 +32,8 @@ except ImportError:
 try:
     
     import lxml
+    import lxml.etree
+    import lxml.html
     
     LXML_IS_OK = True
     
@@ -39,6 +41,36 @@ except ImportError:
     
     LXML_IS_OK = False
     
+LXML_TREE_RECOVERY_ERRORS = { 'ERR_TAG_NAME_MISMATCH', 'HTML_STRUCURE_ERROR' }
+
+XPATH_NAME_RE = re.compile( r'^[A-Za-z_][A-Za-z0-9_\-\.]*$' )
+
+# the xpath fast path has to give the same results as the soup, so it follows bs4's own html rules
+
+# bs4 splits these on whitespace and matches a search value against either any one item or the whole thing
+# '*' is for every tag, the rest only for the tag named
+HTML_MULTI_VALUED_ATTRIBUTES = bs4.builder.HTMLTreeBuilder.DEFAULT_CDATA_LIST_ATTRIBUTES
+
+# newer bs4 wants special string types in these, which the html5lib builder does not make, so the soup never finds any strings in them
+HTML_STRINGLESS_TAGS = set( getattr( bs4.builder.HTMLTreeBuilder, 'DEFAULT_STRING_CONTAINERS', {} ).keys() )
+
+def ConvertStringToXPathLiteral( s ):
+    
+    if "'" not in s:
+        
+        return "'" + s + "'"
+        
+    elif '"' not in s:
+        
+        return '"' + s + '"'
+        
+    else:
+        
+        components = [ "'" + component + "'" for component in s.split( "'" ) ]
+        
+        return 'concat(' + ', "\'", '.join( components ) + ')'
+        
+    
 def ConvertParseResultToPrettyString( result ):
     
     ( ( name, content_type, additional_info ), parsed_text ) = result
@@ -273,6 +305,61 @@ def GetHTMLTagString( tag ):
     
     return result
     
+def GetLXMLNodeString( node ):
+    
+    if isinstance( node, lxml.etree._ElementTree ):
+        
+        node = node.getroot()
+        
+    
+    if node.tag in HTML_STRINGLESS_TAGS:
+        
+        return ''
+        
+    
+    all_strings = [ s for s in node.itertext() if len( s ) > 0 ]
+    
+    if len( all_strings ) == 0:
+        
+        result = ''
+        
+    else:
+        
+        result = all_strings[0]
+        
+    
+    return result
+    
+def GetLXMLTree( html ):
+    
+    if not LXML_IS_OK:
+        
+        raise HydrusExceptions.ParseException( 'This client does not have access to lxml!' )
+        
+    
+    # lxml will not take unicode that declares its own encoding, so we give it utf-8 and tell it so
+    # html5lib drops NULs, where lxml would make them U+FFFD
+    
+    parser = lxml.html.HTMLParser( encoding = 'utf-8' )
+    
+    root = lxml.html.document_fromstring( html.replace( '\x00', '' ).encode( 'utf-8' ), parser = parser )
+    
+    if HTML5LIB_IS_OK:
+        
+        # where tags are misnested, lxml and html5lib patch the tree up in different ways, so we let the soup have these pages
+        
+        if True in ( error.type_name in LXML_TREE_RECOVERY_ERRORS for error in parser.error_log ):
+            
+            return None
+            
+        
+        # the soup is built by html5lib, so we reshape the tree where the two differ in ways the rules can see
+        
+        NormaliseLXMLTreeLikeHTML5Lib( root )
+        
+    
+    return root
+    
 def GetNamespacesFromParsableContent( parsable_content ):
     
     content_type_to_additional_infos = HydrusData.BuildKeyToSetDict( ( ( content_type, additional_infos ) for ( name, content_type, additional_infos ) in parsable_content ) )
@@ -454,6 +541,149 @@ def GetVariableFromParseResults( results ):
     
     return None
     
+def IsMultiValuedHTMLAttribute( tag_name, key ):
+    
+    return key in HTML_MULTI_VALUED_ATTRIBUTES[ '*' ] or ( tag_name in HTML_MULTI_VALUED_ATTRIBUTES and key in HTML_MULTI_VALUED_ATTRIBUTES[ tag_name ] )
+    
+def NormaliseLXMLTreeLikeHTML5Lib( root ):
+    
+    # html5lib always makes a <head> and a <body>, where lxml only makes what the document has content for
+    
+    if root.find( 'head' ) is None:
+        
+        root.insert( 0, lxml.html.Element( 'head' ) )
+        
+    
+    if root.find( 'body' ) is None:
+        
+        root.append( lxml.html.Element( 'body' ) )
+        
+    
+    # html5lib drops the whitespace before <head> and puts the whitespace after </body> inside the <body>
+    
+    if root.text is not None and root.text.strip() == '':
+        
+        root.text = None
+        
+    
+    body = root.find( 'body' )
+    
+    if body.tail is not None and body.tail.strip() == '':
+        
+        if len( body ) > 0:
+            
+            body[-1].tail = ( body[-1].tail or '' ) + body.tail
+            
+        else:
+            
+            body.text = ( body.text or '' ) + body.tail
+            
+        
+        body.tail = None
+        
+    
+    # html5lib drops the newline right after these open, and calls <image> <img>
+    
+    for node in root.iter( 'pre', 'listing', 'textarea' ):
+        
+        if node.text is not None and node.text.startswith( '\n' ):
+            
+            node.text = node.text[1:] if len( node.text ) > 1 else None
+            
+        
+    
+    for node in root.iter( 'image' ):
+        
+        node.tag = 'img'
+        
+    
+    # html5lib puts a <tbody> around any rows or cells that sit right in a <table>, and a <tr> around any cells that sit right in a section, and lxml does neither
+    
+    for table in list( root.iter( 'table' ) ):
+        
+        # and text that is not in a cell goes in front of the table
+        
+        fostered_texts = PopLXMLTableText( table )
+        
+        if len( fostered_texts ) > 0:
+            
+            fostered_text = ''.join( fostered_texts )
+            
+            previous = table.getprevious()
+            
+            if previous is None:
+                
+                parent = table.getparent()
+                
+                parent.text = ( parent.text or '' ) + fostered_text
+                
+            else:
+                
+                previous.tail = ( previous.tail or '' ) + fostered_text
+                
+            
+        
+        tbody = None
+        
+        for child in list( table ):
+            
+            if child.tag in ( 'tr', 'td', 'th' ):
+                
+                if tbody is None:
+                    
+                    tbody = lxml.html.Element( 'tbody' )
+                    
+                    child.addprevious( tbody )
+                    
+                
+                tbody.append( child )
+                
+            elif child.tag in ( 'thead', 'tbody', 'tfoot', 'caption', 'colgroup', 'col' ):
+                
+                tbody = None
+                
+            elif tbody is not None:
+                
+                # comments and the like between rows stay in the section with them
+                
+                tbody.append( child )
+                
+            
+        
+        for section in table:
+            
+            if section.tag not in ( 'thead', 'tbody', 'tfoot' ):
+                
+                continue
+                
+            
+            tr = None
+            
+            for child in list( section ):
+                
+                if child.tag in ( 'td', 'th' ):
+                    
+                    if tr is None:
+                        
+                        tr = lxml.html.Element( 'tr' )
+                        
+                        child.addprevious( tr )
+                        
+                    
+                    tr.append( child )
+                    
+                elif child.tag == 'tr':
+                    
+                    tr = None
+                    
+                elif tr is not None:
+                    
+                    tr.append( child )
+                    
+                
+            
+        
+    
 def MakeParsedTextPretty( parsed_text ):
     
     if isinstance( parsed_text, bytes ):
@@ -463,6 +693,34 @@ def MakeParsedTextPretty( parsed_text ):
     
     return parsed_text
     
+def PopLXMLTableText( node ):
+    
+    texts = []
+    
+    if node.text is not None and node.text.strip() != '':
+        
+        texts.append( node.text )
+        
+        node.text = None
+        
+    
+    for child in node:
+        
+        if child.tag in ( 'thead', 'tbody', 'tfoot', 'tr' ):
+            
+            texts.extend( PopLXMLTableText( child ) )
+            
+        
+        if child.tail is not None and child.tail.strip() != '':
+            
+            texts.append( child.tail )
+            
+            child.tail = None
+            
+        
+    
+    return texts
+    
 def RenderJSONParseRule( rule ):
     
     ( parse_rule_type, parse_rule ) = rule
@@ -810,6 +1068,20 @@ class ParseFormulaHTML( ParseFormula ):
         
         self._attribute_to_fetch = attribute_to_fetch
         
+        self._can_use_lxml = None
+        
+    
+    def _CanUseLXML( self ):
+        
+        if self._can_use_lxml is None:
+            
+            # lxml serialises html differently to bs4, so whole-html results always go through the soup
+            
+            self._can_use_lxml = LXML_IS_OK and self._content_to_fetch != HTML_CONTENT_HTML and len( self._tag_rules ) > 0 and False not in ( tag_rule.CanCompileToXPath() for tag_rule in self._tag_rules )
+            
+        
+        return self._can_use_lxml
+        
     
     def _FindHTMLTags( self, root ):
         
@@ -823,6 +1095,20 @@ class ParseFormulaHTML( ParseFormula ):
         return tags
         
     
+    def _FindLXMLNodes( self, root ):
+        
+        # the soup starts from the document, not the <html> element, so we do too
+        
+        nodes = ( root.getroottree(), )
+        
+        for tag_rule in self._tag_rules:
+            
+            nodes = tag_rule.GetLXMLNodes( nodes )
+            
+        
+        return nodes
+        
+    
     def _GetParsePrettySeparator( self ):
         
         if self._content_to_fetch == HTML_CONTENT_HTML:
@@ -886,6 +1172,66 @@ class ParseFormulaHTML( ParseFormula ):
         return result
         
     
+    def _GetRawTextFromLXMLNode( self, node ):
+        
+        if isinstance( node, lxml.etree._ElementTree ):
+            
+            node = node.getroot()
+            
+            if self._content_to_fetch == HTML_CONTENT_ATTRIBUTE:
+                
+                raise HydrusExceptions.ParseException( 'Attribute ' + self._attribute_to_fetch + ' not found!' )
+                
+            
+        
+        if self._content_to_fetch == HTML_CONTENT_ATTRIBUTE:
+            
+            result = node.get( self._attribute_to_fetch )
+            
+            if result is None:
+                
+                raise HydrusExceptions.ParseException( 'Attribute ' + self._attribute_to_fetch + ' not found!' )
+                
+            
+            if IsMultiValuedHTMLAttribute( node.tag, self._attribute_to_fetch ):
+                
+                result = ' '.join( result.split() )
+                
+            
+        elif self._content_to_fetch == HTML_CONTENT_STRING:
+            
+            result = GetLXMLNodeString( node )
+            
+        
+        if result is None or result == '':
+            
+            raise HydrusExceptions.ParseException( 'Empty/No results found!' )
+            
+        
+        return result
+        
+    
+    def _GetRawTextsFromLXMLNodes( self, nodes ):
+        
+        raw_texts = []
+        
+        for node in nodes:
+            
+            try:
+                
+                raw_text = self._GetRawTextFromLXMLNode( node )
+                
+                raw_texts.append( raw_text )
+                
+            except HydrusExceptions.ParseException:
+                
+                continue
+                
+            
+        
+        return raw_texts
+        
+    
     def _GetRawTextsFromTags( self, tags ):
         
         raw_texts = []
@@ -929,6 +1275,27 @@ class ParseFormulaHTML( ParseFormula ):
     
     def _ParseRawTexts( self, parsing_context, parsing_text ):
         
+        if self._CanUseLXML():
+            
+            try:
+                
+                root = HG.client_controller.parsing_cache.GetLXMLTree( parsing_text )
+                
+            except Exception:
+                
+                root = None # lxml will not take some odd or empty documents, so leave it to the soup
+                
+            
+            if root is not None:
+                
+                nodes = self._FindLXMLNodes( root )
+                
+                raw_texts = self._GetRawTextsFromLXMLNodes( nodes )
+                
+                return raw_texts
+                
+            
+        
         try:
             
             root = HG.client_controller.parsing_cache.GetSoup( parsing_text )
@@ -1152,6 +1519,82 @@ class ParseRuleHTML( HydrusSerialisable.SerialisableBase ):
         
         
     
+    def _GetAttributeXPathPredicate( self, key, value ):
+        
+        literal = ConvertStringToXPathLiteral( value )
+        
+        if IsMultiValuedHTMLAttribute( self._tag_name, key ):
+            
+            predicate = 'normalize-space(@' + key + ')=' + literal
+            
+            if len( value ) > 0 and len( value.split() ) == 1:
+                
+                predicate += ' or contains(concat(" ", normalize-space(@' + key + '), " "), concat(" ", ' + literal + ', " "))'
+                
+            
+        else:
+            
+            predicate = '@' + key + '=' + literal
+            
+        
+        return '[' + predicate + ']'
+        
+    
+    def _GetXPath( self ):
+        
+        # this is the xpath for a single step from a single node, so it gives the same nodes as GetNodes would for that node
+        
+        if self._tag_name is None:
+            
+            name_test = '*'
+            
+        elif isinstance( self._tag_name, str ) and XPATH_NAME_RE.match( self._tag_name ) is not None:
+            
+            name_test = self._tag_name
+            
+        else:
+            
+            return None
+            
+        
+        if self._rule_type == HTML_RULE_TYPE_DESCENDING:
+            
+            xpath = 'descendant::' + name_test
+            
+            for ( key, value ) in sorted( self._tag_attributes.items() ):
+                
+                if not isinstance( key, str ) or XPATH_NAME_RE.match( key ) is None or not isinstance( value, str ) or value == '':
+                    
+                    return None
+                    
+                
+                if self._tag_name is None and not IsMultiValuedHTMLAttribute( None, key ) and True in ( key in keys for keys in HTML_MULTI_VALUED_ATTRIBUTES.values() ):
+                    
+                    # bs4 splits this one for some tags but not others, which one xpath step cannot follow
+                    
+                    return None
+                    
+                
+                xpath += self._GetAttributeXPathPredicate( key, value )
+                
+            
+            if self._tag_index is not None:
+                
+                xpath += '[' + str( self._tag_index + 1 ) + ']'
+                
+            
+        elif self._rule_type == HTML_RULE_TYPE_ASCENDING:
+            
+            xpath = 'ancestor::' + name_test + '[' + str( self._tag_depth ) + ']'
+            
+        else:
+            
+            return None
+            
+        
+        return xpath
+        
+    
     def _GetSerialisableInfo( self ):
         
         serialisable_tag_string_string_match = self._tag_string_string_match.GetSerialisableTuple()
@@ -1184,6 +1627,55 @@ class ParseRuleHTML( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def CanCompileToXPath( self ):
+        
+        return self._GetXPath() is not None
+        
+    
+    def GetLXMLNodes( self, nodes ):
+        
+        xpath = self._GetXPath()
+        
+        relative_xpath = lxml.etree.XPath( xpath )
+        document_xpath = lxml.etree.XPath( '/' + xpath ) # xpath on an ElementTree is otherwise relative to the root element
+        
+        new_nodes = []
+        
+        for node in nodes:
+            
+            if isinstance( node, lxml.etree._ElementTree ):
+                
+                if self._rule_type == HTML_RULE_TYPE_DESCENDING:
+                    
+                    new_nodes.extend( document_xpath( node ) )
+                    
+                
+            else:
+                
+                found_nodes = relative_xpath( node )
+                
+                if len( found_nodes ) == 0 and self._rule_type == HTML_RULE_TYPE_ASCENDING and self._tag_name is None:
+                    
+                    # the soup counts the document itself as one more level above <html>, but xpath will not return it
+                    
+                    if len( list( node.iterancestors() ) ) + 1 == self._tag_depth:
+                        
+                        found_nodes = [ node.getroottree() ]
+                        
+                    
+                
+                new_nodes.extend( found_nodes )
+                
+            
+        
+        if self._should_test_tag_string:
+            
+            new_nodes = [ node for node in new_nodes if self._tag_string_string_match.Matches( GetLXMLNodeString( node ) ) ]
+            
+        
+        return new_nodes
+        
+    
     def GetNodes( self, nodes ):
         
         new_nodes = []
@@ -2133,7 +2625,7 @@ class PageParser( HydrusSerialisable.SerialisableBaseNamed ):
         return self._string_converter
         
     
-    def Parse( self, parsing_context, parsing_text ):
+    def Parse( self, parsing_context, parsing_text, content_parser_timings = None ):
         
         try:
             
@@ -2161,7 +2653,18 @@ class PageParser( HydrusSerialisable.SerialisableBaseNamed ):
             
             for content_parser in self._content_parsers:
                 
-                whole_page_parse_results.extend( content_parser.Parse( parsing_context, converted_parsing_text ) )
+                if content_parser_timings is None:
+                    
+                    whole_page_parse_results.extend( content_parser.Parse( parsing_context, converted_parsing_text ) )
+                    
+                else:
+                    
+                    time_started = time.perf_counter()
+                    
+                    whole_page_parse_results.extend( content_parser.Parse( parsing_context, converted_parsing_text ) )
+                    
+                    content_parser_timings[ ( self._name, content_parser.GetName() ) ] += time.perf_counter() - time_started
+                    
                 
             
         except HydrusExceptions.ParseException as e:
@@ -2207,7 +2710,7 @@ class PageParser( HydrusSerialisable.SerialisableBaseNamed ):
                         
                         try:
                             
-                            page_parser_all_parse_results = page_parser.Parse( parsing_context, post )
+                            page_parser_all_parse_results = page_parser.Parse( parsing_context, post, content_parser_timings = content_parser_timings )
                             
                         except HydrusExceptions.VetoException:
                             
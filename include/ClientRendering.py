@@ -8,6 +8,9 @@ from . import HydrusImageHandling
 from . import HydrusGlobals as HG
 from . import HydrusThreading
 from . import HydrusVideoHandling
+import bisect
+import math
+import numpy
 import os
 import threading
 import time
@@ -77,10 +80,9 @@ def GenerateHydrusBitmapFromPILImage( pil_image, compressed = True ):
     
 class ImageRenderer( object ):
     
-    def __init__( self, media ):
+    def __init__( self, media, target_resolution = None ):
         
         self._media = media
-        self._numpy_image = None
         
         self._hash = self._media.GetHash()
         self._mime = self._media.GetMime()
@@ -89,27 +91,107 @@ class ImageRenderer( object ):
         
         self._path = client_files_manager.GetFilePath( self._hash, self._mime )
         
-        HG.client_controller.CallToThread( self._Initialise )
+        self._lock = threading.Lock()
+        
+        # reduction : numpy_image. the finest level is what we decoded, the coarser ones are built from it as zooms ask for them
+        self._pyramid = {}
+        
+        self._decode_reductions_requested = set()
+        
+        if target_resolution is None:
+            
+            target_resolution = self.GetResolution()
+            
+        
+        self._initial_reduction = self._GetDecodeReduction( target_resolution )
+        
+        self._StartDecode( self._initial_reduction )
+        
+    
+    def _GetBestLevel( self, target_resolution ):
+        
+        ideal_reduction = self._GetPyramidReduction( target_resolution )
+        
+        if ideal_reduction in self._pyramid:
+            
+            return self._pyramid[ ideal_reduction ]
+            
+        
+        finer_reductions = [ reduction for reduction in self._pyramid.keys() if reduction < ideal_reduction ]
+        
+        if len( finer_reductions ) == 0:
+            
+            # we have not decoded anything fine enough yet, so make do with the best we have
+            
+            return self._pyramid[ min( self._pyramid.keys() ) ]
+            
+        
+        reduction = max( finer_reductions )
+        
+        numpy_image = self._pyramid[ reduction ]
+        
+        while reduction < ideal_reduction:
+            
+            ( level_width, level_height ) = HydrusImageHandling.GetResolutionNumPy( numpy_image )
+            
+            numpy_image = HydrusImageHandling.ShrinkNumPyImage( numpy_image, ( max( 1, level_width // 2 ), max( 1, level_height // 2 ) ) )
+            
+            reduction *= 2
+            
+            self._pyramid[ reduction ] = numpy_image
+            
+        
+        return numpy_image
         
     
-    def _Initialise( self ):
+    def _GetDecodeReduction( self, target_resolution ):
         
-        self._numpy_image = ClientImageHandling.GenerateNumPyImage( self._path, self._mime )
+        return HydrusImageHandling.GetDecodeReduction( self.GetResolution(), target_resolution )
         
     
-    def GetEstimatedMemoryFootprint( self ):
+    def _GetPyramidReduction( self, target_resolution ):
+        
+        ( width, height ) = self.GetResolution()
         
-        if self._numpy_image is None:
+        if width is None or height is None:
             
-            ( width, height ) = self.GetResolution()
+            return 1
             
-            return width * height * 3
+        
+        return HydrusImageHandling.GetDecodeReduction( ( width, height ), target_resolution, max_reduction = max( width, height ) )
+        
+    
+    def _Initialise( self, reduction ):
+        
+        numpy_image = ClientImageHandling.GenerateNumPyImage( self._path, self._mime, reduction = reduction )
+        
+        with self._lock:
             
-        else:
+            self._pyramid[ reduction ] = numpy_image
             
-            ( height, width, depth ) = self._numpy_image.shape
+        
+    
+    def _StartDecode( self, reduction ):
+        
+        self._decode_reductions_requested.add( reduction )
+        
+        HG.client_controller.CallToThreadPriority( HydrusThreading.CALL_PRIORITY_UI, self._Initialise, reduction )
+        
+    
+    def GetEstimatedMemoryFootprint( self ):
+        
+        with self._lock:
             
-            return height * width * depth
+            if len( self._pyramid ) == 0:
+                
+                ( width, height ) = self.GetResolution()
+                
+                return ( width // self._initial_reduction ) * ( height // self._initial_reduction ) * 3
+                
+            else:
+                
+                return sum( ( numpy_image.nbytes for numpy_image in self._pyramid.values() ) )
+                
             
         
     
@@ -119,17 +201,54 @@ class ImageRenderer( object ):
     
     def GetResolution( self ): return self._media.GetResolution()
     
-    def GetWXBitmap( self, target_resolution = None ):
+    def GetWXBitmap( self, target_resolution = None, clip_rect = None ):
         
-        # add region param to this to allow clipping before resize
+        # clip_rect is ( x, y, width, height ) in target_resolution coordinates, so a huge zoomed image only renders what is on screen
+        
+        with self._lock:
+            
+            if target_resolution is None:
+                
+                numpy_image = self._pyramid[ min( self._pyramid.keys() ) ]
+                
+            else:
+                
+                numpy_image = self._GetBestLevel( target_resolution )
+                
+            
         
         if target_resolution is None:
             
-            wx_numpy_image = self._numpy_image
+            wx_numpy_image = numpy_image
             
         else:
             
-            wx_numpy_image = ClientImageHandling.ResizeNumPyImageForMediaViewer( self._media.GetMime(), self._numpy_image, target_resolution )
+            ( target_width, target_height ) = target_resolution
+            
+            if clip_rect is None:
+                
+                clip_rect = ( 0, 0, target_width, target_height )
+                
+            
+            ( clip_x, clip_y, clip_width, clip_height ) = clip_rect
+            
+            ( level_width, level_height ) = HydrusImageHandling.GetResolutionNumPy( numpy_image )
+            
+            x_scale = level_width / target_width
+            y_scale = level_height / target_height
+            
+            left = min( level_width - 1, int( clip_x * x_scale ) )
+            top = min( level_height - 1, int( clip_y * y_scale ) )
+            right = max( left + 1, min( level_width, int( math.ceil( ( clip_x + clip_width ) * x_scale ) ) ) )
+            bottom = max( top + 1, min( level_height, int( math.ceil( ( clip_y + clip_height ) * y_scale ) ) ) )
+            
+            numpy_image = numpy_image[ top : bottom, left : right ]
+            
+            wx_numpy_image = ClientImageHandling.ResizeNumPyImageForMediaViewer( self._mime, numpy_image, ( clip_width, clip_height ) )
+            
+            # a clip that needed no resize is still a view into the bigger image, but wx wants a flat buffer
+            
+            wx_numpy_image = numpy.ascontiguousarray( wx_numpy_image )
             
         
         ( wx_height, wx_width, wx_depth ) = wx_numpy_image.shape
@@ -146,9 +265,41 @@ class ImageRenderer( object ):
             
         
     
-    def IsReady( self ):
+    def IsInitialised( self ):
         
-        return self._numpy_image is not None
+        with self._lock:
+            
+            return len( self._pyramid ) > 0
+            
+        
+    
+    def IsReady( self, target_resolution = None ):
+        
+        # if we have only decoded a reduced version so far, asking for more detail kicks off a finer decode
+        
+        if target_resolution is None:
+            
+            target_resolution = self.GetResolution()
+            
+        
+        needed_reduction = self._GetDecodeReduction( target_resolution )
+        
+        with self._lock:
+            
+            # the finest level is always a decoded one
+            
+            if len( self._pyramid ) > 0 and min( self._pyramid.keys() ) <= needed_reduction:
+                
+                return True
+                
+            
+            if needed_reduction not in self._decode_reductions_requested:
+                
+                self._StartDecode( needed_reduction )
+                
+            
+            return False
+            
         
     
 class RasterContainer( object ):
@@ -208,6 +359,8 @@ class RasterContainerVideo( RasterContainer ):
         
         self._renderer = None
         
+        self._keyframe_indices = None
+        
         self._frames = {}
         
         self._buffer_start_index = -1
@@ -271,7 +424,24 @@ class RasterContainerVideo( RasterContainer ):
         self._rendered_first_frame = False
         self._ideal_next_frame = 0
         
-        HG.client_controller.CallToThread( self.THREADRender )
+        HG.client_controller.CallToThreadPriority( HydrusThreading.CALL_PRIORITY_UI, self.THREADRender )
+        
+    
+    def _GetKeyframeIndexBefore( self, index ):
+        
+        if self._keyframe_indices is None:
+            
+            return 0
+            
+        
+        i = bisect.bisect_right( self._keyframe_indices, index )
+        
+        if i == 0:
+            
+            return 0
+            
+        
+        return self._keyframe_indices[ i - 1 ]
         
     
     def _HasFrame( self, index ):
@@ -294,6 +464,54 @@ class RasterContainerVideo( RasterContainer ):
             
         
     
+    def THREADLoadKeyframeIndex( self ):
+        
+        hash = self._media.GetHash()
+        
+        timestamps_ms = HG.client_controller.Read( 'video_keyframe_timestamps', hash )
+        
+        if timestamps_ms is None:
+            
+            # first play, so make the index now. it is saved, so we only ever pay this once
+            
+            try:
+                
+                timestamps_ms = HydrusVideoHandling.GetFFMPEGKeyframeTimestamps( self._path )
+                
+            except Exception as e:
+                
+                HydrusData.Print( 'Could not generate a keyframe index for ' + hash.hex() + ':' )
+                
+                HydrusData.PrintException( e, do_wait = False )
+                
+                return
+                
+            
+            HG.client_controller.Write( 'video_keyframe_timestamps', hash, timestamps_ms )
+            
+        
+        if len( timestamps_ms ) == 0:
+            
+            return
+            
+        
+        num_frames_in_video = self.GetNumFrames()
+        
+        keyframe_indices = sorted( { min( num_frames_in_video - 1, int( round( timestamp_ms / self._average_frame_duration ) ) ) for timestamp_ms in timestamps_ms } )
+        
+        with self._lock:
+            
+            self._keyframe_indices = keyframe_indices
+            
+            renderer = self._renderer
+            
+            if renderer is not None:
+                
+                renderer.SetKeyframeIndices( keyframe_indices )
+                
+            
+        
+    
     def THREADRender( self ):
         
         hash = self._media.GetHash()
@@ -315,6 +533,8 @@ class RasterContainerVideo( RasterContainer ):
             
             self._renderer = HydrusVideoHandling.VideoRendererFFMPEG( self._path, mime, duration, num_frames_in_video, self._target_resolution )
             
+            HG.client_controller.CallToThread( self.THREADLoadKeyframeIndex )
+            
         
         # give ui a chance to draw a blank frame rather than hard-charge right into CPUland
         time.sleep( 0.00001 )
@@ -544,8 +764,9 @@ class RasterContainerVideo( RasterContainer ):
                 if current_ideal_is_out_of_buffer:
                     
                     # the current buffer won't get to where we want, so remake it
+                    # frames before the last keyframe cost a whole extra seek, so for a jump we start the new buffer no earlier than that
                     
-                    self._buffer_start_index = ideal_buffer_start_index
+                    self._buffer_start_index = max( ideal_buffer_start_index, self._GetKeyframeIndexBefore( self._ideal_next_frame ) )
                     self._buffer_end_index = ideal_buffer_end_index
                     
                 else:
@@ -1185,6 +1185,67 @@ class ServiceRepository( ServiceRestricted ):
         return dictionary
         
     
+    def _IterateRequestsInOrder( self, command, arg_name, hashes ):
+        
+        # a fresh sync can have thousands of small files to get, so one at a time spends most of its time waiting on round trips
+        # this keeps a few requests in flight at once--the network engine still applies its per-domain limit and bandwidth rules--but yields the responses in the order they were asked for
+        # only a few responses are ever held, and nothing new starts once the caller stops iterating
+        
+        num_in_flight = max( 1, HG.client_controller.new_options.GetInteger( 'max_network_jobs_per_domain' ) )
+        
+        indices_to_results = {}
+        
+        condition = threading.Condition()
+        
+        def do_it( index, hash ):
+            
+            try:
+                
+                result = ( self.Request( HC.GET, command, { arg_name : hash } ), None )
+                
+            except Exception as e:
+                
+                result = ( None, e )
+                
+            
+            with condition:
+                
+                indices_to_results[ index ] = result
+                
+                condition.notify_all()
+                
+            
+        
+        next_index_to_start = 0
+        
+        for index in range( len( hashes ) ):
+            
+            while next_index_to_start < min( index + num_in_flight, len( hashes ) ):
+                
+                HG.client_controller.CallToThread( do_it, next_index_to_start, hashes[ next_index_to_start ] )
+                
+                next_index_to_start += 1
+                
+            
+            with condition:
+                
+                while index not in indices_to_results:
+                    
+                    condition.wait()
+                    
+                
+                ( response, e ) = indices_to_results.pop( index )
+                
+            
+            if e is not None:
+                
+                raise e
+                
+            
+            yield response
+            
+        
+    
     def _LoadFromDictionary( self, dictionary ):
         
         ServiceRestricted._LoadFromDictionary( self, dictionary )
@@ -1345,6 +1406,8 @@ class ServiceRepository( ServiceRestricted ):
                 
                 HG.client_controller.pub( 'message', job_key )
                 
+                update_network_strings = self._IterateRequestsInOrder( 'update', 'update_hash', update_hashes )
+                
                 for ( i, update_hash ) in enumerate( update_hashes ):
                     
                     status = 'update ' + HydrusData.ConvertValueRangeToPrettyString( i + 1, len( update_hashes ) )
@@ -1375,7 +1438,7 @@ class ServiceRepository( ServiceRestricted ):
                     
                     try:
                         
-                        update_network_string = self.Request( HC.GET, 'update', { 'update_hash' : update_hash } )
+                        update_network_string = next( update_network_strings )
                         
                     except HydrusExceptions.CancelledException as e:
                         
@@ -1632,6 +1695,8 @@ class ServiceRepository( ServiceRestricted ):
                 
                 HG.client_controller.pub( 'message', job_key )
                 
+                thumbnails_bytes = self._IterateRequestsInOrder( 'thumbnail', 'hash', thumbnail_hashes )
+                
                 for ( i, thumbnail_hash ) in enumerate( thumbnail_hashes ):
                     
                     status = 'thumbnail ' + HydrusData.ConvertValueRangeToPrettyString( i + 1, num_to_do )
@@ -1662,7 +1727,7 @@ class ServiceRepository( ServiceRestricted ):
                     
                     try:
                         
-                        thumbnail_bytes = self.Request( HC.GET, 'thumbnail', { 'hash' : thumbnail_hash } )
+                        thumbnail_bytes = next( thumbnails_bytes )
                         
                     except HydrusExceptions.CancelledException as e:
                         
@@ -70,11 +70,22 @@ class GIFRenderer( object ):
             
         
     
-    def _GetCurrentFrame( self ):
+    def _GetCurrentFrame( self, render = True ):
+        
+        # when we are just skipping ahead, we only need to move the decoder on, not make an image
         
         if self._cv_mode:
             
-            ( retval, numpy_image ) = self._cv_video.read()
+            if render:
+                
+                ( retval, numpy_image ) = self._cv_video.read()
+                
+            else:
+                
+                retval = self._cv_video.grab()
+                
+                numpy_image = None
+                
             
             if not retval:
                 
@@ -103,7 +114,15 @@ class GIFRenderer( object ):
                 self._pil_canvas = current_frame
                 
             
-            numpy_image = HydrusImageHandling.GenerateNumPyImageFromPILImage( self._pil_canvas )
+            if render:
+                
+                numpy_image = HydrusImageHandling.GenerateNumPyImageFromPILImage( self._pil_canvas )
+                
+            else:
+                
+                numpy_image = None
+                
+            
             
         
         self._next_render_index = ( self._next_render_index + 1 ) % self._num_frames
@@ -247,7 +266,7 @@ class GIFRenderer( object ):
         if index == self._next_render_index: return
         elif index < self._next_render_index: self._RewindGIF()
         
-        while self._next_render_index < index: self._GetCurrentFrame()
+        while self._next_render_index < index: self._GetCurrentFrame( render = False )
         
         #self._cv_video.set( CV_CAP_PROP_POS_FRAMES, index )
         
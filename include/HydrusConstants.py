@@ -67,7 +67,7 @@ options = {}
 # Misc
 
 NETWORK_VERSION = 18
-SOFTWARE_VERSION = 357
+SOFTWARE_VERSION = 359
 CLIENT_API_VERSION = 8
 
 SERVER_THUMBNAIL_DIMENSIONS = ( 200, 200 )
@@ -10,7 +10,6 @@ from . import HydrusPaths
 from . import HydrusPubSub
 from . import HydrusThreading
 import os
-import random
 import sys
 import threading
 import time
@@ -46,7 +45,7 @@ class HydrusController( object ):
         
         self._thread_slot_lock = threading.Lock()
         
-        self._call_to_threads = []
+        self._call_to_thread_pool = HydrusThreading.CallToThreadPool( self, 'CallToThread' )
         self._long_running_call_to_threads = []
         
         self._thread_pool_busy_status_text = ''
@@ -69,39 +68,6 @@ class HydrusController( object ):
         self.CallToThreadLongRunning( self.DAEMONPubSub )
         
     
-    def _GetCallToThread( self ):
-        
-        with self._call_to_thread_lock:
-            
-            for call_to_thread in self._call_to_threads:
-                
-                if not call_to_thread.CurrentlyWorking():
-                    
-                    return call_to_thread
-                    
-                
-            
-            # all the threads in the pool are currently busy
-            
-            calling_from_the_thread_pool = threading.current_thread() in self._call_to_threads
-            
-            if calling_from_the_thread_pool or len( self._call_to_threads ) < 200:
-                
-                call_to_thread = HydrusThreading.THREADCallToThread( self, 'CallToThread' )
-                
-                self._call_to_threads.append( call_to_thread )
-                
-                call_to_thread.start()
-                
-            else:
-                
-                call_to_thread = random.choice( self._call_to_threads )
-                
-            
-            return call_to_thread
-            
-        
-    
     def _GetCallToThreadLongRunning( self ):
         
         with self._call_to_thread_lock:
@@ -172,8 +138,6 @@ class HydrusController( object ):
                     
                 
             
-            self._call_to_threads = list(filter( filter_call_to_threads, self._call_to_threads ))
-            
             self._long_running_call_to_threads = list(filter( filter_call_to_threads, self._long_running_call_to_threads ))
             
         
@@ -295,6 +259,11 @@ class HydrusController( object ):
     
     def CallToThread( self, callable, *args, **kwargs ):
         
+        self.CallToThreadPriority( HydrusThreading.CALL_PRIORITY_NORMAL, callable, *args, **kwargs )
+        
+    
+    def CallToThreadLongRunning( self, callable, *args, **kwargs ):
+        
         if HG.callto_report_mode:
             
             what_to_report = [ callable ]
@@ -312,12 +281,12 @@ class HydrusController( object ):
             HydrusData.ShowText( tuple( what_to_report ) )
             
         
-        call_to_thread = self._GetCallToThread()
+        call_to_thread = self._GetCallToThreadLongRunning()
         
         call_to_thread.put( callable, *args, **kwargs )
         
     
-    def CallToThreadLongRunning( self, callable, *args, **kwargs ):
+    def CallToThreadPriority( self, priority, callable, *args, **kwargs ):
         
         if HG.callto_report_mode:
             
@@ -336,9 +305,7 @@ class HydrusController( object ):
             HydrusData.ShowText( tuple( what_to_report ) )
             
         
-        call_to_thread = self._GetCallToThreadLongRunning()
-        
-        call_to_thread.put( callable, *args, **kwargs )
+        self._call_to_thread_pool.put( priority, callable, *args, **kwargs )
         
     
     def ClearCaches( self ):
@@ -410,10 +377,7 @@ class HydrusController( object ):
         
         if HydrusData.TimeHasPassed( self._thread_pool_busy_status_text_new_check_time ):
             
-            with self._call_to_thread_lock:
-                
-                num_threads = sum( ( 1 for t in self._call_to_threads if t.CurrentlyWorking() ) )
-                
+            num_threads = self._call_to_thread_pool.GetNumWorking()
             
             if num_threads < 4:
                 
@@ -438,12 +402,17 @@ class HydrusController( object ):
         return self._thread_pool_busy_status_text
         
     
+    def GetThreadPoolStats( self ):
+        
+        return self._call_to_thread_pool.GetStats()
+        
+    
     def GetThreadsSnapshot( self ):
         
         threads = []
         
         threads.extend( self._daemons )
-        threads.extend( self._call_to_threads )
+        threads.extend( self._call_to_thread_pool.GetWorkers() )
         threads.extend( self._long_running_call_to_threads )
         
         threads.append( self._slow_job_scheduler )
@@ -652,6 +621,16 @@ class HydrusController( object ):
         return False
         
     
+    def SetThreadPoolSize( self, num_threads ):
+        
+        if num_threads is None:
+            
+            num_threads = HydrusThreading.GetDefaultCallToThreadPoolSize()
+            
+        
+        self._call_to_thread_pool.SetNumThreads( num_threads )
+        
+    
     def ShutdownModel( self ):
         
         if self.db is not None:
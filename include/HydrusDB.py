@@ -13,6 +13,36 @@ import time
 
 CONNECTION_REFRESH_TIME = 60 * 30
 
+def BackupDBOnline( source_db, db_name, dest_path, pages_per_step = 1024, pause_per_step = 0.01 ):
+    
+    # source_db should be holding a read transaction open, so every step copies from the same snapshot and the backup never restarts
+    # we pause between steps to give the disk back to the live db
+    
+    def progress( status, remaining, total ):
+        
+        time.sleep( pause_per_step )
+        
+    
+    temp_path = dest_path + '.temp'
+    
+    if os.path.exists( temp_path ):
+        
+        os.remove( temp_path )
+        
+    
+    dest_db = sqlite3.connect( temp_path, isolation_level = None )
+    
+    try:
+        
+        source_db.backup( dest_db, pages = pages_per_step, progress = progress, name = db_name )
+        
+    finally:
+        
+        dest_db.close()
+        
+    
+    os.replace( temp_path, dest_path )
+    
 def CanVacuum( db_path, stop_time = None ):
     
     try:
@@ -185,6 +215,8 @@ class HydrusDB( object ):
         self._current_status = ''
         self._current_job_name = ''
         
+        self._total_job_time = 0.0
+        
         self._db = None
         self._c = None
         
@@ -784,6 +816,11 @@ class HydrusDB( object ):
         return ( self._current_status, self._current_job_name )
         
     
+    def GetTotalJobTime( self ):
+        
+        return self._total_job_time
+        
+    
     def IsDBUpdated( self ):
         
         return self._is_db_updated
@@ -836,6 +873,8 @@ class HydrusDB( object ):
                 self._currently_doing_job = True
                 self._current_job_name = job.ToString()
                 
+                job_started = HydrusData.GetNowPrecise()
+                
                 self.publish_status_update()
                 
                 try:
@@ -876,6 +915,8 @@ class HydrusDB( object ):
                     time.sleep( 5 )
                     
                 
+                self._total_job_time += HydrusData.GetNowPrecise() - job_started
+                
                 self._currently_doing_job = False
                 self._current_job_name = ''
                 
@@ -984,3 +1025,57 @@ class TemporaryIntegerTable( object ):
         return False
         
     
+class TemporaryBlobTable( object ):
+    
+    def __init__( self, cursor, blob_iterable, column_name ):
+        
+        self._cursor = cursor
+        self._blob_iterable = blob_iterable
+        self._column_name = column_name
+        
+        self._table_name = 'mem.tempblob' + os.urandom( 32 ).hex()
+        
+    
+    def __enter__( self ):
+        
+        self._cursor.execute( 'CREATE TABLE ' + self._table_name + ' ( ' + self._column_name + ' BLOB_BYTES PRIMARY KEY );' )
+        
+        self._cursor.executemany( 'INSERT OR IGNORE INTO ' + self._table_name + ' ( ' + self._column_name + ' ) VALUES ( ? );', ( ( sqlite3.Binary( b ), ) for b in self._blob_iterable ) )
+        
+        return self._table_name
+        
+    
+    def __exit__( self, exc_type, exc_val, exc_tb ):
+        
+        self._cursor.execute( 'DROP TABLE ' + self._table_name + ';' )
+        
+        return False
+        
+    
+class TemporaryTextTable( object ):
+    
+    def __init__( self, cursor, text_iterable, column_name ):
+        
+        self._cursor = cursor
+        self._text_iterable = text_iterable
+        self._column_name = column_name
+        
+        self._table_name = 'mem.temptext' + os.urandom( 32 ).hex()
+        
+    
+    def __enter__( self ):
+        
+        self._cursor.execute( 'CREATE TABLE ' + self._table_name + ' ( ' + self._column_name + ' TEXT PRIMARY KEY );' )
+        
+        self._cursor.executemany( 'INSERT OR IGNORE INTO ' + self._table_name + ' ( ' + self._column_name + ' ) VALUES ( ? );', ( ( t, ) for t in self._text_iterable ) )
+        
+        return self._table_name
+        
+    
+    def __exit__( self, exc_type, exc_val, exc_tb ):
+        
+        self._cursor.execute( 'DROP TABLE ' + self._table_name + ';' )
+        
+        return False
+        
+    
@@ -254,38 +254,32 @@ def GetMime( path ):
         bit_to_check = f.read( 256 )
         
     
-    for ( offset, header, mime ) in header_and_mime:
+    mime = GetMimeFromHeader( bit_to_check )
+    
+    if mime == HC.UNDETERMINED_WM:
         
-        offset_bit_to_check = bit_to_check[ offset: ]
+        if HydrusVideoHandling.HasVideoStream( path ):
+            
+            return HC.VIDEO_WMV
+            
         
-        if offset_bit_to_check.startswith( header ):
+        # we'll catch and verify wma later
+        
+    elif mime == HC.UNDETERMINED_PNG:
+        
+        if HydrusVideoHandling.HasVideoStream( path ):
             
-            if mime == HC.UNDETERMINED_WM:
-                
-                if HydrusVideoHandling.HasVideoStream( path ):
-                    
-                    return HC.VIDEO_WMV
-                    
-                
-                # we'll catch and verify wma later
-                
-            elif mime == HC.UNDETERMINED_PNG:
-                
-                if HydrusVideoHandling.HasVideoStream( path ):
-                    
-                    return HC.IMAGE_APNG
-                    
-                else:
-                    
-                    return HC.IMAGE_PNG
-                    
-                
-            else:
-                
-                return mime
-                
+            return HC.IMAGE_APNG
+            
+        else:
+            
+            return HC.IMAGE_PNG
             
         
+    elif mime is not None:
+        
+        return mime
+        
     
     try:
         
@@ -313,3 +307,90 @@ def GetMime( path ):
     
     return HC.APPLICATION_UNKNOWN
     
+def GetMimeFromHeader( bit_to_check ):
+    
+    # this only looks at the first few bytes, so it can't tell png from apng or wmv from wma--the undetermined mimes are returned for those
+    
+    for ( offset, header, mime ) in header_and_mime:
+        
+        offset_bit_to_check = bit_to_check[ offset: ]
+        
+        if offset_bit_to_check.startswith( header ):
+            
+            return mime
+            
+        
+    
+    return None
+    
+class FileHasher( object ):
+    
+    def __init__( self ):
+        
+        self._h_sha256 = hashlib.sha256()
+        self._h_md5 = hashlib.md5()
+        self._h_sha1 = hashlib.sha1()
+        self._h_sha512 = hashlib.sha512()
+        
+        self._header = b''
+        self._num_bytes = 0
+        
+    
+    def AddBlock( self, block ):
+        
+        self._h_sha256.update( block )
+        self._h_md5.update( block )
+        self._h_sha1.update( block )
+        self._h_sha512.update( block )
+        
+        if len( self._header ) < 256:
+            
+            self._header += block[ : 256 - len( self._header ) ]
+            
+        
+        self._num_bytes += len( block )
+        
+    
+    def GetExtraHashes( self ):
+        
+        return ( self._h_md5.digest(), self._h_sha1.digest(), self._h_sha512.digest() )
+        
+    
+    def GetHash( self ):
+        
+        return self._h_sha256.digest()
+        
+    
+    def GetNumBytes( self ):
+        
+        return self._num_bytes
+        
+    
+    def GetPossibleMime( self ):
+        
+        mime = GetMimeFromHeader( self._header )
+        
+        if mime == HC.UNDETERMINED_PNG:
+            
+            return HC.IMAGE_PNG
+            
+        elif mime == HC.UNDETERMINED_WM:
+            
+            return None
+            
+        
+        return mime
+        
+    
+    def IsStillValidFor( self, path ):
+        
+        # bmps get converted to png in place before import, which invalidates everything we hashed
+        
+        if GetMimeFromHeader( self._header ) == HC.IMAGE_BMP:
+            
+            return False
+            
+        
+        return os.path.exists( path ) and os.path.getsize( path ) == self._num_bytes
+        
+    
@@ -65,12 +65,27 @@ try:
         CV_PNG_THUMBNAIL_ENCODE_PARAMS = [ cv2.IMWRITE_PNG_COMPRESSION, 9 ]
         
     
+    # these let libjpeg do the downscale in the DCT, so we never hold the full image in memory
+    
+    CV_IMREAD_REDUCED_JPEG_FLAGS = {}
+    
+    if hasattr( cv2, 'IMREAD_REDUCED_COLOR_2' ):
+        
+        CV_IMREAD_REDUCED_JPEG_FLAGS[ 2 ] = cv2.IMREAD_REDUCED_COLOR_2
+        CV_IMREAD_REDUCED_JPEG_FLAGS[ 4 ] = cv2.IMREAD_REDUCED_COLOR_4
+        CV_IMREAD_REDUCED_JPEG_FLAGS[ 8 ] = cv2.IMREAD_REDUCED_COLOR_8
+        
+    
     OPENCV_OK = True
     
 except:
     
     OPENCV_OK = False
     
+    CV_IMREAD_REDUCED_JPEG_FLAGS = {}
+    
+
+MAX_DECODE_REDUCTION = 8
 
 def ConvertToPngIfBmp( path ):
     
@@ -119,7 +134,7 @@ def Dequantize( pil_image ):
     
     return pil_image
     
-def GenerateNumPyImage( path, mime, force_pil = False ):
+def GenerateNumPyImage( path, mime, force_pil = False, reduction = 1 ):
     
     if HG.media_load_report_mode:
         
@@ -138,10 +153,12 @@ def GenerateNumPyImage( path, mime, force_pil = False ):
             HydrusData.ShowText( 'Loading with PIL' )
             
         
-        pil_image = GeneratePILImage( path )
+        pil_image = GeneratePILImage( path, reduction = reduction )
         
         numpy_image = GenerateNumPyImageFromPILImage( pil_image )
         
+        reduced_natively = mime == HC.IMAGE_JPEG
+        
     else:
         
         if HG.media_load_report_mode:
@@ -149,7 +166,15 @@ def GenerateNumPyImage( path, mime, force_pil = False ):
             HydrusData.ShowText( 'Loading with OpenCV' )
             
         
-        if mime == HC.IMAGE_JPEG:
+        reduced_natively = False
+        
+        if mime == HC.IMAGE_JPEG and reduction in CV_IMREAD_REDUCED_JPEG_FLAGS:
+            
+            flags = CV_IMREAD_REDUCED_JPEG_FLAGS[ reduction ]
+            
+            reduced_natively = True
+            
+        elif mime == HC.IMAGE_JPEG:
             
             flags = CV_IMREAD_FLAGS_SUPPORTS_EXIF_REORIENTATION
             
@@ -167,10 +192,12 @@ def GenerateNumPyImage( path, mime, force_pil = False ):
                 HydrusData.ShowText( 'OpenCV Failed, loading with PIL' )
                 
             
-            pil_image = GeneratePILImage( path )
+            pil_image = GeneratePILImage( path, reduction = reduction )
             
             numpy_image = GenerateNumPyImageFromPILImage( pil_image )
             
+            reduced_natively = mime == HC.IMAGE_JPEG
+            
         else:
             
             if numpy_image.dtype == 'uint16':
@@ -206,6 +233,15 @@ def GenerateNumPyImage( path, mime, force_pil = False ):
             
         
     
+    if reduction > 1 and not reduced_natively:
+        
+        # formats without a native reduced decode come out at full size, so we shrink them here to keep what we hold small
+        
+        ( image_width, image_height ) = GetResolutionNumPy( numpy_image )
+        
+        numpy_image = ShrinkNumPyImage( numpy_image, ( max( 1, image_width // reduction ), max( 1, image_height // reduction ) ) )
+        
+    
     return numpy_image
     
 def GenerateNumPyImageFromPILImage( pil_image ):
@@ -218,7 +254,7 @@ def GenerateNumPyImageFromPILImage( pil_image ):
     
     return numpy.fromstring( s, dtype = 'uint8' ).reshape( ( h, w, len( s ) // ( w * h ) ) )
     
-def GeneratePILImage( path ):
+def GeneratePILImage( path, reduction = 1 ):
     
     fp = open( path, 'rb' )
     
@@ -235,6 +271,15 @@ def GeneratePILImage( path ):
         raise HydrusExceptions.MimeException( 'Could not load the image--it was likely malformed!' )
         
     
+    if reduction > 1 and pil_image.format == 'JPEG':
+        
+        # this has to happen before anything loads the pixels
+        
+        ( width, height ) = pil_image.size
+        
+        pil_image.draft( 'RGB', ( max( 1, width // reduction ), max( 1, height // reduction ) ) )
+        
+    
     if pil_image.format == 'JPEG' and hasattr( pil_image, '_getexif' ):
         
         try:
@@ -431,6 +476,27 @@ def GenerateThumbnailBytesPIL( pil_image, mime ):
     
     return thumbnail_bytes
     
+def GetDecodeReduction( image_resolution, target_resolution, max_reduction = MAX_DECODE_REDUCTION ):
+    
+    # the largest power of two we can shrink the image by and still cover the target
+    
+    ( image_width, image_height ) = image_resolution
+    ( target_width, target_height ) = target_resolution
+    
+    if image_width is None or image_height is None or target_width < 1 or target_height < 1:
+        
+        return 1
+        
+    
+    reduction = 1
+    
+    while reduction * 2 <= max_reduction and image_width // ( reduction * 2 ) >= target_width and image_height // ( reduction * 2 ) >= target_height:
+        
+        reduction *= 2
+        
+    
+    return reduction
+    
 def GetGIFFrameDurations( path ):
     
     pil_image = GeneratePILImage( path )
@@ -691,3 +757,18 @@ def ResizeNumPyImage( numpy_image, target_resolution ):
     
     return cv2.resize( numpy_image, ( target_width, target_height ), interpolation = interpolation )
     
+def ShrinkNumPyImage( numpy_image, target_resolution ):
+    
+    if OPENCV_OK:
+        
+        return cv2.resize( numpy_image, target_resolution, interpolation = cv2.INTER_AREA )
+        
+    else:
+        
+        pil_image = GeneratePILImageFromNumPyImage( numpy_image )
+        
+        pil_image = pil_image.resize( target_resolution, PILImage.ANTIALIAS )
+        
+        return GenerateNumPyImageFromPILImage( pil_image )
+        
+    
@@ -14,6 +14,8 @@ STRING_PARAMS = { 'subject_tag' }
 JSON_PARAMS = set()
 JSON_BYTE_LIST_PARAMS = set()
 
+METADATA_SLICE_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
 def GenerateDefaultServiceDictionary( service_type ):
     
     dictionary = HydrusSerialisable.SerialisableDictionary()
@@ -1645,6 +1647,14 @@ class Metadata( HydrusSerialisable.SerialisableBase ):
         
         self._update_hashes = set()
         
+        self._ClearSliceNetworkBytesCache()
+        
+    
+    def _ClearSliceNetworkBytesCache( self ):
+        
+        self._slice_network_bytes_cache = collections.OrderedDict()
+        self._slice_network_bytes_cache_size = 0
+        
     
     def _GetNextUpdateDueTime( self, from_client = False ):
         
@@ -1710,6 +1720,8 @@ class Metadata( HydrusSerialisable.SerialisableBase ):
             
             self._next_update_due = next_update_due
             
+            self._ClearSliceNetworkBytesCache()
+            
         
     
     def GetNextUpdateIndex( self ):
@@ -1778,6 +1790,44 @@ class Metadata( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def GetSliceNetworkBytes( self, from_update_index ):
+        
+        with self._lock:
+            
+            # every client asks for the same few slices after an update, so we serialise each once
+            # anything past the end is the same empty slice, and clamping stops silly values from filling the cache
+            
+            from_update_index = max( 0, min( from_update_index, len( self._metadata ) ) )
+            
+            if from_update_index in self._slice_network_bytes_cache:
+                
+                self._slice_network_bytes_cache.move_to_end( from_update_index )
+                
+                return self._slice_network_bytes_cache[ from_update_index ]
+                
+            
+            metadata = { update_index : row for ( update_index, row ) in list(self._metadata.items()) if update_index >= from_update_index }
+            
+            metadata_slice = Metadata( metadata, self._next_update_due )
+            
+            network_bytes = DumpHydrusArgsToNetworkBytes( { 'metadata_slice' : metadata_slice } )
+            
+            self._slice_network_bytes_cache[ from_update_index ] = network_bytes
+            self._slice_network_bytes_cache_size += len( network_bytes )
+            
+            # a big repo's early slices are many MB each, so old clients walking up from zero could otherwise hold one of everything
+            
+            while self._slice_network_bytes_cache_size > METADATA_SLICE_CACHE_MAX_BYTES:
+                
+                ( evicted_update_index, evicted_network_bytes ) = self._slice_network_bytes_cache.popitem( last = False )
+                
+                self._slice_network_bytes_cache_size -= len( evicted_network_bytes )
+                
+            
+            return network_bytes
+            
+        
+    
     def GetUpdateHashes( self, update_index = None ):
         
         with self._lock:
@@ -1892,6 +1942,8 @@ class Metadata( HydrusSerialisable.SerialisableBase ):
             
             self._next_update_due = metadata_slice._next_update_due
             
+            self._ClearSliceNetworkBytesCache()
+            
         
     
 HydrusSerialisable.SERIALISABLE_TYPES_TO_OBJECT_TYPES[ HydrusSerialisable.SERIALISABLE_TYPE_METADATA ] = Metadata
@@ -2263,6 +2315,14 @@ class ServerServiceRepository( ServerServiceRestricted ):
             
         
     
+    def GetMetadataSliceNetworkBytes( self, from_update_index ):
+        
+        with self._lock:
+            
+            return self._metadata.GetSliceNetworkBytes( from_update_index )
+            
+        
+    
     def HasUpdateHash( self, update_hash ):
         
         with self._lock:
@@ -2280,8 +2340,6 @@ class ServerServiceRepository( ServerServiceRestricted ):
         
         if update_due:
             
-            HG.server_busy = True
-            
             while update_due:
                 
                 with self._lock:
@@ -2293,7 +2351,7 @@ class ServerServiceRepository( ServerServiceRestricted ):
                 
                 end = begin + HC.UPDATE_DURATION
                 
-                update_hashes = HG.server_controller.WriteSynchronous( 'create_update', service_key, begin, end )
+                update_hashes = HG.server_controller.CreateUpdate( service_key, begin, end )
                 
                 next_update_due = end + HC.UPDATE_DURATION + 1
                 
@@ -2305,8 +2363,6 @@ class ServerServiceRepository( ServerServiceRestricted ):
                     
                 
             
-            HG.server_busy = False
-            
             with self._lock:
                 
                 self._SetDirty()
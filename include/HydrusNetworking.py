@@ -382,8 +382,8 @@ class BandwidthRules( HydrusSerialisable.SerialisableBase ):
                 
             
             return rows
+            
         
-    
     def GetRules( self ):
         
         with self._lock:
@@ -407,8 +407,6 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
     MAX_HOURS_TIME_DELTA = 72 * 3600
     MAX_DAYS_TIME_DELTA = 31 * 86400
     
-    CACHE_MAINTENANCE_TIME_DELTA = 120
-    
     MIN_TIME_DELTA_FOR_USER = 10
     
     def __init__( self ):
@@ -417,54 +415,63 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
         
         self._lock = threading.Lock()
         
-        self._next_cache_maintenance_timestamp = HydrusData.GetNow() + self.CACHE_MAINTENANCE_TIME_DELTA
+        self._InitialiseCounters()
         
-        self._months_bytes = collections.Counter()
-        self._days_bytes = collections.Counter()
-        self._hours_bytes = collections.Counter()
-        self._minutes_bytes = collections.Counter()
-        self._seconds_bytes = collections.Counter()
+    
+    def _GetCounters( self ):
         
-        self._months_requests = collections.Counter()
-        self._days_requests = collections.Counter()
-        self._hours_requests = collections.Counter()
-        self._minutes_requests = collections.Counter()
-        self._seconds_requests = collections.Counter()
+        return ( self._months_bytes, self._days_bytes, self._hours_bytes, self._minutes_bytes, self._seconds_bytes, self._months_requests, self._days_requests, self._hours_requests, self._minutes_requests, self._seconds_requests )
         
     
     def _GetSerialisableInfo( self ):
         
         dicts_flat = []
         
-        for d in ( self._months_bytes, self._days_bytes, self._hours_bytes, self._minutes_bytes, self._seconds_bytes, self._months_requests, self._days_requests, self._hours_requests, self._minutes_requests, self._seconds_requests ):
+        for counter in self._GetCounters():
             
-            dicts_flat.append( list( d.items() ) )
+            if isinstance( counter, RollingUsageCounter ):
+                
+                dicts_flat.append( counter.GetItems() )
+                
+            else:
+                
+                dicts_flat.append( list( counter.items() ) )
+                
             
         
         return dicts_flat
         
     
-    def _InitialiseFromSerialisableInfo( self, serialisable_info ):
+    def _InitialiseCounters( self ):
         
-        counters = [ collections.Counter( dict( flat_dict ) ) for flat_dict in serialisable_info ]
+        self._months_bytes = collections.Counter()
+        self._days_bytes = RollingUsageCounter( 86400, self.MAX_DAYS_TIME_DELTA )
+        self._hours_bytes = RollingUsageCounter( 3600, self.MAX_HOURS_TIME_DELTA )
+        self._minutes_bytes = RollingUsageCounter( 60, self.MAX_MINUTES_TIME_DELTA )
+        self._seconds_bytes = RollingUsageCounter( 1, self.MAX_SECONDS_TIME_DELTA )
+        
+        self._months_requests = collections.Counter()
+        self._days_requests = RollingUsageCounter( 86400, self.MAX_DAYS_TIME_DELTA )
+        self._hours_requests = RollingUsageCounter( 3600, self.MAX_HOURS_TIME_DELTA )
+        self._minutes_requests = RollingUsageCounter( 60, self.MAX_MINUTES_TIME_DELTA )
+        self._seconds_requests = RollingUsageCounter( 1, self.MAX_SECONDS_TIME_DELTA )
+        
+    
+    def _InitialiseFromSerialisableInfo( self, serialisable_info ):
         
         # unusual error someone reported by email--it came back an empty list, fugg
-        if len( counters ) != 10:
+        if len( serialisable_info ) != 10:
             
             return
             
         
-        self._months_bytes = counters[ 0 ]
-        self._days_bytes = counters[ 1 ]
-        self._hours_bytes = counters[ 2 ]
-        self._minutes_bytes = counters[ 3 ]
-        self._seconds_bytes = counters[ 4 ]
-        
-        self._months_requests = counters[ 5 ]
-        self._days_requests = counters[ 6 ]
-        self._hours_requests = counters[ 7 ]
-        self._minutes_requests = counters[ 8 ]
-        self._seconds_requests = counters[ 9 ]
+        for ( counter, flat_dict ) in zip( self._GetCounters(), serialisable_info ):
+            
+            for ( timestamp, value ) in sorted( flat_dict ):
+                
+                counter[ timestamp ] += value
+                
+            
         
     
     def _GetCurrentDateTime( self ):
@@ -565,14 +572,7 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
             
             now = HydrusData.GetNow()
             
-            if now in counter:
-                
-                return counter[ now ]
-                
-            else:
-                
-                return 0
-                
+            return counter[ now ]
             
         else:
             
@@ -583,7 +583,7 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
             
             since = HydrusData.GetNow() - search_time_delta
             
-            return sum( ( value for ( timestamp, value ) in list(counter.items()) if timestamp >= since ) )
+            return counter.GetUsageSince( since )
             
         
     
@@ -619,8 +619,6 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
             usage = self._GetRawUsage( bandwidth_type, time_delta )
             
         
-        self._MaintainCache()
-        
         return usage
         
     
@@ -634,9 +632,9 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
         
         since = now - SEARCH_DELTA
         
-        valid_keys = [ key for key in list(counter.keys()) if key >= since ]
+        earliest_timestamp = counter.GetEarliestTimestampSince( since )
         
-        if len( valid_keys ) == 0:
+        if earliest_timestamp is None:
             
             return 0
             
@@ -644,51 +642,15 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
         # If we want the average speed over past five secs but nothing has happened in sec 4 and 5, we don't want to count them
         # otherwise your 1MB/s counts as 200KB/s
         
-        earliest_timestamp = min( valid_keys )
-        
         SAMPLE_DELTA = max( now - earliest_timestamp, 1 )
         
-        total_bytes = sum( ( counter[ key ] for key in valid_keys ) )
+        total_bytes = counter.GetUsageSince( since )
         
         time_delta_average_per_sec = total_bytes / SAMPLE_DELTA
         
         return time_delta_average_per_sec * time_delta
         
     
-    def _MaintainCache( self ):
-        
-        if HydrusData.TimeHasPassed( self._next_cache_maintenance_timestamp ):
-            
-            now = HydrusData.GetNow()
-            
-            oldest_second = now - self.MAX_SECONDS_TIME_DELTA
-            oldest_minute = now - self.MAX_MINUTES_TIME_DELTA
-            oldest_hour = now - self.MAX_HOURS_TIME_DELTA
-            oldest_day = now - self.MAX_DAYS_TIME_DELTA
-            
-            def clear_counter( counter, timestamp ):
-                
-                bad_keys = [ key for key in list(counter.keys()) if key < timestamp ]
-                
-                for bad_key in bad_keys:
-                    
-                    del counter[ bad_key ]
-                    
-                
-            
-            clear_counter( self._days_bytes, oldest_day )
-            clear_counter( self._days_requests, oldest_day )
-            clear_counter( self._hours_bytes, oldest_hour )
-            clear_counter( self._hours_requests, oldest_hour )
-            clear_counter( self._minutes_bytes, oldest_minute )
-            clear_counter( self._minutes_requests, oldest_minute )
-            clear_counter( self._seconds_bytes, oldest_second )
-            clear_counter( self._seconds_requests, oldest_second )
-            
-            self._next_cache_maintenance_timestamp = HydrusData.GetNow() + self.CACHE_MAINTENANCE_TIME_DELTA
-            
-        
-    
     def GetCurrentMonthSummary( self ):
         
         with self._lock:
@@ -770,31 +732,18 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
                 
                 time_delta_in_which_bandwidth_counts = time_delta + window
                 
-                time_and_values = list(counter.items())
-                
-                time_and_values.sort( reverse = True )
-                
                 now = HydrusData.GetNow()
-                usage = 0
                 
-                for ( timestamp, value ) in time_and_values:
-                    
-                    current_search_time_delta = now - timestamp
-                    
-                    if current_search_time_delta > time_delta_in_which_bandwidth_counts: # we are searching beyond our time delta. no need to wait
-                        
-                        break
-                        
-                    
-                    usage += value
+                timestamp = counter.GetLatestTimestampWithUsageSince( now - time_delta_in_which_bandwidth_counts, max_allowed )
+                
+                if timestamp is None: # we are searching beyond our time delta. no need to wait
                     
-                    if usage >= max_allowed:
-                        
-                        return time_delta_in_which_bandwidth_counts - current_search_time_delta
-                        
+                    return 0
                     
                 
-                return 0
+                current_search_time_delta = now - timestamp
+                
+                return time_delta_in_which_bandwidth_counts - current_search_time_delta
                 
             
         
@@ -817,8 +766,6 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
             
             self._seconds_bytes[ second_time ] += num_bytes
             
-            self._MaintainCache()
-            
         
     
     def ReportRequestUsed( self ):
@@ -839,8 +786,226 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
             
             self._seconds_requests[ second_time ] += 1
             
-            self._MaintainCache()
-            
         
     
 HydrusSerialisable.SERIALISABLE_TYPES_TO_OBJECT_TYPES[ HydrusSerialisable.SERIALISABLE_TYPE_BANDWIDTH_TRACKER ] = BandwidthTracker
+
+class RollingUsageCounter( object ):
+    
+    # time buckets that store a running total rather than each bucket's value
+    # so the usage since any time is just the total now minus the total back then, whatever the time delta, and old buckets fall off the front for free
+    # it is indexed like a Counter by the timestamp of each bucket's start, so it can stand in for the old dict of timestamps
+    
+    def __init__( self, bucket_width, max_time_delta ):
+        
+        self._bucket_width = bucket_width
+        
+        # twice the time delta covers the 'window' partial bracket at the far end and gives slack if the clock goes backwards
+        self._num_buckets = ( max_time_delta // bucket_width ) * 2
+        
+        # every network job has a tracker, and most only live a few seconds, so this only holds the buckets from the first report to the latest, up to _num_buckets
+        # everything before them is in the base total
+        self._running_totals = []
+        self._base_total = 0
+        
+        self._latest_bucket = None
+        self._total = 0
+        
+    
+    def __getitem__( self, timestamp ):
+        
+        bucket = timestamp // self._bucket_width
+        
+        if self._latest_bucket is None or bucket > self._latest_bucket or bucket <= self._latest_bucket - self._num_buckets:
+            
+            return 0
+            
+        
+        return self._GetTotalThrough( bucket ) - self._GetTotalThrough( bucket - 1 )
+        
+    
+    def __setitem__( self, timestamp, value ):
+        
+        # only here to support 'counter[ timestamp ] += value'
+        
+        self._Add( timestamp // self._bucket_width, value - self[ timestamp ] )
+        
+    
+    def _Add( self, bucket, value ):
+        
+        if self._latest_bucket is None:
+            
+            self._latest_bucket = bucket
+            
+            self._running_totals = [ self._total ]
+            
+        
+        if bucket > self._latest_bucket:
+            
+            self._AdvanceTo( bucket )
+            
+        
+        if bucket <= self._latest_bucket - self._num_buckets:
+            
+            return
+            
+        
+        oldest_bucket = self._GetOldestBucket()
+        
+        if bucket < oldest_bucket:
+            
+            # the clock went backwards past our first report, so we need some earlier buckets
+            
+            self._running_totals[ 0 : 0 ] = [ self._base_total ] * ( oldest_bucket - bucket )
+            
+            oldest_bucket = bucket
+            
+        
+        # usually the current bucket, so one iteration. this only gets longer if the clock went backwards
+        
+        for i in range( bucket - oldest_bucket, len( self._running_totals ) ):
+            
+            self._running_totals[ i ] += value
+            
+        
+        self._total += value
+        
+    
+    def _AdvanceTo( self, bucket ):
+        
+        num_new_buckets = bucket - self._latest_bucket
+        
+        if num_new_buckets >= self._num_buckets:
+            
+            self._running_totals = [ self._total ]
+            self._base_total = self._total
+            
+        else:
+            
+            self._running_totals.extend( [ self._total ] * num_new_buckets )
+            
+            num_old_buckets = len( self._running_totals ) - self._num_buckets
+            
+            if num_old_buckets > 0:
+                
+                self._base_total = self._running_totals[ num_old_buckets - 1 ]
+                
+                del self._running_totals[ : num_old_buckets ]
+                
+            
+        
+        self._latest_bucket = bucket
+        
+    
+    def _GetOldestBucket( self ):
+        
+        return self._latest_bucket - len( self._running_totals ) + 1
+        
+    
+    def _GetTotalThrough( self, bucket ):
+        
+        if self._latest_bucket is None:
+            
+            return 0
+            
+        
+        if bucket >= self._latest_bucket:
+            
+            return self._total
+            
+        
+        oldest_bucket = self._GetOldestBucket()
+        
+        if bucket < oldest_bucket:
+            
+            return self._base_total
+            
+        
+        return self._running_totals[ bucket - oldest_bucket ]
+        
+    
+    def GetEarliestTimestampSince( self, since ):
+        
+        if self._latest_bucket is None:
+            
+            return None
+            
+        
+        first_bucket = max( -( -since // self._bucket_width ), self._GetOldestBucket() )
+        
+        for bucket in range( first_bucket, self._latest_bucket + 1 ):
+            
+            if self._GetTotalThrough( bucket ) > self._GetTotalThrough( bucket - 1 ):
+                
+                return bucket * self._bucket_width
+                
+            
+        
+        return None
+        
+    
+    def GetItems( self ):
+        
+        items = []
+        
+        if self._latest_bucket is not None:
+            
+            for bucket in range( self._GetOldestBucket(), self._latest_bucket + 1 ):
+                
+                value = self._GetTotalThrough( bucket ) - self._GetTotalThrough( bucket - 1 )
+                
+                if value != 0:
+                    
+                    items.append( ( bucket * self._bucket_width, value ) )
+                    
+                
+            
+        
+        return items
+        
+    
+    def GetLatestTimestampWithUsageSince( self, since, max_allowed ):
+        
+        # the latest bucket at which the usage from it to now reaches max_allowed, if one exists after 'since'
+        # usage from a bucket to now only grows as we go back, so we can binary search
+        
+        if self._latest_bucket is None:
+            
+            return None
+            
+        
+        lowest_bucket = -( -since // self._bucket_width )
+        
+        if self._total - self._GetTotalThrough( lowest_bucket - 1 ) < max_allowed:
+            
+            return None
+            
+        
+        highest_bucket = max( lowest_bucket, self._latest_bucket )
+        
+        while lowest_bucket < highest_bucket:
+            
+            middle_bucket = ( lowest_bucket + highest_bucket + 1 ) // 2
+            
+            if self._total - self._GetTotalThrough( middle_bucket - 1 ) >= max_allowed:
+                
+                lowest_bucket = middle_bucket
+                
+            else:
+                
+                highest_bucket = middle_bucket - 1
+                
+            
+        
+        return lowest_bucket * self._bucket_width
+        
+    
+    def GetUsageSince( self, since ):
+        
+        # the bucket of a timestamp is included if its start is at or after 'since'
+        
+        first_bucket = -( -since // self._bucket_width )
+        
+        return self._total - self._GetTotalThrough( first_bucket - 1 )
+
+
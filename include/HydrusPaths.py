@@ -784,6 +784,71 @@ def MirrorTree( source, dest, text_update_hook = None, is_cancelled_hook = None
             
         
     
+def MirrorImmutableTree( source, dest, manifest_path ):
+    
+    # for a tree of content-addressed files that never change once written, like server_files
+    # the manifest lists what dest already has, so we only have to walk source and copy what is new
+    
+    manifest = set()
+    
+    if os.path.exists( manifest_path ):
+        
+        with open( manifest_path, 'r', encoding = 'utf-8' ) as f:
+            
+            manifest = { relative_path for relative_path in f.read().splitlines() if relative_path != '' }
+            
+        
+    
+    pauser = HydrusData.BigJobPauser()
+    
+    MakeSureDirectoryExists( dest )
+    
+    source_relative_paths = set()
+    
+    for ( root, dirnames, filenames ) in os.walk( source ):
+        
+        for filename in filenames:
+            
+            source_path = os.path.join( root, filename )
+            
+            relative_path = os.path.relpath( source_path, source )
+            
+            source_relative_paths.add( relative_path )
+            
+            if relative_path in manifest:
+                
+                continue
+                
+            
+            pauser.Pause()
+            
+            dest_path = os.path.join( dest, relative_path )
+            
+            MakeSureDirectoryExists( os.path.dirname( dest_path ) )
+            
+            if MirrorFile( source_path, dest_path ):
+                
+                manifest.add( relative_path )
+                
+            
+        
+    
+    for relative_path in manifest.difference( source_relative_paths ):
+        
+        DeletePath( os.path.join( dest, relative_path ) )
+        
+        manifest.discard( relative_path )
+        
+    
+    temp_manifest_path = manifest_path + '.temp'
+    
+    with open( temp_manifest_path, 'w', encoding = 'utf-8' ) as f:
+        
+        f.write( os.linesep.join( sorted( manifest ) ) )
+        
+    
+    os.replace( temp_manifest_path, manifest_path )
+    
 def OpenFileLocation( path ):
     
     def do_it():
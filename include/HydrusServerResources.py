@@ -271,6 +271,12 @@ def ParseFileArguments( path, decompression_bombs_ok = False ):
     
 hydrus_favicon = FileResource( os.path.join( HC.STATIC_DIR, 'hydrus.ico' ), defaultType = 'image/x-icon' )
 
+class FileProducer( NoRangeStaticProducer ):
+    
+    # twisted reads 64KB at a time, which is a lot of trips round the reactor for a big update or file
+    
+    bufferSize = 1024 * 1024
+    
 class HydrusDomain( object ):
     
     def __init__( self, local_only ):
@@ -448,7 +454,7 @@ class HydrusResource( Resource ):
             
             fileObject = open( path, 'rb' )
             
-            producer = NoRangeStaticProducer( request, fileObject )
+            producer = FileProducer( request, fileObject )
             
             producer.start()
             
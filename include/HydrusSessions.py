@@ -14,12 +14,20 @@ from . import HydrusGlobals as HG
 
 HYDRUS_SESSION_LIFETIME = 30 * 86400
 
+SESSION_CREATION_TIMES_TO_KEEP = 1024
+SLOW_SESSION_CREATION_TIME = 1.0
+
 class HydrusSessionManagerServer( object ):
     
     def __init__( self ):
         
         self._lock = threading.Lock()
         
+        self._session_creation_times = collections.deque( maxlen = SESSION_CREATION_TIMES_TO_KEEP )
+        
+        self._num_refreshes_running = 0
+        self._sessions_added_during_refreshes = []
+        
         self.RefreshAllAccounts()
         
         HG.controller.sub( self, 'RefreshAccounts', 'update_session_accounts' )
@@ -28,57 +36,99 @@ class HydrusSessionManagerServer( object ):
     
     def AddSession( self, service_key, access_key ):
         
+        time_started = HydrusData.GetNowPrecise()
+        
+        # the db reads and write happen outside the lock, so a storm of logins does not queue up behind one another's db jobs
+        
+        account_key = HG.controller.Read( 'account_key_from_access_key', service_key, access_key )
+        
         with self._lock:
             
-            account_key = HG.controller.Read( 'account_key_from_access_key', service_key, access_key )
+            account = self._service_keys_to_account_keys_to_accounts[ service_key ].get( account_key, None )
+            
+        
+        if account is None:
+            
+            account = HG.controller.Read( 'account', service_key, account_key )
+            
+        
+        session_key = HydrusData.GenerateKey()
+        
+        now = HydrusData.GetNow()
+        
+        expires = now + HYDRUS_SESSION_LIFETIME
+        
+        # the db gets it first, so any refresh that reads the sessions after we show up below will see us
+        
+        HG.controller.Write( 'session', session_key, service_key, account_key, expires )
+        
+        with self._lock:
             
             account_keys_to_accounts = self._service_keys_to_account_keys_to_accounts[ service_key ]
             
+            # another login may have loaded this account in the meantime, and it may already be carrying bandwidth we do not want to lose
+            
             if account_key not in account_keys_to_accounts:
                 
-                account = HG.controller.Read( 'account', service_key, account_key )
-                
                 account_keys_to_accounts[ account_key ] = account
                 
             
-            session_key = HydrusData.GenerateKey()
+            self._service_keys_to_session_keys_to_sessions[ service_key ][ session_key ] = ( account_key, expires )
             
-            now = HydrusData.GetNow()
+            if self._num_refreshes_running > 0:
+                
+                # a refresh that is reading the sessions right now may have missed us, and it is about to swap its dicts in over ours
+                
+                self._sessions_added_during_refreshes.append( ( service_key, session_key, account_key, expires, account_keys_to_accounts[ account_key ] ) )
+                
             
-            expires = now + HYDRUS_SESSION_LIFETIME
+        
+        time_took = HydrusData.GetNowPrecise() - time_started
+        
+        with self._lock:
             
-            HG.controller.Write( 'session', session_key, service_key, account_key, expires )
+            self._session_creation_times.append( time_took )
             
-            self._service_keys_to_session_keys_to_sessions[ service_key ][ session_key ] = ( account_key, expires )
+        
+        if time_took > SLOW_SESSION_CREATION_TIME:
             
-            return ( session_key, expires )
+            HydrusData.Print( 'Creating a session took ' + HydrusData.TimeDeltaToPrettyTimeDelta( time_took ) + '!' )
             
         
+        return ( session_key, expires )
+        
     
     def GetAccount( self, service_key, session_key ):
         
-        with self._lock:
+        # no lock here, as every request calls this. single dict lookups are atomic, and the refreshes swap whole dicts in rather than clearing them
+        
+        session_keys_to_sessions = self._service_keys_to_session_keys_to_sessions.get( service_key, {} )
+        
+        result = session_keys_to_sessions.get( session_key, None )
+        
+        if result is not None:
             
-            session_keys_to_sessions = self._service_keys_to_session_keys_to_sessions[ service_key ]
+            ( account_key, expires ) = result
             
-            if session_key in session_keys_to_sessions:
-                
-                ( account_key, expires ) = session_keys_to_sessions[ session_key ]
+            if HydrusData.TimeHasPassed( expires ):
                 
-                if HydrusData.TimeHasPassed( expires ):
+                with self._lock:
                     
-                    del session_keys_to_sessions[ session_key ]
+                    session_keys_to_sessions.pop( session_key, None )
                     
-                else:
-                    
-                    account = self._service_keys_to_account_keys_to_accounts[ service_key ][ account_key ]
+                
+            else:
+                
+                account = self._service_keys_to_account_keys_to_accounts.get( service_key, {} ).get( account_key, None )
+                
+                if account is not None:
                     
                     return account
                     
                 
             
-            raise HydrusExceptions.SessionException( 'Did not find that session! Try again!' )
-            
+        
+        raise HydrusExceptions.SessionException( 'Did not find that session! Try again!' )
         
     
     def GetDirtyAccounts( self ):
@@ -101,54 +151,114 @@ class HydrusSessionManagerServer( object ):
             
         
     
-    def RefreshAccounts( self, service_key, account_keys = None ):
+    def GetSessionCreationStats( self ):
         
         with self._lock:
             
-            account_keys_to_accounts = self._service_keys_to_account_keys_to_accounts[ service_key ]
+            session_creation_times = list( self._session_creation_times )
             
-            if account_keys is None:
-                
-                account_keys = list(account_keys_to_accounts.keys())
-                
+        
+        num_sessions = len( session_creation_times )
+        
+        if num_sessions == 0:
+            
+            return ( 0, 0.0, 0.0 )
+            
+        
+        average_time = sum( session_creation_times ) / num_sessions
+        max_time = max( session_creation_times )
+        
+        return ( num_sessions, average_time, max_time )
+        
+    
+    def RefreshAccounts( self, service_key, account_keys = None ):
+        
+        if account_keys is None:
             
-            for account_key in account_keys:
+            with self._lock:
                 
-                account = HG.controller.Read( 'account', service_key, account_key )
-                
-                account_keys_to_accounts[ account_key ] = account
+                account_keys = list( self._service_keys_to_account_keys_to_accounts[ service_key ].keys() )
                 
             
         
+        accounts = [ HG.controller.Read( 'account', service_key, account_key ) for account_key in account_keys ]
+        
+        self.UpdateAccounts( service_key, accounts )
+        
     
     def RefreshAllAccounts( self, service_key = None ):
         
         with self._lock:
             
+            self._num_refreshes_running += 1
+            
+        
+        try:
+            
             if service_key is None:
                 
-                self._service_keys_to_session_keys_to_sessions = collections.defaultdict( dict )
-                
-                self._service_keys_to_account_keys_to_accounts = collections.defaultdict( dict )
-                
                 existing_sessions = HG.controller.Read( 'sessions' )
                 
             else:
                 
-                del self._service_keys_to_session_keys_to_sessions[ service_key ]
-                
-                del self._service_keys_to_account_keys_to_accounts[ service_key ]
-                
                 existing_sessions = HG.controller.Read( 'sessions', service_key )
                 
             
-            for ( session_key, service_key, account, expires ) in existing_sessions:
+            # build the new dicts fully and then swap them in, so lockless readers never see them half-filled
+            
+            service_keys_to_session_keys_to_sessions = collections.defaultdict( dict )
+            service_keys_to_account_keys_to_accounts = collections.defaultdict( dict )
+            
+            for ( session_key, session_service_key, account, expires ) in existing_sessions:
                 
                 account_key = account.GetAccountKey()
                 
-                self._service_keys_to_session_keys_to_sessions[ service_key ][ session_key ] = ( account_key, expires )
+                service_keys_to_session_keys_to_sessions[ session_service_key ][ session_key ] = ( account_key, expires )
+                
+                service_keys_to_account_keys_to_accounts[ session_service_key ][ account_key ] = account
+                
+            
+            with self._lock:
+                
+                # logins that happened while we were reading
+                
+                for ( session_service_key, session_key, account_key, expires, account ) in self._sessions_added_during_refreshes:
+                    
+                    if service_key is not None and session_service_key != service_key:
+                        
+                        continue
+                        
+                    
+                    service_keys_to_session_keys_to_sessions[ session_service_key ][ session_key ] = ( account_key, expires )
+                    
+                    if account_key not in service_keys_to_account_keys_to_accounts[ session_service_key ]:
+                        
+                        service_keys_to_account_keys_to_accounts[ session_service_key ][ account_key ] = account
+                        
+                    
+                
+                if service_key is None:
+                    
+                    self._service_keys_to_session_keys_to_sessions = service_keys_to_session_keys_to_sessions
+                    self._service_keys_to_account_keys_to_accounts = service_keys_to_account_keys_to_accounts
+                    
+                else:
+                    
+                    self._service_keys_to_session_keys_to_sessions[ service_key ] = service_keys_to_session_keys_to_sessions[ service_key ]
+                    self._service_keys_to_account_keys_to_accounts[ service_key ] = service_keys_to_account_keys_to_accounts[ service_key ]
+                    
                 
-                self._service_keys_to_account_keys_to_accounts[ service_key ][ account_key ] = account
+            
+        finally:
+            
+            with self._lock:
+                
+                self._num_refreshes_running -= 1
+                
+                if self._num_refreshes_running == 0:
+                    
+                    self._sessions_added_during_refreshes = []
+                    
                 
             
         
@@ -1,6 +1,8 @@
 import bisect
 import collections
 from . import HydrusExceptions
+import heapq
+import itertools
 import queue
 import random
 import threading
@@ -12,6 +14,16 @@ import os
 
 NEXT_THREAD_CLEAROUT = 0
 
+CALL_PRIORITY_UI = 0
+CALL_PRIORITY_NORMAL = 1
+CALL_PRIORITY_BACKGROUND = 2
+
+call_priority_string_lookup = {}
+
+call_priority_string_lookup[ CALL_PRIORITY_UI ] = 'ui'
+call_priority_string_lookup[ CALL_PRIORITY_NORMAL ] = 'normal'
+call_priority_string_lookup[ CALL_PRIORITY_BACKGROUND ] = 'background'
+
 THREADS_TO_THREAD_INFO = {}
 THREAD_INFO_LOCK = threading.Lock()
 
@@ -37,6 +49,19 @@ def ClearOutDeadThreads():
             
         
     
+def GetDefaultCallToThreadPoolSize():
+    
+    # most of our jobs are waiting on the db, disk, or network, not the cpu, so we can afford a few per core
+    
+    num_cores = os.cpu_count()
+    
+    if num_cores is None:
+        
+        num_cores = 4
+        
+    
+    return min( max( num_cores * 4, 16 ), 64 )
+    
 def GetThreadInfo( thread = None ):
     
     global NEXT_THREAD_CLEAROUT
@@ -369,6 +394,351 @@ class THREADCallToThread( DAEMON ):
             
         
     
+class CallToThreadPool( object ):
+    
+    def __init__( self, controller, name, num_threads = None, max_num_threads = 200, stall_period = 0.5, idle_timeout = 10.0 ):
+        
+        if num_threads is None:
+            
+            num_threads = GetDefaultCallToThreadPoolSize()
+            
+        
+        self._controller = controller
+        self._name = name
+        self._num_threads = num_threads
+        self._max_num_threads = max_num_threads
+        self._stall_period = stall_period
+        self._idle_timeout = idle_timeout
+        
+        self._lock = threading.Lock()
+        self._job_available = threading.Condition( self._lock )
+        
+        self._queue = []
+        self._job_counter = itertools.count()
+        
+        self._workers = []
+        self._num_idle_workers = 0
+        
+        self._watchdog = None
+        
+        self._queue_depths = collections.Counter()
+        self._num_jobs_done = collections.Counter()
+        self._wait_times = collections.defaultdict( lambda: collections.deque( maxlen = 256 ) )
+        
+    
+    def _CurrentlyStalled( self ):
+        
+        if len( self._queue ) <= self._num_idle_workers:
+            
+            return False
+            
+        
+        now = time.perf_counter()
+        
+        oldest_time_queued = min( ( time_queued for ( priority, job_number, time_queued, callable, args, kwargs ) in self._queue ) )
+        
+        return now - oldest_time_queued > self._stall_period
+        
+    
+    def _StartWorker( self ):
+        
+        worker = THREADCallToThreadPoolWorker( self._controller, self._name, self )
+        
+        self._workers.append( worker )
+        
+        worker.start()
+        
+        if self._watchdog is None:
+            
+            self._watchdog = THREADCallToThreadPoolWatchdog( self._controller, self._name + ' watchdog', self )
+            
+            self._watchdog.start()
+            
+        
+    
+    def GetJob( self, worker ):
+        
+        with self._lock:
+            
+            self._num_idle_workers += 1
+            
+            try:
+                
+                while len( self._queue ) == 0:
+                    
+                    CheckIfThreadShuttingDown()
+                    
+                    job_arrived = self._job_available.wait( self._idle_timeout )
+                    
+                    if not job_arrived and len( self._queue ) == 0 and len( self._workers ) > self._num_threads:
+                        
+                        # an overflow thread that is no longer needed
+                        
+                        self._workers.remove( worker )
+                        
+                        return None
+                        
+                    
+                
+            finally:
+                
+                self._num_idle_workers -= 1
+                
+            
+            ( priority, job_number, time_queued, callable, args, kwargs ) = heapq.heappop( self._queue )
+            
+            self._queue_depths[ priority ] -= 1
+            self._num_jobs_done[ priority ] += 1
+            self._wait_times[ priority ].append( time.perf_counter() - time_queued )
+            
+            return ( callable, args, kwargs )
+            
+        
+    
+    def GetNumWorking( self ):
+        
+        with self._lock:
+            
+            return len( self._workers ) - self._num_idle_workers
+            
+        
+    
+    def GetStats( self ):
+        
+        with self._lock:
+            
+            stats = []
+            
+            for priority in ( CALL_PRIORITY_UI, CALL_PRIORITY_NORMAL, CALL_PRIORITY_BACKGROUND ):
+                
+                wait_times = self._wait_times[ priority ]
+                
+                if len( wait_times ) == 0:
+                    
+                    average_wait = 0.0
+                    max_wait = 0.0
+                    
+                else:
+                    
+                    average_wait = sum( wait_times ) / len( wait_times )
+                    max_wait = max( wait_times )
+                    
+                
+                stats.append( ( priority, self._queue_depths[ priority ], self._num_jobs_done[ priority ], average_wait, max_wait ) )
+                
+            
+            return stats
+            
+        
+    
+    def GetWorkers( self ):
+        
+        with self._lock:
+            
+            return list( self._workers )
+            
+        
+    
+    def IsWorker( self, thread ):
+        
+        with self._lock:
+            
+            return thread in self._workers
+            
+        
+    
+    def MaintainWorkers( self ):
+        
+        # if everything we have is tied up in long jobs, the queue would otherwise wait on them indefinitely, so add an overflow thread
+        
+        with self._lock:
+            
+            if self._CurrentlyStalled() and len( self._workers ) < self._max_num_threads:
+                
+                self._StartWorker()
+                
+            
+            return len( self._queue ) > 0
+            
+        
+    
+    def put( self, priority, callable, *args, **kwargs ):
+        
+        with self._lock:
+            
+            heapq.heappush( self._queue, ( priority, next( self._job_counter ), time.perf_counter(), callable, args, kwargs ) )
+            
+            self._queue_depths[ priority ] += 1
+            
+            if len( self._queue ) > self._num_idle_workers:
+                
+                num_workers = len( self._workers )
+                
+                # a pool thread that is waiting on a job it queues would deadlock us if we made it wait its turn
+                
+                calling_from_the_pool = threading.current_thread() in self._workers
+                
+                if num_workers < self._num_threads or ( calling_from_the_pool and num_workers < self._max_num_threads ):
+                    
+                    self._StartWorker()
+                    
+                else:
+                    
+                    self._watchdog.wake()
+                    
+                
+            
+            self._job_available.notify()
+            
+        
+    
+    def SetNumThreads( self, num_threads ):
+        
+        with self._lock:
+            
+            self._num_threads = max( 1, num_threads )
+            
+            # spare workers will retire on their next idle timeout
+            
+        
+    
+    def WakeWorkers( self ):
+        
+        with self._lock:
+            
+            self._job_available.notify_all()
+            
+        
+    
+class THREADCallToThreadPoolWatchdog( DAEMON ):
+    
+    def __init__( self, controller, name, pool ):
+        
+        DAEMON.__init__( self, controller, name )
+        
+        self._pool = pool
+        
+    
+    def GetCurrentJobSummary( self ):
+        
+        return 'watching for a stalled queue'
+        
+    
+    def run( self ):
+        
+        try:
+            
+            while True:
+                
+                CheckIfThreadShuttingDown()
+                
+                jobs_waiting = self._pool.MaintainWorkers()
+                
+                if jobs_waiting:
+                    
+                    wait_time = 0.25
+                    
+                else:
+                    
+                    wait_time = 10.0
+                    
+                
+                self._event.wait( wait_time )
+                
+                self._event.clear()
+                
+            
+        except HydrusExceptions.ShutdownException:
+            
+            return
+            
+        
+    
+class THREADCallToThreadPoolWorker( DAEMON ):
+    
+    def __init__( self, controller, name, pool ):
+        
+        DAEMON.__init__( self, controller, name )
+        
+        self._pool = pool
+        
+        self._callable = None
+        
+        self._currently_working = False
+        
+    
+    def CurrentlyWorking( self ):
+        
+        return self._currently_working
+        
+    
+    def GetCurrentJobSummary( self ):
+        
+        return self._callable
+        
+    
+    def run( self ):
+        
+        try:
+            
+            while True:
+                
+                job = self._pool.GetJob( self )
+                
+                if job is None:
+                    
+                    return
+                    
+                
+                CheckIfThreadShuttingDown()
+                
+                self._DoPreCall()
+                
+                self._currently_working = True
+                
+                try:
+                    
+                    ( callable, args, kwargs ) = job
+                    
+                    self._callable = job
+                    
+                    callable( *args, **kwargs )
+                    
+                    del callable
+                    
+                except HydrusExceptions.ShutdownException:
+                    
+                    return
+                    
+                except Exception as e:
+                    
+                    HydrusData.Print( traceback.format_exc() )
+                    
+                    HydrusData.ShowException( e )
+                    
+                finally:
+                    
+                    self._callable = None
+                    
+                    del job
+                    
+                    self._currently_working = False
+                    
+                
+            
+        except HydrusExceptions.ShutdownException:
+            
+            return
+            
+        
+    
+    def wake( self ):
+        
+        DAEMON.wake( self )
+        
+        self._pool.WakeWorkers()
+        
+    
 class JobScheduler( threading.Thread ):
     
     def __init__( self, controller ):
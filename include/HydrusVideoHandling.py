@@ -5,6 +5,7 @@ from . import HydrusImageHandling
 from . import HydrusPaths
 from . import HydrusText
 from . import HydrusThreading
+import bisect
 import numpy
 import os
 import re
@@ -226,6 +227,48 @@ def GetFFMPEGInfoLines( path, count_frames_manually = False, only_first_second =
     
     return lines
     
+def GetFFMPEGKeyframeTimestamps( path ):
+    
+    # asking the decoder to skip everything but keyframes makes this quick, and showinfo tells us where each one sits
+    
+    cmd = [ FFMPEG_PATH, '-skip_frame', 'nokey', '-i', path, '-an', '-vf', 'showinfo', '-f', 'null', '-' ]
+    
+    sbp_kwargs = HydrusData.GetSubprocessKWArgs()
+    
+    try:
+        
+        process = subprocess.Popen( cmd, bufsize = 10**5, stdout = subprocess.PIPE, stderr = subprocess.PIPE, **sbp_kwargs )
+        
+    except FileNotFoundError as e:
+        
+        raise FileNotFoundError( 'Cannot index video because FFMPEG not found--are you sure it is installed? Full error: ' + str( e ) )
+        
+    
+    ( stdout, stderr ) = process.communicate()
+    
+    del process
+    
+    ( text, encoding ) = HydrusText.NonFailingUnicodeDecode( stderr, 'utf-8' )
+    
+    timestamps_ms = set()
+    
+    for line in text.splitlines():
+        
+        if 'showinfo' not in line or 'iskey:1' not in line:
+            
+            continue
+            
+        
+        result = re.search( r'pts_time:\s*(-?[\d\.]+)', line )
+        
+        if result is not None:
+            
+            timestamps_ms.add( max( 0, int( float( result.group( 1 ) ) * 1000 ) ) )
+            
+        
+    
+    return sorted( timestamps_ms )
+    
 def GetFFMPEGVideoProperties( path, force_count_frames_manually = False ):
     
     first_second_lines = GetFFMPEGInfoLines( path, count_frames_manually = True, only_first_second = True )
@@ -739,6 +782,8 @@ class VideoRendererFFMPEG( object ):
         
         self.bufsize = bufsize
         
+        self._keyframe_indices = None
+        
         self.initialize()
         
     
@@ -898,16 +943,65 @@ class VideoRendererFFMPEG( object ):
     def set_position( self, pos ):
         
         rewind = pos < self.pos
-        jump_a_long_way_ahead = pos > self.pos + 60
         
-        if rewind or jump_a_long_way_ahead:
+        if rewind or self.process is None:
             
             self.initialize( pos )
             
-        else:
+        elif self._mime in ( HC.IMAGE_APNG, HC.IMAGE_GIF ):
+            
+            # a restart would decode from frame 0 and skip up to here anyway, so going on is always cheaper
             
             self.skip_frames( pos - self.pos )
             
+        elif self._keyframe_indices is not None:
+            
+            # a restart has to decode from the last keyframe before pos, so if we are already past it, the current process is the quicker way there
+            
+            if self.GetKeyframeIndexBefore( pos ) <= self.pos:
+                
+                self.skip_frames( pos - self.pos )
+                
+            else:
+                
+                self.initialize( pos )
+                
+            
+        else:
+            
+            jump_a_long_way_ahead = pos > self.pos + 60
+            
+            if jump_a_long_way_ahead:
+                
+                self.initialize( pos )
+                
+            else:
+                
+                self.skip_frames( pos - self.pos )
+                
+            
+        
+    
+    def GetKeyframeIndexBefore( self, pos ):
+        
+        if self._keyframe_indices is None or len( self._keyframe_indices ) == 0:
+            
+            return 0
+            
+        
+        i = bisect.bisect_right( self._keyframe_indices, pos )
+        
+        if i == 0:
+            
+            return 0
+            
+        
+        return self._keyframe_indices[ i - 1 ]
+        
+    
+    def SetKeyframeIndices( self, keyframe_indices ):
+        
+        self._keyframe_indices = keyframe_indices
         
     
     def Stop( self ):
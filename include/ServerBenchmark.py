@@ -0,0 +1,685 @@
+from . import HydrusConstants as HC
+from . import HydrusData
+from . import HydrusExceptions
+from . import HydrusNetwork
+from . import HydrusNetworking
+from . import ServerController
+import collections
+import random
+import requests
+import threading
+import time
+
+SEED_ROWS_PER_REQUEST = 10000
+
+UPLOAD_ROWS_PER_REQUEST = 20
+PETITION_ROWS_PER_REQUEST = 5
+
+# real clients hold a session for a long time, so the swarm only asks for a new one every few sync cycles
+CYCLES_PER_SESSION = 10
+
+JANITOR_IDLE_PERIOD = 0.5
+
+SERVICE_START_TIMEOUT = 30
+
+def GetPercentile( sorted_values, percentile ):
+    
+    if len( sorted_values ) == 0:
+        
+        return 0.0
+        
+    
+    index = min( len( sorted_values ) - 1, int( len( sorted_values ) * percentile ) )
+    
+    return sorted_values[ index ]
+    
+class BenchmarkClient( object ):
+    
+    def __init__( self, port, access_key, stats ):
+        
+        self._base_url = 'https://127.0.0.1:' + str( port ) + '/'
+        self._access_key = access_key
+        self._stats = stats
+        
+        self._session = requests.Session()
+        
+        self._session.headers[ 'User-Agent' ] = 'hydrus client/' + str( HC.NETWORK_VERSION )
+        
+    
+    def Reconnect( self ):
+        
+        # a kept-alive connection stays with the listener it was made to, even after that service has been restarted
+        
+        self._session.close()
+        
+    
+    def Request( self, flow, method, command, request_args = None ):
+        
+        if request_args is None:
+            
+            request_args = {}
+            
+        
+        headers = {}
+        
+        if method == HC.GET:
+            
+            method_string = 'GET'
+            
+            query = HydrusNetwork.DumpToGETQuery( request_args )
+            
+            body = None
+            
+        else:
+            
+            method_string = 'POST'
+            
+            query = ''
+            
+            headers[ 'Content-Type' ] = HC.mime_string_lookup[ HC.APPLICATION_JSON ]
+            
+            body = HydrusNetwork.DumpHydrusArgsToNetworkBytes( request_args )
+            
+        
+        url = self._base_url + command
+        
+        if query != '':
+            
+            url += '?' + query
+            
+        
+        if command == 'session_key':
+            
+            headers[ 'Hydrus-Key' ] = self._access_key.hex()
+            
+        
+        time_started = HydrusData.GetNowPrecise()
+        
+        try:
+            
+            # verify goes in here rather than on the session, as a CA bundle in the environment would override it
+            
+            response = self._session.request( method_string, url, data = body, headers = headers, verify = False )
+            
+            network_bytes = response.content
+            
+        except Exception as e:
+            
+            self._stats.ReportError( flow, HydrusData.GetNowPrecise() - time_started, str( e ) )
+            
+            raise HydrusExceptions.NetworkException( str( e ) )
+            
+        
+        latency = HydrusData.GetNowPrecise() - time_started
+        
+        if not response.ok:
+            
+            error_text = command + ' gave ' + str( response.status_code ) + ': ' + response.text
+            
+            self._stats.ReportError( flow, latency, error_text )
+            
+            raise HydrusExceptions.NetworkException( error_text )
+            
+        
+        self._stats.ReportRequest( flow, latency )
+        
+        if response.headers.get( 'Content-Type', '' ) == 'application/json':
+            
+            return HydrusNetwork.ParseNetworkBytesToParsedHydrusArgs( network_bytes )
+            
+        else:
+            
+            return network_bytes
+            
+        
+    
+    def SetAccessKey( self, access_key ):
+        
+        self._access_key = access_key
+        
+    
+class BenchmarkStats( object ):
+    
+    def __init__( self ):
+        
+        self._lock = threading.Lock()
+        
+        self._flows_to_latencies = collections.defaultdict( list )
+        self._flows_to_num_errors = collections.Counter()
+        
+        self._last_error_text = None
+        
+    
+    def _GetSummaryLine( self, flow, sorted_latencies, num_errors, duration ):
+        
+        line = flow + ': ' + HydrusData.ToHumanInt( len( sorted_latencies ) ) + ' requests, ' + '{:.1f}'.format( len( sorted_latencies ) / duration ) + ' requests/s'
+        line += ', p50 ' + '{:.1f}'.format( GetPercentile( sorted_latencies, 0.5 ) * 1000 ) + 'ms'
+        line += ', p99 ' + '{:.1f}'.format( GetPercentile( sorted_latencies, 0.99 ) * 1000 ) + 'ms'
+        
+        if num_errors > 0:
+            
+            line += ', ' + HydrusData.ToHumanInt( num_errors ) + ' errors'
+            
+        
+        return line
+        
+    
+    def GetReportLines( self, duration ):
+        
+        duration = max( duration, 0.000001 )
+        
+        lines = []
+        
+        with self._lock:
+            
+            all_latencies = []
+            
+            for flow in sorted( self._flows_to_latencies.keys() ):
+                
+                latencies = sorted( self._flows_to_latencies[ flow ] )
+                
+                all_latencies.extend( latencies )
+                
+                lines.append( self._GetSummaryLine( flow, latencies, self._flows_to_num_errors[ flow ], duration ) )
+                
+            
+            all_latencies.sort()
+            
+            lines.append( self._GetSummaryLine( 'all', all_latencies, sum( self._flows_to_num_errors.values() ), duration ) )
+            
+            if self._last_error_text is not None:
+                
+                lines.append( 'last error: ' + self._last_error_text )
+                
+            
+        
+        return lines
+        
+    
+    def ReportError( self, flow, latency, error_text ):
+        
+        with self._lock:
+            
+            self._flows_to_latencies[ flow ].append( latency )
+            self._flows_to_num_errors[ flow ] += 1
+            
+            self._last_error_text = error_text
+            
+        
+    
+    def ReportRequest( self, flow, latency ):
+        
+        with self._lock:
+            
+            self._flows_to_latencies[ flow ].append( latency )
+            
+        
+    
+class ServerBenchmark( object ):
+    
+    def __init__( self, db_dir, port, num_hashes, num_tags, num_mappings, num_clients, num_janitors, duration ):
+        
+        self._db_dir = db_dir
+        self._port = port
+        
+        self._num_hashes = num_hashes
+        self._num_tags = num_tags
+        self._num_mappings = num_mappings
+        
+        self._num_clients = num_clients
+        self._num_janitors = num_janitors
+        self._duration = duration
+        
+        self._controller = None
+        
+        self._admin_client = None
+        self._tag_admin_client = None
+        
+        self._tag_admin_access_key = None
+        self._tag_service_key = HydrusData.GenerateKey()
+        
+        self._hashes = []
+        self._tags = []
+        self._tags_to_hashes = {}
+        
+        self._stop_event = threading.Event()
+        
+    
+    def _BootServer( self ):
+        
+        for port in ( HC.DEFAULT_SERVER_ADMIN_PORT, self._port ):
+            
+            if HydrusNetworking.LocalPortInUse( port ):
+                
+                raise HydrusExceptions.ShutdownException( 'Something is already bound to port ' + str( port ) + ', so the benchmark server cannot start!' )
+                
+            
+        
+        HydrusData.Print( 'Booting server…' )
+        
+        HydrusData.RecordRunningStart( self._db_dir, 'server' )
+        
+        self._controller = ServerController.Controller( self._db_dir )
+        
+        self._controller.InitModel()
+        
+        self._controller.InitView()
+        
+        setup_stats = BenchmarkStats()
+        
+        self._admin_client = BenchmarkClient( HC.DEFAULT_SERVER_ADMIN_PORT, None, setup_stats )
+        
+        self._WaitForService( self._admin_client )
+        
+        response = self._admin_client.Request( 'setup', HC.GET, 'access_key', { 'registration_key' : b'init' } )
+        
+        self._admin_client.SetAccessKey( response[ 'access_key' ] )
+        
+        self._admin_client.Request( 'setup', HC.GET, 'session_key' )
+        
+    
+    def _CreateRepository( self ):
+        
+        HydrusData.Print( 'Creating tag repository…' )
+        
+        services = self._admin_client.Request( 'setup', HC.GET, 'services' )[ 'services' ]
+        
+        # the first update is made due later, once the seed content is in, so the daemon does not cut an empty one in the meantime
+        
+        dictionary = HydrusNetwork.GenerateDefaultServiceDictionary( HC.TAG_REPOSITORY )
+        
+        tag_service = HydrusNetwork.GenerateService( self._tag_service_key, HC.TAG_REPOSITORY, 'benchmark tag repository', self._port, dictionary )
+        
+        services.append( tag_service )
+        
+        response = self._admin_client.Request( 'setup', HC.POST, 'services', { 'services' : services } )
+        
+        self._tag_admin_access_key = response[ 'service_keys_to_access_keys' ][ self._tag_service_key ]
+        
+        self._tag_admin_client = BenchmarkClient( self._port, self._tag_admin_access_key, BenchmarkStats() )
+        
+        self._WaitForService( self._tag_admin_client )
+        
+        self._tag_admin_client.Request( 'setup', HC.GET, 'session_key' )
+        
+    
+    def _CreateUserAccessKeys( self ):
+        
+        account_types = self._tag_admin_client.Request( 'setup', HC.GET, 'account_types' )[ 'account_types' ]
+        
+        permissions = { HC.CONTENT_TYPE_MAPPINGS : HC.PERMISSION_ACTION_CREATE }
+        
+        user_account_type = HydrusNetwork.AccountType.GenerateNewAccountTypeFromParameters( 'benchmark user', permissions, HydrusNetworking.BandwidthRules() )
+        
+        account_types.append( user_account_type )
+        
+        self._tag_admin_client.Request( 'setup', HC.POST, 'account_types', { 'account_types' : account_types, 'deletee_account_type_keys_to_new_account_type_keys' : {} } )
+        
+        response = self._tag_admin_client.Request( 'setup', HC.GET, 'registration_keys', { 'num' : self._num_clients, 'account_type_key' : user_account_type.GetAccountTypeKey() } )
+        
+        access_keys = []
+        
+        for registration_key in response[ 'registration_keys' ]:
+            
+            response = self._tag_admin_client.Request( 'setup', HC.GET, 'access_key', { 'registration_key' : registration_key } )
+            
+            access_keys.append( response[ 'access_key' ] )
+            
+        
+        return access_keys
+        
+    
+    def _GenerateUpdates( self ):
+        
+        HydrusData.Print( 'Generating repository updates…' )
+        
+        services = self._admin_client.Request( 'setup', HC.GET, 'services' )[ 'services' ]
+        
+        now = HydrusData.GetNow()
+        
+        for ( i, service ) in enumerate( services ):
+            
+            if service.GetServiceKey() == self._tag_service_key:
+                
+                ( service_key, service_type, name, port, dictionary ) = service.ToTuple()
+                
+                # a fresh repository's first update is empty, so this just brings its second forward to now
+                
+                end = dictionary[ 'metadata' ].GetNextUpdateBegin() - 1
+                
+                dictionary[ 'metadata' ] = HydrusNetwork.Metadata( { 0 : ( [], 0, end ) }, next_update_due = now - 1 )
+                
+                services[ i ] = HydrusNetwork.GenerateService( service_key, service_type, name, port, dictionary )
+                
+            
+        
+        self._admin_client.Request( 'setup', HC.POST, 'services', { 'services' : services } )
+        
+        self._admin_client.Reconnect()
+        
+        time_started = HydrusData.GetNowPrecise()
+        
+        self._controller.SyncRepositories()
+        
+        HydrusData.Print( 'Updates generated in ' + '{:.1f}'.format( HydrusData.GetNowPrecise() - time_started ) + 's.' )
+        
+        self._WaitForService( self._admin_client )
+        self._WaitForService( self._tag_admin_client )
+        
+        self._WaitForMetadata()
+        
+        self._admin_client.Request( 'setup', HC.GET, 'session_key' )
+        self._tag_admin_client.Request( 'setup', HC.GET, 'session_key' )
+        
+    
+    def _SeedRepository( self ):
+        
+        HydrusData.Print( 'Seeding ' + HydrusData.ToHumanInt( self._num_mappings ) + ' mappings over ' + HydrusData.ToHumanInt( self._num_hashes ) + ' hashes and ' + HydrusData.ToHumanInt( self._num_tags ) + ' tags…' )
+        
+        self._hashes = [ HydrusData.GenerateKey() for i in range( self._num_hashes ) ]
+        self._tags = [ 'benchmark:' + str( i ) for i in range( self._num_tags ) ]
+        
+        num_mappings = min( self._num_mappings, self._num_hashes * self._num_tags )
+        
+        tags_to_hashes = collections.defaultdict( set )
+        
+        num_generated = 0
+        
+        while num_generated < num_mappings:
+            
+            hashes = tags_to_hashes[ random.choice( self._tags ) ]
+            
+            hash = random.choice( self._hashes )
+            
+            if hash not in hashes:
+                
+                hashes.add( hash )
+                
+                num_generated += 1
+                
+            
+        
+        self._tags_to_hashes = { tag : list( hashes ) for ( tag, hashes ) in tags_to_hashes.items() }
+        
+        time_started = HydrusData.GetNowPrecise()
+        
+        client_to_server_update = HydrusNetwork.ClientToServerUpdate()
+        num_rows = 0
+        
+        for ( tag, hashes ) in self._tags_to_hashes.items():
+            
+            for chunk_of_hashes in HydrusData.SplitListIntoChunks( hashes, SEED_ROWS_PER_REQUEST ):
+                
+                client_to_server_update.AddContent( HC.CONTENT_UPDATE_PEND, HydrusNetwork.Content( HC.CONTENT_TYPE_MAPPINGS, ( tag, chunk_of_hashes ) ) )
+                
+                num_rows += len( chunk_of_hashes )
+                
+                if num_rows >= SEED_ROWS_PER_REQUEST:
+                    
+                    self._tag_admin_client.Request( 'setup', HC.POST, 'update', { 'client_to_server_update' : client_to_server_update } )
+                    
+                    client_to_server_update = HydrusNetwork.ClientToServerUpdate()
+                    num_rows = 0
+                    
+                
+            
+        
+        if num_rows > 0:
+            
+            self._tag_admin_client.Request( 'setup', HC.POST, 'update', { 'client_to_server_update' : client_to_server_update } )
+            
+        
+        seed_time = HydrusData.GetNowPrecise() - time_started
+        
+        HydrusData.Print( 'Seeded at ' + HydrusData.ToHumanInt( int( num_mappings / max( seed_time, 0.000001 ) ) ) + ' mappings/s.' )
+        
+    
+    def _WaitForMetadata( self ):
+        
+        # the restarted listener only picks up the new service a moment after the services are set, so wait until the new updates are actually being served
+        
+        [ service ] = [ service for service in self._controller.GetServices() if service.GetServiceKey() == self._tag_service_key ]
+        
+        next_update_index = service.GetMetadataSlice( 0 ).GetNextUpdateIndex()
+        
+        give_up_time = HydrusData.GetNow() + SERVICE_START_TIMEOUT
+        
+        while True:
+            
+            try:
+                
+                metadata_slice = self._tag_admin_client.Request( 'setup', HC.GET, 'metadata', { 'since' : 0 } )[ 'metadata_slice' ]
+                
+                if metadata_slice.GetNextUpdateIndex() >= next_update_index:
+                    
+                    return
+                    
+                
+                self._tag_admin_client.Reconnect()
+                
+            except HydrusExceptions.NetworkException:
+                
+                pass
+                
+            
+            if HydrusData.TimeHasPassed( give_up_time ):
+                
+                raise Exception( 'The tag repository did not start serving its new updates in time!' )
+                
+            
+            time.sleep( 0.25 )
+            
+        
+    
+    def _WaitForService( self, client ):
+        
+        # services are bound a moment after they are set, over on the twisted thread
+        
+        give_up_time = HydrusData.GetNow() + SERVICE_START_TIMEOUT
+        
+        while True:
+            
+            try:
+                
+                client.Request( 'setup', HC.GET, '' )
+                
+                return
+                
+            except HydrusExceptions.NetworkException:
+                
+                if HydrusData.TimeHasPassed( give_up_time ):
+                    
+                    raise
+                    
+                
+                time.sleep( 0.25 )
+                
+            
+        
+    
+    def _WorkClient( self, client ):
+        
+        num_cycles = 0
+        
+        next_update_index = 0
+        update_hashes = []
+        
+        while not self._stop_event.is_set():
+            
+            try:
+                
+                if num_cycles % CYCLES_PER_SESSION == 0:
+                    
+                    client.Request( 'session key', HC.GET, 'session_key' )
+                    
+                
+                num_cycles += 1
+                
+                metadata_slice = client.Request( 'metadata', HC.GET, 'metadata', { 'since' : next_update_index } )[ 'metadata_slice' ]
+                
+                next_update_index = max( next_update_index, metadata_slice.GetNextUpdateIndex() )
+                
+                update_hashes.extend( metadata_slice.GetUpdateHashes() )
+                
+                if len( update_hashes ) > 0:
+                    
+                    client.Request( 'update download', HC.GET, 'update', { 'update_hash' : random.choice( update_hashes ) } )
+                    
+                
+                client_to_server_update = HydrusNetwork.ClientToServerUpdate()
+                
+                tag = random.choice( self._tags )
+                hashes = random.sample( self._hashes, min( UPLOAD_ROWS_PER_REQUEST, len( self._hashes ) ) )
+                
+                client_to_server_update.AddContent( HC.CONTENT_UPDATE_PEND, HydrusNetwork.Content( HC.CONTENT_TYPE_MAPPINGS, ( tag, hashes ) ) )
+                
+                if len( self._tags_to_hashes ) > 0:
+                    
+                    ( tag, hashes ) = random.choice( list( self._tags_to_hashes.items() ) )
+                    
+                    hashes = random.sample( hashes, min( PETITION_ROWS_PER_REQUEST, len( hashes ) ) )
+                    
+                    client_to_server_update.AddContent( HC.CONTENT_UPDATE_PETITION, HydrusNetwork.Content( HC.CONTENT_TYPE_MAPPINGS, ( tag, hashes ) ), 'benchmark petition' )
+                    
+                
+                client.Request( 'content upload', HC.POST, 'update', { 'client_to_server_update' : client_to_server_update } )
+                
+            except HydrusExceptions.NetworkException:
+                
+                # already counted in the stats
+                
+                time.sleep( 0.1 )
+                
+            
+        
+    
+    def _WorkJanitor( self, client ):
+        
+        try:
+            
+            client.Request( 'session key', HC.GET, 'session_key' )
+            
+        except HydrusExceptions.NetworkException:
+            
+            return
+            
+        
+        while not self._stop_event.is_set():
+            
+            try:
+                
+                petition_count_info = client.Request( 'num petitions', HC.GET, 'num_petitions' )[ 'num_petitions' ]
+                
+                num_mapping_petitions = sum( ( num_petitions for ( content_type, status, num_petitions ) in petition_count_info if content_type == HC.CONTENT_TYPE_MAPPINGS and status == HC.CONTENT_STATUS_PETITIONED ) )
+                
+                if num_mapping_petitions == 0:
+                    
+                    time.sleep( JANITOR_IDLE_PERIOD )
+                    
+                    continue
+                    
+                
+                petition = client.Request( 'petition', HC.GET, 'petition', { 'content_type' : HC.CONTENT_TYPE_MAPPINGS, 'status' : HC.CONTENT_STATUS_PETITIONED } )[ 'petition' ]
+                
+                contents = petition.GetContents()
+                
+                if random.random() < 0.5:
+                    
+                    ( client_to_server_update, content_updates ) = petition.GetApproval( contents )
+                    
+                else:
+                    
+                    client_to_server_update = petition.GetDenial( contents )
+                    
+                
+                client.Request( 'petition processing', HC.POST, 'update', { 'client_to_server_update' : client_to_server_update } )
+                
+            except HydrusExceptions.NetworkException:
+                
+                time.sleep( 0.1 )
+                
+            
+        
+    
+    def Run( self ):
+        
+        try:
+            
+            self._BootServer()
+            
+            self._CreateRepository()
+            
+            access_keys = self._CreateUserAccessKeys()
+            
+            self._SeedRepository()
+            
+            self._GenerateUpdates()
+            
+            HydrusData.Print( 'Running ' + HydrusData.ToHumanInt( self._num_clients ) + ' clients and ' + HydrusData.ToHumanInt( self._num_janitors ) + ' janitors for ' + HydrusData.ToHumanInt( self._duration ) + 's…' )
+            
+            stats = BenchmarkStats()
+            
+            threads = []
+            
+            for access_key in access_keys:
+                
+                client = BenchmarkClient( self._port, access_key, stats )
+                
+                threads.append( threading.Thread( target = self._WorkClient, args = ( client, ), name = 'benchmark client' ) )
+                
+            
+            for i in range( self._num_janitors ):
+                
+                client = BenchmarkClient( self._port, self._tag_admin_access_key, stats )
+                
+                threads.append( threading.Thread( target = self._WorkJanitor, args = ( client, ), name = 'benchmark janitor' ) )
+                
+            
+            db_job_time_started = self._controller.db.GetTotalJobTime()
+            time_started = HydrusData.GetNowPrecise()
+            
+            for thread in threads:
+                
+                thread.start()
+                
+            
+            self._stop_event.wait( self._duration )
+            
+            self._stop_event.set()
+            
+            for thread in threads:
+                
+                thread.join()
+                
+            
+            duration = HydrusData.GetNowPrecise() - time_started
+            db_job_time = self._controller.db.GetTotalJobTime() - db_job_time_started
+            
+            lines = stats.GetReportLines( duration )
+            
+            lines.append( 'db thread utilisation: ' + HydrusData.ConvertFloatToPercentage( db_job_time / duration ) )
+            
+            ( num_sessions_created, average_creation_time, max_creation_time ) = self._controller.server_session_manager.GetSessionCreationStats()
+            
+            lines.append( 'sessions created: ' + HydrusData.ToHumanInt( num_sessions_created ) + ', average ' + '{:.1f}'.format( average_creation_time * 1000 ) + 'ms, max ' + '{:.1f}'.format( max_creation_time * 1000 ) + 'ms' )
+            
+            for line in lines:
+                
+                HydrusData.Print( line )
+                
+            
+            return lines
+            
+        finally:
+            
+            self._stop_event.set()
+            
+            if self._controller is not None:
+                
+                HydrusData.Print( 'Shutting down server…' )
+                
+                self._controller.Exit()
+                
+            
+        
+    
@@ -1,13 +1,17 @@
+import collections
 from . import HydrusConstants as HC
 from . import HydrusController
 from . import HydrusData
 from . import HydrusExceptions
 from . import HydrusGlobals as HG
+from . import HydrusNetwork
 from . import HydrusNetworking
 from . import HydrusSessions
 from . import HydrusThreading
 import os
+import queue
 from . import ServerDB
+from . import ServerFiles
 from . import ServerServer
 import requests
 import sys
@@ -170,6 +174,46 @@ class Controller( HydrusController.HydrusController ):
         return ServerDB.DB( self, self.db_dir, 'server' )
         
     
+    def _WriteUpdates( self, updates ):
+        
+        # serialising, compressing and hashing is the heavy part, so it happens out here in the thread pool while the db gets on with other requests
+        
+        results = queue.Queue()
+        
+        def do_it( index, update ):
+            
+            try:
+                
+                results.put( ( index, ServerFiles.WriteUpdate( update ), None ) )
+                
+            except Exception as e:
+                
+                results.put( ( index, None, e ) )
+                
+            
+        
+        for ( index, update ) in enumerate( updates ):
+            
+            self.CallToThread( do_it, index, update )
+            
+        
+        update_hashes = [ None ] * len( updates )
+        
+        for i in range( len( updates ) ):
+            
+            ( index, update_hash, e ) = results.get()
+            
+            if e is not None:
+                
+                raise e
+                
+            
+            update_hashes[ index ] = update_hash
+            
+        
+        return update_hashes
+        
+    
     def StartService( self, service ):
         
         def TWISTEDDoIt():
@@ -254,9 +298,86 @@ class Controller( HydrusController.HydrusController ):
         reactor.callFromThread( TWISTEDDoIt )
         
     
+    def CreateUpdate( self, service_key, begin, end ):
+        
+        # the db hands the period over a batch at a time and only moves on once a batch is on disk, so a huge period never sits in memory at once and a restart picks up where it left off
+        
+        total_definition_rows = 0
+        total_content_rows = 0
+        total_num_updates = 0
+        
+        finished = False
+        
+        while not finished:
+            
+            ( updates, position, finished ) = self.Read( 'repository_updates', service_key, begin, end )
+            
+            batch_update_hashes = self._WriteUpdates( updates )
+            
+            update_hashes = self.WriteSynchronous( 'repository_update_progress', service_key, begin, end, batch_update_hashes, position, finished )
+            
+            total_definition_rows += sum( ( update.GetNumRows() for update in updates if isinstance( update, HydrusNetwork.DefinitionsUpdate ) ) )
+            total_content_rows += sum( ( update.GetNumRows() for update in updates if isinstance( update, HydrusNetwork.ContentUpdate ) ) )
+            total_num_updates += len( updates )
+            
+        
+        HydrusData.Print( 'Update OK. ' + HydrusData.ToHumanInt( total_definition_rows ) + ' definition rows and ' + HydrusData.ToHumanInt( total_content_rows ) + ' content rows in ' + HydrusData.ToHumanInt( total_num_updates ) + ' update files.' )
+        
+        return update_hashes
+        
+    
     def DeleteOrphans( self ):
         
-        self.WriteSynchronous( 'delete_orphans' )
+        # a prefix at a time, so the db can get on with other jobs in between
+        # we count everything before touching anything, so if the keep rules are ever wrong, the log says how much is about to go
+        
+        prefixes_with_orphans = []
+        file_types_to_num_orphans = collections.Counter()
+        
+        for prefix in HydrusData.IterateHexPrefixes():
+            
+            if self.ModelIsShutdown():
+                
+                return
+                
+            
+            orphans = self.Read( 'orphans', prefix )
+            
+            if len( orphans ) > 0:
+                
+                prefixes_with_orphans.append( prefix )
+                
+                file_types_to_num_orphans.update( ( file_type for ( file_type, hash, path ) in orphans ) )
+                
+            
+        
+        if len( prefixes_with_orphans ) > 0:
+            
+            HydrusData.Print( 'Found ' + HydrusData.ToHumanInt( file_types_to_num_orphans[ 'file' ] ) + ' orphan files and ' + HydrusData.ToHumanInt( file_types_to_num_orphans[ 'thumbnail' ] ) + ' orphan thumbnails, deleting them now.' )
+            
+            num_deleted = 0
+            
+            for prefix in prefixes_with_orphans:
+                
+                if self.ModelIsShutdown():
+                    
+                    break
+                    
+                
+                num_deleted += self.WriteSynchronous( 'delete_orphans', prefix )
+                
+            
+            HydrusData.Print( 'Deleted ' + HydrusData.ToHumanInt( num_deleted ) + ' orphan files and thumbnails.' )
+            
+        
+        # deleting from a pack only marks the space as free, so rewrite whichever prefixes are now mostly dead weight. this is outside the db, so it blocks nothing else
+        
+        num_compacted = self.server_pack_store.Compact()
+        
+        if num_compacted > 0:
+            
+            HydrusData.Print( 'Compacted ' + HydrusData.ToHumanInt( num_compacted ) + ' pack prefixes.' )
+            
         
     
     def Exit( self ):
@@ -269,6 +390,8 @@ class Controller( HydrusController.HydrusController ):
         
         self.ShutdownModel()
         
+        self.server_pack_store.Close()
+        
         HydrusData.CleanRunningFile( self.db_dir, 'server' )
         
     
@@ -277,6 +400,11 @@ class Controller( HydrusController.HydrusController ):
         return self.db.GetFilesDir()
         
     
+    def GetPacksDir( self ):
+        
+        return self.db.GetPacksDir()
+        
+    
     def GetServices( self ):
         
         return list( self._services )
@@ -292,6 +420,8 @@ class Controller( HydrusController.HydrusController ):
         
         self.server_session_manager = HydrusSessions.HydrusSessionManagerServer()
         
+        self.server_pack_store = ServerFiles.PackStore( self.GetPacksDir() )
+        
         self._service_keys_to_connected_ports = {}
         
     
@@ -327,6 +457,10 @@ class Controller( HydrusController.HydrusController ):
         
         self._daemon_jobs[ 'delete_orphans' ] = job
         
+        job = self.CallRepeating( 3600.0, 7 * 86400.0, self.VacuumDB )
+        
+        self._daemon_jobs[ 'vacuum' ] = job
+        
     
     def JustWokeFromSleep( self ):
         
@@ -469,3 +603,24 @@ class Controller( HydrusController.HydrusController ):
             
         
     
+    def VacuumDB( self ):
+        
+        if HG.server_busy:
+            
+            return
+            
+        
+        # only vacuum what we think will be done in five minutes, since the server is busy meanwhile
+        
+        stop_time = HydrusData.GetNow() + 300
+        
+        vacuum_done = self.WriteSynchronous( 'vacuum', stop_time = stop_time )
+        
+        if not vacuum_done:
+            
+            # a backup is running, so try again once it has probably finished, rather than in a week
+            
+            self.CallLater( 600.0, self.VacuumDB )
+            
+        
+    
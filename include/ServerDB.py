@@ -27,6 +27,16 @@ from . import HydrusData
 from . import HydrusTags
 from . import HydrusGlobals as HG
 
+ID_CACHE_SIZE = 100000
+
+ORPHAN_GRACE_PERIOD = 3600
+
+PETITION_SUMMARY_BLOCK_SIZE = 1024
+
+UPDATE_MAX_DEFINITIONS_ROWS = 50000
+UPDATE_MAX_CONTENT_ROWS = 250000
+UPDATE_MAX_CONTENT_CHUNK = 25000
+
 def GenerateRepositoryMasterMapTableNames( service_id ):
     
     suffix = str( service_id )
@@ -59,6 +69,19 @@ def GenerateRepositoryMappingsTableNames( service_id ):
     
     return ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name )
     
+def GenerateRepositoryPetitionSummaryBlocksTableName( summary_table_name ):
+    
+    return summary_table_name + '_blocks'
+    
+def GenerateRepositoryPetitionSummaryTableNames( service_id ):
+    
+    suffix = str( service_id )
+    
+    petitioned_files_summary_table_name = 'petitioned_files_summary_' + suffix
+    petitioned_mappings_summary_table_name = 'external_mappings.petitioned_mappings_summary_' + suffix
+    
+    return ( petitioned_files_summary_table_name, petitioned_mappings_summary_table_name )
+    
 def GenerateRepositoryTagParentsTableNames( service_id ):
     
     suffix = str( service_id )
@@ -81,19 +104,24 @@ def GenerateRepositoryTagSiblingsTableNames( service_id ):
     
     return ( current_tag_siblings_table_name, deleted_tag_siblings_table_name, pending_tag_siblings_table_name, petitioned_tag_siblings_table_name )
     
+def GenerateRepositoryUpdateStagingTableName( service_id ):
+    
+    return 'external_mappings.update_staging_mappings_' + str( service_id )
+    
 def GenerateRepositoryUpdateTableName( service_id ):
     
     return 'updates_' + str( service_id )
     
 class DB( HydrusDB.HydrusDB ):
     
-    READ_WRITE_ACTIONS = [ 'access_key', 'immediate_content_update', 'registration_keys' ]
+    READ_WRITE_ACTIONS = [ 'access_key', 'immediate_content_update', 'registration_keys', 'repository_updates' ]
     
     TRANSACTION_COMMIT_TIME = 120
     
     def __init__( self, controller, db_dir, db_name ):
         
         self._files_dir = os.path.join( db_dir, 'server_files' )
+        self._packs_dir = os.path.join( db_dir, 'server_packs' )
         
         self._ssl_cert_filename = 'server.crt'
         self._ssl_key_filename = 'server.key'
@@ -103,6 +131,8 @@ class DB( HydrusDB.HydrusDB ):
         
         self._account_type_cache = {}
         
+        self._backup_running = False
+        
         HydrusDB.HydrusDB.__init__( self, controller, db_dir, db_name )
         
     
@@ -155,14 +185,9 @@ class DB( HydrusDB.HydrusDB ):
             
             if 'thumbnail' in file_dict:
                 
-                thumbnail_dest_path = ServerFiles.GetExpectedThumbnailPath( hash )
-                
                 thumbnail_bytes = file_dict[ 'thumbnail' ]
                 
-                with open( thumbnail_dest_path, 'wb' ) as f:
-                    
-                    f.write( thumbnail_bytes )
-                    
+                ServerFiles.WriteThumbnail( hash, thumbnail_bytes )
                 
             
             self._c.execute( 'INSERT OR IGNORE INTO files_info ( master_hash_id, size, mime, width, height, duration, num_frames, num_words ) VALUES ( ?, ?, ?, ?, ?, ?, ?, ? );', ( master_hash_id, size, mime, width, height, duration, num_frames, num_words ) )
@@ -215,6 +240,18 @@ class DB( HydrusDB.HydrusDB ):
         self._c.execute( 'INSERT INTO sessions ( session_key, service_id, account_id, expires ) VALUES ( ?, ?, ?, ? );', ( sqlite3.Binary( session_key ), service_id, account_id, expires ) )
         
     
+    def _AddToIdCache( self, id_cache, key, value ):
+        
+        id_cache[ key ] = value
+        
+        id_cache.move_to_end( key )
+        
+        while len( id_cache ) > ID_CACHE_SIZE:
+            
+            id_cache.popitem( last = False )
+            
+        
+    
     def _Analyze( self, maintenance_mode = HC.MAINTENANCE_FORCED, stop_time = None ):
         
         stale_time_delta = 30 * 86400
@@ -271,61 +308,129 @@ class DB( HydrusDB.HydrusDB ):
     
     def _Backup( self ):
         
-        self._CloseDBCursor()
+        if self._backup_running:
+            
+            HydrusData.Print( 'A backup was requested, but one is already running!' )
+            
+            return
+            
         
-        HG.server_busy = True
+        backup_path = os.path.join( self._db_dir, 'server_backup' )
         
-        try:
+        HydrusPaths.MakeSureDirectoryExists( backup_path )
+        
+        if HG.no_wal:
             
-            stop_time = HydrusData.GetNow() + 300
+            # without WAL, a reader holding a snapshot open would stop us committing, so we have to go offline
             
-            for filename in list(self._db_filenames.values()):
-                
-                db_path = os.path.join( self._db_dir, filename )
+            self._CloseDBCursor()
+            
+            HG.server_busy = True
+            
+            try:
                 
-                if HydrusDB.CanVacuum( db_path, stop_time ):
+                for filename in list(self._db_filenames.values()):
                     
-                    HydrusData.Print( 'backing up: vacuuming ' + filename )
+                    HydrusData.Print( 'backing up: copying ' + filename )
                     
-                    HydrusDB.VacuumDB( db_path )
+                    source = os.path.join( self._db_dir, filename )
+                    dest = os.path.join( backup_path, filename )
+                    
+                    HydrusPaths.MirrorFile( source, dest )
                     
                 
+                self._BackupFiles( backup_path )
+                
+            finally:
+                
+                HG.server_busy = False
+                
+                self._InitDBCursor()
+                
             
-            backup_path = os.path.join( self._db_dir, 'server_backup' )
+            HydrusData.Print( 'backing up: done!' )
             
-            HydrusPaths.MakeSureDirectoryExists( backup_path )
+        else:
             
-            for filename in list(self._db_filenames.values()):
+            # commit everything so far and pin a snapshot of every db on a second connection before we take any more writes
+            # the copy then happens in another thread while we keep serving
+            
+            self._Commit()
+            
+            try:
                 
-                HydrusData.Print( 'backing up: copying ' + filename )
+                source_db = sqlite3.connect( os.path.join( self._db_dir, self._db_filenames[ 'main' ] ), isolation_level = None, check_same_thread = False )
                 
-                source = os.path.join( self._db_dir, filename )
-                dest = os.path.join( backup_path, filename )
+                source_c = source_db.cursor()
                 
-                HydrusPaths.MirrorFile( source, dest )
+                for ( name, filename ) in list(self._db_filenames.items()):
+                    
+                    if name != 'main':
+                        
+                        source_c.execute( 'ATTACH ? AS ' + name + ';', ( os.path.join( self._db_dir, filename ), ) )
+                        
+                    
                 
-            
-            for filename in [ self._ssl_cert_filename, self._ssl_key_filename ]:
+                source_c.execute( 'BEGIN;' )
                 
-                HydrusData.Print( 'backing up: copying ' + filename )
+                for name in list(self._db_filenames.keys()):
+                    
+                    source_c.execute( 'SELECT 1 FROM ' + name + '.sqlite_master;' ).fetchone()
+                    
                 
-                source = os.path.join( self._db_dir, filename )
-                dest = os.path.join( backup_path, filename )
+            finally:
                 
-                HydrusPaths.MirrorFile( source, dest )
+                self._BeginImmediate()
                 
             
-            HydrusData.Print( 'backing up: copying files' )
-            HydrusPaths.MirrorTree( self._files_dir, os.path.join( backup_path, 'server_files' ) )
+            self._backup_running = True
             
-        finally:
+            self._controller.CallToThreadLongRunning( self.THREADBackup, source_db, backup_path )
             
-            HG.server_busy = False
+        
+    
+    def _BackupFiles( self, backup_path ):
+        
+        for filename in [ self._ssl_cert_filename, self._ssl_key_filename ]:
             
-            self._InitDBCursor()
+            HydrusData.Print( 'backing up: copying ' + filename )
+            
+            source = os.path.join( self._db_dir, filename )
+            dest = os.path.join( backup_path, filename )
+            
+            HydrusPaths.MirrorFile( source, dest )
+            
+        
+        HydrusData.Print( 'backing up: copying files' )
+        
+        manifest_path = os.path.join( backup_path, 'server_files_manifest.txt' )
+        
+        HydrusPaths.MirrorImmutableTree( self._files_dir, os.path.join( backup_path, 'server_files' ), manifest_path )
+        
+        # pack segments grow and get compacted, so they cannot go through the manifest. there are only a few hundred of them, so a plain mirror is cheap
+        # a compaction replaces and deletes whole segments, so we hold it off until the copy is done. an append mid-copy only leaves a short tail, which a load truncates
+        
+        HydrusData.Print( 'backing up: copying packs' )
+        
+        pack_store = self._controller.server_pack_store
+        
+        pack_store.PauseCompaction()
+        
+        try:
+            
+            HydrusPaths.MirrorTree( self._packs_dir, os.path.join( backup_path, 'server_packs' ) )
+            
+        finally:
+            
+            pack_store.ResumeCompaction()
             
         
-        HydrusData.Print( 'backing up: done!' )
+    
+    def _ClearIdCaches( self ):
+        
+        self._hashes_to_master_hash_ids = collections.OrderedDict()
+        self._service_master_hash_ids_to_service_hash_ids = collections.OrderedDict()
+        self._service_master_tag_ids_to_service_tag_ids = collections.OrderedDict()
         
     
     def _CreateDB( self ):
@@ -358,6 +463,9 @@ class DB( HydrusDB.HydrusDB ):
         
         self._c.execute( 'CREATE TABLE registration_keys ( registration_key BLOB_BYTES PRIMARY KEY, service_id INTEGER, account_type_id INTEGER, account_key BLOB_BYTES, access_key BLOB_BYTES UNIQUE, expires INTEGER );' )
         
+        self._c.execute( 'CREATE TABLE repository_update_generation ( service_id INTEGER PRIMARY KEY, begin INTEGER, end INTEGER, last_content_update_action INTEGER, last_service_tag_id INTEGER, last_service_hash_id INTEGER );' )
+        self._c.execute( 'CREATE TABLE repository_update_generation_hashes ( service_id INTEGER, update_index INTEGER, update_hash BLOB_BYTES, PRIMARY KEY ( service_id, update_index ) );' )
+        
         self._c.execute( 'CREATE TABLE sessions ( session_key BLOB_BYTES, service_id INTEGER, account_id INTEGER, expires INTEGER );' )
         
         self._c.execute( 'CREATE TABLE version ( version INTEGER, year INTEGER, month INTEGER );' )
@@ -409,25 +517,37 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
-    def _DeleteOrphans( self ):
+    def _DeleteOrphans( self, prefix ):
+        
+        # we look again rather than trusting an earlier read, as something may have become useful since
         
-        # make a table for files
-        # make a table for thumbnails
+        orphans = self._GetOrphans( prefix )
+        
+        if len( orphans ) == 0:
+            
+            return 0
+            
         
-        # populate both tables with what you have in your hdd
-        # if the filename isn't even a hash, schedule it for immediate deletion instead
+        for ( file_type, hash, path ) in orphans:
+            
+            if path is not None:
+                
+                HydrusPaths.DeletePath( path )
+                
+            
         
-        # delete from the tables based on what is in current and pending repo file tables
-        # delete from the file tables based on what is in update tables
+        pack_store = self._controller.server_pack_store
         
-        # delete whatever is left
+        for file_type in ( 'file', 'thumbnail' ):
+            
+            pack_store.DeleteObjects( file_type, [ hash for ( orphan_file_type, hash, path ) in orphans if orphan_file_type == file_type and path is None ] )
+            
         
-        # might want to split this up into 256 jobs--depends on how fast its bits run
-        # might also want to set server_busy, if it isn't already
+        # with its files_info gone, a later upload of the same file writes it out again
         
-        # also think about how often it runs--maybe only once a month is appropriate
+        self._c.executemany( 'DELETE FROM files_info WHERE master_hash_id IN ( SELECT master_hash_id FROM hashes WHERE hash = ? );', ( ( sqlite3.Binary( hash ), ) for ( file_type, hash, path ) in orphans if file_type == 'file' ) )
         
-        return # return to this to fix it for new system
+        return len( orphans )
         
     
     def _DeleteService( self, service_key ):
@@ -766,6 +886,18 @@ class DB( HydrusDB.HydrusDB ):
         return list(self._account_type_cache[ service_id ].values())
         
     
+    def _GetFromIdCache( self, id_cache, key ):
+        
+        if key in id_cache:
+            
+            id_cache.move_to_end( key )
+            
+            return id_cache[ key ]
+            
+        
+        return None
+        
+    
     def _GetHash( self, master_hash_id ):
         
         result = self._c.execute( 'SELECT hash FROM hashes WHERE master_hash_id = ?;', ( master_hash_id, ) ).fetchone()
@@ -789,6 +921,13 @@ class DB( HydrusDB.HydrusDB ):
     
     def _GetMasterHashId( self, hash ):
         
+        master_hash_id = self._GetFromIdCache( self._hashes_to_master_hash_ids, hash )
+        
+        if master_hash_id is not None:
+            
+            return master_hash_id
+            
+        
         result = self._c.execute( 'SELECT master_hash_id FROM hashes WHERE hash = ?;', ( sqlite3.Binary( hash ), ) ).fetchone()
         
         if result is None:
@@ -797,20 +936,20 @@ class DB( HydrusDB.HydrusDB ):
             
             master_hash_id = self._c.lastrowid
             
-            return master_hash_id
-            
         else:
             
             ( master_hash_id, ) = result
             
-            return master_hash_id
-            
+        
+        self._AddToIdCache( self._hashes_to_master_hash_ids, hash, master_hash_id )
+        
+        return master_hash_id
         
     
     def _GetMasterHashIds( self, hashes ):
         
         master_hash_ids = set()
-        hashes_not_in_db = set()
+        hashes_not_in_cache = set()
         
         for hash in hashes:
             
@@ -819,29 +958,32 @@ class DB( HydrusDB.HydrusDB ):
                 continue
                 
             
-            result = self._c.execute( 'SELECT master_hash_id FROM hashes WHERE hash = ?;', ( sqlite3.Binary( hash ), ) ).fetchone()
+            master_hash_id = self._GetFromIdCache( self._hashes_to_master_hash_ids, hash )
             
-            if result is None:
+            if master_hash_id is None:
                 
-                hashes_not_in_db.add( hash )
+                hashes_not_in_cache.add( hash )
                 
             else:
                 
-                ( master_hash_id, ) = result
-                
                 master_hash_ids.add( master_hash_id )
                 
             
         
-        if len( hashes_not_in_db ) > 0:
+        if len( hashes_not_in_cache ) > 0:
             
-            self._c.executemany( 'INSERT INTO hashes ( hash ) VALUES ( ? );', ( ( sqlite3.Binary( hash ), ) for hash in hashes_not_in_db ) )
+            # one pass to add whatever is new and one join to fetch the lot, rather than a query per hash
             
-            for hash in hashes_not_in_db:
+            with HydrusDB.TemporaryBlobTable( self._c, hashes_not_in_cache, 'hash' ) as temp_table_name:
                 
-                ( master_hash_id, ) = self._c.execute( 'SELECT master_hash_id FROM hashes WHERE hash = ?;', ( sqlite3.Binary( hash ), ) ).fetchone()
+                self._c.execute( 'INSERT OR IGNORE INTO hashes ( hash ) SELECT hash FROM ' + temp_table_name + ';' )
                 
-                master_hash_ids.add( master_hash_id )
+                for ( hash, master_hash_id ) in self._c.execute( 'SELECT hash, master_hash_id FROM ' + temp_table_name + ' CROSS JOIN hashes USING ( hash );' ):
+                    
+                    master_hash_ids.add( master_hash_id )
+                    
+                    self._AddToIdCache( self._hashes_to_master_hash_ids, hash, master_hash_id )
+                    
                 
             
         
@@ -881,6 +1023,52 @@ class DB( HydrusDB.HydrusDB ):
         return options
         
     
+    def _GetOrphans( self, prefix ):
+        
+        # a file and its thumbnail are useful while the file is current or pending in any file repository, and an update file while any repository has it registered or an unfinished generation has written it
+        # anything younger than the grace period is left alone, as it may belong to a job that has not reached the db yet, like an update batch that is written but not yet recorded
+        
+        grace_timestamp = HydrusData.GetNow() - ORPHAN_GRACE_PERIOD
+        
+        objects = [ ( file_type, hash, path ) for ( file_type, hash, timestamp, path ) in ServerFiles.IterateObjects( prefix ) if timestamp < grace_timestamp ]
+        
+        if len( objects ) == 0:
+            
+            return []
+            
+        
+        candidate_hashes = { hash for ( file_type, hash, path ) in objects }
+        
+        useful_hashes = set()
+        
+        with HydrusDB.TemporaryBlobTable( self._c, candidate_hashes, 'hash' ) as temp_table_name:
+            
+            # a generation that is still going, maybe one we are resuming after a crash, has written its batches but not registered them yet
+            
+            useful_hashes.update( ( update_hash for ( update_hash, ) in self._c.execute( 'SELECT update_hash FROM repository_update_generation_hashes WHERE update_hash IN ( SELECT hash FROM ' + temp_table_name + ' );' ) ) )
+            
+            table_join = temp_table_name + ' NATURAL JOIN hashes'
+            
+            for service_id in self._GetServiceIds( HC.REPOSITORIES ):
+                
+                if self._GetServiceType( service_id ) == HC.FILE_REPOSITORY:
+                    
+                    ( hash_id_map_table_name, tag_id_map_table_name ) = GenerateRepositoryMasterMapTableNames( service_id )
+                    ( current_files_table_name, deleted_files_table_name, pending_files_table_name, petitioned_files_table_name, ip_addresses_table_name ) = GenerateRepositoryFilesTableNames( service_id )
+                    
+                    useful_hashes.update( ( hash for ( hash, ) in self._c.execute( 'SELECT hash FROM ' + table_join + ' NATURAL JOIN ' + hash_id_map_table_name + ' NATURAL JOIN ' + current_files_table_name + ';' ) ) )
+                    useful_hashes.update( ( hash for ( hash, ) in self._c.execute( 'SELECT hash FROM ' + table_join + ' NATURAL JOIN ' + pending_files_table_name + ';' ) ) )
+                    
+                
+                update_table_name = GenerateRepositoryUpdateTableName( service_id )
+                
+                useful_hashes.update( ( hash for ( hash, ) in self._c.execute( 'SELECT hash FROM ' + table_join + ' NATURAL JOIN ' + update_table_name + ';' ) ) )
+                
+            
+        
+        return [ ( file_type, hash, path ) for ( file_type, hash, path ) in objects if hash not in useful_hashes ]
+        
+    
     def _GetReason( self, reason_id ):
         
         result = self._c.execute( 'SELECT reason FROM reasons WHERE reason_id = ?;', ( reason_id, ) ).fetchone()
@@ -1045,6 +1233,8 @@ class DB( HydrusDB.HydrusDB ):
         self._over_monthly_data = False
         self._services_over_monthly_data = set()
         
+        self._ClearIdCaches()
+        
     
     def _InitExternalDatabases( self ):
         
@@ -1229,8 +1419,10 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'immediate_update': result = self._RepositoryGenerateImmediateUpdate( *args, **kwargs )
         elif action == 'ip': result = self._RepositoryGetIPTimestamp( *args, **kwargs )
         elif action == 'num_petitions': result = self._RepositoryGetNumPetitions( *args, **kwargs )
+        elif action == 'orphans': result = self._GetOrphans( *args, **kwargs )
         elif action == 'petition': result = self._RepositoryGetPetition( *args, **kwargs )
         elif action == 'registration_keys': result = self._GenerateRegistrationKeysFromAccount( *args, **kwargs )
+        elif action == 'repository_updates': result = self._RepositoryGenerateUpdatesBatch( *args, **kwargs )
         elif action == 'service_has_file': result = self._RepositoryHasFile( *args, **kwargs )
         elif action == 'service_keys': result = self._GetServiceKeys( *args, **kwargs )
         elif action == 'services': result = self._GetServices( *args, **kwargs )
@@ -1407,6 +1599,11 @@ class DB( HydrusDB.HydrusDB ):
         self._c.executemany( 'DELETE FROM ' + pending_mappings_table_name + ' WHERE account_id = ?;', ( ( subject_account_id, ) for subject_account_id in subject_account_ids ) )
         self._c.executemany( 'DELETE FROM ' + petitioned_mappings_table_name + ' WHERE account_id = ?;', ( ( subject_account_id, ) for subject_account_id in subject_account_ids ) )
         
+        ( petitioned_files_summary_table_name, petitioned_mappings_summary_table_name ) = GenerateRepositoryPetitionSummaryTableNames( service_id )
+        
+        self._RepositoryDeletePetitionSummaryAccounts( petitioned_files_summary_table_name, subject_account_ids )
+        self._RepositoryDeletePetitionSummaryAccounts( petitioned_mappings_summary_table_name, subject_account_ids )
+        
         ( current_tag_parents_table_name, deleted_tag_parents_table_name, pending_tag_parents_table_name, petitioned_tag_parents_table_name ) = GenerateRepositoryTagParentsTableNames( service_id )
         
         self._c.executemany( 'DELETE FROM ' + pending_tag_parents_table_name + ' WHERE account_id = ?;', ( ( subject_account_id, ) for subject_account_id in subject_account_ids ) )
@@ -1418,6 +1615,16 @@ class DB( HydrusDB.HydrusDB ):
         self._c.executemany( 'DELETE FROM ' + petitioned_tag_siblings_table_name + ' WHERE account_id = ?;', ( ( subject_account_id, ) for subject_account_id in subject_account_ids ) )
         
     
+    def _RepositoryClearUpdateGeneration( self, service_id ):
+        
+        self._c.execute( 'DELETE FROM repository_update_generation WHERE service_id = ?;', ( service_id, ) )
+        self._c.execute( 'DELETE FROM repository_update_generation_hashes WHERE service_id = ?;', ( service_id, ) )
+        
+        staging_table_name = GenerateRepositoryUpdateStagingTableName( service_id )
+        
+        self._c.execute( 'DROP TABLE IF EXISTS ' + staging_table_name + ';' )
+        
+    
     def _RepositoryCreate( self, service_id ):
         
         ( hash_id_map_table_name, tag_id_map_table_name ) = GenerateRepositoryMasterMapTableNames( service_id )
@@ -1504,66 +1711,46 @@ class DB( HydrusDB.HydrusDB ):
         
         #
         
+        self._RepositoryCreatePetitionSummaries( service_id )
+        
+        #
+        
         ( update_table_name ) = GenerateRepositoryUpdateTableName( service_id )
         
         self._c.execute( 'CREATE TABLE ' + update_table_name + ' ( master_hash_id INTEGER PRIMARY KEY );' )
         
     
-    def _RepositoryCreateUpdate( self, service_key, begin, end ):
+    def _RepositoryCreatePetitionSummaries( self, service_id ):
         
-        service_id = self._GetServiceId( service_key )
+        # one row per petition as the janitor sees it, weighted by how many rows it holds, so picking and counting them does not have to scan the petitioned tables
         
-        ( name, ) = self._c.execute( 'SELECT name FROM services WHERE service_id = ?;', ( service_id, ) ).fetchone()
+        ( current_files_table_name, deleted_files_table_name, pending_files_table_name, petitioned_files_table_name, ip_addresses_table_name ) = GenerateRepositoryFilesTableNames( service_id )
+        ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateRepositoryMappingsTableNames( service_id )
         
-        HydrusData.Print( 'Creating update for ' + repr( name ) + ' from ' + HydrusData.ConvertTimestampToPrettyTime( begin, in_gmt = True ) + ' to ' + HydrusData.ConvertTimestampToPrettyTime( end, in_gmt = True ) )
+        ( petitioned_files_summary_table_name, petitioned_mappings_summary_table_name ) = GenerateRepositoryPetitionSummaryTableNames( service_id )
         
-        updates = self._RepositoryGenerateUpdates( service_id, begin, end )
+        self._c.execute( 'CREATE TABLE ' + petitioned_files_summary_table_name + ' ( account_id INTEGER, reason_id INTEGER, petition_weight INTEGER, PRIMARY KEY ( account_id, reason_id ) );' )
+        self._CreateIndex( petitioned_files_summary_table_name, [ 'petition_weight' ] )
         
-        update_hashes = []
+        self._c.execute( 'INSERT INTO ' + petitioned_files_summary_table_name + ' ( account_id, reason_id, petition_weight ) SELECT account_id, reason_id, COUNT( * ) FROM ' + petitioned_files_table_name + ' GROUP BY account_id, reason_id;' )
         
-        total_definition_rows = 0
-        total_content_rows = 0
+        self._c.execute( 'CREATE TABLE ' + petitioned_mappings_summary_table_name + ' ( service_tag_id INTEGER, account_id INTEGER, reason_id INTEGER, petition_weight INTEGER, PRIMARY KEY ( service_tag_id, account_id, reason_id ) );' )
+        self._CreateIndex( petitioned_mappings_summary_table_name, [ 'account_id', 'reason_id' ] )
+        self._CreateIndex( petitioned_mappings_summary_table_name, [ 'petition_weight' ] )
         
-        if len( updates ) > 0:
-            
-            for update in updates:
-                
-                num_rows = update.GetNumRows()
-                
-                if isinstance( update, HydrusNetwork.DefinitionsUpdate ):
-                    
-                    total_definition_rows += num_rows
-                    
-                elif isinstance( update, HydrusNetwork.ContentUpdate ):
-                    
-                    total_content_rows += num_rows
-                    
-                
-                update_bytes = update.DumpToNetworkBytes()
-                
-                update_hash = hashlib.sha256( update_bytes ).digest()
-                
-                dest_path = ServerFiles.GetExpectedFilePath( update_hash )
-                
-                with open( dest_path, 'wb' ) as f:
-                    
-                    f.write( update_bytes )
-                    
-                
-                update_hashes.append( update_hash )
-                
+        self._c.execute( 'INSERT INTO ' + petitioned_mappings_summary_table_name + ' ( service_tag_id, account_id, reason_id, petition_weight ) SELECT service_tag_id, account_id, reason_id, COUNT( * ) FROM ' + petitioned_mappings_table_name + ' GROUP BY service_tag_id, account_id, reason_id;' )
+        
+        # and each summary gets the total weight of every run of rowids, so a weighted pick can seek to the right run without adding up the whole summary
+        
+        for summary_table_name in ( petitioned_files_summary_table_name, petitioned_mappings_summary_table_name ):
             
-            ( update_table_name ) = GenerateRepositoryUpdateTableName( service_id )
+            blocks_table_name = GenerateRepositoryPetitionSummaryBlocksTableName( summary_table_name )
             
-            master_hash_ids = self._GetMasterHashIds( update_hashes )
+            self._c.execute( 'CREATE TABLE ' + blocks_table_name + ' ( block_id INTEGER PRIMARY KEY, block_weight INTEGER );' )
             
-            self._c.executemany( 'INSERT OR IGNORE INTO ' + update_table_name + ' ( master_hash_id ) VALUES ( ? );', ( ( master_hash_id, ) for master_hash_id in master_hash_ids ) )
+            self._c.execute( 'INSERT INTO ' + blocks_table_name + ' ( block_id, block_weight ) SELECT rowid / ?, SUM( petition_weight ) FROM ' + summary_table_name + ' GROUP BY rowid / ?;', ( PETITION_SUMMARY_BLOCK_SIZE, PETITION_SUMMARY_BLOCK_SIZE ) )
             
         
-        HydrusData.Print( 'Update OK. ' + HydrusData.ToHumanInt( total_definition_rows ) + ' definition rows and ' + HydrusData.ToHumanInt( total_content_rows ) + ' content rows in ' + HydrusData.ToHumanInt( len( updates ) ) + ' update files.' )
-        
-        return update_hashes
-        
     
     def _RepositoryDeleteFiles( self, service_id, account_id, service_hash_ids ):
         
@@ -1576,13 +1763,92 @@ class DB( HydrusDB.HydrusDB ):
         self._RepositoryRewardFilePetitioners( service_id, valid_service_hash_ids, 1 )
         
         self._c.executemany( 'DELETE FROM ' + current_files_table_name + ' WHERE service_hash_id = ?', ( ( service_hash_id, ) for service_hash_id in valid_service_hash_ids ) )
-        self._c.executemany( 'DELETE FROM ' + petitioned_files_table_name + ' WHERE service_hash_id = ?', ( ( service_hash_id, ) for service_hash_id in valid_service_hash_ids ) )
+        
+        self._RepositoryDeleteFilePetitions( service_id, valid_service_hash_ids )
         
         now = HydrusData.GetNow()
         
         self._c.executemany( 'INSERT OR IGNORE INTO ' + deleted_files_table_name + ' ( service_hash_id, account_id, file_timestamp ) VALUES ( ?, ?, ? );', ( ( service_hash_id, account_id, now ) for service_hash_id in valid_service_hash_ids ) )
         
     
+    def _RepositoryDeleteFilePetitions( self, service_id, service_hash_ids, account_id = None ):
+        
+        ( current_files_table_name, deleted_files_table_name, pending_files_table_name, petitioned_files_table_name, ip_addresses_table_name ) = GenerateRepositoryFilesTableNames( service_id )
+        
+        ( petitioned_files_summary_table_name, petitioned_mappings_summary_table_name ) = GenerateRepositoryPetitionSummaryTableNames( service_id )
+        
+        if account_id is None:
+            
+            select_statement = 'SELECT account_id, reason_id, COUNT( * ) FROM ' + petitioned_files_table_name + ' WHERE service_hash_id IN {} GROUP BY account_id, reason_id;'
+            
+        else:
+            
+            select_statement = 'SELECT account_id, reason_id, COUNT( * ) FROM ' + petitioned_files_table_name + ' WHERE account_id = ' + str( account_id ) + ' AND service_hash_id IN {} GROUP BY account_id, reason_id;'
+            
+        
+        groups_to_weights = collections.Counter()
+        
+        for ( petitioner_account_id, reason_id, count ) in self._SelectFromList( select_statement, service_hash_ids ):
+            
+            groups_to_weights[ ( petitioner_account_id, reason_id ) ] -= count
+            
+        
+        if len( groups_to_weights ) == 0:
+            
+            return
+            
+        
+        self._RepositoryUpdatePetitionSummary( petitioned_files_summary_table_name, [ 'account_id', 'reason_id' ], groups_to_weights )
+        
+        if account_id is None:
+            
+            self._c.executemany( 'DELETE FROM ' + petitioned_files_table_name + ' WHERE service_hash_id = ?;', ( ( service_hash_id, ) for service_hash_id in service_hash_ids ) )
+            
+        else:
+            
+            self._c.executemany( 'DELETE FROM ' + petitioned_files_table_name + ' WHERE service_hash_id = ? AND account_id = ?;', ( ( service_hash_id, account_id ) for service_hash_id in service_hash_ids ) )
+            
+        
+    
+    def _RepositoryDeleteMappingPetitions( self, service_id, service_tag_id, service_hash_ids, account_id = None ):
+        
+        ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateRepositoryMappingsTableNames( service_id )
+        
+        ( petitioned_files_summary_table_name, petitioned_mappings_summary_table_name ) = GenerateRepositoryPetitionSummaryTableNames( service_id )
+        
+        if account_id is None:
+            
+            select_statement = 'SELECT account_id, reason_id, COUNT( * ) FROM ' + petitioned_mappings_table_name + ' WHERE service_tag_id = ' + str( service_tag_id ) + ' AND service_hash_id IN {} GROUP BY account_id, reason_id;'
+            
+        else:
+            
+            select_statement = 'SELECT account_id, reason_id, COUNT( * ) FROM ' + petitioned_mappings_table_name + ' WHERE service_tag_id = ' + str( service_tag_id ) + ' AND account_id = ' + str( account_id ) + ' AND service_hash_id IN {} GROUP BY account_id, reason_id;'
+            
+        
+        groups_to_weights = collections.Counter()
+        
+        for ( petitioner_account_id, reason_id, count ) in self._SelectFromList( select_statement, service_hash_ids ):
+            
+            groups_to_weights[ ( service_tag_id, petitioner_account_id, reason_id ) ] -= count
+            
+        
+        if len( groups_to_weights ) == 0:
+            
+            return
+            
+        
+        self._RepositoryUpdatePetitionSummary( petitioned_mappings_summary_table_name, [ 'service_tag_id', 'account_id', 'reason_id' ], groups_to_weights )
+        
+        if account_id is None:
+            
+            self._c.executemany( 'DELETE FROM ' + petitioned_mappings_table_name + ' WHERE service_tag_id = ? AND service_hash_id = ?;', ( ( service_tag_id, service_hash_id ) for service_hash_id in service_hash_ids ) )
+            
+        else:
+            
+            self._c.executemany( 'DELETE FROM ' + petitioned_mappings_table_name + ' WHERE service_tag_id = ? AND service_hash_id = ? AND account_id = ?;', ( ( service_tag_id, service_hash_id, account_id ) for service_hash_id in service_hash_ids ) )
+            
+        
+    
     def _RepositoryDeleteMappings( self, service_id, account_id, service_tag_id, service_hash_ids ):
         
         ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateRepositoryMappingsTableNames( service_id )
@@ -1594,13 +1860,30 @@ class DB( HydrusDB.HydrusDB ):
         self._RepositoryRewardMappingPetitioners( service_id, service_tag_id, valid_service_hash_ids, 1 )
         
         self._c.executemany( 'DELETE FROM ' + current_mappings_table_name + ' WHERE service_tag_id = ? AND service_hash_id = ?;', ( ( service_tag_id, service_hash_id ) for service_hash_id in valid_service_hash_ids ) )
-        self._c.executemany( 'DELETE FROM ' + petitioned_mappings_table_name + ' WHERE service_tag_id = ? AND service_hash_id = ?;', ( ( service_tag_id, service_hash_id ) for service_hash_id in valid_service_hash_ids ) )
+        
+        self._RepositoryDeleteMappingPetitions( service_id, service_tag_id, valid_service_hash_ids )
         
         now = HydrusData.GetNow()
         
         self._c.executemany( 'INSERT OR IGNORE INTO ' + deleted_mappings_table_name + ' ( service_tag_id, service_hash_id, account_id, mapping_timestamp ) VALUES ( ?, ?, ?, ? );', ( ( service_tag_id, service_hash_id, account_id, now ) for service_hash_id in valid_service_hash_ids ) )
         
     
+    def _RepositoryDeletePetitionSummaryAccounts( self, summary_table_name, account_ids ):
+        
+        block_ids_to_weights = collections.Counter()
+        
+        select_statement = 'SELECT rowid, petition_weight FROM ' + summary_table_name + ' WHERE account_id IN {};'
+        
+        for ( rowid, petition_weight ) in self._SelectFromListFetchAll( select_statement, account_ids ):
+            
+            block_ids_to_weights[ rowid // PETITION_SUMMARY_BLOCK_SIZE ] -= petition_weight
+            
+        
+        self._c.executemany( 'DELETE FROM ' + summary_table_name + ' WHERE account_id = ?;', ( ( account_id, ) for account_id in account_ids ) )
+        
+        self._RepositoryUpdatePetitionSummaryBlocks( GenerateRepositoryPetitionSummaryBlocksTableName( summary_table_name ), block_ids_to_weights )
+        
+    
     def _RepositoryDeleteTagParent( self, service_id, account_id, child_service_tag_id, parent_service_tag_id ):
         
         ( current_tag_parents_table_name, deleted_tag_parents_table_name, pending_tag_parents_table_name, petitioned_tag_parents_table_name ) = GenerateRepositoryTagParentsTableNames( service_id )
@@ -1633,18 +1916,14 @@ class DB( HydrusDB.HydrusDB ):
         
         self._RepositoryRewardFilePetitioners( service_id, service_hash_ids, -1 )
         
-        ( current_files_table_name, deleted_files_table_name, pending_files_table_name, petitioned_files_table_name, ip_addresses_table_name ) = GenerateRepositoryFilesTableNames( service_id )
-        
-        self._c.executemany( 'DELETE FROM ' + petitioned_files_table_name + ' WHERE service_hash_id = ?;', ( ( service_hash_id, ) for service_hash_id in service_hash_ids ) )
+        self._RepositoryDeleteFilePetitions( service_id, service_hash_ids )
         
     
     def _RepositoryDenyMappingPetition( self, service_id, service_tag_id, service_hash_ids ):
         
         self._RepositoryRewardMappingPetitioners( service_id, service_tag_id, service_hash_ids, -1 )
         
-        ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateRepositoryMappingsTableNames( service_id )
-        
-        self._c.executemany( 'DELETE FROM ' + petitioned_mappings_table_name + ' WHERE service_tag_id = ? AND service_hash_id = ?;', ( ( service_tag_id, service_hash_id ) for service_hash_id in service_hash_ids ) )
+        self._RepositoryDeleteMappingPetitions( service_id, service_tag_id, service_hash_ids )
         
     
     def _RepositoryDenyTagParentPend( self, service_id, child_master_tag_id, parent_master_tag_id ):
@@ -1697,6 +1976,12 @@ class DB( HydrusDB.HydrusDB ):
         
         table_names.extend( GenerateRepositoryTagSiblingsTableNames( service_id ) )
         
+        summary_table_names = GenerateRepositoryPetitionSummaryTableNames( service_id )
+        
+        table_names.extend( summary_table_names )
+        
+        table_names.extend( ( GenerateRepositoryPetitionSummaryBlocksTableName( summary_table_name ) for summary_table_name in summary_table_names ) )
+        
         table_names.append( GenerateRepositoryUpdateTableName( service_id ) )
         
         for table_name in table_names:
@@ -1704,32 +1989,16 @@ class DB( HydrusDB.HydrusDB ):
             self._c.execute( 'DROP TABLE ' + table_name + ';' )
             
         
-    
-    def _RepositoryGenerateImmediateUpdate( self, service_key, account, begin, end ):
+        self._RepositoryClearUpdateGeneration( service_id )
         
-        if True not in ( account.HasPermission( content_type, HC.PERMISSION_ACTION_OVERRULE ) for content_type in HC.REPOSITORY_CONTENT_TYPES ):
-            
-            raise HydrusExceptions.InsufficientCredentialsException( 'You do not have permission to generate an immediate update!' )
-            
+        # the service_id may be reused later, so nothing cached against it can survive
         
-        service_id = self._GetServiceId( service_key )
-        
-        updates = self._RepositoryGenerateUpdates( service_id, begin, end )
-        
-        return updates
+        self._ClearIdCaches()
         
     
-    def _RepositoryGenerateUpdates( self, service_id, begin, end ):
-        
-        MAX_DEFINITIONS_ROWS = 50000
-        MAX_CONTENT_ROWS = 250000
+    def _RepositoryGenerateDefinitionsUpdates( self, service_id, begin, end ):
         
-        MAX_CONTENT_CHUNK = 25000
-        
-        updates = []
-        
-        definitions_update_builder = HydrusNetwork.UpdateBuilder( HydrusNetwork.DefinitionsUpdate, MAX_DEFINITIONS_ROWS )
-        content_update_builder = HydrusNetwork.UpdateBuilder( HydrusNetwork.ContentUpdate, MAX_CONTENT_ROWS )
+        definitions_update_builder = HydrusNetwork.UpdateBuilder( HydrusNetwork.DefinitionsUpdate, UPDATE_MAX_DEFINITIONS_ROWS )
         
         ( service_hash_ids_table_name, service_tag_ids_table_name ) = GenerateRepositoryMasterMapTableNames( service_id )
         
@@ -1749,9 +2018,26 @@ class DB( HydrusDB.HydrusDB ):
         
         definitions_update_builder.Finish()
         
-        updates.extend( definitions_update_builder.GetUpdates() )
+        return definitions_update_builder.GetUpdates()
         
-        #
+    
+    def _RepositoryGenerateImmediateUpdate( self, service_key, account, begin, end ):
+        
+        if True not in ( account.HasPermission( content_type, HC.PERMISSION_ACTION_OVERRULE ) for content_type in HC.REPOSITORY_CONTENT_TYPES ):
+            
+            raise HydrusExceptions.InsufficientCredentialsException( 'You do not have permission to generate an immediate update!' )
+            
+        
+        service_id = self._GetServiceId( service_key )
+        
+        updates = self._RepositoryGenerateUpdates( service_id, begin, end )
+        
+        return updates
+        
+    
+    def _RepositoryGenerateNonMappingContentUpdates( self, service_id, begin, end ):
+        
+        content_update_builder = HydrusNetwork.UpdateBuilder( HydrusNetwork.ContentUpdate, UPDATE_MAX_CONTENT_ROWS )
         
         ( current_files_table_name, deleted_files_table_name, pending_files_table_name, petitioned_files_table_name, ip_addresses_table_name ) = GenerateRepositoryFilesTableNames( service_id )
         
@@ -1771,34 +2057,6 @@ class DB( HydrusDB.HydrusDB ):
             content_update_builder.AddRow( ( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_DELETE, service_hash_id ) )
             
         
-        #
-        
-        ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateRepositoryMappingsTableNames( service_id )
-        
-        service_tag_ids_to_service_hash_ids = HydrusData.BuildKeyToListDict( self._c.execute( 'SELECT service_tag_id, service_hash_id FROM ' + current_mappings_table_name + ' WHERE mapping_timestamp BETWEEN ? AND ?;', ( begin, end ) ) )
-        
-        for ( service_tag_id, service_hash_ids ) in list(service_tag_ids_to_service_hash_ids.items()):
-            
-            for block_of_service_hash_ids in HydrusData.SplitListIntoChunks( service_hash_ids, MAX_CONTENT_CHUNK ):
-                
-                row_weight = len( block_of_service_hash_ids )
-                
-                content_update_builder.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( service_tag_id, block_of_service_hash_ids ) ), row_weight )
-                
-            
-        
-        service_tag_ids_to_service_hash_ids = HydrusData.BuildKeyToListDict( self._c.execute( 'SELECT service_tag_id, service_hash_id FROM ' + deleted_mappings_table_name + ' WHERE mapping_timestamp BETWEEN ? AND ?;', ( begin, end ) ) )
-        
-        for ( service_tag_id, service_hash_ids ) in list(service_tag_ids_to_service_hash_ids.items()):
-            
-            for block_of_service_hash_ids in HydrusData.SplitListIntoChunks( service_hash_ids, MAX_CONTENT_CHUNK ):
-                
-                row_weight = len( block_of_service_hash_ids )
-                
-                content_update_builder.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_DELETE, ( service_tag_id, block_of_service_hash_ids ) ), row_weight )
-                
-            
-        
         #
         
         ( current_tag_parents_table_name, deleted_tag_parents_table_name, pending_tag_parents_table_name, petitioned_tag_parents_table_name ) = GenerateRepositoryTagParentsTableNames( service_id )
@@ -1837,13 +2095,113 @@ class DB( HydrusDB.HydrusDB ):
         
         #
         
+        content_update_builder.Finish()
+        
+        return content_update_builder.GetUpdates()
+        
+    
+    def _RepositoryGenerateUpdates( self, service_id, begin, end ):
+        
+        # this does the whole period in one go, so it is only for short periods. regular updates go through _RepositoryGenerateUpdatesBatch
+        
+        updates = []
+        
+        updates.extend( self._RepositoryGenerateDefinitionsUpdates( service_id, begin, end ) )
+        
+        content_update_builder = HydrusNetwork.UpdateBuilder( HydrusNetwork.ContentUpdate, UPDATE_MAX_CONTENT_ROWS )
+        
+        ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateRepositoryMappingsTableNames( service_id )
+        
+        for ( content_update_action, mappings_table_name ) in ( ( HC.CONTENT_UPDATE_ADD, current_mappings_table_name ), ( HC.CONTENT_UPDATE_DELETE, deleted_mappings_table_name ) ):
+            
+            service_tag_ids_to_service_hash_ids = HydrusData.BuildKeyToListDict( self._c.execute( 'SELECT service_tag_id, service_hash_id FROM ' + mappings_table_name + ' WHERE mapping_timestamp BETWEEN ? AND ?;', ( begin, end ) ) )
+            
+            for ( service_tag_id, service_hash_ids ) in list(service_tag_ids_to_service_hash_ids.items()):
+                
+                for block_of_service_hash_ids in HydrusData.SplitListIntoChunks( service_hash_ids, UPDATE_MAX_CONTENT_CHUNK ):
+                    
+                    row_weight = len( block_of_service_hash_ids )
+                    
+                    content_update_builder.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, content_update_action, ( service_tag_id, block_of_service_hash_ids ) ), row_weight )
+                    
+                
+            
+        
         content_update_builder.Finish()
         
         updates.extend( content_update_builder.GetUpdates() )
         
+        updates.extend( self._RepositoryGenerateNonMappingContentUpdates( service_id, begin, end ) )
+        
         return updates
         
     
+    def _RepositoryGenerateUpdatesBatch( self, service_key, begin, end ):
+        
+        # a period can hold tens of millions of mappings, so it is handed out an update file at a time
+        # the first batch snapshots the period's mappings into a staging table that sorts them by tag, and every later batch picks up after the last row the controller wrote to disk
+        
+        service_id = self._GetServiceId( service_key )
+        
+        staging_table_name = GenerateRepositoryUpdateStagingTableName( service_id )
+        
+        result = self._c.execute( 'SELECT last_content_update_action, last_service_tag_id, last_service_hash_id FROM repository_update_generation WHERE service_id = ? AND begin = ? AND end = ?;', ( service_id, begin, end ) ).fetchone()
+        
+        if result is None:
+            
+            ( name, ) = self._c.execute( 'SELECT name FROM services WHERE service_id = ?;', ( service_id, ) ).fetchone()
+            
+            HydrusData.Print( 'Creating update for ' + repr( name ) + ' from ' + HydrusData.ConvertTimestampToPrettyTime( begin, in_gmt = True ) + ' to ' + HydrusData.ConvertTimestampToPrettyTime( end, in_gmt = True ) )
+            
+            self._RepositoryClearUpdateGeneration( service_id )
+            
+            self._c.execute( 'CREATE TABLE ' + staging_table_name + ' ( content_update_action INTEGER, service_tag_id INTEGER, service_hash_id INTEGER, PRIMARY KEY ( content_update_action, service_tag_id, service_hash_id ) ) WITHOUT ROWID;' )
+            
+            ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateRepositoryMappingsTableNames( service_id )
+            
+            for ( content_update_action, mappings_table_name ) in ( ( HC.CONTENT_UPDATE_ADD, current_mappings_table_name ), ( HC.CONTENT_UPDATE_DELETE, deleted_mappings_table_name ) ):
+                
+                self._c.execute( 'INSERT INTO ' + staging_table_name + ' ( content_update_action, service_tag_id, service_hash_id ) SELECT ?, service_tag_id, service_hash_id FROM ' + mappings_table_name + ' WHERE mapping_timestamp BETWEEN ? AND ?;', ( content_update_action, begin, end ) )
+                
+            
+            updates = []
+            
+            updates.extend( self._RepositoryGenerateDefinitionsUpdates( service_id, begin, end ) )
+            updates.extend( self._RepositoryGenerateNonMappingContentUpdates( service_id, begin, end ) )
+            
+            position = ( -1, -1, -1 )
+            
+            return ( updates, position, False )
+            
+        
+        position = result
+        
+        rows = self._c.execute( 'SELECT content_update_action, service_tag_id, service_hash_id FROM ' + staging_table_name + ' WHERE ( content_update_action, service_tag_id, service_hash_id ) > ( ?, ?, ? ) ORDER BY content_update_action, service_tag_id, service_hash_id LIMIT ?;', position + ( UPDATE_MAX_CONTENT_ROWS, ) ).fetchall()
+        
+        if len( rows ) == 0:
+            
+            return ( [], position, True )
+            
+        
+        content_update = HydrusNetwork.ContentUpdate()
+        
+        for ( ( content_update_action, service_tag_id ), group_rows ) in itertools.groupby( rows, key = lambda row: row[:2] ):
+            
+            service_hash_ids = [ service_hash_id for ( content_update_action, service_tag_id, service_hash_id ) in group_rows ]
+            
+            for block_of_service_hash_ids in HydrusData.SplitListIntoChunks( service_hash_ids, UPDATE_MAX_CONTENT_CHUNK ):
+                
+                content_update.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, content_update_action, ( service_tag_id, block_of_service_hash_ids ) ) )
+                
+            
+        
+        position = rows[-1]
+        
+        finished = len( rows ) < UPDATE_MAX_CONTENT_ROWS
+        
+        return ( [ content_update ], position, finished )
+        
+    
     def _RepositoryGetAccountInfo( self, service_id, account_id ):
         
         ( hash_id_map_table_name, tag_id_map_table_name ) = GenerateRepositoryMasterMapTableNames( service_id )
@@ -1932,14 +2290,9 @@ class DB( HydrusDB.HydrusDB ):
         
         ( current_files_table_name, deleted_files_table_name, pending_files_table_name, petitioned_files_table_name, ip_addresses_table_name ) = GenerateRepositoryFilesTableNames( service_id )
         
-        result = self._c.execute( 'SELECT account_id, reason_id FROM ' + petitioned_files_table_name + ' ORDER BY RANDOM() LIMIT 1;' ).fetchone()
-        
-        if result is None:
-            
-            raise HydrusExceptions.NotFoundException( 'No petitions!' )
-            
+        ( petitioned_files_summary_table_name, petitioned_mappings_summary_table_name ) = GenerateRepositoryPetitionSummaryTableNames( service_id )
         
-        ( petitioner_account_id, reason_id ) = result
+        ( petitioner_account_id, reason_id ) = self._RepositoryGetRandomPetitionGroup( petitioned_files_summary_table_name, [ 'account_id', 'reason_id' ] )
         
         action = HC.CONTENT_UPDATE_PETITION
         
@@ -1986,20 +2339,18 @@ class DB( HydrusDB.HydrusDB ):
         
         petition_count_info = []
         
-        ( current_files_table_name, deleted_files_table_name, pending_files_table_name, petitioned_files_table_name, ip_addresses_table_name ) = GenerateRepositoryFilesTableNames( service_id )
+        ( petitioned_files_summary_table_name, petitioned_mappings_summary_table_name ) = GenerateRepositoryPetitionSummaryTableNames( service_id )
         
         if account.HasPermission( HC.CONTENT_TYPE_FILES, HC.PERMISSION_ACTION_OVERRULE ):
             
-            ( num_petitions, ) = self._c.execute( 'SELECT COUNT( * ) FROM ( SELECT DISTINCT account_id, reason_id FROM ' + petitioned_files_table_name + ' );' ).fetchone()
+            ( num_petitions, ) = self._c.execute( 'SELECT COUNT( * ) FROM ' + petitioned_files_summary_table_name + ';' ).fetchone()
             
             petition_count_info.append( ( HC.CONTENT_TYPE_FILES, HC.CONTENT_STATUS_PETITIONED, num_petitions ) )
             
         
-        ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateRepositoryMappingsTableNames( service_id )
-        
         if account.HasPermission( HC.CONTENT_TYPE_MAPPINGS, HC.PERMISSION_ACTION_OVERRULE ):
             
-            ( num_petitions, ) = self._c.execute( 'SELECT COUNT( * ) FROM ( SELECT DISTINCT service_tag_id, account_id, reason_id FROM ' + petitioned_mappings_table_name + ' );' ).fetchone()
+            ( num_petitions, ) = self._c.execute( 'SELECT COUNT( * ) FROM ' + petitioned_mappings_summary_table_name + ';' ).fetchone()
             
             petition_count_info.append( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_STATUS_PETITIONED, num_petitions ) )
             
@@ -2037,14 +2388,9 @@ class DB( HydrusDB.HydrusDB ):
         
         ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateRepositoryMappingsTableNames( service_id )
         
-        result = self._c.execute( 'SELECT account_id, reason_id FROM ' + petitioned_mappings_table_name + ' ORDER BY RANDOM() LIMIT 1;' ).fetchone()
-        
-        if result is None:
-            
-            raise HydrusExceptions.NotFoundException( 'No petitions!' )
-            
+        ( petitioned_files_summary_table_name, petitioned_mappings_summary_table_name ) = GenerateRepositoryPetitionSummaryTableNames( service_id )
         
-        ( petitioner_account_id, reason_id ) = result
+        ( service_tag_id, petitioner_account_id, reason_id ) = self._RepositoryGetRandomPetitionGroup( petitioned_mappings_summary_table_name, [ 'service_tag_id', 'account_id', 'reason_id' ] )
         
         action = HC.CONTENT_UPDATE_PETITION
         
@@ -2052,7 +2398,9 @@ class DB( HydrusDB.HydrusDB ):
         
         reason = self._GetReason( reason_id )
         
-        tag_ids_to_hash_ids = HydrusData.BuildKeyToListDict( self._c.execute( 'SELECT service_tag_id, service_hash_id FROM ' + petitioned_mappings_table_name + ' WHERE account_id = ? AND reason_id = ?;', ( petitioner_account_id, reason_id ) ) )
+        # the summary knows each tag's weight, so we only fetch the hashes for the tags that make it into the petition
+        
+        petition_pairs = self._c.execute( 'SELECT service_tag_id, petition_weight FROM ' + petitioned_mappings_summary_table_name + ' WHERE account_id = ? AND reason_id = ?;', ( petitioner_account_id, reason_id ) ).fetchall()
         
         contents = []
         
@@ -2064,13 +2412,9 @@ class DB( HydrusDB.HydrusDB ):
         
         max_total_weight = None
         
-        petition_pairs = list( tag_ids_to_hash_ids.items() )
-        
         random.shuffle( petition_pairs )
         
-        for ( service_tag_id, service_hash_ids ) in petition_pairs:
-            
-            content_weight = len( service_hash_ids )
+        for ( service_tag_id, content_weight ) in petition_pairs:
             
             if min_weight_permitted is None:
                 
@@ -2118,6 +2462,8 @@ class DB( HydrusDB.HydrusDB ):
                     
                 
             
+            service_hash_ids = self._STL( self._c.execute( 'SELECT service_hash_id FROM ' + petitioned_mappings_table_name + ' WHERE service_tag_id = ? AND account_id = ? AND reason_id = ?;', ( service_tag_id, petitioner_account_id, reason_id ) ) )
+            
             master_tag_id = self._RepositoryGetMasterTagId( service_id, service_tag_id )
             master_hash_ids = self._RepositoryGetMasterHashIds( service_id, service_hash_ids )
             
@@ -2214,8 +2560,63 @@ class DB( HydrusDB.HydrusDB ):
         return petition
         
     
+    def _RepositoryGetRandomPetitionGroup( self, summary_table_name, group_column_names ):
+        
+        # a group is picked in proportion to its weight, as if we had picked a random petitioned row
+        # we count our way along the blocks to the one holding that row and then along the few groups in that block
+        
+        blocks_table_name = GenerateRepositoryPetitionSummaryBlocksTableName( summary_table_name )
+        
+        blocks = self._c.execute( 'SELECT block_id, block_weight FROM ' + blocks_table_name + ' ORDER BY block_id ASC;' ).fetchall()
+        
+        total_weight = sum( ( block_weight for ( block_id, block_weight ) in blocks ) )
+        
+        if total_weight == 0:
+            
+            raise HydrusExceptions.NotFoundException( 'No petitions!' )
+            
+        
+        position = random.randrange( total_weight )
+        
+        for ( block_id, block_weight ) in blocks:
+            
+            if position < block_weight:
+                
+                break
+                
+            
+            position -= block_weight
+            
+        
+        select_statement = 'SELECT ' + ', '.join( group_column_names ) + ', petition_weight FROM ' + summary_table_name + ' WHERE rowid BETWEEN ? AND ? ORDER BY rowid ASC;'
+        
+        rows = self._c.execute( select_statement, ( block_id * PETITION_SUMMARY_BLOCK_SIZE, ( block_id + 1 ) * PETITION_SUMMARY_BLOCK_SIZE - 1 ) ).fetchall()
+        
+        for row in rows:
+            
+            group = row[:-1]
+            petition_weight = row[-1]
+            
+            if position < petition_weight:
+                
+                return group
+                
+            
+            position -= petition_weight
+            
+        
+        raise HydrusExceptions.DataMissing( 'The petition summary did not match its blocks!' )
+        
+    
     def _RepositoryGetServiceHashId( self, service_id, master_hash_id ):
         
+        service_hash_id = self._GetFromIdCache( self._service_master_hash_ids_to_service_hash_ids, ( service_id, master_hash_id ) )
+        
+        if service_hash_id is not None:
+            
+            return service_hash_id
+            
+        
         ( hash_id_map_table_name, tag_id_map_table_name ) = GenerateRepositoryMasterMapTableNames( service_id )
         
         result = self._c.execute( 'SELECT service_hash_id FROM ' + hash_id_map_table_name + ' WHERE master_hash_id = ?;', ( master_hash_id, ) ).fetchone()
@@ -2228,14 +2629,14 @@ class DB( HydrusDB.HydrusDB ):
             
             service_hash_id = self._c.lastrowid
             
-            return service_hash_id
-            
         else:
             
             ( service_hash_id, ) = result
             
-            return service_hash_id
-            
+        
+        self._AddToIdCache( self._service_master_hash_ids_to_service_hash_ids, ( service_id, master_hash_id ), service_hash_id )
+        
+        return service_hash_id
         
     
     def _RepositoryGetServiceHashIds( self, service_id, master_hash_ids ):
@@ -2243,35 +2644,36 @@ class DB( HydrusDB.HydrusDB ):
         ( hash_id_map_table_name, tag_id_map_table_name ) = GenerateRepositoryMasterMapTableNames( service_id )
         
         service_hash_ids = set()
-        master_hash_ids_not_in_table = set()
+        master_hash_ids_not_in_cache = set()
         
         for master_hash_id in master_hash_ids:
             
-            result = self._c.execute( 'SELECT service_hash_id FROM ' + hash_id_map_table_name + ' WHERE master_hash_id = ?;', ( master_hash_id, ) ).fetchone()
+            service_hash_id = self._GetFromIdCache( self._service_master_hash_ids_to_service_hash_ids, ( service_id, master_hash_id ) )
             
-            if result is None:
+            if service_hash_id is None:
                 
-                master_hash_ids_not_in_table.add( master_hash_id )
+                master_hash_ids_not_in_cache.add( master_hash_id )
                 
             else:
                 
-                ( service_hash_id, ) = result
-                
                 service_hash_ids.add( service_hash_id )
                 
             
         
-        if len( master_hash_ids_not_in_table ) > 0:
+        if len( master_hash_ids_not_in_cache ) > 0:
             
             now = HydrusData.GetNow()
             
-            self._c.executemany( 'INSERT INTO ' + hash_id_map_table_name + ' ( master_hash_id, hash_id_timestamp ) VALUES ( ?, ? );', ( ( master_hash_id, now ) for master_hash_id in master_hash_ids_not_in_table ) )
-            
-            for master_hash_id in master_hash_ids_not_in_table:
+            with HydrusDB.TemporaryIntegerTable( self._c, master_hash_ids_not_in_cache, 'master_hash_id' ) as temp_table_name:
                 
-                ( service_hash_id, ) = self._c.execute( 'SELECT service_hash_id FROM ' + hash_id_map_table_name + ' WHERE master_hash_id = ?;', ( master_hash_id, ) ).fetchone()
+                self._c.execute( 'INSERT OR IGNORE INTO ' + hash_id_map_table_name + ' ( master_hash_id, hash_id_timestamp ) SELECT master_hash_id, ? FROM ' + temp_table_name + ';', ( now, ) )
                 
-                service_hash_ids.add( service_hash_id )
+                for ( master_hash_id, service_hash_id ) in self._c.execute( 'SELECT master_hash_id, service_hash_id FROM ' + temp_table_name + ' CROSS JOIN ' + hash_id_map_table_name + ' USING ( master_hash_id );' ):
+                    
+                    service_hash_ids.add( service_hash_id )
+                    
+                    self._AddToIdCache( self._service_master_hash_ids_to_service_hash_ids, ( service_id, master_hash_id ), service_hash_id )
+                    
                 
             
         
@@ -2280,6 +2682,13 @@ class DB( HydrusDB.HydrusDB ):
     
     def _RepositoryGetServiceTagId( self, service_id, master_tag_id ):
         
+        service_tag_id = self._GetFromIdCache( self._service_master_tag_ids_to_service_tag_ids, ( service_id, master_tag_id ) )
+        
+        if service_tag_id is not None:
+            
+            return service_tag_id
+            
+        
         ( hash_id_map_table_name, tag_id_map_table_name ) = GenerateRepositoryMasterMapTableNames( service_id )
         
         result = self._c.execute( 'SELECT service_tag_id FROM ' + tag_id_map_table_name + ' WHERE master_tag_id = ?;', ( master_tag_id, ) ).fetchone()
@@ -2292,14 +2701,14 @@ class DB( HydrusDB.HydrusDB ):
             
             service_tag_id = self._c.lastrowid
             
-            return service_tag_id
-            
         else:
             
             ( service_tag_id, ) = result
             
-            return service_tag_id
-            
+        
+        self._AddToIdCache( self._service_master_tag_ids_to_service_tag_ids, ( service_id, master_tag_id ), service_tag_id )
+        
+        return service_tag_id
         
     
     def _RepositoryGetTagParentPend( self, service_id ):
@@ -2591,9 +3000,20 @@ class DB( HydrusDB.HydrusDB ):
         
         valid_service_hash_ids = [ service_hash_id for ( service_hash_id, ) in self._SelectFromList( select_statement, service_hash_ids ) ]
         
-        now = HydrusData.GetNow()
+        if len( valid_service_hash_ids ) == 0:
+            
+            return
+            
         
-        self._c.executemany( 'REPLACE INTO ' + petitioned_files_table_name + ' ( service_hash_id, account_id, reason_id ) VALUES ( ?, ?, ? );', ( ( service_hash_id, account_id, reason_id ) for service_hash_id in valid_service_hash_ids ) )
+        # the account may be re-petitioning with a new reason, so clear what it had first to keep the summary in sync
+        
+        self._RepositoryDeleteFilePetitions( service_id, valid_service_hash_ids, account_id = account_id )
+        
+        self._c.executemany( 'INSERT INTO ' + petitioned_files_table_name + ' ( service_hash_id, account_id, reason_id ) VALUES ( ?, ?, ? );', ( ( service_hash_id, account_id, reason_id ) for service_hash_id in valid_service_hash_ids ) )
+        
+        ( petitioned_files_summary_table_name, petitioned_mappings_summary_table_name ) = GenerateRepositoryPetitionSummaryTableNames( service_id )
+        
+        self._RepositoryUpdatePetitionSummary( petitioned_files_summary_table_name, [ 'account_id', 'reason_id' ], { ( account_id, reason_id ) : len( valid_service_hash_ids ) } )
         
     
     def _RepositoryPetitionMappings( self, service_id, account_id, service_tag_id, service_hash_ids, reason_id ):
@@ -2604,7 +3024,18 @@ class DB( HydrusDB.HydrusDB ):
         
         valid_service_hash_ids = [ service_hash_id for ( service_hash_id, ) in self._SelectFromList( select_statement, service_hash_ids ) ]
         
-        self._c.executemany( 'REPLACE INTO ' + petitioned_mappings_table_name + ' ( service_tag_id, service_hash_id, account_id, reason_id ) VALUES ( ?, ?, ?, ? );', [ ( service_tag_id, service_hash_id, account_id, reason_id ) for service_hash_id in valid_service_hash_ids ] )
+        if len( valid_service_hash_ids ) == 0:
+            
+            return
+            
+        
+        self._RepositoryDeleteMappingPetitions( service_id, service_tag_id, valid_service_hash_ids, account_id = account_id )
+        
+        self._c.executemany( 'INSERT INTO ' + petitioned_mappings_table_name + ' ( service_tag_id, service_hash_id, account_id, reason_id ) VALUES ( ?, ?, ?, ? );', [ ( service_tag_id, service_hash_id, account_id, reason_id ) for service_hash_id in valid_service_hash_ids ] )
+        
+        ( petitioned_files_summary_table_name, petitioned_mappings_summary_table_name ) = GenerateRepositoryPetitionSummaryTableNames( service_id )
+        
+        self._RepositoryUpdatePetitionSummary( petitioned_mappings_summary_table_name, [ 'service_tag_id', 'account_id', 'reason_id' ], { ( service_tag_id, account_id, reason_id ) : len( valid_service_hash_ids ) } )
         
     
     def _RepositoryPetitionTagParent( self, service_id, account_id, child_service_tag_id, parent_service_tag_id, reason_id ):
@@ -2940,6 +3371,50 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _RepositoryRecordUpdateGenerationProgress( self, service_key, begin, end, update_hashes, position, finished ):
+        
+        service_id = self._GetServiceId( service_key )
+        
+        # the files are registered as soon as they exist, so nothing takes them for orphans while the rest of the period is still being written
+        
+        self._RepositoryRegisterUpdates( service_key, update_hashes )
+        
+        ( num_update_hashes, ) = self._c.execute( 'SELECT COUNT( * ) FROM repository_update_generation_hashes WHERE service_id = ?;', ( service_id, ) ).fetchone()
+        
+        self._c.executemany( 'INSERT INTO repository_update_generation_hashes ( service_id, update_index, update_hash ) VALUES ( ?, ?, ? );', ( ( service_id, num_update_hashes + i, sqlite3.Binary( update_hash ) ) for ( i, update_hash ) in enumerate( update_hashes ) ) )
+        
+        if finished:
+            
+            all_update_hashes = [ update_hash for ( update_hash, ) in self._c.execute( 'SELECT update_hash FROM repository_update_generation_hashes WHERE service_id = ? ORDER BY update_index ASC;', ( service_id, ) ) ]
+            
+            self._RepositoryClearUpdateGeneration( service_id )
+            
+            return all_update_hashes
+            
+        
+        ( last_content_update_action, last_service_tag_id, last_service_hash_id ) = position
+        
+        self._c.execute( 'REPLACE INTO repository_update_generation ( service_id, begin, end, last_content_update_action, last_service_tag_id, last_service_hash_id ) VALUES ( ?, ?, ?, ?, ?, ? );', ( service_id, begin, end, last_content_update_action, last_service_tag_id, last_service_hash_id ) )
+        
+        return None
+        
+    
+    def _RepositoryRegisterUpdates( self, service_key, update_hashes ):
+        
+        if len( update_hashes ) == 0:
+            
+            return
+            
+        
+        service_id = self._GetServiceId( service_key )
+        
+        update_table_name = GenerateRepositoryUpdateTableName( service_id )
+        
+        master_hash_ids = self._GetMasterHashIds( update_hashes )
+        
+        self._c.executemany( 'INSERT OR IGNORE INTO ' + update_table_name + ' ( master_hash_id ) VALUES ( ? );', ( ( master_hash_id, ) for master_hash_id in master_hash_ids ) )
+        
+    
     def _RepositoryRewardFilePetitioners( self, service_id, service_hash_ids, multiplier ):
         
         ( current_files_table_name, deleted_files_table_name, pending_files_table_name, petitioned_files_table_name, ip_addresses_table_name ) = GenerateRepositoryFilesTableNames( service_id )
@@ -3122,6 +3597,58 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _RepositoryUpdatePetitionSummary( self, summary_table_name, group_column_names, groups_to_weights ):
+        
+        group_predicate = ' AND '.join( ( column_name + ' = ?' for column_name in group_column_names ) )
+        
+        insert_statement = 'INSERT OR IGNORE INTO ' + summary_table_name + ' ( ' + ', '.join( group_column_names ) + ', petition_weight ) VALUES ( ' + ', '.join( ( '?' for column_name in group_column_names ) ) + ', 0 );'
+        
+        block_ids_to_weights = collections.Counter()
+        
+        for ( group, weight ) in groups_to_weights.items():
+            
+            if weight == 0:
+                
+                continue
+                
+            
+            self._c.execute( insert_statement, group )
+            
+            ( rowid, ) = self._c.execute( 'SELECT rowid FROM ' + summary_table_name + ' WHERE ' + group_predicate + ';', group ).fetchone()
+            
+            self._c.execute( 'UPDATE ' + summary_table_name + ' SET petition_weight = petition_weight + ? WHERE ' + group_predicate + ';', ( weight, ) + group )
+            
+            if weight < 0:
+                
+                self._c.execute( 'DELETE FROM ' + summary_table_name + ' WHERE ' + group_predicate + ' AND petition_weight <= 0;', group )
+                
+            
+            block_ids_to_weights[ rowid // PETITION_SUMMARY_BLOCK_SIZE ] += weight
+            
+        
+        self._RepositoryUpdatePetitionSummaryBlocks( GenerateRepositoryPetitionSummaryBlocksTableName( summary_table_name ), block_ids_to_weights )
+        
+    
+    def _RepositoryUpdatePetitionSummaryBlocks( self, blocks_table_name, block_ids_to_weights ):
+        
+        for ( block_id, weight ) in block_ids_to_weights.items():
+            
+            if weight == 0:
+                
+                continue
+                
+            
+            self._c.execute( 'INSERT OR IGNORE INTO ' + blocks_table_name + ' ( block_id, block_weight ) VALUES ( ?, 0 );', ( block_id, ) )
+            
+            self._c.execute( 'UPDATE ' + blocks_table_name + ' SET block_weight = block_weight + ? WHERE block_id = ?;', ( weight, block_id ) )
+            
+            if weight < 0:
+                
+                self._c.execute( 'DELETE FROM ' + blocks_table_name + ' WHERE block_id = ? AND block_weight <= 0;', ( block_id, ) )
+                
+            
+        
+    
     def _RewardAccounts( self, service_id, score_type, scores ):
         
         self._c.executemany( 'INSERT OR IGNORE INTO account_scores ( service_id, account_id, score_type, score ) VALUES ( ?, ?, ?, ? );', [ ( service_id, account_id, score_type, 0 ) for ( account_id, score ) in scores ] )
@@ -3129,6 +3656,15 @@ class DB( HydrusDB.HydrusDB ):
         self._c.executemany( 'UPDATE account_scores SET score = score + ? WHERE service_id = ? AND account_id = ? and score_type = ?;', [ ( score, service_id, account_id, score_type ) for ( account_id, score ) in scores ] )
         
     
+    def _Rollback( self ):
+        
+        # ids handed out during the failed job are about to stop existing
+        
+        self._ClearIdCaches()
+        
+        HydrusDB.HydrusDB._Rollback( self )
+        
+    
     def _SaveAccounts( self, service_id, accounts ):
         
         for account in accounts:
@@ -3195,11 +3731,61 @@ class DB( HydrusDB.HydrusDB ):
         
         # all updates timed out, 244->245 was the last
         
+        if version == 358:
+            
+            for service_id in self._GetServiceIds( HC.REPOSITORIES ):
+                
+                self._RepositoryCreatePetitionSummaries( service_id )
+                
+            
+            self._c.execute( 'CREATE TABLE IF NOT EXISTS repository_update_generation ( service_id INTEGER PRIMARY KEY, begin INTEGER, end INTEGER, last_content_update_action INTEGER, last_service_tag_id INTEGER, last_service_hash_id INTEGER );' )
+            self._c.execute( 'CREATE TABLE IF NOT EXISTS repository_update_generation_hashes ( service_id INTEGER, update_index INTEGER, update_hash BLOB_BYTES, PRIMARY KEY ( service_id, update_index ) );' )
+            
+        
         HydrusData.Print( 'The server has updated to version ' + str( version + 1 ) )
         
         self._c.execute( 'UPDATE version SET version = ?;', ( version + 1, ) )
         
     
+    def _Vacuum( self, stop_time = None ):
+        
+        if self._backup_running:
+            
+            # the backup is copying from a live connection, and a vacuum rewrites the whole file under it
+            
+            HydrusData.Print( 'A vacuum was due, but a backup is running, so it will wait!' )
+            
+            return False
+            
+        
+        self._CloseDBCursor()
+        
+        HG.server_busy = True
+        
+        try:
+            
+            for filename in list(self._db_filenames.values()):
+                
+                db_path = os.path.join( self._db_dir, filename )
+                
+                if HydrusDB.CanVacuum( db_path, stop_time ):
+                    
+                    HydrusData.Print( 'vacuuming ' + filename )
+                    
+                    HydrusDB.VacuumDB( db_path )
+                    
+                
+            
+        finally:
+            
+            HG.server_busy = False
+            
+            self._InitDBCursor()
+            
+        
+        return True
+        
+    
     def _VerifyAccessKey( self, service_key, access_key ):
         
         service_id = self._GetServiceId( service_key )
@@ -3227,14 +3813,15 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'account_types': self._ModifyAccountTypes( *args, **kwargs )
         elif action == 'analyze': self._Analyze( *args, **kwargs )
         elif action == 'backup': self._Backup( *args, **kwargs )
-        elif action == 'create_update': result = self._RepositoryCreateUpdate( *args, **kwargs )
-        elif action == 'delete_orphans': self._DeleteOrphans( *args, **kwargs )
+        elif action == 'delete_orphans': result = self._DeleteOrphans( *args, **kwargs )
         elif action == 'dirty_accounts': self._SaveDirtyAccounts( *args, **kwargs )
         elif action == 'dirty_services': self._SaveDirtyServices( *args, **kwargs )
         elif action == 'file': self._RepositoryProcessAddFile( *args, **kwargs )
+        elif action == 'repository_update_progress': result = self._RepositoryRecordUpdateGenerationProgress( *args, **kwargs )
         elif action == 'services': result = self._ModifyServices( *args, **kwargs )
         elif action == 'session': self._AddSession( *args, **kwargs )
         elif action == 'update': self._RepositoryProcessClientToServerUpdate( *args, **kwargs )
+        elif action == 'vacuum': result = self._Vacuum( *args, **kwargs )
         else: raise Exception( 'db received an unknown write command: ' + action )
         
         return result
@@ -3245,8 +3832,52 @@ class DB( HydrusDB.HydrusDB ):
         return self._files_dir
         
     
+    def GetPacksDir( self ):
+        
+        return self._packs_dir
+        
+    
     def GetSSLPaths( self ):
         
         return ( self._ssl_cert_path, self._ssl_key_path )
         
     
+    def THREADBackup( self, source_db, backup_path ):
+        
+        try:
+            
+            for ( name, filename ) in list(self._db_filenames.items()):
+                
+                HydrusData.Print( 'backing up: copying ' + filename )
+                
+                HydrusDB.BackupDBOnline( source_db, name, os.path.join( backup_path, filename ) )
+                
+            
+            # let go of the snapshot asap, so the WAL can checkpoint
+            
+            source_db.close()
+            
+            source_db = None
+            
+            self._BackupFiles( backup_path )
+            
+            HydrusData.Print( 'backing up: done!' )
+            
+        except Exception as e:
+            
+            HydrusData.Print( 'backing up: failed!' )
+            
+            HydrusData.PrintException( e )
+            
+        finally:
+            
+            if source_db is not None:
+                
+                source_db.close()
+                
+            
+            self._backup_running = False
+            
+        
+        
+    
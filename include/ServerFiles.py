@@ -2,12 +2,42 @@ from . import HydrusConstants as HC
 from . import HydrusData
 from . import HydrusExceptions
 from . import HydrusGlobals as HG
+from . import HydrusPaths
+import hashlib
 import itertools
 import os
+import struct
+import threading
+
+# small objects go in append-only pack segments, one set per hash prefix, rather than a loose file each
+# bigger objects, and all repository files, stay loose in the prefix directories
+
+PACK_MAX_OBJECT_SIZE = 256 * 1024
+PACK_SEGMENT_MAX_SIZE = 64 * 1024 * 1024
+PACK_COMPACTION_MIN_WASTE = 1024 * 1024
+
+PACK_RECORD_PUT = 1
+PACK_RECORD_DELETE = 2
+
+# record type, file type, hash, timestamp, object length
+
+PACK_RECORD_HEADER = struct.Struct( '!BB32sQI' )
+
+PACK_FILE_TYPES_TO_CODES = { 'file' : 1, 'thumbnail' : 2 }
+PACK_CODES_TO_FILE_TYPES = { code : file_type for ( file_type, code ) in PACK_FILE_TYPES_TO_CODES.items() }
 
 def GetAllHashes( file_type ):
     
-    return { bytes.fromhex( os.path.split( path )[1] ) for path in IterateAllPaths( file_type ) }
+    hashes = { bytes.fromhex( os.path.split( path )[1] ) for path in IterateAllPaths( file_type ) }
+    
+    pack_store = HG.server_controller.server_pack_store
+    
+    for prefix in HydrusData.IterateHexPrefixes():
+        
+        hashes.update( ( hash for ( object_file_type, hash, timestamp ) in pack_store.GetObjects( prefix ) if object_file_type == file_type ) )
+        
+    
+    return hashes
     
 def GetExpectedFilePath( hash ):
     
@@ -44,6 +74,19 @@ def GetFilePath( hash ):
     
     return path
     
+def GetFileSource( hash ):
+    
+    # returns ( body, path ), one of which is None, ready for a ResponseContext
+    
+    object_bytes = HG.server_controller.server_pack_store.GetObject( 'file', hash )
+    
+    if object_bytes is not None:
+        
+        return ( object_bytes, None )
+        
+    
+    return ( None, GetFilePath( hash ) )
+    
 def GetThumbnailPath( hash ):
     
     path = GetExpectedThumbnailPath( hash )
@@ -55,6 +98,17 @@ def GetThumbnailPath( hash ):
     
     return path
     
+def GetThumbnailSource( hash ):
+    
+    object_bytes = HG.server_controller.server_pack_store.GetObject( 'thumbnail', hash )
+    
+    if object_bytes is not None:
+        
+        return ( object_bytes, None )
+        
+    
+    return ( None, GetThumbnailPath( hash ) )
+    
 def IterateAllPaths( file_type ):
     
     files_dir = HG.server_controller.GetFilesDir()
@@ -80,3 +134,556 @@ def IterateAllPaths( file_type ):
             
         
     
+def IterateObjects( prefix ):
+    
+    # yields ( file_type, hash, timestamp, path ) for everything stored under the prefix, loose or packed. packed objects have no path
+    
+    dir = os.path.join( HG.server_controller.GetFilesDir(), prefix )
+    
+    for filename in os.listdir( dir ):
+        
+        if filename.endswith( '.thumbnail' ):
+            
+            file_type = 'thumbnail'
+            
+            hash_encoded = filename[ : - len( '.thumbnail' ) ]
+            
+        else:
+            
+            file_type = 'file'
+            
+            hash_encoded = filename
+            
+        
+        try:
+            
+            hash = bytes.fromhex( hash_encoded )
+            
+        except ValueError:
+            
+            continue
+            
+        
+        path = os.path.join( dir, filename )
+        
+        timestamp = int( os.path.getmtime( path ) )
+        
+        yield ( file_type, hash, timestamp, path )
+        
+    
+    for ( file_type, hash, timestamp ) in HG.server_controller.server_pack_store.GetObjects( prefix ):
+        
+        yield ( file_type, hash, timestamp, None )
+        
+    
+def WriteThumbnail( hash, thumbnail_bytes ):
+    
+    if len( thumbnail_bytes ) <= PACK_MAX_OBJECT_SIZE:
+        
+        HG.server_controller.server_pack_store.AddObject( 'thumbnail', hash, thumbnail_bytes )
+        
+    else:
+        
+        dest_path = GetExpectedThumbnailPath( hash )
+        
+        with open( dest_path, 'wb' ) as f:
+            
+            f.write( thumbnail_bytes )
+            
+        
+    
+def WriteUpdate( update ):
+    
+    update_bytes = update.DumpToNetworkBytes()
+    
+    update_hash = hashlib.sha256( update_bytes ).digest()
+    
+    if len( update_bytes ) <= PACK_MAX_OBJECT_SIZE:
+        
+        HG.server_controller.server_pack_store.AddObject( 'file', update_hash, update_bytes )
+        
+    else:
+        
+        dest_path = GetExpectedFilePath( update_hash )
+        
+        with open( dest_path, 'wb' ) as f:
+            
+            f.write( update_bytes )
+            
+        
+    
+    return update_hash
+    
+class PackPrefix( object ):
+    
+    def __init__( self, packs_dir, prefix ):
+        
+        self._packs_dir = packs_dir
+        self._prefix = prefix
+        
+        self._lock = threading.Lock()
+        
+        self._loaded = False
+        
+        self._segment_nums_to_sizes = {}
+        self._segment_nums_to_handles = {}
+        
+        self._keys_to_locations = {}
+        
+        self._num_live_bytes = 0
+        
+    
+    def _AppendRecord( self, record_type, file_type, hash, timestamp, object_bytes ):
+        
+        record_size = PACK_RECORD_HEADER.size + len( object_bytes )
+        
+        if len( self._segment_nums_to_sizes ) == 0:
+            
+            segment_num = 0
+            
+            self._StartSegment( segment_num )
+            
+        else:
+            
+            segment_num = max( self._segment_nums_to_sizes.keys() )
+            
+            segment_size = self._segment_nums_to_sizes[ segment_num ]
+            
+            if segment_size > 0 and segment_size + record_size > PACK_SEGMENT_MAX_SIZE:
+                
+                segment_num += 1
+                
+                self._StartSegment( segment_num )
+                
+            
+        
+        f = self._GetHandle( segment_num )
+        
+        offset = self._segment_nums_to_sizes[ segment_num ]
+        
+        f.seek( offset )
+        
+        f.write( PACK_RECORD_HEADER.pack( record_type, PACK_FILE_TYPES_TO_CODES[ file_type ], hash, timestamp, len( object_bytes ) ) )
+        f.write( object_bytes )
+        
+        f.flush()
+        
+        self._segment_nums_to_sizes[ segment_num ] += record_size
+        
+        return ( segment_num, offset + PACK_RECORD_HEADER.size )
+        
+    
+    def _CloseHandles( self, segment_nums ):
+        
+        for segment_num in segment_nums:
+            
+            if segment_num in self._segment_nums_to_handles:
+                
+                f = self._segment_nums_to_handles[ segment_num ]
+                
+                f.close()
+                
+                del self._segment_nums_to_handles[ segment_num ]
+                
+            
+        
+    
+    def _GetHandle( self, segment_num ):
+        
+        if segment_num not in self._segment_nums_to_handles:
+            
+            self._segment_nums_to_handles[ segment_num ] = open( self._GetSegmentPath( segment_num ), 'r+b' )
+            
+        
+        return self._segment_nums_to_handles[ segment_num ]
+        
+    
+    def _GetSegmentPath( self, segment_num ):
+        
+        return os.path.join( self._packs_dir, self._prefix + '.' + str( segment_num ) + '.pack' )
+        
+    
+    def _GetWaste( self ):
+        
+        return sum( self._segment_nums_to_sizes.values() ) - self._num_live_bytes
+        
+    
+    def _Load( self ):
+        
+        if self._loaded:
+            
+            return
+            
+        
+        segment_nums = []
+        
+        for filename in os.listdir( self._packs_dir ):
+            
+            if not filename.startswith( self._prefix + '.' ):
+                
+                continue
+                
+            
+            if filename.endswith( '.pack.temp' ):
+                
+                # an interrupted compaction, which never replaced anything
+                
+                HydrusPaths.DeletePath( os.path.join( self._packs_dir, filename ) )
+                
+            elif filename.endswith( '.pack' ):
+                
+                segment_nums.append( int( filename.split( '.' )[1] ) )
+                
+            
+        
+        # segments are replayed in order, so a later put or delete always wins
+        
+        for segment_num in sorted( segment_nums ):
+            
+            self._ScanSegment( segment_num )
+            
+        
+        self._loaded = True
+        
+    
+    def _ScanSegment( self, segment_num ):
+        
+        path = self._GetSegmentPath( segment_num )
+        
+        file_size = os.path.getsize( path )
+        
+        offset = 0
+        
+        with open( path, 'rb' ) as f:
+            
+            while offset < file_size:
+                
+                header_bytes = f.read( PACK_RECORD_HEADER.size )
+                
+                if len( header_bytes ) < PACK_RECORD_HEADER.size:
+                    
+                    break
+                    
+                
+                ( record_type, file_type_code, hash, timestamp, length ) = PACK_RECORD_HEADER.unpack( header_bytes )
+                
+                if record_type not in ( PACK_RECORD_PUT, PACK_RECORD_DELETE ) or file_type_code not in PACK_CODES_TO_FILE_TYPES or offset + PACK_RECORD_HEADER.size + length > file_size:
+                    
+                    break
+                    
+                
+                key = ( PACK_CODES_TO_FILE_TYPES[ file_type_code ], hash )
+                
+                if key in self._keys_to_locations:
+                    
+                    ( old_segment_num, old_offset, old_length, old_timestamp ) = self._keys_to_locations[ key ]
+                    
+                    del self._keys_to_locations[ key ]
+                    
+                    self._num_live_bytes -= PACK_RECORD_HEADER.size + old_length
+                    
+                
+                if record_type == PACK_RECORD_PUT:
+                    
+                    self._keys_to_locations[ key ] = ( segment_num, offset + PACK_RECORD_HEADER.size, length, timestamp )
+                    
+                    self._num_live_bytes += PACK_RECORD_HEADER.size + length
+                    
+                
+                offset += PACK_RECORD_HEADER.size + length
+                
+                f.seek( offset )
+                
+            
+        
+        if offset < file_size:
+            
+            # a record cut short by a crash can only be at the end of what was being appended to
+            
+            HydrusData.Print( 'Pack segment ' + path + ' had a damaged tail, which was truncated.' )
+            
+            with open( path, 'r+b' ) as f:
+                
+                f.truncate( offset )
+                
+            
+        
+        self._segment_nums_to_sizes[ segment_num ] = offset
+        
+    
+    def _StartSegment( self, segment_num ):
+        
+        with open( self._GetSegmentPath( segment_num ), 'wb' ):
+            
+            pass
+            
+        
+        self._segment_nums_to_sizes[ segment_num ] = 0
+        
+    
+    def AddObject( self, file_type, hash, object_bytes ):
+        
+        with self._lock:
+            
+            self._Load()
+            
+            key = ( file_type, hash )
+            
+            # content-addressed, so the same hash is the same bytes
+            
+            if key in self._keys_to_locations:
+                
+                return
+                
+            
+            timestamp = HydrusData.GetNow()
+            
+            ( segment_num, offset ) = self._AppendRecord( PACK_RECORD_PUT, file_type, hash, timestamp, object_bytes )
+            
+            self._keys_to_locations[ key ] = ( segment_num, offset, len( object_bytes ), timestamp )
+            
+            self._num_live_bytes += PACK_RECORD_HEADER.size + len( object_bytes )
+            
+        
+    
+    def Close( self ):
+        
+        with self._lock:
+            
+            self._CloseHandles( list( self._segment_nums_to_handles.keys() ) )
+            
+        
+    
+    def Compact( self ):
+        
+        # this holds the prefix lock throughout, but a prefix is only a 256th of the store, so the rest keeps serving
+        
+        with self._lock:
+            
+            self._Load()
+            
+            waste = self._GetWaste()
+            
+            if waste == 0 or waste < PACK_COMPACTION_MIN_WASTE or waste < self._num_live_bytes:
+                
+                return False
+                
+            
+            old_segment_nums = sorted( self._segment_nums_to_sizes.keys() )
+            
+            new_segment_num = old_segment_nums[-1] + 1
+            
+            new_path = self._GetSegmentPath( new_segment_num )
+            temp_path = new_path + '.temp'
+            
+            new_keys_to_locations = {}
+            
+            new_offset = 0
+            
+            # copying in old disk order keeps the reads sequential
+            
+            sorted_items = sorted( self._keys_to_locations.items(), key = lambda item: item[1][:2] )
+            
+            with open( temp_path, 'wb' ) as f_dest:
+                
+                for ( ( file_type, hash ), ( segment_num, offset, length, timestamp ) ) in sorted_items:
+                    
+                    f_source = self._GetHandle( segment_num )
+                    
+                    f_source.seek( offset )
+                    
+                    object_bytes = f_source.read( length )
+                    
+                    f_dest.write( PACK_RECORD_HEADER.pack( PACK_RECORD_PUT, PACK_FILE_TYPES_TO_CODES[ file_type ], hash, timestamp, length ) )
+                    f_dest.write( object_bytes )
+                    
+                    new_keys_to_locations[ ( file_type, hash ) ] = ( new_segment_num, new_offset + PACK_RECORD_HEADER.size, length, timestamp )
+                    
+                    new_offset += PACK_RECORD_HEADER.size + length
+                    
+                
+                f_dest.flush()
+                
+                os.fsync( f_dest.fileno() )
+                
+            
+            # once the new segment has its real name it is complete, and as the newest segment it overrides the old ones if we die before deleting them
+            
+            os.replace( temp_path, new_path )
+            
+            self._CloseHandles( old_segment_nums )
+            
+            for segment_num in old_segment_nums:
+                
+                HydrusPaths.DeletePath( self._GetSegmentPath( segment_num ) )
+                
+                del self._segment_nums_to_sizes[ segment_num ]
+                
+            
+            self._segment_nums_to_sizes[ new_segment_num ] = new_offset
+            
+            self._keys_to_locations = new_keys_to_locations
+            
+            return True
+            
+        
+    
+    def DeleteObjects( self, file_type, hashes ):
+        
+        with self._lock:
+            
+            self._Load()
+            
+            timestamp = HydrusData.GetNow()
+            
+            for hash in hashes:
+                
+                key = ( file_type, hash )
+                
+                if key not in self._keys_to_locations:
+                    
+                    continue
+                    
+                
+                ( segment_num, offset, length, old_timestamp ) = self._keys_to_locations[ key ]
+                
+                self._AppendRecord( PACK_RECORD_DELETE, file_type, hash, timestamp, b'' )
+                
+                del self._keys_to_locations[ key ]
+                
+                self._num_live_bytes -= PACK_RECORD_HEADER.size + length
+                
+            
+        
+    
+    def GetObject( self, file_type, hash ):
+        
+        with self._lock:
+            
+            self._Load()
+            
+            key = ( file_type, hash )
+            
+            if key not in self._keys_to_locations:
+                
+                return None
+                
+            
+            ( segment_num, offset, length, timestamp ) = self._keys_to_locations[ key ]
+            
+            f = self._GetHandle( segment_num )
+            
+            f.seek( offset )
+            
+            return f.read( length )
+            
+        
+    
+    def GetObjects( self ):
+        
+        with self._lock:
+            
+            self._Load()
+            
+            return [ ( file_type, hash, timestamp ) for ( ( file_type, hash ), ( segment_num, offset, length, timestamp ) ) in self._keys_to_locations.items() ]
+            
+        
+    
+class PackStore( object ):
+    
+    def __init__( self, packs_dir ):
+        
+        HydrusPaths.MakeSureDirectoryExists( packs_dir )
+        
+        # each prefix loads its index the first time it is touched, so boot does not have to read every segment
+        
+        self._prefixes_to_pack_prefixes = { prefix : PackPrefix( packs_dir, prefix ) for prefix in HydrusData.IterateHexPrefixes() }
+        
+        self._compaction_lock = threading.Lock()
+        self._compaction_paused = False
+        
+    
+    def _GetPackPrefix( self, hash ):
+        
+        return self._prefixes_to_pack_prefixes[ hash.hex()[:2] ]
+        
+    
+    def AddObject( self, file_type, hash, object_bytes ):
+        
+        self._GetPackPrefix( hash ).AddObject( file_type, hash, object_bytes )
+        
+    
+    def Close( self ):
+        
+        for pack_prefix in self._prefixes_to_pack_prefixes.values():
+            
+            pack_prefix.Close()
+            
+        
+    
+    def Compact( self, stop_time = None ):
+        
+        num_compacted = 0
+        
+        for pack_prefix in self._prefixes_to_pack_prefixes.values():
+            
+            if stop_time is not None and HydrusData.TimeHasPassed( stop_time ):
+                
+                break
+                
+            
+            # a backup copies segments as they stand, so we cannot swap them out from under it
+            
+            with self._compaction_lock:
+                
+                if self._compaction_paused:
+                    
+                    break
+                    
+                
+                if pack_prefix.Compact():
+                    
+                    num_compacted += 1
+                    
+                
+            
+        
+        return num_compacted
+        
+    
+    def DeleteObjects( self, file_type, hashes ):
+        
+        for ( prefix, prefix_hashes ) in HydrusData.BuildKeyToListDict( ( ( hash.hex()[:2], hash ) for hash in hashes ) ).items():
+            
+            self._prefixes_to_pack_prefixes[ prefix ].DeleteObjects( file_type, prefix_hashes )
+            
+        
+    
+    def GetObject( self, file_type, hash ):
+        
+        return self._GetPackPrefix( hash ).GetObject( file_type, hash )
+        
+    
+    def GetObjects( self, prefix ):
+        
+        return self._prefixes_to_pack_prefixes[ prefix ].GetObjects()
+        
+    
+    def PauseCompaction( self ):
+        
+        # if a prefix is being compacted right now, this waits for it to finish
+        
+        with self._compaction_lock:
+            
+            self._compaction_paused = True
+            
+        
+    
+    def ResumeCompaction( self ):
+        
+        with self._compaction_lock:
+            
+            self._compaction_paused = False
+            
+        
+    
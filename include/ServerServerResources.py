@@ -511,9 +511,9 @@ class HydrusResourceRestrictedRepositoryThumbnail( HydrusResourceRestricted ):
             raise HydrusExceptions.NotFoundException( 'That mime should not have a thumbnail!' )
             
         
-        path = ServerFiles.GetThumbnailPath( hash )
+        ( body, path ) = ServerFiles.GetThumbnailSource( hash )
         
-        response_context = HydrusServerResources.ResponseContext( 200, mime = HC.APPLICATION_OCTET_STREAM, path = path )
+        response_context = HydrusServerResources.ResponseContext( 200, mime = HC.APPLICATION_OCTET_STREAM, body = body, path = path )
         
         return response_context
         
@@ -571,9 +571,9 @@ class HydrusResourceRestrictedUpdate( HydrusResourceRestricted ):
             raise HydrusExceptions.NotFoundException( 'This update hash does not exist on this service!' )
             
         
-        path = ServerFiles.GetFilePath( update_hash )
+        ( body, path ) = ServerFiles.GetFileSource( update_hash )
         
-        response_context = HydrusServerResources.ResponseContext( 200, mime = HC.APPLICATION_OCTET_STREAM, path = path )
+        response_context = HydrusServerResources.ResponseContext( 200, mime = HC.APPLICATION_OCTET_STREAM, body = body, path = path )
         
         return response_context
         
@@ -612,9 +612,7 @@ class HydrusResourceRestrictedMetadataUpdate( HydrusResourceRestricted ):
         
         since = request.parsed_request_args[ 'since' ]
         
-        metadata_slice = self._service.GetMetadataSlice( since )
-        
-        body = HydrusNetwork.DumpHydrusArgsToNetworkBytes( { 'metadata_slice' : metadata_slice } )
+        body = self._service.GetMetadataSliceNetworkBytes( since )
         
         response_context = HydrusServerResources.ResponseContext( 200, body = body )
         
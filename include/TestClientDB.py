@@ -204,6 +204,22 @@ class TestClientDB( unittest.TestCase ):
         
         self.assertEqual( result.GetName(), export_folder.GetName() )
         
+        #
+        
+        self.assertEqual( self._read( 'export_folder_manifest', 'test path' ), {} )
+        
+        self._write( 'export_folder_manifest', 'test path', [], [ ( '/export/a.jpg', 1, 1024, 1500000000 ), ( '/export/b.jpg', 2, 2048, 1500000001 ) ] )
+        
+        self.assertEqual( self._read( 'export_folder_manifest', 'test path' ), { '/export/a.jpg' : ( 1, 1024, 1500000000 ), '/export/b.jpg' : ( 2, 2048, 1500000001 ) } )
+        
+        self._write( 'export_folder_manifest', 'test path', [ '/export/a.jpg' ], [ ( '/export/b.jpg', 3, 4096, 1500000002 ) ] )
+        
+        self.assertEqual( self._read( 'export_folder_manifest', 'test path' ), { '/export/b.jpg' : ( 3, 4096, 1500000002 ) } )
+        
+        self._write( 'delete_serialisable_named', HydrusSerialisable.SERIALISABLE_TYPE_EXPORT_FOLDER, 'test path' )
+        
+        self.assertEqual( self._read( 'export_folder_manifest', 'test path' ), {} )
+        
     
     def test_file_query_ids( self ):
         
@@ -1241,3 +1257,149 @@ class TestClientDB( unittest.TestCase ):
             
         
     
+    def test_url_statuses( self ):
+        
+        TestClientDB._clear_db()
+        
+        hashes = {}
+        
+        for ( name, filename ) in ( ( 'current', 'muh_jpg.jpg' ), ( 'trashed', 'muh_gif.gif' ), ( 'deleted', 'muh_swf.swf' ) ):
+            
+            path = os.path.join( HC.STATIC_DIR, 'testing', filename )
+            
+            file_import_job = ClientImportFileSeeds.FileImportJob( path )
+            
+            file_import_job.GenerateHashAndStatus()
+            
+            file_import_job.GenerateInfo()
+            
+            self._write( 'import_file', file_import_job )
+            
+            hashes[ name ] = file_import_job.GetHash()
+            
+        
+        hashes[ 'unknown' ] = HydrusData.GenerateKey() + HydrusData.GenerateKey()
+        
+        url_current = 'https://example.com/post/current'
+        url_trashed = 'https://example.com/post/trashed'
+        url_deleted = 'https://example.com/post/deleted'
+        url_unknown = 'https://example.com/post/unknown'
+        url_multiple = 'https://example.com/post/multiple'
+        url_missing = 'https://example.com/post/missing'
+        
+        content_updates = []
+        
+        for ( url, name ) in ( ( url_current, 'current' ), ( url_trashed, 'trashed' ), ( url_deleted, 'deleted' ), ( url_unknown, 'unknown' ) ):
+            
+            content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_URLS, HC.CONTENT_UPDATE_ADD, ( ( url, ), ( hashes[ name ], ) ) ) )
+            
+        
+        content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_URLS, HC.CONTENT_UPDATE_ADD, ( ( url_multiple, ), ( hashes[ 'current' ], hashes[ 'trashed' ], hashes[ 'deleted' ] ) ) ) )
+        
+        self._write( 'content_updates', { CC.COMBINED_LOCAL_FILE_SERVICE_KEY : content_updates } )
+        
+        # trashed is deleted from my files, deleted is then deleted from the trash too
+        
+        content_update = HydrusData.ContentUpdate( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_DELETE, ( hashes[ 'trashed' ], hashes[ 'deleted' ] ), reason = 'test delete' )
+        
+        self._write( 'content_updates', { CC.LOCAL_FILE_SERVICE_KEY : ( content_update, ) } )
+        
+        content_update = HydrusData.ContentUpdate( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_DELETE, ( hashes[ 'deleted' ], ) )
+        
+        self._write( 'content_updates', { CC.TRASH_SERVICE_KEY : ( content_update, ) } )
+        
+        #
+        
+        urls = [ url_current, url_trashed, url_deleted, url_unknown, url_multiple, url_missing, 'http://example.com/post/current' ]
+        
+        urls_to_url_statuses = self._read( 'urls_to_url_statuses', urls )
+        
+        self.assertEqual( set( urls_to_url_statuses.keys() ), set( urls ) )
+        
+        def check_current( url_status ):
+            
+            ( status, hash, note ) = url_status
+            
+            self.assertEqual( hash, hashes[ 'current' ] )
+            
+            # the test client files manager does not keep files, so this sometimes comes back as missing
+            self.assertIn( status, ( CC.STATUS_UNKNOWN, CC.STATUS_SUCCESSFUL_BUT_REDUNDANT ) )
+            
+            if status == CC.STATUS_UNKNOWN:
+                
+                self.assertIn( 'truly missing', note )
+                
+            else:
+                
+                self.assertIn( 'Imported at', note )
+                
+            
+        
+        def check_trashed( url_status ):
+            
+            ( status, hash, note ) = url_status
+            
+            self.assertEqual( ( status, hash ), ( CC.STATUS_DELETED, hashes[ 'trashed' ] ) )
+            self.assertTrue( note.startswith( 'url recognised: Currently in trash (test delete).' ) )
+            
+        
+        def check_deleted( url_status ):
+            
+            self.assertEqual( url_status, ( CC.STATUS_DELETED, hashes[ 'deleted' ], 'url recognised: test delete' ) )
+            
+        
+        ( url_status, ) = urls_to_url_statuses[ url_current ]
+        
+        check_current( url_status )
+        
+        ( url_status, ) = urls_to_url_statuses[ url_trashed ]
+        
+        check_trashed( url_status )
+        
+        ( url_status, ) = urls_to_url_statuses[ url_deleted ]
+        
+        check_deleted( url_status )
+        
+        self.assertEqual( urls_to_url_statuses[ url_unknown ], [ ( CC.STATUS_UNKNOWN, hashes[ 'unknown' ], '' ) ] )
+        
+        hashes_to_url_statuses = { url_status[1] : url_status for url_status in urls_to_url_statuses[ url_multiple ] }
+        
+        self.assertEqual( set( hashes_to_url_statuses.keys() ), { hashes[ 'current' ], hashes[ 'trashed' ], hashes[ 'deleted' ] } )
+        
+        check_current( hashes_to_url_statuses[ hashes[ 'current' ] ] )
+        check_trashed( hashes_to_url_statuses[ hashes[ 'trashed' ] ] )
+        check_deleted( hashes_to_url_statuses[ hashes[ 'deleted' ] ] )
+        
+        self.assertEqual( urls_to_url_statuses[ url_missing ], [] )
+        
+        # the search covers http/https differences
+        
+        ( url_status, ) = urls_to_url_statuses[ 'http://example.com/post/current' ]
+        
+        check_current( url_status )
+        
+        # and the single url read agrees
+        
+        for url in urls:
+            
+            # notes say how long ago things happened, so they may tick over between reads
+            
+            self.assertEqual( sorted( ( status, hash ) for ( status, hash, note ) in self._read( 'url_statuses', url ) ), sorted( ( status, hash ) for ( status, hash, note ) in urls_to_url_statuses[ url ] ) )
+            
+        
+    
+    def test_video_keyframe_timestamps( self ):
+        
+        hash = HydrusData.GenerateKey()
+        
+        result = self._read( 'video_keyframe_timestamps', hash )
+        
+        self.assertEqual( result, None )
+        
+        self._write( 'video_keyframe_timestamps', hash, [ 0, 2002, 4004 ] )
+        
+        result = self._read( 'video_keyframe_timestamps', hash )
+        
+        self.assertEqual( result, [ 0, 2002, 4004 ] )
+        
+    
@@ -2,6 +2,7 @@ from . import ClientConstants as CC
 from . import ClientImageHandling
 import collections
 from . import HydrusConstants as HC
+from . import HydrusImageHandling
 import os
 import unittest
 
@@ -21,3 +22,16 @@ class TestImageHandling( unittest.TestCase ):
         
         self.assertEqual( phashes, set( [ b'\xb4M\xc7\xb2M\xcb8\x1c' ] ) )
         
+    
+    def test_reduced_decode( self ):
+        
+        path = os.path.join( HC.STATIC_DIR, 'hydrus.png' )
+        
+        self.assertEqual( HydrusImageHandling.GetDecodeReduction( ( 200, 200 ), ( 200, 200 ) ), 1 )
+        self.assertEqual( HydrusImageHandling.GetDecodeReduction( ( 200, 200 ), ( 60, 40 ) ), 2 )
+        self.assertEqual( HydrusImageHandling.GetDecodeReduction( ( 20000, 20000 ), ( 100, 100 ) ), HydrusImageHandling.MAX_DECODE_REDUCTION )
+        
+        numpy_image = HydrusImageHandling.GenerateNumPyImage( path, HC.IMAGE_PNG, reduction = 4 )
+        
+        self.assertEqual( HydrusImageHandling.GetResolutionNumPy( numpy_image ), ( 50, 50 ) )
+        
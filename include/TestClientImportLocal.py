@@ -0,0 +1,414 @@
+from . import ClientImportFileSeeds
+from . import ClientImportLocal
+from . import ClientThreading
+from . import HydrusPaths
+import os
+import shutil
+import time
+import unittest
+from mock import patch
+
+class TestImportFolderSnapshot( unittest.TestCase ):
+    
+    def setUp( self ):
+        
+        self._test_dir = HydrusPaths.GetTempDir()
+        
+        HydrusPaths.MakeSureDirectoryExists( self._test_dir )
+        
+        self._sub_dir = os.path.join( self._test_dir, 'sub' )
+        
+        HydrusPaths.MakeSureDirectoryExists( self._sub_dir )
+        
+        # the snapshot won't trust a dir mtime from the last couple of seconds, so we push everything into the past to test the fast path
+        
+        self._fake_time = time.time() - 3600
+        
+    
+    def tearDown( self ):
+        
+        shutil.rmtree( self._test_dir )
+        
+    
+    def _AgeDirs( self ):
+        
+        self._fake_time += 60
+        
+        for dir_path in ( self._test_dir, self._sub_dir ):
+            
+            if os.path.exists( dir_path ):
+                
+                os.utime( dir_path, ( self._fake_time, self._fake_time ) )
+                
+            
+        
+    
+    def _GetJobKey( self ):
+        
+        return ClientThreading.JobKey( pausable = False, cancellable = True )
+        
+    
+    def _WriteFile( self, path, content ):
+        
+        with open( path, 'wb' ) as f:
+            
+            f.write( content )
+            
+        
+    
+    def test_new_files( self ):
+        
+        path_a = os.path.join( self._test_dir, 'a' )
+        path_b = os.path.join( self._sub_dir, 'b' )
+        path_txt = os.path.join( self._test_dir, 'a.txt' )
+        
+        self._WriteFile( path_a, b'aaa' )
+        self._WriteFile( path_b, b'bbb' )
+        self._WriteFile( path_txt, b'tags' )
+        
+        self._AgeDirs()
+        
+        snapshot = ClientImportLocal.ImportFolderSnapshot( self._test_dir )
+        
+        self.assertEqual( set( snapshot.Scan( self._GetJobKey() ) ), { path_a, path_b } )
+        self.assertEqual( set( snapshot.GetDirectories() ), { self._test_dir, self._sub_dir } )
+        
+        self.assertEqual( snapshot.Scan( self._GetJobKey() ), [] )
+        
+        path_c = os.path.join( self._sub_dir, 'c' )
+        
+        self._WriteFile( path_c, b'ccc' )
+        
+        self._AgeDirs()
+        
+        self.assertEqual( snapshot.Scan( self._GetJobKey() ), [ path_c ] )
+        
+        self.assertEqual( snapshot.Scan( self._GetJobKey() ), [] )
+        
+    
+    def test_changed_files( self ):
+        
+        path_a = os.path.join( self._test_dir, 'a' )
+        path_b = os.path.join( self._test_dir, 'b' )
+        
+        self._WriteFile( path_a, b'aaa' )
+        self._WriteFile( path_b, b'bbb' )
+        
+        self._AgeDirs()
+        
+        snapshot = ClientImportLocal.ImportFolderSnapshot( self._test_dir )
+        
+        self.assertEqual( snapshot.Scan( self._GetJobKey() ), [ path_a, path_b ] )
+        
+        # rewriting a file in place does not touch its dir, so a trusted dir mtime means we do not relist
+        
+        self._WriteFile( path_a, b'aaaaaa' )
+        
+        os.utime( self._test_dir, ( self._fake_time, self._fake_time ) )
+        
+        self.assertEqual( snapshot.Scan( self._GetJobKey() ), [] )
+        
+        # but once the dir changes, files with new stats come back while untouched ones do not
+        
+        self._WriteFile( os.path.join( self._test_dir, 'b.txt' ), b'tags' )
+        
+        self._AgeDirs()
+        
+        self.assertEqual( snapshot.Scan( self._GetJobKey() ), [ path_a ] )
+        
+        # a dir that changed moments ago is relisted every time until it settles
+        
+        self._WriteFile( path_b, b'bbbbbb' )
+        
+        now = time.time()
+        
+        os.utime( self._test_dir, ( now, now ) )
+        
+        self.assertEqual( snapshot.Scan( self._GetJobKey() ), [ path_b ] )
+        
+        self._WriteFile( path_a, b'aaaaaaaaa' )
+        
+        self.assertEqual( snapshot.Scan( self._GetJobKey() ), [ path_a ] )
+        
+    
+    def test_files_still_being_written( self ):
+        
+        path_a = os.path.join( self._test_dir, 'a' )
+        path_b = os.path.join( self._test_dir, 'b' )
+        
+        self._WriteFile( path_a, b'aaa' )
+        self._WriteFile( path_b, b'bbb' )
+        
+        self._AgeDirs()
+        
+        snapshot = ClientImportLocal.ImportFolderSnapshot( self._test_dir )
+        
+        def filter_free_paths( paths ):
+            
+            return [ path for path in paths if path != path_b ]
+            
+        
+        with patch.object( HydrusPaths, 'FilterFreePaths', side_effect = filter_free_paths ):
+            
+            self.assertEqual( snapshot.Scan( self._GetJobKey() ), [ path_a ] )
+            
+            # still in use, so still held back
+            
+            self.assertEqual( snapshot.Scan( self._GetJobKey() ), [] )
+            
+        
+        # nothing about the file or its dir has changed, but now it is free it comes through
+        
+        self.assertEqual( snapshot.Scan( self._GetJobKey() ), [ path_b ] )
+        
+        self.assertEqual( snapshot.Scan( self._GetJobKey() ), [] )
+        
+    
+    def test_removed_files( self ):
+        
+        path_a = os.path.join( self._test_dir, 'a' )
+        path_b = os.path.join( self._sub_dir, 'b' )
+        path_c = os.path.join( self._test_dir, 'c' )
+        
+        self._WriteFile( path_a, b'aaa' )
+        self._WriteFile( path_b, b'bbb' )
+        self._WriteFile( path_c, b'ccc' )
+        
+        self._AgeDirs()
+        
+        snapshot = ClientImportLocal.ImportFolderSnapshot( self._test_dir )
+        
+        with patch.object( HydrusPaths, 'FilterFreePaths', return_value = [ path_a, path_b ] ):
+            
+            self.assertEqual( snapshot.Scan( self._GetJobKey() ), [ path_a, path_b ] )
+            
+        
+        # c was in use and then went away before it was done, and the whole subdir goes too
+        
+        os.unlink( path_c )
+        
+        shutil.rmtree( self._sub_dir )
+        
+        self._AgeDirs()
+        
+        with patch.object( HydrusPaths, 'FilterFreePaths', side_effect = lambda paths: list( paths ) ) as filter_free_paths:
+            
+            self.assertEqual( snapshot.Scan( self._GetJobKey() ), [] )
+            
+            ( ( checked_paths, ), kwargs ) = filter_free_paths.call_args
+            
+            self.assertEqual( list( checked_paths ), [] )
+            
+        
+        self.assertEqual( snapshot.GetDirectories(), [ self._test_dir ] )
+        
+        # a file that comes back with the same name is new again
+        
+        self._WriteFile( path_c, b'ccc' )
+        
+        self._AgeDirs()
+        
+        self.assertEqual( snapshot.Scan( self._GetJobKey() ), [ path_c ] )
+        
+    
+    def test_cancelled_scan_keeps_pending( self ):
+        
+        path_a = os.path.join( self._test_dir, 'a' )
+        
+        self._WriteFile( path_a, b'aaa' )
+        
+        self._AgeDirs()
+        
+        snapshot = ClientImportLocal.ImportFolderSnapshot( self._test_dir )
+        
+        with patch.object( HydrusPaths, 'FilterFreePaths', return_value = [] ):
+            
+            self.assertEqual( snapshot.Scan( self._GetJobKey() ), [] )
+            
+        
+        job_key = self._GetJobKey()
+        
+        job_key.Cancel()
+        
+        # we did not get to look at anything, so we cannot say the pending file went away
+        
+        self.assertEqual( snapshot.Scan( job_key ), [ path_a ] )
+        
+    
+class FakeImportFolderWatcher( object ):
+    
+    def __init__( self ):
+        
+        self.event_count = 0
+        self.roots_to_dirs = {}
+        
+    
+    def GetEventCount( self, root ):
+        
+        return self.event_count
+        
+    
+    def SetWatchedDirectories( self, root, dir_paths ):
+        
+        self.roots_to_dirs[ root ] = set( dir_paths )
+        
+    
+class TestImportFolderChecks( unittest.TestCase ):
+    
+    def setUp( self ):
+        
+        self._test_dir = HydrusPaths.GetTempDir()
+        
+        self._sub_dir = os.path.join( self._test_dir, 'sub' )
+        
+        HydrusPaths.MakeSureDirectoryExists( self._sub_dir )
+        
+        self._path = os.path.join( self._sub_dir, '0' )
+        
+        with open( self._path, 'wb' ) as f:
+            
+            f.write( b'blarg' )
+            
+        
+        # old enough that the snapshot trusts the dir mtimes
+        
+        past = time.time() - 3600
+        
+        for dir_path in ( self._sub_dir, self._test_dir ):
+            
+            os.utime( dir_path, ( past, past ) )
+            
+        
+        self._import_folder = ClientImportLocal.ImportFolder( 'check test', path = self._test_dir )
+        
+        self._file_seed = ClientImportFileSeeds.FileSeed( ClientImportFileSeeds.FILE_SEED_TYPE_HDD, self._path )
+        
+    
+    def tearDown( self ):
+        
+        self._import_folder._ResetSnapshot()
+        
+        shutil.rmtree( self._test_dir )
+        
+    
+    def _CheckFolder( self ):
+        
+        self._import_folder._CheckFolder( ClientThreading.JobKey( pausable = False, cancellable = True ) )
+        
+        return self._import_folder.GetFileSeedCache().HasFileSeed( self._file_seed )
+        
+    
+    def test_edits_reset_snapshot( self ):
+        
+        with patch.object( ClientImportLocal, 'INOTIFY_OK', False ):
+            
+            self.assertTrue( self._CheckFolder() )
+            
+            # nothing on disk changed, so the snapshot does not offer the file again by itself
+            
+            self._import_folder.GetFileSeedCache().RemoveFileSeeds( ( self._file_seed, ) )
+            
+            self.assertFalse( self._CheckFolder() )
+            
+            # but the user clearing it in the edit dialog does
+            
+            self._import_folder.SetTuple( *self._import_folder.ToTuple() )
+            
+            self.assertTrue( self._CheckFolder() )
+            
+            self._import_folder.SetFileSeedCache( ClientImportFileSeeds.FileSeedCache() )
+            
+            self.assertTrue( self._CheckFolder() )
+            
+        
+    
+    def test_watcher_seeded_at_boot( self ):
+        
+        watcher = FakeImportFolderWatcher()
+        
+        with patch.object( ClientImportLocal, 'GetImportFolderWatcher', return_value = watcher ):
+            
+            # the first look after boot starts the watch without forcing a scan
+            
+            self.assertFalse( self._import_folder._WatcherSawChanges() )
+            
+            self.assertEqual( watcher.roots_to_dirs, { self._test_dir : { self._test_dir, self._sub_dir } } )
+            
+            self.assertFalse( self._import_folder.GetFileSeedCache().HasFileSeed( self._file_seed ) )
+            
+            self.assertFalse( self._import_folder._WatcherSawChanges() )
+            
+            watcher.event_count += 1
+            
+            self.assertTrue( self._import_folder._WatcherSawChanges() )
+            
+            # and the check that follows still looks at everything, even in dirs that have not changed
+            
+            self.assertTrue( self._CheckFolder() )
+            
+            self.assertFalse( self._import_folder._WatcherSawChanges() )
+            
+        
+    
+class TestImportFolderWatcherFallback( unittest.TestCase ):
+    
+    def test_no_inotify( self ):
+        
+        test_dir = HydrusPaths.GetTempDir()
+        
+        try:
+            
+            HydrusPaths.MakeSureDirectoryExists( test_dir )
+            
+            path = os.path.join( test_dir, '0' )
+            
+            with open( path, 'wb' ) as f:
+                
+                f.write( b'blarg' )
+                
+            
+            import_folder = ClientImportLocal.ImportFolder( 'watcher fallback test', path = test_dir )
+            
+            with patch.object( ClientImportLocal, 'INOTIFY_OK', False ):
+                
+                self.assertEqual( ClientImportLocal.GetImportFolderWatcher(), None )
+                
+                # with nothing watching, only the period can make the folder due
+                
+                self.assertFalse( import_folder._WatcherSawChanges() )
+                
+                import_folder._CheckFolder( ClientThreading.JobKey( pausable = False, cancellable = True ) )
+                
+                file_seed = ClientImportFileSeeds.FileSeed( ClientImportFileSeeds.FILE_SEED_TYPE_HDD, path )
+                
+                self.assertTrue( import_folder.GetFileSeedCache().HasFileSeed( file_seed ) )
+                
+            
+        finally:
+            
+            shutil.rmtree( test_dir )
+            
+        
+    
+    def test_watcher_fails_to_start( self ):
+        
+        with patch.object( ClientImportLocal, 'INOTIFY_OK', True ):
+            
+            with patch.object( ClientImportLocal, 'import_folder_watcher', None ):
+                
+                with patch.object( ClientImportLocal, 'ImportFolderWatcher', side_effect = OSError( 24, 'Too many open files' ) ):
+                    
+                    self.assertEqual( ClientImportLocal.GetImportFolderWatcher(), None )
+                    
+                    self.assertFalse( ClientImportLocal.INOTIFY_OK )
+                    
+                    # and we do not keep trying
+                    
+                    self.assertEqual( ClientImportLocal.GetImportFolderWatcher(), None )
+                    
+                    self.assertEqual( ClientImportLocal.ImportFolderWatcher.call_count, 1 )
+                    
+                
+            
+        
+    
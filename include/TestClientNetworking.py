@@ -1,4 +1,5 @@
 from . import ClientConstants as CC
+from . import ClientDefaults
 from . import ClientNetworking
 from . import ClientNetworkingBandwidth
 from . import ClientNetworkingContexts
@@ -8,11 +9,17 @@ from . import ClientNetworkingLogin
 from . import ClientNetworkingSessions
 from . import ClientServices
 import collections
+import http.server
 from . import HydrusConstants as HC
 from . import HydrusData
 from . import HydrusExceptions
+from . import HydrusFileHandling
 from . import HydrusNetworking
+from . import HydrusPaths
 import os
+import pickle
+import requests
+import socket
 from . import TestController
 import threading
 import time
@@ -55,6 +62,28 @@ def catch_wew_ok( url, request ):
     
     return GOOD_RESPONSE
     
+@urlmatch( netloc = 'wew.lad' )
+def catch_wew_resumable( url, request ):
+    
+    # first time, we cut out after 64KB. second time, we serve the rest if asked correctly
+    
+    num_bytes = len( LONG_GOOD_RESPONSE )
+    
+    if 'Range' in request.headers and request.headers.get( 'If-Range' ) == '"muh_etag"':
+        
+        start = int( request.headers[ 'Range' ][ 6 : -1 ] )
+        
+        headers = { 'ETag' : '"muh_etag"', 'Content-Range' : 'bytes {}-{}/{}'.format( start, num_bytes - 1, num_bytes ), 'Content-Length' : str( num_bytes - start ) }
+        
+        return response( 206, LONG_GOOD_RESPONSE[ start : ], headers, 'Partial Content' )
+        
+    else:
+        
+        headers = { 'ETag' : '"muh_etag"', 'Content-Length' : str( num_bytes ) }
+        
+        return response( 200, LONG_GOOD_RESPONSE[ : 65536 ], headers, 'OK' )
+        
+    
 @urlmatch( netloc = MOCK_HYDRUS_ADDRESS )
 def catch_hydrus_error( url, request ):
     
@@ -220,6 +249,109 @@ class TestBandwidthManager( unittest.TestCase ):
         pass
         
     
+class TestNetworkDomainManager( unittest.TestCase ):
+    
+    def _GetDomainManager( self ):
+        
+        domain_manager = ClientNetworkingDomain.NetworkDomainManager()
+        
+        ClientDefaults.SetDefaultDomainManagerData( domain_manager )
+        
+        return domain_manager
+        
+    
+    def test_url_classifications( self ):
+        
+        domain_manager = self._GetDomainManager()
+        
+        danbooru_url = 'https://danbooru.donmai.us/posts/2982422?q=blah'
+        pixiv_url = 'https://www.pixiv.net/member_illust.php?illust_id=69073387&mode=medium'
+        unknown_url = 'https://example.com/some/page?b=2&a=1'
+        
+        urls = [ danbooru_url, pixiv_url, unknown_url, danbooru_url ]
+        
+        classifications = domain_manager.GetURLClassifications( urls )
+        
+        self.assertEqual( len( classifications ), 4 )
+        
+        for ( url, ( url_class_key, normalised_url, api_url ) ) in zip( urls, classifications ):
+            
+            url_class = domain_manager.GetURLClass( url )
+            
+            if url_class is None:
+                
+                self.assertEqual( url_class_key, None )
+                self.assertEqual( api_url, None )
+                
+            else:
+                
+                self.assertEqual( url_class_key, url_class.GetMatchKey() )
+                
+            
+            self.assertEqual( normalised_url, domain_manager.NormaliseURL( url ) )
+            
+        
+        self.assertEqual( domain_manager.GetURLClass( danbooru_url ).GetName(), 'danbooru file page' )
+        self.assertEqual( classifications[0][1], 'https://danbooru.donmai.us/posts/2982422' )
+        self.assertEqual( classifications[0][2], 'https://danbooru.donmai.us/posts/2982422' )
+        self.assertEqual( classifications[0], classifications[3] )
+        
+        # this one goes to its api
+        
+        ( pixiv_url_to_fetch, parser ) = domain_manager.GetURLToFetchAndParser( pixiv_url )
+        
+        self.assertNotEqual( classifications[1][2], classifications[1][1] )
+        self.assertEqual( classifications[1][2], pixiv_url_to_fetch )
+        
+        self.assertEqual( classifications[2], ( None, 'https://example.com/some/page?a=1&b=2', None ) )
+        
+        self.assertEqual( domain_manager.NormaliseURLs( urls ), [ normalised_url for ( url_class_key, normalised_url, api_url ) in classifications ] )
+        
+    
+    def test_url_classification_cache( self ):
+        
+        domain_manager = self._GetDomainManager()
+        
+        url_classes = domain_manager.GetURLClasses()
+        
+        danbooru_url = 'https://danbooru.donmai.us/posts/2982422?q=blah'
+        
+        self.assertEqual( domain_manager.GetURLClass( danbooru_url ).GetName(), 'danbooru file page' )
+        self.assertEqual( domain_manager.NormaliseURL( danbooru_url ), 'https://danbooru.donmai.us/posts/2982422' )
+        
+        self.assertIn( danbooru_url, domain_manager._urls_to_classifications )
+        
+        # with the url classes gone, the cached answers have to go too
+        
+        domain_manager.SetURLClasses( [ url_class for url_class in url_classes if url_class.GetName() != 'danbooru file page' ] )
+        
+        self.assertEqual( len( domain_manager._urls_to_classifications ), 0 )
+        
+        # the gallery page url class is happy to take it now
+        
+        self.assertEqual( domain_manager.GetURLClass( danbooru_url ).GetName(), 'danbooru gallery page' )
+        self.assertNotEqual( domain_manager.NormaliseURL( danbooru_url ), 'https://danbooru.donmai.us/posts/2982422' )
+        
+        domain_manager.SetURLClasses( url_classes )
+        
+        self.assertEqual( domain_manager.GetURLClass( danbooru_url ).GetName(), 'danbooru file page' )
+        self.assertEqual( domain_manager.NormaliseURL( danbooru_url ), 'https://danbooru.donmai.us/posts/2982422' )
+        
+        # and the cache stays within its size
+        
+        with patch.object( ClientNetworkingDomain, 'URL_CLASSIFICATION_CACHE_SIZE', 50 ):
+            
+            urls = [ 'https://danbooru.donmai.us/posts/{}'.format( i ) for i in range( 60 ) ]
+            
+            domain_manager.NormaliseURLs( urls )
+            
+            self.assertEqual( len( domain_manager._urls_to_classifications ), 50 )
+            self.assertNotIn( urls[0], domain_manager._urls_to_classifications )
+            self.assertIn( urls[-1], domain_manager._urls_to_classifications )
+            
+        
+        
+    
 class TestNetworkingEngine( unittest.TestCase ):
     
     def test_engine_shutdown_app( self ):
@@ -314,10 +446,7 @@ class TestNetworkingEngine( unittest.TestCase ):
                 
                 time.sleep( 0.25 )
                 
-                self.assertEqual( len( engine._jobs_awaiting_validity ), 0 )
-                self.assertEqual( len( engine._jobs_awaiting_bandwidth ), 0 )
-                self.assertEqual( len( engine._jobs_awaiting_login ), 0 )
-                self.assertEqual( len( engine._jobs_awaiting_slot ), 0 )
+                self.assertEqual( engine.GetJobsSnapshot(), [] )
                 self.assertEqual( len( engine._jobs_running ), 0 )
                 
             
@@ -327,11 +456,92 @@ class TestNetworkingEngine( unittest.TestCase ):
         engine.Shutdown()
         
     
+    def test_engine_slot_queues( self ):
+        
+        mock_controller = TestController.MockController()
+        bandwidth_manager = ClientNetworkingBandwidth.NetworkBandwidthManager()
+        session_manager = ClientNetworkingSessions.NetworkSessionManager()
+        domain_manager = ClientNetworkingDomain.NetworkDomainManager()
+        login_manager = ClientNetworkingLogin.NetworkLoginManager()
+        
+        engine = ClientNetworking.NetworkEngine( mock_controller, bandwidth_manager, session_manager, domain_manager, login_manager )
+        
+        # with new traffic paused, everything stops in the slot queue
+        
+        engine.PausePlayNewJobs()
+        
+        mock_controller.CallToThread( engine.MainLoop )
+        
+        def get_slot_queue():
+            
+            with engine._lock:
+                
+                return [ job for job_queue in engine._domains_to_jobs_awaiting_slot.values() for ( ticket, job ) in job_queue if engine._TicketIsCurrent( job, ticket ) ]
+                
+            
+        
+        def get_snapshot_jobs():
+            
+            return [ job for ( status, job ) in engine.GetJobsSnapshot() ]
+            
+        
+        try:
+            
+            jobs = [ ClientNetworkingJobs.NetworkJob( 'GET', MOCK_URL ) for i in range( 4 ) ]
+            
+            for job in jobs:
+                
+                engine.AddJob( job )
+                
+            
+            time.sleep( 0.25 )
+            
+            self.assertEqual( get_slot_queue(), jobs )
+            self.assertEqual( set( get_snapshot_jobs() ), set( jobs ) )
+            
+            # a woken job keeps its place
+            
+            jobs[1].OverrideBandwidth()
+            
+            time.sleep( 0.25 )
+            
+            self.assertEqual( get_slot_queue(), jobs )
+            
+            # a cancelled one goes straight away, without waiting for a slot to come up
+            
+            jobs[2].Cancel()
+            
+            time.sleep( 0.25 )
+            
+            self.assertEqual( get_slot_queue(), [ jobs[0], jobs[1], jobs[3] ] )
+            self.assertEqual( set( get_snapshot_jobs() ), { jobs[0], jobs[1], jobs[3] } )
+            
+            with engine._lock:
+                
+                self.assertNotIn( jobs[2], [ job for job_queue in engine._domains_to_jobs_awaiting_slot.values() for ( ticket, job ) in job_queue ] )
+                
+            
+            for job in jobs:
+                
+                job.Cancel()
+                
+            
+            time.sleep( 0.25 )
+            
+            self.assertEqual( get_snapshot_jobs(), [] )
+            self.assertEqual( engine._domains_to_jobs_awaiting_slot, {} )
+            
+        finally:
+            
+            engine.Shutdown()
+            
+        
+    
 class TestNetworkingJob( unittest.TestCase ):
     
-    def _GetJob( self, for_login = False ):
+    def _GetJob( self, for_login = False, temp_path = None ):
         
-        job = ClientNetworkingJobs.NetworkJob( 'GET', MOCK_URL )
+        job = ClientNetworkingJobs.NetworkJob( 'GET', MOCK_URL, temp_path = temp_path )
         
         job.SetForLogin( for_login )
         
@@ -522,6 +732,39 @@ class TestNetworkingJob( unittest.TestCase ):
             
         
     
+    def test_file_hashing( self ):
+        
+        ( os_file_handle, temp_path ) = HydrusPaths.GetTempPath()
+        
+        try:
+            
+            with HTTMock( catch_all ):
+                
+                with HTTMock( catch_wew_ok ):
+                    
+                    job = self._GetJob( temp_path = temp_path )
+                    
+                    job.SetFileHashing( True )
+                    
+                    job.Start()
+                    
+                    self.assertFalse( job.HasError() )
+                    
+                    file_hasher = job.GetFileHasher()
+                    
+                    self.assertEqual( file_hasher.GetNumBytes(), 256 )
+                    self.assertEqual( file_hasher.GetHash(), HydrusFileHandling.GetHashFromPath( temp_path ) )
+                    self.assertEqual( file_hasher.GetExtraHashes(), HydrusFileHandling.GetExtraHashesFromPath( temp_path ) )
+                    self.assertTrue( file_hasher.IsStillValidFor( temp_path ) )
+                    
+                
+            
+        finally:
+            
+            HydrusPaths.CleanUpTempPath( os_file_handle, temp_path )
+            
+        
+    
     def test_generate_login_process( self ):
         
         # test the system works as expected
@@ -536,6 +779,45 @@ class TestNetworkingJob( unittest.TestCase ):
         pass
         
     
+    def test_resume( self ):
+        
+        ( os_file_handle, temp_path ) = HydrusPaths.GetTempPath()
+        
+        try:
+            
+            with HTTMock( catch_all ):
+                
+                with HTTMock( catch_wew_resumable ):
+                    
+                    job = self._GetJob( temp_path = temp_path )
+                    
+                    job.SetFileHashing( True )
+                    
+                    with patch.object( job, '_WaitOnConnectionError' ):
+                        
+                        job.Start()
+                        
+                    
+                    self.assertFalse( job.HasError() )
+                    
+                    with open( temp_path, 'rb' ) as f:
+                        
+                        self.assertEqual( f.read(), LONG_GOOD_RESPONSE )
+                        
+                    
+                    # we only paid for the bytes we actually got, not the first 64KB twice
+                    self.assertEqual( job.GetTotalDataUsed(), len( LONG_GOOD_RESPONSE ) )
+                    
+                    self.assertEqual( job.GetFileHasher().GetHash(), HydrusFileHandling.GetHashFromPath( temp_path ) )
+                    
+                
+            
+        finally:
+            
+            HydrusPaths.CleanUpTempPath( os_file_handle, temp_path )
+            
+        
+    
 class TestNetworkingJobHydrus( unittest.TestCase ):
     
     def _GetJob( self, for_login = False ):
@@ -691,3 +973,210 @@ class TestNetworkingJobHydrus( unittest.TestCase ):
         pass
         
     
+class TestNetworkSessionManager( unittest.TestCase ):
+    
+    def _GetLocalServer( self ):
+        
+        class KeepAliveHandler( http.server.BaseHTTPRequestHandler ):
+            
+            protocol_version = 'HTTP/1.1'
+            
+            def do_GET( self ):
+                
+                self.send_response( 200 )
+                self.send_header( 'Content-Length', str( len( GOOD_RESPONSE ) ) )
+                self.end_headers()
+                
+                self.wfile.write( GOOD_RESPONSE )
+                
+            
+            def log_message( self, *args ):
+                
+                pass
+                
+            
+        
+        server = http.server.ThreadingHTTPServer( ( '127.0.0.1', 0 ), KeepAliveHandler )
+        
+        server.daemon_threads = True
+        
+        threading.Thread( target = server.serve_forever, daemon = True ).start()
+        
+        self.addCleanup( server.server_close )
+        self.addCleanup( server.shutdown )
+        
+        return 'http://127.0.0.1:' + str( server.server_address[1] ) + '/'
+        
+    
+    def test_pool_adapter( self ):
+        
+        session_manager = ClientNetworkingSessions.NetworkSessionManager()
+        
+        network_context = ClientNetworkingContexts.NetworkContext( CC.NETWORK_CONTEXT_DOMAIN, '127.0.0.1' )
+        
+        session = session_manager.GetSession( network_context )
+        
+        pool_maxsize = HG.client_controller.new_options.GetInteger( 'max_network_jobs_per_domain' )
+        
+        for prefix in ( 'http://', 'https://' ):
+            
+            adapter = session.get_adapter( prefix )
+            
+            self.assertIsInstance( adapter, ClientNetworkingSessions.NetworkConnectionPoolAdapter )
+            self.assertEqual( adapter.GetPoolMaxSize(), pool_maxsize )
+            
+            self.assertIn( ( socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1 ), adapter.poolmanager.connection_pool_kw[ 'socket_options' ] )
+            
+        
+        # three requests to one host should share one kept-alive connection
+        
+        url = self._GetLocalServer()
+        
+        for i in range( 3 ):
+            
+            response = session.get( url )
+            
+            self.assertEqual( response.content, GOOD_RESPONSE )
+            
+        
+        self.assertEqual( session_manager.GetConnectionPoolStats( network_context ), ( 3, 1 ) )
+        
+        # closing idle pools keeps the stats, and the next request makes a fresh connection
+        
+        adapter = session.get_adapter( url )
+        
+        adapter._last_request_time = HydrusData.GetNow() - session_manager.CONNECTION_POOL_IDLE_TIMEOUT - 1
+        
+        session_manager.MaintainConnectionPools()
+        
+        self.assertEqual( session_manager.GetConnectionPoolStats( network_context ), ( 3, 1 ) )
+        
+        session.get( url )
+        
+        self.assertEqual( session_manager.GetConnectionPoolStats( network_context ), ( 4, 2 ) )
+        
+    
+    def test_pool_adapter_pickle( self ):
+        
+        session = requests.Session()
+        
+        session.mount( 'https://', ClientNetworkingSessions.NetworkConnectionPoolAdapter( 5 ) )
+        
+        # saved sessions must not depend on our adapter class
+        
+        loaded_session = pickle.loads( pickle.dumps( session ) )
+        
+        self.assertIs( type( loaded_session.get_adapter( 'https://' ) ), requests.adapters.HTTPAdapter )
+        
+        # and the session manager swaps ours back in when the session is next used
+        
+        session_manager = ClientNetworkingSessions.NetworkSessionManager()
+        
+        session_manager._EnsureConnectionPools( loaded_session )
+        
+        self.assertIsInstance( loaded_session.get_adapter( 'https://' ), ClientNetworkingSessions.NetworkConnectionPoolAdapter )
+        
+    
+class TestRepositoryRequests( unittest.TestCase ):
+    
+    def _IterateWithStubbedRequests( self, hashes, responses, error_index = None, error = None ):
+        
+        # within each window of three, the later requests answer first, so the responses come in out of order
+        
+        completed = [ threading.Event() for hash in hashes ]
+        completion_order = []
+        
+        def request( method, command, request_args ):
+            
+            index = hashes.index( request_args[ 'hash' ] )
+            
+            if index % 3 != 2 and index + 1 < len( hashes ):
+                
+                completed[ index + 1 ].wait( 5 )
+                
+            
+            completion_order.append( index )
+            
+            completed[ index ].set()
+            
+            if index == error_index:
+                
+                raise error
+                
+            
+            return responses[ index ]
+            
+        
+        def call_to_thread( callable, *args ):
+            
+            # a real thread each, so a slow request cannot end up queued behind a fast one
+            
+            threading.Thread( target = callable, args = args ).start()
+            
+        
+        service = ClientServices.GenerateService( HydrusData.GenerateKey(), HC.FILE_REPOSITORY, 'test file repo' )
+        
+        results = []
+        raised = None
+        
+        with patch.object( HG.client_controller.new_options, 'GetInteger', return_value = 3 ):
+            
+            with patch.object( HG.client_controller, 'CallToThread', side_effect = call_to_thread ):
+                
+                with patch.object( service, 'Request', side_effect = request ):
+                    
+                    try:
+                        
+                        for network_bytes in service._IterateRequestsInOrder( 'thumbnail', 'hash', hashes ):
+                            
+                            results.append( network_bytes )
+                            
+                        
+                    except Exception as e:
+                        
+                        raised = e
+                        
+                    
+                    for event in completed:
+                        
+                        event.wait( 5 )
+                        
+                    
+                
+            
+        
+        return ( results, raised, completion_order )
+        
+    
+    def test_in_order( self ):
+        
+        hashes = [ HydrusData.GenerateKey() for i in range( 6 ) ]
+        responses = [ b'thumbnail ' + str( i ).encode( 'utf-8' ) for i in range( 6 ) ]
+        
+        ( results, raised, completion_order ) = self._IterateWithStubbedRequests( hashes, responses )
+        
+        self.assertEqual( completion_order, [ 2, 1, 0, 5, 4, 3 ] )
+        
+        self.assertEqual( raised, None )
+        
+        self.assertEqual( results, responses )
+        
+    
+    def test_error_partway( self ):
+        
+        hashes = [ HydrusData.GenerateKey() for i in range( 6 ) ]
+        responses = [ b'thumbnail ' + str( i ).encode( 'utf-8' ) for i in range( 6 ) ]
+        
+        error = HydrusExceptions.NotFoundException( 'thumbnail 4 was not found' )
+        
+        ( results, raised, completion_order ) = self._IterateWithStubbedRequests( hashes, responses, error_index = 4, error = error )
+        
+        # 5 answered fine before 4 failed, but the error still comes out in 4's place, after everything before it
+        
+        self.assertEqual( completion_order, [ 2, 1, 0, 5, 4, 3 ] )
+        
+        self.assertIs( raised, error )
+        
+        self.assertEqual( results, responses[:4] )
+        
+    
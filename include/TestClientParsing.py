@@ -0,0 +1,433 @@
+from . import ClientCaches
+from . import ClientDefaults
+from . import ClientParsing
+from . import ClientSerialisable
+from . import HydrusConstants as HC
+from . import HydrusData
+from . import HydrusGlobals as HG
+from . import HydrusSerialisable
+import collections
+import json
+import os
+import random
+import time
+import unittest
+
+# each 'xxx.fixture.json' in here names a parser, a saved example page in the same dir, and the results that page should give
+# the parser is looked up in the defaults unless 'parser_path' points to an exported png or json dump in the same dir
+
+PARSER_FIXTURES_DIR = os.path.join( HC.STATIC_DIR, 'testing', 'parsers' )
+
+# no <tbody>s, messy attribute whitespace, comments and scripts, all things the lxml tree and the soup have to agree on
+DIFFERENTIAL_HTML = '''<!DOCTYPE html>
+<!-- a comment before the document -->
+<html>
+<head><title>differential test</title><link rel=" stylesheet  alternate " href="style.css"></head>
+<body>
+<div id="content" class="  main   content ">
+<table class="post-table" id="posts">
+<tr class="header"><th headers=" a  b ">tag</th><th>count</th></tr>
+<tr class="odd"><td class="tag-type-1"><a href="/tags/a" rel=" tag  nofollow ">a</a></td><td>1</td></tr>
+<tr class="even"><td class="tag-type-3 extra"><a href="/tags/b" class=" search-tag ">b</a> <span class="count">2</span></td><td>2</td></tr>
+<tr><td><table class="inner"><tr><td class="tag-type-1"><a href="/tags/c">c<!-- hidden -->c</a></td></tr></table></td><td><script>var x = 1;</script>3</td></tr>
+</table>
+<table><tbody><tr><td><div rel=" not  split "><a href="/tags/d">d</a></div></td></tr></tbody></table>
+<ul id="tag-list">
+<li class="tag-type-general"><a href="/tags/e">e</a></li>
+<li class="tag-type-general"><a href="/tags/f">f</a><p>unclosed paragraph<li>g</li>
+</ul>
+</div>
+<p>text with<br>a break
+</body>
+</html>'''
+
+NUM_BENCHMARK_RUNS = 10
+
+def BenchmarkPageParser( page_parser, parsing_context, parsing_text, num_runs = NUM_BENCHMARK_RUNS ):
+    
+    original_parsing_cache = HG.client_controller.parsing_cache
+    
+    try:
+        
+        # a fresh cache every time, so each run pays to parse the document, as a real download would
+        
+        total_time = 0.0
+        
+        for i in range( num_runs ):
+            
+            HG.client_controller.parsing_cache = ClientCaches.ParsingCache()
+            
+            time_started = time.perf_counter()
+            
+            page_parser.Parse( parsing_context, parsing_text )
+            
+            total_time += time.perf_counter() - time_started
+            
+        
+        # now the document is cached, so these are what the content parsers cost by themselves
+        
+        content_parser_timings = collections.Counter()
+        
+        for i in range( num_runs ):
+            
+            page_parser.Parse( parsing_context, parsing_text, content_parser_timings = content_parser_timings )
+            
+        
+    finally:
+        
+        HG.client_controller.parsing_cache = original_parsing_cache
+        
+    
+    pages_per_second = num_runs / max( total_time, 0.000001 )
+    
+    average_content_parser_timings = { key : timing / num_runs for ( key, timing ) in content_parser_timings.items() }
+    
+    return ( pages_per_second, average_content_parser_timings )
+    
+def ConvertParseResultsToComparable( all_parse_results ):
+    
+    comparable = []
+    
+    for parse_results in all_parse_results:
+        
+        rows = []
+        
+        for ( ( name, content_type, additional_info ), parsed_text ) in parse_results:
+            
+            if isinstance( parsed_text, bytes ):
+                
+                parsed_text = parsed_text.hex()
+                
+            
+            rows.append( [ name, content_type, parsed_text ] )
+            
+        
+        comparable.append( rows )
+        
+    
+    return comparable
+    
+def GetHTMLFormulas( obj, formulas = None ):
+    
+    if formulas is None:
+        
+        formulas = []
+        
+    
+    if isinstance( obj, ClientParsing.ParseFormulaHTML ):
+        
+        formulas.append( obj )
+        
+    elif isinstance( obj, ( list, tuple, set ) ):
+        
+        for item in obj:
+            
+            GetHTMLFormulas( item, formulas )
+            
+        
+    elif isinstance( obj, dict ):
+        
+        for item in obj.values():
+            
+            GetHTMLFormulas( item, formulas )
+            
+        
+    elif isinstance( obj, HydrusSerialisable.SerialisableBase ):
+        
+        GetHTMLFormulas( obj.__dict__, formulas )
+        
+    
+    return formulas
+    
+def GetParserFixtures():
+    
+    fixtures = []
+    
+    for filename in sorted( os.listdir( PARSER_FIXTURES_DIR ) ):
+        
+        if not filename.endswith( '.fixture.json' ):
+            
+            continue
+            
+        
+        path = os.path.join( PARSER_FIXTURES_DIR, filename )
+        
+        with open( path, 'r', encoding = 'utf-8' ) as f:
+            
+            manifest = json.load( f )
+            
+        
+        fixtures.append( ( filename, manifest ) )
+        
+    
+    return fixtures
+    
+def GetSoupAndLXMLRawTexts( formula, html ):
+    
+    soup = ClientParsing.GetSoup( html )
+    
+    soup_raw_texts = formula._GetRawTextsFromTags( formula._FindHTMLTags( soup ) )
+    
+    lxml_tree = ClientParsing.GetLXMLTree( html )
+    
+    lxml_raw_texts = formula._GetRawTextsFromLXMLNodes( formula._FindLXMLNodes( lxml_tree ) )
+    
+    return ( soup_raw_texts, lxml_raw_texts )
+    
+def LoadFixtureParser( manifest, default_parsers ):
+    
+    if 'parser_path' in manifest:
+        
+        path = os.path.join( PARSER_FIXTURES_DIR, manifest[ 'parser_path' ] )
+        
+        if path.endswith( '.png' ):
+            
+            payload = ClientSerialisable.LoadFromPng( path )
+            
+            obj = HydrusSerialisable.CreateFromNetworkBytes( payload )
+            
+        else:
+            
+            with open( path, 'r', encoding = 'utf-8' ) as f:
+                
+                obj = HydrusSerialisable.CreateFromString( f.read() )
+                
+            
+        
+        return obj
+        
+    
+    return default_parsers[ manifest[ 'parser' ] ]
+    
+class TestParserFixtures( unittest.TestCase ):
+    
+    @classmethod
+    def setUpClass( cls ):
+        
+        cls._default_parsers = { page_parser.GetName() : page_parser for page_parser in ClientDefaults.GetDefaultParsers() }
+        
+    
+    def test_parser_fixtures( self ):
+        
+        fixtures = GetParserFixtures()
+        
+        self.assertGreater( len( fixtures ), 0 )
+        
+        report_lines = []
+        
+        for ( filename, manifest ) in fixtures:
+            
+            page_parser = LoadFixtureParser( manifest, self._default_parsers )
+            
+            parsing_context = { 'url' : manifest[ 'url' ] }
+            
+            with open( os.path.join( PARSER_FIXTURES_DIR, manifest[ 'data' ] ), 'r', encoding = 'utf-8' ) as f:
+                
+                parsing_text = f.read()
+                
+            
+            all_parse_results = page_parser.Parse( parsing_context, parsing_text )
+            
+            comparable = ConvertParseResultsToComparable( all_parse_results )
+            
+            if 'results' not in manifest:
+                
+                self.fail( filename + ' has no recorded results. If these are correct, add them as \'results\':' + os.linesep + json.dumps( comparable, indent = 1 ) )
+                
+            
+            self.assertEqual( comparable, manifest[ 'results' ], filename )
+            
+            ( pages_per_second, content_parser_timings ) = BenchmarkPageParser( page_parser, parsing_context, parsing_text )
+            
+            report_lines.append( page_parser.GetName() + ' on ' + manifest[ 'data' ] + ': ' + '{:.1f}'.format( pages_per_second ) + ' pages/s' )
+            
+            for ( ( page_parser_name, content_parser_name ), timing ) in sorted( content_parser_timings.items(), key = lambda item: -item[1] ):
+                
+                report_lines.append( '    ' + page_parser_name + ' -> ' + content_parser_name + ': ' + '{:.3f}'.format( timing * 1000 ) + 'ms' )
+                
+            
+        
+        HydrusData.Print( os.linesep.join( report_lines ) )
+        
+    
+class TestLXMLFastPath( unittest.TestCase ):
+    
+    def _CompareRules( self, tag_rules, content_to_fetch = ClientParsing.HTML_CONTENT_STRING, attribute_to_fetch = None, html = DIFFERENTIAL_HTML ):
+        
+        formula = ClientParsing.ParseFormulaHTML( tag_rules = tag_rules, content_to_fetch = content_to_fetch, attribute_to_fetch = attribute_to_fetch )
+        
+        self.assertTrue( formula._CanUseLXML() )
+        
+        ( soup_raw_texts, lxml_raw_texts ) = GetSoupAndLXMLRawTexts( formula, html )
+        
+        self.assertEqual( lxml_raw_texts, soup_raw_texts, repr( [ tag_rule.ToTuple() for tag_rule in tag_rules ] ) )
+        
+        return soup_raw_texts
+        
+    
+    def test_tables( self ):
+        
+        rule = ClientParsing.ParseRuleHTML
+        
+        DESCENDING = ClientParsing.HTML_RULE_TYPE_DESCENDING
+        
+        # the soup puts in the implied <tbody>s, so the lxml tree has to as well
+        
+        texts = self._CompareRules( [ rule( DESCENDING, 'tbody' ), rule( DESCENDING, 'td', tag_index = 0 ) ] )
+        
+        self.assertEqual( len( texts ), 3 )
+        
+        self._CompareRules( [ rule( DESCENDING, 'table', { 'id' : 'posts' } ), rule( DESCENDING, 'tbody', tag_index = 0 ), rule( DESCENDING, 'tr', tag_index = 2 ), rule( DESCENDING, 'a' ) ], ClientParsing.HTML_CONTENT_ATTRIBUTE, 'href' )
+        self._CompareRules( [ rule( DESCENDING, 'table', { 'class' : 'inner' } ), rule( DESCENDING, 'td' ) ] )
+        self._CompareRules( [ rule( DESCENDING, 'td', { 'class' : 'tag-type-3' } ), rule( DESCENDING, 'a' ) ], ClientParsing.HTML_CONTENT_ATTRIBUTE, 'class' )
+        self._CompareRules( [ rule( DESCENDING, 'td', { 'class' : 'tag-type-3 extra' } ) ] )
+        self._CompareRules( [ rule( DESCENDING, 'div', { 'class' : 'main content' } ), rule( DESCENDING, 'tr', { 'class' : 'odd' } ) ], ClientParsing.HTML_CONTENT_ATTRIBUTE, 'class' )
+        self._CompareRules( [ rule( DESCENDING, 'th' ) ], ClientParsing.HTML_CONTENT_ATTRIBUTE, 'headers' )
+        self._CompareRules( [ rule( DESCENDING, 'div', { 'rel' : 'not  split' } ) ], ClientParsing.HTML_CONTENT_ATTRIBUTE, 'rel' )
+        self._CompareRules( [ rule( DESCENDING, 'div' ) ], ClientParsing.HTML_CONTENT_ATTRIBUTE, 'rel' )
+        self._CompareRules( [ rule( DESCENDING, 'a', { 'rel' : 'tag' } ) ], ClientParsing.HTML_CONTENT_ATTRIBUTE, 'rel' )
+        self._CompareRules( [ rule( DESCENDING, 'link' ) ], ClientParsing.HTML_CONTENT_ATTRIBUTE, 'rel' )
+        self._CompareRules( [ rule( DESCENDING, 'li' ) ] )
+        self._CompareRules( [ rule( DESCENDING, 'td' ) ] )
+        self._CompareRules( [ rule( DESCENDING, 'script' ) ] )
+        self._CompareRules( [ rule( DESCENDING, None, tag_index = 1 ) ] )
+        
+    
+    def test_ascending( self ):
+        
+        rule = ClientParsing.ParseRuleHTML
+        
+        DESCENDING = ClientParsing.HTML_RULE_TYPE_DESCENDING
+        ASCENDING = ClientParsing.HTML_RULE_TYPE_ASCENDING
+        
+        texts = self._CompareRules( [ rule( DESCENDING, 'a' ), rule( ASCENDING, 'tbody' ), rule( DESCENDING, 'th' ) ] )
+        
+        self.assertEqual( texts, [ 'tag', 'count', 'tag', 'count' ] )
+        
+        self._CompareRules( [ rule( DESCENDING, 'span', { 'class' : 'count' } ), rule( ASCENDING, 'tr' ), rule( DESCENDING, 'td', tag_index = 1 ) ] )
+        self._CompareRules( [ rule( DESCENDING, 'a', { 'href' : '/tags/c' } ), rule( ASCENDING, 'table', tag_depth = 2 ) ], ClientParsing.HTML_CONTENT_ATTRIBUTE, 'id' )
+        self._CompareRules( [ rule( DESCENDING, 'a', { 'href' : '/tags/c' } ), rule( ASCENDING, 'tbody', tag_depth = 2 ), rule( DESCENDING, 'tr', tag_index = 0 ) ], ClientParsing.HTML_CONTENT_ATTRIBUTE, 'class' )
+        
+        # right up the tree, past <html> to the document and beyond
+        
+        for tag_depth in range( 1, 15 ):
+            
+            self._CompareRules( [ rule( DESCENDING, 'a', { 'href' : '/tags/c' } ), rule( ASCENDING, None, tag_depth = tag_depth ) ] )
+            self._CompareRules( [ rule( DESCENDING, 'a', { 'href' : '/tags/c' } ), rule( ASCENDING, None, tag_depth = tag_depth ), rule( DESCENDING, 'td', tag_index = 0 ) ] )
+            self._CompareRules( [ rule( DESCENDING, 'a', { 'href' : '/tags/c' } ), rule( ASCENDING, None, tag_depth = tag_depth ) ], ClientParsing.HTML_CONTENT_ATTRIBUTE, 'class' )
+            self._CompareRules( [ rule( DESCENDING, 'title' ), rule( ASCENDING, None, tag_depth = tag_depth ), rule( DESCENDING, None, tag_index = 0 ) ], ClientParsing.HTML_CONTENT_ATTRIBUTE, 'rel' )
+            
+        
+    
+    def test_random_rules( self ):
+        
+        rng = random.Random( 1234 )
+        
+        tag_names = [ None, 'html', 'body', 'div', 'table', 'tbody', 'tr', 'td', 'th', 'a', 'span', 'ul', 'li', 'p', 'link' ]
+        attributes = [ {}, { 'class' : 'tag-type-1' }, { 'class' : 'odd' }, { 'class' : 'main' }, { 'class' : 'main content' }, { 'id' : 'posts' }, { 'href' : '/tags/b' } ]
+        
+        for i in range( 300 ):
+            
+            tag_rules = []
+            
+            for j in range( rng.randint( 1, 4 ) ):
+                
+                tag_name = rng.choice( tag_names )
+                
+                if rng.random() < 0.3:
+                    
+                    tag_rules.append( ClientParsing.ParseRuleHTML( ClientParsing.HTML_RULE_TYPE_ASCENDING, tag_name, tag_depth = rng.randint( 1, 6 ) ) )
+                    
+                else:
+                    
+                    tag_index = rng.choice( [ None, None, 0, 1, 2 ] )
+                    
+                    tag_rules.append( ClientParsing.ParseRuleHTML( ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name, dict( rng.choice( attributes ) ), tag_index = tag_index ) )
+                    
+                
+            
+            self._CompareRules( tag_rules )
+            self._CompareRules( tag_rules, ClientParsing.HTML_CONTENT_ATTRIBUTE, rng.choice( [ 'class', 'href', 'id', 'rel' ] ) )
+            
+        
+    
+    def test_default_parsers( self ):
+        
+        pages = [ DIFFERENTIAL_HTML ]
+        
+        for ( filename, manifest ) in GetParserFixtures():
+            
+            if manifest[ 'data' ].endswith( '.html' ):
+                
+                with open( os.path.join( PARSER_FIXTURES_DIR, manifest[ 'data' ] ), 'r', encoding = 'utf-8' ) as f:
+                    
+                    pages.append( f.read() )
+                    
+                
+            
+        
+        formulas = GetHTMLFormulas( ClientDefaults.GetDefaultParsers() )
+        
+        self.assertGreater( len( formulas ), 0 )
+        
+        num_compiled = 0
+        
+        for formula in formulas:
+            
+            if not formula._CanUseLXML():
+                
+                continue
+                
+            
+            num_compiled += 1
+            
+            for html in pages:
+                
+                ( soup_raw_texts, lxml_raw_texts ) = GetSoupAndLXMLRawTexts( formula, html )
+                
+                self.assertEqual( lxml_raw_texts, soup_raw_texts )
+                
+            
+        
+        self.assertGreater( num_compiled, 0 )
+        
+    
+    def test_html_fix_ups( self ):
+        
+        rule = ClientParsing.ParseRuleHTML
+        
+        DESCENDING = ClientParsing.HTML_RULE_TYPE_DESCENDING
+        
+        # lxml builds these differently to html5lib, so the tree is reshaped to match the soup
+        
+        html = '\n<div id="a"><pre>\nline</pre><table>stray<td>1</td><td>2</td><tr><td>3</td></tr></table><table><tbody><th>4</th></tbody></table><textarea>\n\ntext</textarea><image src="x.png"></div>\n\n'
+        
+        for tag_rules in [ [ rule( DESCENDING, 'pre' ) ], [ rule( DESCENDING, 'textarea' ) ], [ rule( DESCENDING, 'tbody' ), rule( DESCENDING, 'tr', tag_index = 0 ), rule( DESCENDING, None ) ], [ rule( DESCENDING, 'tr' ) ], [ rule( DESCENDING, 'body' ) ], [ rule( DESCENDING, 'div', { 'id' : 'a' } ) ], [ rule( DESCENDING, 'head' ) ] ]:
+            
+            self._CompareRules( tag_rules, html = html )
+            
+        
+        self._CompareRules( [ rule( DESCENDING, 'img' ) ], ClientParsing.HTML_CONTENT_ATTRIBUTE, 'src', html = html )
+        
+        # but misnested tags are patched up differently by each, so those pages go to the soup
+        
+        html = '<p><b>bold <i>both</b> italic</i></p><div>after</div>'
+        
+        self.assertEqual( ClientParsing.GetLXMLTree( html ), None )
+        
+        formula = ClientParsing.ParseFormulaHTML( tag_rules = [ rule( DESCENDING, 'i' ) ], content_to_fetch = ClientParsing.HTML_CONTENT_STRING )
+        
+        self.assertTrue( formula._CanUseLXML() )
+        
+        self.assertEqual( formula._ParseRawTexts( {}, html ), formula._GetRawTextsFromTags( formula._FindHTMLTags( ClientParsing.GetSoup( html ) ) ) )
+        
+    
+    def test_html_content_uses_soup( self ):
+        
+        rule = ClientParsing.ParseRuleHTML( ClientParsing.HTML_RULE_TYPE_DESCENDING, 'td' )
+        
+        formula = ClientParsing.ParseFormulaHTML( tag_rules = [ rule ], content_to_fetch = ClientParsing.HTML_CONTENT_HTML )
+        
+        self.assertFalse( formula._CanUseLXML() )
+        
+    
@@ -35,10 +35,12 @@ from . import TestClientData
 from . import TestClientDB
 from . import TestClientDBDuplicates
 from . import TestClientImageHandling
+from . import TestClientImportLocal
 from . import TestClientImportOptions
 from . import TestClientImportSubscriptions
 from . import TestClientListBoxes
 from . import TestClientNetworking
+from . import TestClientParsing
 from . import TestClientThreading
 from . import TestDialogs
 from . import TestFunctions
@@ -48,13 +50,16 @@ from . import TestHydrusSerialisable
 from . import TestHydrusServer
 from . import TestHydrusSessions
 from . import TestHydrusTags
+from . import TestHydrusThreading
 from . import TestServerDB
+from . import TestServerFiles
 from twisted.internet import reactor
 from . import ClientCaches
 from . import ClientData
 from . import ClientOptions
 from . import HydrusData
 from . import HydrusPaths
+from . import ServerFiles
 
 
 DB_DIR = None
@@ -179,6 +184,7 @@ class Controller( object ):
         DB_DIR = self.db_dir
         
         self._server_files_dir = os.path.join( self.db_dir, 'server_files' )
+        self._server_packs_dir = os.path.join( self.db_dir, 'server_packs' )
         self._updates_dir = os.path.join( self.db_dir, 'test_updates' )
         
         client_files_default = os.path.join( self.db_dir, 'client_files' )
@@ -187,6 +193,8 @@ class Controller( object ):
         HydrusPaths.MakeSureDirectoryExists( self._updates_dir )
         HydrusPaths.MakeSureDirectoryExists( client_files_default )
         
+        self.server_pack_store = ServerFiles.PackStore( self._server_packs_dir )
+        
         HG.controller = self
         HG.client_controller = self
         HG.server_controller = self
@@ -250,6 +258,7 @@ class Controller( object ):
         self._reads[ 'tag_parents' ] = {}
         self._reads[ 'tag_siblings' ] = {}
         self._reads[ 'in_inbox' ] = False
+        self._reads[ 'urls_to_url_statuses' ] = {}
         
         self._writes = collections.defaultdict( list )
         
@@ -419,6 +428,11 @@ class Controller( object ):
     
     CallToThreadLongRunning = CallToThread
     
+    def CallToThreadPriority( self, priority, callable, *args, **kwargs ):
+        
+        self.CallToThread( callable, *args, **kwargs )
+        
+    
     def CallLater( self, initial_delay, func, *args, **kwargs ):
         
         call = HydrusData.Call( func, *args, **kwargs )
@@ -530,6 +544,11 @@ class Controller( object ):
         return self.new_options
         
     
+    def GetPacksDir( self ):
+        
+        return self._server_packs_dir
+        
+    
     def GetManager( self, manager_type ):
         
         return self._managers[ manager_type ]
@@ -663,6 +682,7 @@ class Controller( object ):
             suites.append( unittest.TestLoader().loadTestsFromModule( TestHydrusSerialisable ) )
             suites.append( unittest.TestLoader().loadTestsFromModule( TestHydrusSessions ) )
             suites.append( unittest.TestLoader().loadTestsFromModule( TestHydrusTags ) )
+            suites.append( unittest.TestLoader().loadTestsFromModule( TestHydrusThreading ) )
             
         if run_all or self.only_run == 'db':
             
@@ -680,8 +700,13 @@ class Controller( object ):
             
         if run_all or self.only_run == 'import':
             
+            suites.append( unittest.TestLoader().loadTestsFromModule( TestClientImportLocal ) )
             suites.append( unittest.TestLoader().loadTestsFromModule( TestClientImportSubscriptions ) )
             
+        if run_all or self.only_run == 'parsing':
+            
+            suites.append( unittest.TestLoader().loadTestsFromModule( TestClientParsing ) )
+            
         if run_all or self.only_run == 'image':
             
             suites.append( unittest.TestLoader().loadTestsFromModule( TestClientImageHandling ) )
@@ -694,6 +719,7 @@ class Controller( object ):
         if run_all or self.only_run == 'server':
             
             suites.append( unittest.TestLoader().loadTestsFromModule( TestHydrusServer ) )
+            suites.append( unittest.TestLoader().loadTestsFromModule( TestServerFiles ) )
             
         
         suite = unittest.TestSuite( suites )
@@ -6,6 +6,7 @@ import time
 import unittest
 from . import HydrusData
 from . import HydrusGlobals as HG
+from . import HydrusNetwork
 from . import HydrusNetworking
 from mock import patch
 
@@ -518,6 +519,165 @@ class TestBandwidthTracker( unittest.TestCase ):
             
             self.assertEqual( bandwidth_tracker.GetUsage( HC.BANDWIDTH_TYPE_DATA, None ), 1088 )
             self.assertEqual( bandwidth_tracker.GetUsage( HC.BANDWIDTH_TYPE_REQUESTS, None ), 3 )
+        
+    
+    def test_rolling_usage_counter( self ):
+        
+        counter = HydrusNetworking.RollingUsageCounter( 1, 10 )
+        
+        self.assertEqual( counter._running_totals, [] )
+        
+        counter[ 1000 ] += 5
+        counter[ 1002 ] += 3
+        
+        # it only holds the buckets since the first report
+        
+        self.assertEqual( len( counter._running_totals ), 3 )
+        
+        self.assertEqual( counter.GetItems(), [ ( 1000, 5 ), ( 1002, 3 ) ] )
+        self.assertEqual( counter.GetUsageSince( 1001 ), 3 )
+        
+        # the clock went back a bit
+        
+        counter[ 998 ] += 2
+        
+        self.assertEqual( counter.GetItems(), [ ( 998, 2 ), ( 1000, 5 ), ( 1002, 3 ) ] )
+        self.assertEqual( counter.GetUsageSince( 999 ), 8 )
+        self.assertEqual( counter.GetEarliestTimestampSince( 999 ), 1000 )
+        
+        # and never more than twice the time delta
+        
+        counter[ 1015 ] += 1
+        
+        self.assertEqual( len( counter._running_totals ), 18 )
+        
+        self.assertEqual( counter.GetItems(), [ ( 998, 2 ), ( 1000, 5 ), ( 1002, 3 ), ( 1015, 1 ) ] )
+        
+        counter[ 1020 ] += 1
+        
+        self.assertEqual( len( counter._running_totals ), 20 )
+        
+        self.assertEqual( counter.GetItems(), [ ( 1002, 3 ), ( 1015, 1 ), ( 1020, 1 ) ] )
+        self.assertEqual( counter.GetUsageSince( 0 ), 5 )
+        self.assertEqual( counter.GetUsageSince( 1003 ), 2 )
+        
+        counter[ 2000 ] += 1
+        
+        self.assertEqual( len( counter._running_totals ), 1 )
+        
+        self.assertEqual( counter.GetItems(), [ ( 2000, 1 ) ] )
+        self.assertEqual( counter.GetUsageSince( 1990 ), 1 )
+        
+    
+class TestMetadata( unittest.TestCase ):
+    
+    def _GetMetadata( self, num_updates ):
+        
+        metadata = HydrusNetwork.Metadata()
+        
+        for i in range( num_updates ):
+            
+            update_hashes = [ HydrusData.GenerateKey() for j in range( 10 ) ]
+            
+            metadata.AppendUpdate( update_hashes, i * 100, ( i + 1 ) * 100 - 1, ( i + 2 ) * 100 )
+            
+        
+        return metadata
+        
+    
+    def _GetSliceUpdateIndices( self, network_bytes ):
+        
+        args = HydrusNetwork.ParseNetworkBytesToParsedHydrusArgs( network_bytes )
+        
+        metadata_slice = args[ 'metadata_slice' ]
+        
+        return set( metadata_slice._metadata.keys() )
+        
+    
+    def test_slice_network_bytes_cache( self ):
+        
+        metadata = self._GetMetadata( 8 )
+        
+        for from_update_index in range( 9 ):
+            
+            self.assertEqual( self._GetSliceUpdateIndices( metadata.GetSliceNetworkBytes( from_update_index ) ), set( range( from_update_index, 8 ) ) )
+            
+        
+        # silly values clamp to a real slice and do not get their own entries
+        
+        self.assertEqual( self._GetSliceUpdateIndices( metadata.GetSliceNetworkBytes( -5 ) ), set( range( 8 ) ) )
+        self.assertEqual( self._GetSliceUpdateIndices( metadata.GetSliceNetworkBytes( 1000 ) ), set() )
+        
+        self.assertEqual( set( metadata._slice_network_bytes_cache.keys() ), set( range( 9 ) ) )
+        
+        self.assertEqual( metadata._slice_network_bytes_cache_size, sum( ( len( network_bytes ) for network_bytes in metadata._slice_network_bytes_cache.values() ) ) )
+        
+        # a hit gives the same object back
+        
+        self.assertIs( metadata.GetSliceNetworkBytes( 3 ), metadata.GetSliceNetworkBytes( 3 ) )
+        
+        # a new update makes everything stale
+        
+        metadata.AppendUpdate( [ HydrusData.GenerateKey() ], 800, 899, 1000 )
+        
+        self.assertEqual( len( metadata._slice_network_bytes_cache ), 0 )
+        self.assertEqual( metadata._slice_network_bytes_cache_size, 0 )
+        
+        self.assertEqual( self._GetSliceUpdateIndices( metadata.GetSliceNetworkBytes( 3 ) ), set( range( 3, 9 ) ) )
+        
+    
+    def test_slice_network_bytes_cache_bound( self ):
+        
+        metadata = self._GetMetadata( 8 )
+        
+        # room for the last few small slices but never the whole lot
+        
+        max_bytes = len( metadata.GetSliceNetworkBytes( 5 ) ) * 3
+        
+        metadata = self._GetMetadata( 8 )
+        
+        with patch.object( HydrusNetwork, 'METADATA_SLICE_CACHE_MAX_BYTES', max_bytes ):
+            
+            for from_update_index in range( 8, -1, -1 ):
+                
+                self.assertEqual( self._GetSliceUpdateIndices( metadata.GetSliceNetworkBytes( from_update_index ) ), set( range( from_update_index, 8 ) ) )
+                
+                self.assertLessEqual( metadata._slice_network_bytes_cache_size, max_bytes )
+                
+                self.assertEqual( metadata._slice_network_bytes_cache_size, sum( ( len( network_bytes ) for network_bytes in metadata._slice_network_bytes_cache.values() ) ) )
+                
+            
+            # the big early slices pushed the old small ones out
+            
+            self.assertNotIn( 8, metadata._slice_network_bytes_cache )
+            
+            cached_indices = list( metadata._slice_network_bytes_cache.keys() )
+            
+            self.assertTrue( len( cached_indices ) > 0 )
+            
+            # a hit moves an entry to the back, so it is the last to go
+            
+            oldest_index = cached_indices[0]
+            
+            metadata.GetSliceNetworkBytes( oldest_index )
+            
+            self.assertEqual( list( metadata._slice_network_bytes_cache.keys() )[-1], oldest_index )
+            
+            metadata.GetSliceNetworkBytes( 7 )
+            
+            self.assertIn( oldest_index, metadata._slice_network_bytes_cache )
+            
+        
+        # a slice bigger than the whole cap is still served, it just is not kept
+        
+        metadata = self._GetMetadata( 8 )
+        
+        with patch.object( HydrusNetwork, 'METADATA_SLICE_CACHE_MAX_BYTES', 1 ):
+            
+            self.assertEqual( self._GetSliceUpdateIndices( metadata.GetSliceNetworkBytes( 0 ) ), set( range( 8 ) ) )
+            
+            self.assertEqual( len( metadata._slice_network_bytes_cache ), 0 )
+            self.assertEqual( metadata._slice_network_bytes_cache_size, 0 )
             
         
     
@@ -8,6 +8,7 @@ import os
 import unittest
 from . import HydrusData
 from . import HydrusGlobals as HG
+from mock import patch
 
 class TestSessions( unittest.TestCase ):
     
@@ -97,6 +98,11 @@ class TestSessions( unittest.TestCase ):
         
         self.assertIs( read_account, read_account_original )
         
+        ( num_sessions, average_time, max_time ) = session_manager.GetSessionCreationStats()
+        
+        self.assertEqual( num_sessions, 2 )
+        self.assertLessEqual( average_time, max_time )
+        
         # test individual account refresh
         
         expires = HydrusData.GetNow() + 300
@@ -137,3 +143,67 @@ class TestSessions( unittest.TestCase ):
         
         self.assertIs( read_account, updated_account_2 )
         
+        
+        # test a login that lands while a refresh is reading the db, which still has the old sessions
+        
+        account_key_4 = HydrusData.GenerateKey()
+        
+        account_4 = HydrusNetwork.Account( account_key_4, account_type, created, expires )
+        
+        HG.test_controller.SetRead( 'account_key_from_access_key', account_key_4 )
+        HG.test_controller.SetRead( 'account', account_4 )
+        
+        stale_sessions = [ ( session_key_1, service_key, updated_account_2, expires ) ]
+        
+        added_sessions = []
+        
+        original_read = HG.test_controller.Read
+        
+        def read( name, *args, **kwargs ):
+            
+            if name == 'sessions':
+                
+                added_sessions.append( session_manager.AddSession( service_key, access_key ) )
+                
+                return stale_sessions
+                
+            
+            return original_read( name, *args, **kwargs )
+            
+        
+        with patch.object( HG.test_controller, 'Read', side_effect = read ):
+            
+            session_manager.RefreshAllAccounts()
+            
+        
+        [ ( session_key_4, expires_4 ) ] = added_sessions
+        
+        read_account = session_manager.GetAccount( service_key, session_key_4 )
+        
+        self.assertIs( read_account, account_4 )
+        
+        read_account = session_manager.GetAccount( service_key, session_key_1 )
+        
+        self.assertIs( read_account, updated_account_2 )
+        
+        # the stale read was the truth for everything else
+        
+        with self.assertRaises( HydrusExceptions.SessionException ):
+            
+            session_manager.GetAccount( service_key, session_key_2 )
+            
+        
+        # and once the refresh is done, nothing is held on to
+        
+        self.assertEqual( session_manager._sessions_added_during_refreshes, [] )
+        
+        with patch.object( HG.test_controller, 'Read', side_effect = read ):
+            
+            session_manager.RefreshAllAccounts()
+            
+        
+        with self.assertRaises( HydrusExceptions.SessionException ):
+            
+            session_manager.GetAccount( service_key, session_key_4 )
+            
+        
@@ -0,0 +1,232 @@
+from . import HydrusGlobals as HG
+from . import HydrusThreading
+import threading
+import time
+import unittest
+
+class TestCallToThreadPool( unittest.TestCase ):
+    
+    def setUp( self ):
+        
+        self._pools = []
+        
+    
+    def tearDown( self ):
+        
+        for pool in self._pools:
+            
+            threads = pool.GetWorkers()
+            
+            if pool._watchdog is not None:
+                
+                threads.append( pool._watchdog )
+                
+            
+            for thread in threads:
+                
+                thread.shutdown()
+                
+            
+            for thread in threads:
+                
+                thread.join( 5 )
+                
+            
+        
+    
+    def _GetPool( self, **kwargs ):
+        
+        pool = HydrusThreading.CallToThreadPool( HG.test_controller, 'test pool', **kwargs )
+        
+        self._pools.append( pool )
+        
+        return pool
+        
+    
+    def _WaitFor( self, test, timeout = 5.0 ):
+        
+        started = time.perf_counter()
+        
+        while not test():
+            
+            if time.perf_counter() - started > timeout:
+                
+                return False
+                
+            
+            time.sleep( 0.02 )
+            
+        
+        return True
+        
+    
+    def test_priority_order( self ):
+        
+        pool = self._GetPool( num_threads = 1, stall_period = 60.0 )
+        
+        blocker_started = threading.Event()
+        blocker_release = threading.Event()
+        
+        def blocker():
+            
+            blocker_started.set()
+            
+            blocker_release.wait( 5 )
+            
+        
+        results = []
+        
+        pool.put( HydrusThreading.CALL_PRIORITY_NORMAL, blocker )
+        
+        self.assertTrue( blocker_started.wait( 5 ) )
+        
+        pool.put( HydrusThreading.CALL_PRIORITY_BACKGROUND, results.append, 'background' )
+        pool.put( HydrusThreading.CALL_PRIORITY_NORMAL, results.append, 'normal 1' )
+        pool.put( HydrusThreading.CALL_PRIORITY_UI, results.append, 'ui' )
+        pool.put( HydrusThreading.CALL_PRIORITY_NORMAL, results.append, 'normal 2' )
+        
+        blocker_release.set()
+        
+        self.assertTrue( self._WaitFor( lambda: len( results ) == 4 ) )
+        
+        self.assertEqual( results, [ 'ui', 'normal 1', 'normal 2', 'background' ] )
+        
+        self.assertEqual( len( pool.GetWorkers() ), 1 )
+        
+        stats = { priority : ( queue_depth, num_done ) for ( priority, queue_depth, num_done, average_wait, max_wait ) in pool.GetStats() }
+        
+        self.assertEqual( stats[ HydrusThreading.CALL_PRIORITY_UI ], ( 0, 1 ) )
+        self.assertEqual( stats[ HydrusThreading.CALL_PRIORITY_NORMAL ], ( 0, 3 ) )
+        self.assertEqual( stats[ HydrusThreading.CALL_PRIORITY_BACKGROUND ], ( 0, 1 ) )
+        
+    
+    def test_overflow_workers( self ):
+        
+        pool = self._GetPool( num_threads = 1, stall_period = 0.1, idle_timeout = 0.5 )
+        
+        blocker_started = threading.Event()
+        blocker_release = threading.Event()
+        
+        def blocker():
+            
+            blocker_started.set()
+            
+            blocker_release.wait( 10 )
+            
+        
+        try:
+            
+            pool.put( HydrusThreading.CALL_PRIORITY_NORMAL, blocker )
+            
+            self.assertTrue( blocker_started.wait( 5 ) )
+            
+            # the only worker is tied up, so the watchdog has to add an overflow thread for this to run
+            
+            second_job_done = threading.Event()
+            
+            pool.put( HydrusThreading.CALL_PRIORITY_NORMAL, second_job_done.set )
+            
+            self.assertTrue( second_job_done.wait( 5 ) )
+            
+            self.assertEqual( len( pool.GetWorkers() ), 2 )
+            self.assertFalse( blocker_release.is_set() )
+            
+        finally:
+            
+            blocker_release.set()
+            
+        
+        # once things are quiet, the overflow thread retires and we are back to our normal size
+        
+        self.assertTrue( self._WaitFor( lambda: len( pool.GetWorkers() ) == 1 ) )
+        
+        time.sleep( 1.0 )
+        
+        self.assertEqual( len( pool.GetWorkers() ), 1 )
+        
+        # and the survivor still works
+        
+        third_job_done = threading.Event()
+        
+        pool.put( HydrusThreading.CALL_PRIORITY_NORMAL, third_job_done.set )
+        
+        self.assertTrue( third_job_done.wait( 5 ) )
+        
+    
+    def test_no_overflow_before_stall( self ):
+        
+        pool = self._GetPool( num_threads = 1, stall_period = 60.0 )
+        
+        blocker_started = threading.Event()
+        blocker_release = threading.Event()
+        
+        def blocker():
+            
+            blocker_started.set()
+            
+            blocker_release.wait( 5 )
+            
+        
+        second_job_done = threading.Event()
+        
+        try:
+            
+            pool.put( HydrusThreading.CALL_PRIORITY_NORMAL, blocker )
+            
+            self.assertTrue( blocker_started.wait( 5 ) )
+            
+            pool.put( HydrusThreading.CALL_PRIORITY_NORMAL, second_job_done.set )
+            
+            self.assertFalse( second_job_done.wait( 0.5 ) )
+            
+            self.assertEqual( len( pool.GetWorkers() ), 1 )
+            
+        finally:
+            
+            blocker_release.set()
+            
+        
+        self.assertTrue( second_job_done.wait( 5 ) )
+        
+    
+    def test_nested_calls( self ):
+        
+        # with no watchdog help, a worker waiting on a job it queued itself would hang forever
+        
+        pool = self._GetPool( num_threads = 1, stall_period = 60.0 )
+        
+        results = []
+        
+        def inner():
+            
+            results.append( 'inner' )
+            
+        
+        def outer():
+            
+            inner_done = threading.Event()
+            
+            def do_inner():
+                
+                inner()
+                
+                inner_done.set()
+                
+            
+            pool.put( HydrusThreading.CALL_PRIORITY_NORMAL, do_inner )
+            
+            if inner_done.wait( 5 ):
+                
+                results.append( 'outer' )
+                
+            
+        
+        pool.put( HydrusThreading.CALL_PRIORITY_NORMAL, outer )
+        
+        self.assertTrue( self._WaitFor( lambda: len( results ) == 2 ) )
+        
+        self.assertEqual( results, [ 'inner', 'outer' ] )
+        
+        self.assertEqual( len( pool.GetWorkers() ), 2 )
+        
+    
@@ -18,14 +18,17 @@ from . import ClientTags
 import collections
 from . import HydrusConstants as HC
 from . import HydrusData
+from . import HydrusDB
 from . import HydrusExceptions
 from . import HydrusVideoHandling
 from . import HydrusGlobals as HG
 from . import HydrusNetwork
+from . import HydrusNetworking
 from . import HydrusSerialisable
 import itertools
 import os
 from . import ServerDB
+from . import ServerFiles
 import shutil
 import sqlite3
 import stat
@@ -34,6 +37,7 @@ import time
 import threading
 import unittest
 import wx
+from mock import patch
 
 class TestServerDB( unittest.TestCase ):
     
@@ -45,6 +49,11 @@ class TestServerDB( unittest.TestCase ):
         
         cls._db = ServerDB.DB( HG.test_controller, TestController.DB_DIR, 'server' )
         
+        # the server admin can only be initialised once per db, so whichever test gets there first shares it with the rest
+        
+        cls._admin_access_key = None
+        cls._admin_account_key = None
+        
     
     @classmethod
     def tearDownClass( cls ):
@@ -59,6 +68,304 @@ class TestServerDB( unittest.TestCase ):
         del cls._db
         
     
+    def _ban( self, service_key, admin_account, subject_accounts, superban ):
+        
+        # nothing sends a ban to the db yet, so we run one on the db thread in place of a write
+        
+        db = TestServerDB._db
+        
+        with patch.object( db, '_Write', side_effect = lambda action, *args: db._DeleteAllAccountContributions( *args ) ):
+            
+            self._write( 'ban', service_key, admin_account, subject_accounts, superban )
+            
+        
+    
+    def _check_petition_summaries( self, service_keys ):
+        
+        # the db keeps its transaction open between jobs, so we close it to look at what it wrote
+        
+        self._close_db()
+        
+        try:
+            
+            db = sqlite3.connect( os.path.join( TestController.DB_DIR, 'server.db' ) )
+            
+            c = db.cursor()
+            
+            c.execute( 'ATTACH ? AS external_mappings;', ( os.path.join( TestController.DB_DIR, 'server.mappings.db' ), ) )
+            
+            for service_key in service_keys:
+                
+                ( service_id, ) = c.execute( 'SELECT service_id FROM services WHERE service_key = ?;', ( sqlite3.Binary( service_key ), ) ).fetchone()
+                
+                ( current_files_table_name, deleted_files_table_name, pending_files_table_name, petitioned_files_table_name, ip_addresses_table_name ) = ServerDB.GenerateRepositoryFilesTableNames( service_id )
+                ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = ServerDB.GenerateRepositoryMappingsTableNames( service_id )
+                
+                ( petitioned_files_summary_table_name, petitioned_mappings_summary_table_name ) = ServerDB.GenerateRepositoryPetitionSummaryTableNames( service_id )
+                
+                for ( summary_table_name, petitioned_table_name, group_columns ) in ( ( petitioned_files_summary_table_name, petitioned_files_table_name, 'account_id, reason_id' ), ( petitioned_mappings_summary_table_name, petitioned_mappings_table_name, 'service_tag_id, account_id, reason_id' ) ):
+                    
+                    summary_rows = c.execute( 'SELECT ' + group_columns + ', petition_weight FROM ' + summary_table_name + ';' ).fetchall()
+                    
+                    expected_summary_rows = c.execute( 'SELECT ' + group_columns + ', COUNT( * ) FROM ' + petitioned_table_name + ' GROUP BY ' + group_columns + ';' ).fetchall()
+                    
+                    self.assertEqual( sorted( summary_rows ), sorted( expected_summary_rows ) )
+                    
+                    blocks_table_name = ServerDB.GenerateRepositoryPetitionSummaryBlocksTableName( summary_table_name )
+                    
+                    block_rows = c.execute( 'SELECT block_id, block_weight FROM ' + blocks_table_name + ';' ).fetchall()
+                    
+                    expected_block_rows = c.execute( 'SELECT rowid / ?, SUM( petition_weight ) FROM ' + summary_table_name + ' GROUP BY rowid / ?;', ( ServerDB.PETITION_SUMMARY_BLOCK_SIZE, ServerDB.PETITION_SUMMARY_BLOCK_SIZE ) ).fetchall()
+                    
+                    self.assertEqual( sorted( block_rows ), sorted( expected_block_rows ) )
+                    
+                
+            
+            db.close()
+            
+        finally:
+            
+            self._open_db()
+            
+        
+    
+    def _close_db( self ):
+        
+        TestServerDB._db.Shutdown()
+        
+        while not TestServerDB._db.LoopIsFinished():
+            
+            time.sleep( 0.1 )
+            
+        
+    
+    def _create_account( self, service_key, admin_account, permissions ):
+        
+        account_type = HydrusNetwork.AccountType.GenerateNewAccountTypeFromParameters( 'test', permissions, HydrusNetworking.BandwidthRules() )
+        
+        account_types = self._read( 'account_types', service_key, admin_account )
+        
+        account_types.append( account_type )
+        
+        self._write( 'account_types', service_key, admin_account, account_types, {} )
+        
+        [ registration_key ] = self._read( 'registration_keys', service_key, admin_account, 1, account_type.GetAccountTypeKey(), None )
+        
+        access_key = self._read( 'access_key', service_key, registration_key )
+        
+        account_key = self._read( 'account_key_from_access_key', service_key, access_key )
+        
+        return self._read( 'account', service_key, account_key )
+        
+    
+    def _create_repository( self, service_type ):
+        
+        admin_account = self._get_admin_account()
+        
+        services = self._read( 'services' )
+        
+        service_key = HydrusData.GenerateKey()
+        
+        port = max( ( service.GetPort() for service in services ) ) + 1
+        
+        services.append( HydrusNetwork.GenerateService( service_key, service_type, 'test repo', port ) )
+        
+        service_keys_to_access_keys = self._write( 'services', admin_account, services )
+        
+        access_key = service_keys_to_access_keys[ service_key ]
+        
+        account_key = self._read( 'account_key_from_access_key', service_key, access_key )
+        
+        account = self._read( 'account', service_key, account_key )
+        
+        return ( service_key, account )
+        
+    
+    def _generate_update_batches( self, service_key, begin, end, max_num_batches = None ):
+        
+        # this is the controller's update loop, with made-up hashes standing in for the files it would write
+        
+        updates = []
+        update_hashes = []
+        
+        num_batches = 0
+        finished = False
+        all_update_hashes = None
+        
+        while not finished and ( max_num_batches is None or num_batches < max_num_batches ):
+            
+            ( batch_updates, position, finished ) = self._read( 'repository_updates', service_key, begin, end )
+            
+            batch_update_hashes = [ HydrusData.GenerateKey() for update in batch_updates ]
+            
+            all_update_hashes = self._write( 'repository_update_progress', service_key, begin, end, batch_update_hashes, position, finished )
+            
+            updates.extend( batch_updates )
+            update_hashes.extend( batch_update_hashes )
+            
+            num_batches += 1
+            
+        
+        return ( updates, update_hashes, all_update_hashes, num_batches, finished )
+        
+    
+    def _get_admin_account( self ):
+        
+        if TestServerDB._admin_account_key is None:
+            
+            self._test_init_server_admin()
+            
+        
+        return self._read( 'account', HC.SERVER_ADMIN_KEY, TestServerDB._admin_account_key )
+        
+    
+    def _get_mappings_from_updates( self, updates ):
+        
+        hash_ids_to_hashes = {}
+        tag_ids_to_tags = {}
+        
+        for update in updates:
+            
+            if isinstance( update, HydrusNetwork.DefinitionsUpdate ):
+                
+                hash_ids_to_hashes.update( update.GetHashIdsToHashes() )
+                tag_ids_to_tags.update( update.GetTagIdsToTags() )
+                
+            
+        
+        current_mappings = []
+        deleted_mappings = []
+        
+        for update in updates:
+            
+            if isinstance( update, HydrusNetwork.ContentUpdate ):
+                
+                for ( mappings, rows ) in ( ( current_mappings, update.GetNewMappings() ), ( deleted_mappings, update.GetDeletedMappings() ) ):
+                    
+                    for ( service_tag_id, service_hash_ids ) in rows:
+                        
+                        mappings.extend( ( ( tag_ids_to_tags[ service_tag_id ], hash_ids_to_hashes[ service_hash_id ] ) for service_hash_id in service_hash_ids ) )
+                        
+                    
+                
+            
+        
+        return ( hash_ids_to_hashes, current_mappings, deleted_mappings )
+        
+    
+    def _upload_file( self, service_key, account, hash = None, thumbnail_bytes = None ):
+        
+        [ service ] = [ service for service in self._read( 'services' ) if service.GetServiceKey() == service_key ]
+        
+        if hash is None:
+            
+            hash = HydrusData.GenerateKey()
+            
+        
+        path = os.path.join( TestController.DB_DIR, hash.hex() )
+        
+        with open( path, 'wb' ) as f:
+            
+            f.write( hash )
+            
+        
+        file_dict = { 'hash' : hash, 'size' : len( hash ), 'mime' : HC.IMAGE_PNG, 'path' : path }
+        
+        if thumbnail_bytes is not None:
+            
+            file_dict[ 'thumbnail' ] = thumbnail_bytes
+            
+        
+        self._write( 'file', service, account, file_dict )
+        
+        os.unlink( path )
+        
+        return hash
+        
+    
+    def _upload_files( self, service_key, account, action, hashes, reason = None ):
+        
+        client_to_server_update = HydrusNetwork.ClientToServerUpdate()
+        
+        client_to_server_update.AddContent( action, HydrusNetwork.Content( HC.CONTENT_TYPE_FILES, hashes ), reason )
+        
+        self._write( 'update', service_key, account, client_to_server_update )
+        
+    
+    def _upload_mappings( self, service_key, account, action, tag, hashes, reason = None ):
+        
+        client_to_server_update = HydrusNetwork.ClientToServerUpdate()
+        
+        client_to_server_update.AddContent( action, HydrusNetwork.Content( HC.CONTENT_TYPE_MAPPINGS, ( tag, hashes ) ), reason )
+        
+        self._write( 'update', service_key, account, client_to_server_update )
+        
+    
+    def _open_db( self ):
+        
+        TestServerDB._db = ServerDB.DB( HG.test_controller, TestController.DB_DIR, 'server' )
+        
+    
+    def _pend_file( self, service_key, account, hash ):
+        
+        # nothing pends a file yet, so we put one straight into the pending table on the db thread in place of a write
+        
+        db = TestServerDB._db
+        
+        def do_pend( action, *args ):
+            
+            service_id = db._GetServiceId( service_key )
+            account_id = db._GetAccountId( account.GetAccountKey() )
+            master_hash_id = db._GetMasterHashId( hash )
+            reason_id = db._GetReasonId( 'test' )
+            
+            ( current_files_table_name, deleted_files_table_name, pending_files_table_name, petitioned_files_table_name, ip_addresses_table_name ) = ServerDB.GenerateRepositoryFilesTableNames( service_id )
+            
+            db._c.execute( 'INSERT INTO ' + pending_files_table_name + ' ( master_hash_id, account_id, reason_id ) VALUES ( ?, ?, ? );', ( master_hash_id, account_id, reason_id ) )
+            
+        
+        with patch.object( db, '_Write', side_effect = do_pend ):
+            
+            self._write( 'pend_file' )
+            
+        
+    
+    def _record_generation_hash( self, service_key, update_hash ):
+        
+        # we put the row straight into the in-progress generation table on the db thread in place of a write, without registering it
+        
+        db = TestServerDB._db
+        
+        def do_record( action, *args ):
+            
+            service_id = db._GetServiceId( service_key )
+            
+            ( num_update_hashes, ) = db._c.execute( 'SELECT COUNT( * ) FROM repository_update_generation_hashes WHERE service_id = ?;', ( service_id, ) ).fetchone()
+            
+            db._c.execute( 'INSERT INTO repository_update_generation_hashes ( service_id, update_index, update_hash ) VALUES ( ?, ?, ? );', ( service_id, num_update_hashes, sqlite3.Binary( update_hash ) ) )
+            
+        
+        with patch.object( db, '_Write', side_effect = do_record ):
+            
+            self._write( 'record_generation_hash' )
+            
+        
+    
+    def _setup_update_generation_mappings( self, service_key, account ):
+        
+        hashes = [ HydrusData.GenerateKey() for i in range( 6 ) ]
+        
+        self._upload_mappings( service_key, account, HC.CONTENT_UPDATE_PEND, 'a', hashes[ 0 : 5 ] )
+        self._upload_mappings( service_key, account, HC.CONTENT_UPDATE_PEND, 'b', hashes[ 0 : 4 ] )
+        self._upload_mappings( service_key, account, HC.CONTENT_UPDATE_PEND, 'c', hashes[ 2 : 6 ] )
+        self._upload_mappings( service_key, account, HC.CONTENT_UPDATE_PETITION, 'b', hashes[ 0 : 2 ] )
+        
+        expected_current_mappings = [ ( 'a', hash ) for hash in hashes[ 0 : 5 ] ] + [ ( 'b', hash ) for hash in hashes[ 2 : 4 ] ] + [ ( 'c', hash ) for hash in hashes[ 2 : 6 ] ]
+        expected_deleted_mappings = [ ( 'b', hash ) for hash in hashes[ 0 : 2 ] ]
+        
+        return ( expected_current_mappings, expected_deleted_mappings )
+        
+    
     def _test_account_creation( self ):
         
         result = self._read( 'account_types', self._tag_service_key )
@@ -148,14 +455,14 @@ class TestServerDB( unittest.TestCase ):
         self.assertEqual( type( result ), bytes )
         self.assertEqual( len( result ), 32 )
         
-        self._admin_access_key = result
+        TestServerDB._admin_access_key = result
         
         result = self._read( 'account_key_from_access_key', HC.SERVER_ADMIN_KEY, self._admin_access_key )
         
         self.assertEqual( type( result ), bytes )
         self.assertEqual( len( result ), 32 )
         
-        self._admin_account_key = result
+        TestServerDB._admin_account_key = result
         
     
     def _test_service_creation( self ):
@@ -194,9 +501,348 @@ class TestServerDB( unittest.TestCase ):
         self.assertEqual( set( result ), { self._tag_service_key, self._file_service_key } )
         
     
+    def test_bulk_id_resolution( self ):
+        
+        ( service_key, account ) = self._create_repository( HC.TAG_REPOSITORY )
+        
+        hashes = [ HydrusData.GenerateKey() for i in range( 8 ) ]
+        
+        # with no cache, every lookup goes to the db, so the second upload resolves two existing hashes and two new ones in the same pass
+        
+        with patch.object( ServerDB, 'ID_CACHE_SIZE', 0 ):
+            
+            self._upload_mappings( service_key, account, HC.CONTENT_UPDATE_PEND, 'a', hashes[ 0 : 3 ] )
+            self._upload_mappings( service_key, account, HC.CONTENT_UPDATE_PEND, 'b', hashes[ 1 : 5 ] )
+            
+        
+        # and here the first hashes come out of the cache while the rest are new
+        
+        self._upload_mappings( service_key, account, HC.CONTENT_UPDATE_PEND, 'c', hashes[ 0 : 6 ] )
+        self._upload_mappings( service_key, account, HC.CONTENT_UPDATE_PEND, 'd', hashes[ 4 : 8 ] + hashes[ 4 : 5 ] )
+        
+        updates = self._read( 'immediate_update', service_key, account, 0, HydrusData.GetNow() + 100 )
+        
+        ( hash_ids_to_hashes, current_mappings, deleted_mappings ) = self._get_mappings_from_updates( updates )
+        
+        # one service id per hash, however it was resolved
+        
+        self.assertEqual( len( hash_ids_to_hashes ), len( hashes ) )
+        self.assertEqual( set( hash_ids_to_hashes.values() ), set( hashes ) )
+        
+        expected_mappings = set()
+        
+        for ( tag, tag_hashes ) in ( ( 'a', hashes[ 0 : 3 ] ), ( 'b', hashes[ 1 : 5 ] ), ( 'c', hashes[ 0 : 6 ] ), ( 'd', hashes[ 4 : 8 ] ) ):
+            
+            expected_mappings.update( ( ( tag, hash ) for hash in tag_hashes ) )
+            
+        
+        self.assertEqual( len( current_mappings ), len( expected_mappings ) )
+        self.assertEqual( set( current_mappings ), expected_mappings )
+        self.assertEqual( deleted_mappings, [] )
+        
+    
+    def test_orphans( self ):
+        
+        ( service_key, account ) = self._create_repository( HC.FILE_REPOSITORY )
+        
+        pack_store = HG.test_controller.server_pack_store
+        
+        # all our files go under one prefix, so we can delete there without touching what the other tests leave around
+        
+        prefix = 'fe'
+        
+        def generate_hash():
+            
+            return bytes.fromhex( prefix ) + os.urandom( 31 )
+            
+        
+        def write_loose_file( hash ):
+            
+            with open( ServerFiles.GetExpectedFilePath( hash ), 'wb' ) as f:
+                
+                f.write( hash )
+                
+            
+        
+        current_hash = self._upload_file( service_key, account, hash = generate_hash(), thumbnail_bytes = b'current thumbnail' )
+        deleted_hash = self._upload_file( service_key, account, hash = generate_hash(), thumbnail_bytes = b'deleted thumbnail' )
+        
+        self._upload_files( service_key, account, HC.CONTENT_UPDATE_PETITION, [ deleted_hash ], reason = 'test' )
+        
+        pending_hash = generate_hash()
+        
+        write_loose_file( pending_hash )
+        
+        self._pend_file( service_key, account, pending_hash )
+        
+        unknown_hash = generate_hash()
+        
+        write_loose_file( unknown_hash )
+        
+        pack_store.AddObject( 'thumbnail', unknown_hash, b'unknown thumbnail' )
+        
+        unregistered_update_hash = generate_hash()
+        
+        pack_store.AddObject( 'file', unregistered_update_hash, b'unregistered update' )
+        
+        now = HydrusData.GetNow()
+        
+        ( updates, update_hashes, all_update_hashes, num_batches, finished ) = self._generate_update_batches( service_key, now - 100, now + 100 )
+        
+        self.assertTrue( len( update_hashes ) > 0 )
+        
+        for update_hash in update_hashes:
+            
+            pack_store.AddObject( 'file', update_hash, b'update' )
+            
+        
+        # a generation that stopped partway, as if the server died, has written a batch and will finish it later
+        
+        ( tag_service_key, tag_account ) = self._create_repository( HC.TAG_REPOSITORY )
+        
+        self._setup_update_generation_mappings( tag_service_key, tag_account )
+        
+        with patch.object( ServerDB, 'UPDATE_MAX_CONTENT_ROWS', 3 ):
+            
+            with patch.object( ServerDB, 'UPDATE_MAX_CONTENT_CHUNK', 2 ):
+                
+                ( in_progress_updates, in_progress_update_hashes, all_in_progress_update_hashes, num_batches, finished ) = self._generate_update_batches( tag_service_key, now - 100, now + 100, max_num_batches = 1 )
+                
+            
+        
+        self.assertFalse( finished )
+        self.assertTrue( len( in_progress_update_hashes ) > 0 )
+        
+        for update_hash in in_progress_update_hashes:
+            
+            pack_store.AddObject( 'file', update_hash, b'in progress update' )
+            
+        
+        # and a batch the generation table knows about that never made it into the update table
+        
+        unregistered_batch_hash = generate_hash()
+        
+        pack_store.AddObject( 'file', unregistered_batch_hash, b'unregistered batch' )
+        
+        self._record_generation_hash( tag_service_key, unregistered_batch_hash )
+        
+        update_hashes = update_hashes + in_progress_update_hashes + [ unregistered_batch_hash ]
+        
+        test_keys = { ( 'file', current_hash ), ( 'thumbnail', current_hash ), ( 'file', deleted_hash ), ( 'thumbnail', deleted_hash ), ( 'file', pending_hash ), ( 'file', unknown_hash ), ( 'thumbnail', unknown_hash ), ( 'file', unregistered_update_hash ) }
+        test_keys.update( ( ( 'file', update_hash ) for update_hash in update_hashes ) )
+        
+        prefixes = { prefix } | { update_hash.hex()[:2] for update_hash in update_hashes }
+        
+        def get_orphans():
+            
+            orphans = set()
+            
+            for p in prefixes:
+                
+                orphans.update( ( ( file_type, hash ) for ( file_type, hash, path ) in self._read( 'orphans', p ) ) )
+                
+            
+            return orphans & test_keys
+            
+        
+        # everything is younger than the grace period, so nothing can go yet
+        
+        self.assertEqual( get_orphans(), set() )
+        
+        expected_orphans = { ( 'file', deleted_hash ), ( 'thumbnail', deleted_hash ), ( 'file', unknown_hash ), ( 'thumbnail', unknown_hash ), ( 'file', unregistered_update_hash ) }
+        
+        later = now + ServerDB.ORPHAN_GRACE_PERIOD + 60
+        
+        with patch.object( HydrusData, 'GetNow', return_value = later ):
+            
+            young_hash = generate_hash()
+            
+            pack_store.AddObject( 'thumbnail', young_hash, b'young thumbnail' )
+            
+            test_keys.add( ( 'thumbnail', young_hash ) )
+            
+            self.assertEqual( get_orphans(), expected_orphans )
+            
+            num_deleted = self._write( 'delete_orphans', prefix )
+            
+            self.assertTrue( num_deleted >= len( expected_orphans ) )
+            
+            self.assertEqual( get_orphans(), set() )
+            
+        
+        self.assertTrue( os.path.exists( ServerFiles.GetExpectedFilePath( current_hash ) ) )
+        self.assertTrue( os.path.exists( ServerFiles.GetExpectedFilePath( pending_hash ) ) )
+        self.assertFalse( os.path.exists( ServerFiles.GetExpectedFilePath( deleted_hash ) ) )
+        self.assertFalse( os.path.exists( ServerFiles.GetExpectedFilePath( unknown_hash ) ) )
+        
+        self.assertEqual( pack_store.GetObject( 'thumbnail', current_hash ), b'current thumbnail' )
+        self.assertEqual( pack_store.GetObject( 'thumbnail', young_hash ), b'young thumbnail' )
+        self.assertEqual( pack_store.GetObject( 'thumbnail', deleted_hash ), None )
+        self.assertEqual( pack_store.GetObject( 'thumbnail', unknown_hash ), None )
+        self.assertEqual( pack_store.GetObject( 'file', unregistered_update_hash ), None )
+        
+        for update_hash in update_hashes:
+            
+            self.assertNotEqual( pack_store.GetObject( 'file', update_hash ), None )
+            
+        
+        # its files_info went with it, so uploading it again writes the file back out
+        
+        self._upload_file( service_key, account, hash = deleted_hash )
+        
+        self.assertTrue( os.path.exists( ServerFiles.GetExpectedFilePath( deleted_hash ) ) )
+        
+    
+    def test_petition_summaries( self ):
+        
+        # a tiny block size so the summaries run over several blocks
+        
+        with patch.object( ServerDB, 'PETITION_SUMMARY_BLOCK_SIZE', 2 ):
+            
+            ( tag_service_key, tag_admin_account ) = self._create_repository( HC.TAG_REPOSITORY )
+            ( file_service_key, file_admin_account ) = self._create_repository( HC.FILE_REPOSITORY )
+            
+            service_keys = ( tag_service_key, file_service_key )
+            
+            tag_uploader = self._create_account( tag_service_key, tag_admin_account, { HC.CONTENT_TYPE_MAPPINGS : HC.PERMISSION_ACTION_CREATE } )
+            ( tag_petitioner_1, tag_petitioner_2 ) = [ self._create_account( tag_service_key, tag_admin_account, { HC.CONTENT_TYPE_MAPPINGS : HC.PERMISSION_ACTION_PETITION } ) for i in range( 2 ) ]
+            
+            file_uploader = self._create_account( file_service_key, file_admin_account, { HC.CONTENT_TYPE_FILES : HC.PERMISSION_ACTION_CREATE } )
+            ( file_petitioner_1, file_petitioner_2 ) = [ self._create_account( file_service_key, file_admin_account, { HC.CONTENT_TYPE_FILES : HC.PERMISSION_ACTION_PETITION } ) for i in range( 2 ) ]
+            
+            mapping_hashes = [ HydrusData.GenerateKey() for i in range( 6 ) ]
+            
+            for tag in ( 'a', 'b', 'c' ):
+                
+                self._upload_mappings( tag_service_key, tag_uploader, HC.CONTENT_UPDATE_PEND, tag, mapping_hashes )
+                
+            
+            file_hashes = [ self._upload_file( file_service_key, file_uploader ) for i in range( 6 ) ]
+            
+            # petition
+            
+            self._upload_mappings( tag_service_key, tag_petitioner_1, HC.CONTENT_UPDATE_PETITION, 'a', mapping_hashes[ 0 : 4 ], 'wrong' )
+            self._upload_mappings( tag_service_key, tag_petitioner_1, HC.CONTENT_UPDATE_PETITION, 'b', mapping_hashes[ 0 : 2 ], 'wrong' )
+            self._upload_mappings( tag_service_key, tag_petitioner_2, HC.CONTENT_UPDATE_PETITION, 'a', mapping_hashes[ 2 : 6 ], 'spam' )
+            self._upload_mappings( tag_service_key, tag_petitioner_2, HC.CONTENT_UPDATE_PETITION, 'c', mapping_hashes, 'spam' )
+            
+            self._upload_files( file_service_key, file_petitioner_1, HC.CONTENT_UPDATE_PETITION, file_hashes[ 0 : 4 ], 'dupe' )
+            self._upload_files( file_service_key, file_petitioner_2, HC.CONTENT_UPDATE_PETITION, file_hashes[ 2 : 6 ], 'spam' )
+            
+            # a petitioner changing their mind moves rows from one group to another
+            
+            self._upload_mappings( tag_service_key, tag_petitioner_1, HC.CONTENT_UPDATE_PETITION, 'a', mapping_hashes[ 0 : 1 ], 'spam' )
+            
+            self._upload_files( file_service_key, file_petitioner_1, HC.CONTENT_UPDATE_PETITION, file_hashes[ 0 : 1 ], 'spam' )
+            
+            self._check_petition_summaries( service_keys )
+            
+            # approve and deny whatever the janitor is handed
+            
+            for ( service_key, admin_account, content_type ) in ( ( tag_service_key, tag_admin_account, HC.CONTENT_TYPE_MAPPINGS ), ( file_service_key, file_admin_account, HC.CONTENT_TYPE_FILES ) ):
+                
+                petition = self._read( 'petition', service_key, admin_account, content_type, HC.CONTENT_STATUS_PETITIONED )
+                
+                ( client_to_server_update, content_updates ) = petition.GetApproval( petition.GetContents() )
+                
+                self._write( 'update', service_key, admin_account, client_to_server_update )
+                
+                self._check_petition_summaries( service_keys )
+                
+                petition = self._read( 'petition', service_key, admin_account, content_type, HC.CONTENT_STATUS_PETITIONED )
+                
+                client_to_server_update = petition.GetDenial( petition.GetContents() )
+                
+                self._write( 'update', service_key, admin_account, client_to_server_update )
+                
+                self._check_petition_summaries( service_keys )
+                
+            
+            # delete petitioned content outright, across several groups at once
+            
+            self._upload_mappings( tag_service_key, tag_admin_account, HC.CONTENT_UPDATE_PETITION, 'a', mapping_hashes[ 1 : 4 ] )
+            
+            self._upload_files( file_service_key, file_admin_account, HC.CONTENT_UPDATE_PETITION, file_hashes[ 1 : 3 ] )
+            
+            self._check_petition_summaries( service_keys )
+            
+            # ban a petitioner
+            
+            self._ban( tag_service_key, tag_admin_account, [ tag_petitioner_1 ], False )
+            self._ban( file_service_key, file_admin_account, [ file_petitioner_1 ], False )
+            
+            self._check_petition_summaries( service_keys )
+            
+            # and superban the uploader, which takes every remaining petition with it
+            
+            self._upload_mappings( tag_service_key, tag_petitioner_2, HC.CONTENT_UPDATE_PETITION, 'b', mapping_hashes[ 2 : 6 ], 'late' )
+            
+            late_file_hash = self._upload_file( file_service_key, file_uploader )
+            
+            self._upload_files( file_service_key, file_petitioner_2, HC.CONTENT_UPDATE_PETITION, [ late_file_hash ], 'late' )
+            
+            self._check_petition_summaries( service_keys )
+            
+            self._ban( tag_service_key, tag_admin_account, [ tag_uploader ], True )
+            self._ban( file_service_key, file_admin_account, [ file_uploader ], True )
+            
+            self._check_petition_summaries( service_keys )
+            
+            self.assertRaises( HydrusExceptions.NotFoundException, self._read, 'petition', tag_service_key, tag_admin_account, HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_STATUS_PETITIONED )
+            self.assertRaises( HydrusExceptions.NotFoundException, self._read, 'petition', file_service_key, file_admin_account, HC.CONTENT_TYPE_FILES, HC.CONTENT_STATUS_PETITIONED )
+            
+        
+    
+    def test_petition_weighting( self ):
+        
+        with patch.object( ServerDB, 'PETITION_SUMMARY_BLOCK_SIZE', 4 ):
+            
+            ( service_key, admin_account ) = self._create_repository( HC.TAG_REPOSITORY )
+            
+            uploader = self._create_account( service_key, admin_account, { HC.CONTENT_TYPE_MAPPINGS : HC.PERMISSION_ACTION_CREATE } )
+            ( heavy_petitioner, light_petitioner ) = [ self._create_account( service_key, admin_account, { HC.CONTENT_TYPE_MAPPINGS : HC.PERMISSION_ACTION_PETITION } ) for i in range( 2 ) ]
+            
+            # one group of a thousand rows and twenty groups of one row each
+            
+            heavy_hashes = [ HydrusData.GenerateKey() for i in range( 1000 ) ]
+            
+            self._upload_mappings( service_key, uploader, HC.CONTENT_UPDATE_PEND, 'heavy', heavy_hashes )
+            self._upload_mappings( service_key, heavy_petitioner, HC.CONTENT_UPDATE_PETITION, 'heavy', heavy_hashes, 'heavy' )
+            
+            for i in range( 20 ):
+                
+                tag = 'light ' + str( i )
+                hashes = [ HydrusData.GenerateKey() ]
+                
+                self._upload_mappings( service_key, uploader, HC.CONTENT_UPDATE_PEND, tag, hashes )
+                self._upload_mappings( service_key, light_petitioner, HC.CONTENT_UPDATE_PETITION, tag, hashes, 'light' )
+                
+            
+            num_light = 0
+            
+            for i in range( 500 ):
+                
+                petition = self._read( 'petition', service_key, admin_account, HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_STATUS_PETITIONED )
+                
+                if petition.GetReason() == 'light':
+                    
+                    num_light += 1
+                    
+                
+            
+            # about ten in five hundred. picking groups uniformly would give over two hundred
+            
+            self.assertGreater( num_light, 0 )
+            self.assertLess( num_light, 30 )
+            
+        
+    
     def test_server( self ):
         
-        self._test_init_server_admin()
+        if TestServerDB._admin_account_key is None:
+            
+            self._test_init_server_admin()
+            
         
         # broke since service rewrite
         #self._test_service_creation()
@@ -205,4 +851,139 @@ class TestServerDB( unittest.TestCase ):
         
         #self._test_content_creation()
         
-
+    
+    def test_update_generation_batches( self ):
+        
+        ( service_key, account ) = self._create_repository( HC.TAG_REPOSITORY )
+        
+        ( expected_current_mappings, expected_deleted_mappings ) = self._setup_update_generation_mappings( service_key, account )
+        
+        now = HydrusData.GetNow()
+        
+        ( begin, end ) = ( now - 100, now + 100 )
+        
+        with patch.object( ServerDB, 'UPDATE_MAX_CONTENT_ROWS', 3 ):
+            
+            with patch.object( ServerDB, 'UPDATE_MAX_CONTENT_CHUNK', 2 ):
+                
+                ( updates, update_hashes, all_update_hashes, num_batches, finished ) = self._generate_update_batches( service_key, begin, end )
+                
+            
+        
+        self.assertTrue( finished )
+        self.assertEqual( all_update_hashes, update_hashes )
+        
+        # thirteen mapping rows three at a time, after the definitions
+        
+        self.assertEqual( num_batches, 6 )
+        
+        for update in updates:
+            
+            if isinstance( update, HydrusNetwork.ContentUpdate ):
+                
+                self.assertLessEqual( update.GetNumRows(), 3 )
+                
+            
+        
+        ( hash_ids_to_hashes, current_mappings, deleted_mappings ) = self._get_mappings_from_updates( updates )
+        
+        # every mapping exactly once
+        
+        self.assertEqual( sorted( current_mappings ), sorted( expected_current_mappings ) )
+        self.assertEqual( sorted( deleted_mappings ), sorted( expected_deleted_mappings ) )
+        
+        # the one-shot path agrees
+        
+        immediate_updates = self._read( 'immediate_update', service_key, account, begin, end )
+        
+        ( immediate_hash_ids_to_hashes, immediate_current_mappings, immediate_deleted_mappings ) = self._get_mappings_from_updates( immediate_updates )
+        
+        self.assertEqual( hash_ids_to_hashes, immediate_hash_ids_to_hashes )
+        self.assertEqual( sorted( current_mappings ), sorted( immediate_current_mappings ) )
+        self.assertEqual( sorted( deleted_mappings ), sorted( immediate_deleted_mappings ) )
+        
+        # a finished period leaves nothing behind, so asking again starts from scratch
+        
+        ( updates, position, finished ) = self._read( 'repository_updates', service_key, begin, end )
+        
+        self.assertEqual( position, ( -1, -1, -1 ) )
+        self.assertFalse( finished )
+        
+    
+    def test_update_generation_resume( self ):
+        
+        ( service_key, account ) = self._create_repository( HC.TAG_REPOSITORY )
+        
+        ( expected_current_mappings, expected_deleted_mappings ) = self._setup_update_generation_mappings( service_key, account )
+        
+        now = HydrusData.GetNow()
+        
+        ( begin, end ) = ( now - 100, now + 100 )
+        
+        with patch.object( ServerDB, 'UPDATE_MAX_CONTENT_ROWS', 3 ):
+            
+            ( updates, update_hashes, all_update_hashes, num_batches, finished ) = self._generate_update_batches( service_key, begin, end, max_num_batches = 3 )
+            
+            self.assertFalse( finished )
+            
+            # this batch is fetched but the server goes down before it is on disk
+            
+            ( lost_updates, position, finished ) = self._read( 'repository_updates', service_key, begin, end )
+            
+            self._close_db()
+            self._open_db()
+            
+            ( more_updates, more_update_hashes, all_update_hashes, num_batches, finished ) = self._generate_update_batches( service_key, begin, end )
+            
+        
+        self.assertTrue( finished )
+        
+        # the files written before the restart are still part of the period
+        
+        self.assertEqual( all_update_hashes, update_hashes + more_update_hashes )
+        
+        # we pick up at the lost batch, not at the start of the period
+        
+        self.assertEqual( len( lost_updates ), 1 )
+        
+        self.assertFalse( True in ( isinstance( update, HydrusNetwork.DefinitionsUpdate ) for update in more_updates ) )
+        
+        self.assertEqual( lost_updates[0].GetNewMappings(), more_updates[0].GetNewMappings() )
+        self.assertEqual( lost_updates[0].GetDeletedMappings(), more_updates[0].GetDeletedMappings() )
+        
+        ( hash_ids_to_hashes, current_mappings, deleted_mappings ) = self._get_mappings_from_updates( updates + more_updates )
+        
+        self.assertEqual( sorted( current_mappings ), sorted( expected_current_mappings ) )
+        self.assertEqual( sorted( deleted_mappings ), sorted( expected_deleted_mappings ) )
+        
+    
+    def test_vacuum( self ):
+        
+        db = TestServerDB._db
+        
+        with patch.object( HydrusDB, 'CanVacuum', return_value = True ):
+            
+            with patch.object( HydrusDB, 'VacuumDB' ) as vacuum_db:
+                
+                # a backup copying the db files puts it off
+                
+                db._backup_running = True
+                
+                try:
+                    
+                    self.assertFalse( self._write( 'vacuum' ) )
+                    
+                finally:
+                    
+                    db._backup_running = False
+                    
+                
+                self.assertEqual( vacuum_db.call_count, 0 )
+                
+                self.assertTrue( self._write( 'vacuum' ) )
+                
+                self.assertEqual( vacuum_db.call_count, len( db._db_filenames ) )
+                
+            
+        
+    
@@ -0,0 +1,324 @@
+from . import HydrusPaths
+import os
+from . import ServerFiles
+import shutil
+import unittest
+from mock import patch
+
+class TestPackStore( unittest.TestCase ):
+    
+    def setUp( self ):
+        
+        self._packs_dir = HydrusPaths.GetTempDir()
+        
+        self._stores = []
+        
+    
+    def tearDown( self ):
+        
+        for store in self._stores:
+            
+            store.Close()
+            
+        
+        shutil.rmtree( self._packs_dir )
+        
+    
+    def _GenerateHash( self, prefix = 'ab' ):
+        
+        return bytes.fromhex( prefix ) + os.urandom( 31 )
+        
+    
+    def _GetObjects( self, store, prefix = 'ab' ):
+        
+        return { ( file_type, hash ) for ( file_type, hash, timestamp ) in store.GetObjects( prefix ) }
+        
+    
+    def _GetSegmentFilenames( self, prefix = 'ab' ):
+        
+        return sorted( ( filename for filename in os.listdir( self._packs_dir ) if filename.startswith( prefix + '.' ) ) )
+        
+    
+    def _GetStore( self ):
+        
+        store = ServerFiles.PackStore( self._packs_dir )
+        
+        self._stores.append( store )
+        
+        return store
+        
+    
+    def _ReloadStore( self, store ):
+        
+        store.Close()
+        
+        self._stores.remove( store )
+        
+        return self._GetStore()
+        
+    
+    def test_add_get_delete( self ):
+        
+        store = self._GetStore()
+        
+        hash_1 = self._GenerateHash()
+        hash_2 = self._GenerateHash()
+        other_prefix_hash = self._GenerateHash( 'cd' )
+        
+        self.assertEqual( store.GetObject( 'file', hash_1 ), None )
+        
+        store.AddObject( 'file', hash_1, b'file 1' )
+        store.AddObject( 'thumbnail', hash_1, b'thumbnail 1' )
+        store.AddObject( 'file', hash_2, b'file 2' )
+        store.AddObject( 'file', other_prefix_hash, b'other' )
+        
+        self.assertEqual( store.GetObject( 'file', hash_1 ), b'file 1' )
+        self.assertEqual( store.GetObject( 'thumbnail', hash_1 ), b'thumbnail 1' )
+        self.assertEqual( store.GetObject( 'file', hash_2 ), b'file 2' )
+        self.assertEqual( store.GetObject( 'thumbnail', hash_2 ), None )
+        
+        self.assertEqual( self._GetObjects( store ), { ( 'file', hash_1 ), ( 'thumbnail', hash_1 ), ( 'file', hash_2 ) } )
+        self.assertEqual( self._GetObjects( store, 'cd' ), { ( 'file', other_prefix_hash ) } )
+        
+        # content-addressed, so a repeat add writes nothing
+        
+        segment_size = os.path.getsize( os.path.join( self._packs_dir, 'ab.0.pack' ) )
+        
+        store.AddObject( 'file', hash_1, b'file 1' )
+        
+        self.assertEqual( os.path.getsize( os.path.join( self._packs_dir, 'ab.0.pack' ) ), segment_size )
+        
+        store.DeleteObjects( 'file', [ hash_1, other_prefix_hash, self._GenerateHash() ] )
+        
+        self.assertEqual( store.GetObject( 'file', hash_1 ), None )
+        self.assertEqual( store.GetObject( 'file', other_prefix_hash ), None )
+        self.assertEqual( store.GetObject( 'thumbnail', hash_1 ), b'thumbnail 1' )
+        
+        self.assertEqual( self._GetObjects( store ), { ( 'thumbnail', hash_1 ), ( 'file', hash_2 ) } )
+        
+        # and a deleted object can come back
+        
+        store.AddObject( 'file', hash_1, b'file 1' )
+        
+        self.assertEqual( store.GetObject( 'file', hash_1 ), b'file 1' )
+        
+    
+    def test_reload( self ):
+        
+        store = self._GetStore()
+        
+        hashes = [ self._GenerateHash() for i in range( 10 ) ]
+        
+        with patch.object( ServerFiles, 'PACK_SEGMENT_MAX_SIZE', 200 ):
+            
+            for hash in hashes:
+                
+                store.AddObject( 'file', hash, hash * 2 )
+                
+            
+            store.DeleteObjects( 'file', hashes[:3] )
+            
+            store.AddObject( 'file', hashes[0], hashes[0] * 2 )
+            
+        
+        # small segments, so the puts and deletes are spread over several and have to be replayed in order
+        
+        self.assertTrue( len( self._GetSegmentFilenames() ) > 3 )
+        
+        store = self._ReloadStore( store )
+        
+        expected_hashes = [ hashes[0] ] + hashes[3:]
+        
+        self.assertEqual( self._GetObjects( store ), { ( 'file', hash ) for hash in expected_hashes } )
+        
+        for hash in expected_hashes:
+            
+            self.assertEqual( store.GetObject( 'file', hash ), hash * 2 )
+            
+        
+        for hash in hashes[1:3]:
+            
+            self.assertEqual( store.GetObject( 'file', hash ), None )
+            
+        
+    
+    def test_damaged_tail( self ):
+        
+        store = self._GetStore()
+        
+        hash_1 = self._GenerateHash()
+        hash_2 = self._GenerateHash()
+        
+        store.AddObject( 'file', hash_1, b'file 1' )
+        
+        store.Close()
+        
+        path = os.path.join( self._packs_dir, 'ab.0.pack' )
+        
+        good_size = os.path.getsize( path )
+        
+        store.AddObject( 'file', hash_2, b'file 2' )
+        
+        store.Close()
+        
+        # a crash partway through writing the second record
+        
+        with open( path, 'r+b' ) as f:
+            
+            f.truncate( os.path.getsize( path ) - 3 )
+            
+        
+        store = self._ReloadStore( store )
+        
+        self.assertEqual( store.GetObject( 'file', hash_1 ), b'file 1' )
+        self.assertEqual( store.GetObject( 'file', hash_2 ), None )
+        
+        self.assertEqual( os.path.getsize( path ), good_size )
+        
+        # writing carries on from the good end
+        
+        store.AddObject( 'file', hash_2, b'file 2' )
+        
+        store.Close()
+        
+        # and a tail of junk that does not parse as a header
+        
+        with open( path, 'ab' ) as f:
+            
+            f.write( b'\xff' * ( ServerFiles.PACK_RECORD_HEADER.size + 10 ) )
+            
+        
+        store = self._ReloadStore( store )
+        
+        self.assertEqual( store.GetObject( 'file', hash_1 ), b'file 1' )
+        self.assertEqual( store.GetObject( 'file', hash_2 ), b'file 2' )
+        
+        self.assertEqual( self._GetObjects( store ), { ( 'file', hash_1 ), ( 'file', hash_2 ) } )
+        
+    
+    def test_compaction( self ):
+        
+        store = self._GetStore()
+        
+        hashes = [ self._GenerateHash() for i in range( 20 ) ]
+        
+        with patch.object( ServerFiles, 'PACK_SEGMENT_MAX_SIZE', 500 ):
+            
+            for hash in hashes:
+                
+                store.AddObject( 'file', hash, hash * 4 )
+                
+            
+        
+        with patch.object( ServerFiles, 'PACK_COMPACTION_MIN_WASTE', 100 ):
+            
+            # not enough dead weight yet
+            
+            store.DeleteObjects( 'file', hashes[:2] )
+            
+            self.assertEqual( store.Compact(), 0 )
+            
+            store.DeleteObjects( 'file', hashes[2:15] )
+            
+            old_segment_filenames = self._GetSegmentFilenames()
+            
+            self.assertTrue( len( old_segment_filenames ) > 1 )
+            
+            self.assertEqual( store.Compact(), 1 )
+            
+            # everything live is now in one new segment, and the old ones are gone
+            
+            [ new_segment_filename ] = self._GetSegmentFilenames()
+            
+            self.assertNotIn( new_segment_filename, old_segment_filenames )
+            
+            self.assertEqual( os.path.getsize( os.path.join( self._packs_dir, new_segment_filename ) ), 5 * ( ServerFiles.PACK_RECORD_HEADER.size + 32 * 4 ) )
+            
+            self.assertEqual( store.Compact(), 0 )
+            
+        
+        for hash in hashes[:15]:
+            
+            self.assertEqual( store.GetObject( 'file', hash ), None )
+            
+        
+        for hash in hashes[15:]:
+            
+            self.assertEqual( store.GetObject( 'file', hash ), hash * 4 )
+            
+        
+        # new objects go on the end of the new segment
+        
+        new_hash = self._GenerateHash()
+        
+        store.AddObject( 'file', new_hash, b'new' )
+        
+        store = self._ReloadStore( store )
+        
+        self.assertEqual( self._GetObjects( store ), { ( 'file', hash ) for hash in hashes[15:] + [ new_hash ] } )
+        
+        self.assertEqual( store.GetObject( 'file', new_hash ), b'new' )
+        
+    
+    def test_interrupted_compaction( self ):
+        
+        store = self._GetStore()
+        
+        hash = self._GenerateHash()
+        
+        store.AddObject( 'file', hash, b'file' )
+        
+        store.Close()
+        
+        # a compaction that died before its new segment got its real name
+        
+        temp_path = os.path.join( self._packs_dir, 'ab.1.pack.temp' )
+        
+        with open( temp_path, 'wb' ) as f:
+            
+            f.write( b'half a segment' )
+            
+        
+        store = self._ReloadStore( store )
+        
+        self.assertEqual( store.GetObject( 'file', hash ), b'file' )
+        
+        self.assertFalse( os.path.exists( temp_path ) )
+        
+    
+    def test_compaction_paused( self ):
+        
+        store = self._GetStore()
+        
+        hashes = [ self._GenerateHash() for i in range( 10 ) ]
+        
+        for hash in hashes:
+            
+            store.AddObject( 'file', hash, hash * 4 )
+            
+        
+        store.DeleteObjects( 'file', hashes[:8] )
+        
+        with patch.object( ServerFiles, 'PACK_COMPACTION_MIN_WASTE', 100 ):
+            
+            store.PauseCompaction()
+            
+            # a backup is copying the segments, so nothing gets swapped out
+            
+            self.assertEqual( store.Compact(), 0 )
+            
+            self.assertEqual( self._GetSegmentFilenames(), [ 'ab.0.pack' ] )
+            
+            store.ResumeCompaction()
+            
+            self.assertEqual( store.Compact(), 1 )
+            
+            self.assertEqual( self._GetSegmentFilenames(), [ 'ab.1.pack' ] )
+            
+        
+        for hash in hashes[8:]:
+            
+            self.assertEqual( store.GetObject( 'file', hash ), hash * 4 )
+            
+        
+    
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+# This program is free software. It comes without any warranty, to
+# the extent permitted by applicable law. You can redistribute it
+# and/or modify it under the terms of the Do What The Fuck You Want
+# To Public License, Version 2, as published by Sam Hocevar. See
+# http://sam.zoy.org/wtfpl/COPYING for more details.
+
+import locale
+
+try: locale.setlocale( locale.LC_ALL, '' )
+except: pass
+
+from include import HydrusConstants as HC
+from include import HydrusData
+from include import HydrusPaths
+from include import ServerBenchmark
+import argparse
+import threading
+import traceback
+from twisted.internet import reactor
+
+if __name__ == '__main__':
+    
+    argparser = argparse.ArgumentParser( description = 'boots a throwaway hydrus server with a synthetic tag repository and measures it under a swarm of simulated clients' )
+    
+    argparser.add_argument( '--port', type = int, default = HC.DEFAULT_SERVICE_PORT, help = 'the port for the benchmark tag repository' )
+    argparser.add_argument( '--num_hashes', type = int, default = 10000, help = 'how many files the synthetic repository knows about' )
+    argparser.add_argument( '--num_tags', type = int, default = 1000, help = 'how many tags the synthetic repository knows about' )
+    argparser.add_argument( '--num_mappings', type = int, default = 100000, help = 'how many mappings to seed the synthetic repository with' )
+    argparser.add_argument( '--num_clients', type = int, default = 8, help = 'how many simulated clients sync, download and upload at once' )
+    argparser.add_argument( '--num_janitors', type = int, default = 1, help = 'how many simulated janitors process petitions at once' )
+    argparser.add_argument( '--duration', type = int, default = 60, help = 'how many seconds to run the swarm for' )
+    argparser.add_argument( '-d', '--db_dir', help = 'set a db location, rather than a temporary one that is deleted afterwards' )
+    
+    result = argparser.parse_args()
+    
+    if result.db_dir is None:
+        
+        db_dir = HydrusPaths.GetTempDir()
+        
+        delete_db_dir = True
+        
+    else:
+        
+        db_dir = result.db_dir
+        
+        HydrusPaths.MakeSureDirectoryExists( db_dir )
+        
+        delete_db_dir = False
+        
+    
+    threading.Thread( target = reactor.run, name = 'twisted', kwargs = { 'installSignalHandlers' : 0 } ).start()
+    
+    try:
+        
+        benchmark = ServerBenchmark.ServerBenchmark( db_dir, result.port, result.num_hashes, result.num_tags, result.num_mappings, result.num_clients, result.num_janitors, result.duration )
+        
+        benchmark.Run()
+        
+    except:
+        
+        HydrusData.Print( 'Benchmark failed' )
+        
+        HydrusData.Print( traceback.format_exc() )
+        
+    finally:
+        
+        reactor.callFromThread( reactor.stop )
+        
+        if delete_db_dir:
+            
+            HydrusPaths.DeletePath( db_dir )
+            
+        
+    